@@ -1,12 +1,25 @@
-from typing import Any
+from __future__ import annotations
+import random
+from collections import Counter
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Optional, Type
 from utils import *
-from rich import print as pprint
+from placements import sample_consistent_layouts
+
+if TYPE_CHECKING:
+    # Imported when sampling with processes: it takes longer than the rest of ai.py
+    from concurrent.futures import ProcessPoolExecutor
+
+numpy = lazy_import("numpy")
 
 
 class Strategy:
     name: str
     own_board: "ControlledBoard"
     ennemy_board: "ProjectiveBoard"
+    # Whether choosing a shot takes milliseconds even on small boards, so that
+    # event loops have to choose it in a thread (see server.HostedGame)
+    slow: bool = False
 
     def __init__(
         self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
@@ -28,16 +41,42 @@ class Strategy:
         """
         raise NotImplementedError("Please implement react_to_shot_result.")
 
-    def d(self, t: str, *args, **kwargs):
+    def save_state(self) -> Any:
+        """
+        What the strategy knows about the game so far, to save it (see snapshot.py):
+        its attributes, except for the boards it plays on.
+        The state is pickled: strategies knowing a lot store cells as numbers
+        (x * size + y) rather than tuples, or pack their state into bytes.
+        """
+        return {
+            name: value
+            for name, value in vars(self).items()
+            if name not in ("own_board", "ennemy_board")
+        }
+
+    def restore_state(self, state: Any):
+        """
+        Restores a state returned by save_state(), which it may then modify
+        """
+        vars(self).update(state)
+
+    def d(self, t: Message, *args, level: int = DEBUG, **kwargs):
+        if not logging_at(level):
+            return
         return self.own_board.d(
-            f"[bold]{{Strategy [i]{self.name}[/i]}}[/bold] " + t, *args, **kwargs
+            lambda: f"[bold]{{Strategy [i]{self.name}[/i]}}[/bold] "
+            + (t() if callable(t) else t),
+            *args,
+            level=level,
+            **kwargs,
         )
 
 
 class HuntTarget(Strategy):
 
     potential_targets: list[tuple[int, int]]
-    already_hit: list[tuple[int, int]]
+    # Numbers (x * size + y) of the cells fired at
+    already_hit: set[int]
     name: str = "Hunt & Target"
 
     def __init__(
@@ -45,7 +84,7 @@ class HuntTarget(Strategy):
     ) -> None:
         super().__init__(name, own_board, ennemy_board)
         self.potential_targets = []
-        self.already_hit = []
+        self.already_hit = set()
         self.name = "Hunt & Target"
 
     def choose_shot_location(self) -> tuple[int, int]:
@@ -55,16 +94,444 @@ class HuntTarget(Strategy):
             return self.potential_targets.pop()
 
     def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
-        self.already_hit.append((x, y))
+        size = self.ennemy_board.size
+        self.already_hit.add(x * size + y)
 
         if hit_a_ship:
             self.potential_targets += [
                 target for target in
                 self.ennemy_board.cardinal_coordinates(x, y)
                 if self.ennemy_board.within_bounds(*target)
-                and target not in self.already_hit
+                and target[0] * size + target[1] not in self.already_hit
             ]
-            self.d(f"potential targets are {self.potential_targets}")
+            self.d(
+                lambda: f"potential targets are {self.potential_targets}", level=TRACE
+            )
+
+
+class ParityHuntTarget(Strategy):
+    """
+    Hunts on a checkerboard-like lattice spaced by the smallest ship that may
+    still be afloat, then targets around hits, following lines of aligned hits.
+    A line that is blocked at both ends is assumed to be a sunken ship when a
+    ship of that length remains, which lets the lattice grow sparser.
+    Never fires twice at the same cell.
+    """
+
+    name: str = "Parity Hunt & Target"
+
+    # Numbers (x * size + y) of the cells fired at
+    fired: set[int]
+    # Hits that do not belong to a ship known to be sunken, most recent last
+    cluster: list[tuple[int, int]]
+    # Orientations (as (dx, dy)) already fully explored through each hit
+    exhausted: dict[tuple[int, int], set[tuple[int, int]]]
+    remaining: list[int]
+    spacing: int
+    # Lattices hold the cells where (x + y) % spacing == offset % spacing
+    offset: int
+    # Numbers of the lattice's cells, popped from the end
+    hunt_cells: list[int]
+
+    def __init__(
+        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+    ) -> None:
+        super().__init__(name, own_board, ennemy_board)
+        self.fired = set()
+        self.cluster = []
+        self.exhausted = {}
+        self.remaining = sorted(ennemy_board.real_board.fleet)
+        self.spacing = 0
+        self.offset = random.randrange(self.remaining[-1] if self.remaining else 1)
+        self.hunt_cells = []
+
+    def choose_shot_location(self) -> tuple[int, int]:
+        return self.target() or self.hunt()
+
+    def hunt(self) -> tuple[int, int]:
+        # Once down to every cell left, stay there rather than rebuilding lattices
+        if self.spacing != 1:
+            spacing = self.remaining[0] if self.remaining else 1
+            if spacing != self.spacing:
+                self.spacing = spacing
+                self.build_lattice()
+        size = self.ennemy_board.size
+        while self.hunt_cells:
+            cell = self.hunt_cells.pop()
+            if cell not in self.fired:
+                return divmod(cell, size)
+        # Ships hiding off the lattice: fall back to every cell left, for good
+        self.spacing = 1
+        self.build_lattice()
+        return divmod(self.hunt_cells.pop(), size)
+
+    def build_lattice(self):
+        size = self.ennemy_board.size
+        offset = self.offset % self.spacing
+        self.hunt_cells = [
+            x * size + y
+            for x in range(size)
+            for y in range(size)
+            if (x + y) % self.spacing == offset and x * size + y not in self.fired
+        ]
+        random.shuffle(self.hunt_cells)
+
+    def target(self) -> Optional[tuple[int, int]]:
+        """
+        Next cell to fire at around the hits of the cluster, None if there is none left
+        """
+        size = self.ennemy_board.size
+        while self.cluster:
+            hit = self.cluster[-1]
+            cluster = set(self.cluster)
+            lines = {
+                orientation: self.line(hit, orientation, cluster)
+                for orientation in {(0, 1), (1, 0)}
+                - self.exhausted.setdefault(hit, set())
+            }
+            # Follow lines of at least two hits first
+            for orientation in sorted(lines, key=lambda o: -len(lines[o])):
+                line = lines[orientation]
+                dx, dy = orientation
+                (first_x, first_y), (last_x, last_y) = line[0], line[-1]
+                for end in ((last_x + dx, last_y + dy), (first_x - dx, first_y - dy)):
+                    if (
+                        self.ennemy_board.within_bounds(*end)
+                        and end[0] * size + end[1] not in self.fired
+                    ):
+                        return end
+                # Both ends are blocked
+                for cell in line:
+                    self.exhausted.setdefault(cell, set()).add(orientation)
+                if len(line) > 1 and len(line) in self.remaining:
+                    self.d(lambda: f"assuming ship {line} is sunken", level=TRACE)
+                    self.remaining.remove(len(line))
+                    self.cluster = [cell for cell in self.cluster if cell not in line]
+                break
+            else:
+                self.cluster.pop()
+        return None
+
+    def line(
+        self,
+        hit: tuple[int, int],
+        orientation: tuple[int, int],
+        cluster: set[tuple[int, int]],
+    ) -> list[tuple[int, int]]:
+        """
+        The hits of the cluster (given as a set) aligned with `hit` without gaps,
+        in order
+        """
+        dx, dy = orientation
+        x, y = hit
+        while (x - dx, y - dy) in cluster:
+            x, y = x - dx, y - dy
+        line = []
+        while (x, y) in cluster:
+            line.append((x, y))
+            x, y = x + dx, y + dy
+        return line
+
+    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
+        self.fired.add(x * self.ennemy_board.size + y)
+        if hit_a_ship:
+            self.cluster.append((x, y))
+
+
+class ProbabilityDensity(Strategy):
+    """
+    Fires at the cell that the most ship placements go through.
+    Placements cannot cover a miss, and placements going through hits are
+    favored, so the strategy naturally finishes off ships it has found.
+    Like ParityHuntTarget, a line of hits blocked at both ends is assumed to be
+    a sunken ship when one of that length remains: its cells then block placements
+    instead of attracting them, and the ship is left out of the fleet.
+    """
+
+    name: str = "Probability density"
+    # How much more likely a placement becomes for each hit it goes through
+    hit_weight: int = 20
+
+    unknown: numpy.ndarray
+    hits: numpy.ndarray
+    misses: numpy.ndarray
+    # Hits of the ships assumed to be sunken
+    sunken: numpy.ndarray
+    # Lengths of the ships that may still be afloat
+    remaining: Counter
+
+    def __init__(
+        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+    ) -> None:
+        super().__init__(name, own_board, ennemy_board)
+        size = ennemy_board.size
+        self.unknown = numpy.ones((size, size), dtype=bool)
+        self.hits = numpy.zeros((size, size), dtype=numpy.int64)
+        self.misses = numpy.zeros((size, size), dtype=numpy.int64)
+        self.sunken = numpy.zeros((size, size), dtype=numpy.int64)
+        self.remaining = Counter(ennemy_board.real_board.fleet)
+
+    def save_state(self) -> tuple[bytes, tuple[tuple[int, int], ...]]:
+        """
+        A byte per cell, with bit 0 set for hits, 1 for misses and 2 for sunken
+        hits, and the number of remaining ships of each length
+        """
+        cells = self.hits + 2 * self.misses + 4 * self.sunken
+        return cells.astype(numpy.uint8).tobytes(), tuple(self.remaining.items())
+
+    def restore_state(self, state: tuple[bytes, tuple[tuple[int, int], ...]]):
+        packed, remaining = state
+        size = self.ennemy_board.size
+        cells = numpy.frombuffer(packed, numpy.uint8).reshape(size, size)
+        self.hits = (cells & 1).astype(numpy.int64)
+        self.misses = (cells >> 1 & 1).astype(numpy.int64)
+        self.sunken = (cells >> 2 & 1).astype(numpy.int64)
+        # Cells are known once fired at, hit or missed
+        self.unknown = cells & 3 == 0
+        self.remaining = Counter(dict(remaining))
+
+    def density(self) -> numpy.ndarray:
+        """
+        For every cell, the (weighted) number of placements of the remaining ships
+        covering it
+        """
+        blocked = self.misses + self.sunken
+        hits = self.hits - self.sunken
+        fleet = +self.remaining
+        return self.line_density(blocked, hits, fleet) + self.line_density(
+            blocked.T, hits.T, fleet
+        ).T
+
+    def line_density(
+        self, misses: numpy.ndarray, hits: numpy.ndarray, fleet: Counter
+    ) -> numpy.ndarray:
+        """
+        Density of horizontal placements of the fleet's ships
+        """
+        rows, columns = misses.shape
+        cumulated_misses = cumulative_sums(misses)
+        cumulated_hits = cumulative_sums(hits)
+        density = numpy.zeros((rows, columns), dtype=numpy.int64)
+        spread = numpy.zeros((rows, columns + 1), dtype=numpy.int64)
+        for length, count in fleet.items():
+            if length > columns:
+                continue
+            # Placements starting at each column: can't cover a miss, favored by hits
+            blocked = cumulated_misses[:, length:] - cumulated_misses[:, :-length]
+            through_hits = cumulated_hits[:, length:] - cumulated_hits[:, :-length]
+            weights = (blocked == 0) * (count + count * self.hit_weight * through_hits)
+            # Spread each placement's weight on the `length` cells it covers:
+            # +weight where it starts, -weight right after it ends, then cumulate.
+            spread[:] = 0
+            spread[:, : columns - length + 1] += weights
+            spread[:, length:] -= weights
+            density += numpy.cumsum(spread[:, :columns], axis=1)
+        return density
+
+    def choose_shot_location(self) -> tuple[int, int]:
+        density = numpy.where(self.unknown, self.density(), -1)
+        best = numpy.flatnonzero(density == density.max())
+        return divmod(int(random.choice(best)), self.unknown.shape[1])
+
+    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
+        self.unknown[x, y] = False
+        if hit_a_ship:
+            self.hits[x, y] = 1
+        else:
+            self.misses[x, y] = 1
+        # The shot may have closed a line of hits, through it or ending next to it
+        for dx, dy in (0, 1), (1, 0):
+            for cell in (x, y), (x - dx, y - dy), (x + dx, y + dy):
+                line = self.closed_line(cell, (dx, dy))
+                if line is not None and self.remaining[len(line)]:
+                    self.d(lambda: f"assuming ship {line} is sunken", level=TRACE)
+                    self.remaining[len(line)] -= 1
+                    for hit in line:
+                        self.sunken[hit] = 1
+
+    def closed_line(
+        self, cell: tuple[int, int], orientation: tuple[int, int]
+    ) -> Optional[list[tuple[int, int]]]:
+        """
+        The line of hits through `cell` along `orientation`, if it is at least
+        two hits long, blocked at both ends, and no other hit touches it sideways.
+        None otherwise.
+        """
+        dx, dy = orientation
+        size = self.ennemy_board.size
+
+        def afloat(x: int, y: int) -> bool:
+            return (
+                0 <= x < size
+                and 0 <= y < size
+                and self.hits[x, y]
+                and not self.sunken[x, y]
+            )
+
+        x, y = cell
+        if not afloat(x, y):
+            return None
+        while afloat(x - dx, y - dy):
+            x, y = x - dx, y - dy
+        line = []
+        while afloat(x, y):
+            line.append((x, y))
+            x, y = x + dx, y + dy
+        first_x, first_y = line[0]
+        ends = (first_x - dx, first_y - dy), (x, y)
+        if len(line) < 2 or any(
+            0 <= end_x < size and 0 <= end_y < size and self.unknown[end_x, end_y]
+            for end_x, end_y in ends
+        ):
+            return None
+        if any(
+            afloat(x + dy * side, y + dx * side) for x, y in line for side in (-1, 1)
+        ):
+            return None
+        return line
+
+
+class MonteCarlo(ProbabilityDensity):
+    """
+    Samples enemy fleet layouts consistent with every hit and miss so far,
+    and fires at the cell most likely to hold a ship.
+    Sampling stops after `samples` layouts or `time_budget` seconds, whichever comes first;
+    without any sample, it falls back to ProbabilityDensity.
+    """
+
+    name: str = "Monte Carlo"
+    slow: bool = True
+    samples: int = 5000
+    time_budget: float = 0.05
+    # Number of processes sampling in parallel, 0 to sample in the calling process,
+    # None for one per CPU (see sampling_workers)
+    workers: Optional[int] = None
+
+    def __init__(
+        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+    ) -> None:
+        super().__init__(name, own_board, ennemy_board)
+        if workers := sampling_workers(self.workers):
+            # Starting the processes takes longer than a decision's time budget
+            sampling_pool(workers)
+
+    def choose_shot_location(self) -> tuple[int, int]:
+        size = self.ennemy_board.size
+        counts, found = self.sample(perf_counter() + self.time_budget)
+        self.d(lambda: f"sampled {found} layouts", level=TRACE)
+        if not found:
+            return super().choose_shot_location()
+        likelihood = numpy.where(self.unknown.reshape(-1), counts, -1)
+        best = numpy.flatnonzero(likelihood == likelihood.max())
+        return divmod(int(random.choice(best)), size)
+
+    def sample(self, deadline: float) -> tuple[numpy.ndarray, int]:
+        """
+        Number of sampled layouts with a ship on each cell, and number of samples
+        """
+        arguments = (
+            self.ennemy_board.size,
+            list(self.ennemy_board.real_board.fleet),
+            self.misses.reshape(-1).astype(bool),
+            self.hits.reshape(-1).astype(bool),
+        )
+        workers = sampling_workers(self.workers)
+        if not workers:
+            return sample_consistent_layouts(
+                *arguments,
+                deadline=deadline,
+                max_samples=self.samples,
+                rng=numpy.random.default_rng(random.getrandbits(64)),
+            )
+
+        from concurrent.futures import wait
+
+        pool = sampling_pool(workers)
+        # Workers get their own deadline, measured from when they start
+        budget = max(deadline - perf_counter(), 0)
+        jobs = [
+            pool.submit(
+                sample_in_worker,
+                *arguments,
+                budget,
+                -(-self.samples // workers),
+                random.getrandbits(64),
+            )
+            for _ in range(workers)
+        ]
+        done, late = wait(jobs, timeout=budget + 0.01)
+        # Late samples are left out. Jobs still queued are cancelled so as not to hold
+        # up the next decision's; running ones stop at their own deadline.
+        for job in late:
+            job.cancel()
+        counts = numpy.zeros(self.unknown.size, dtype=numpy.int64)
+        found = 0
+        for job in done:
+            job_counts, job_found = job.result()
+            counts += job_counts
+            found += job_found
+        return counts, found
+
+
+sampling_pools: dict[int, ProcessPoolExecutor] = {}
+
+
+def sampling_workers(workers: Optional[int]) -> int:
+    """
+    The number of processes to sample with, `workers` if given.
+    By default, one per CPU, but none on a single CPU, or in a process started by
+    another: simulate.py's and league.py's already keep every CPU busy, and those of
+    a multiprocessing.Pool cannot start processes.
+    """
+    if workers is not None:
+        return workers
+    from multiprocessing import parent_process
+    from os import cpu_count
+
+    cpus = cpu_count() or 1
+    return cpus if cpus > 1 and parent_process() is None else 0
+
+
+def sampling_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    The process pool used by MonteCarlo strategies, created and started on first use
+    """
+    from concurrent.futures import ProcessPoolExecutor, wait
+
+    if workers not in sampling_pools:
+        pool = sampling_pools[workers] = ProcessPoolExecutor(workers)
+        wait([pool.submit(int) for _ in range(workers)])
+    return sampling_pools[workers]
+
+
+def sample_in_worker(
+    grid_size: int,
+    fleet: list[int],
+    misses: numpy.ndarray,
+    hits: numpy.ndarray,
+    budget: float,
+    max_samples: int,
+    seed: int,
+) -> tuple[numpy.ndarray, int]:
+    return sample_consistent_layouts(
+        grid_size,
+        fleet,
+        misses,
+        hits,
+        deadline=perf_counter() + budget,
+        max_samples=max_samples,
+        rng=numpy.random.default_rng(seed),
+    )
+
+
+def cumulative_sums(grid: numpy.ndarray) -> numpy.ndarray:
+    """
+    Cumulative sums along each row of grid, starting with a column of zeros,
+    so that the sum of grid[:, a:b] is result[:, b] - result[:, a]
+    """
+    cumulated = numpy.zeros((grid.shape[0], grid.shape[1] + 1), dtype=numpy.int64)
+    numpy.cumsum(grid, axis=1, out=cumulated[:, 1:])
+    return cumulated
 
 
 class NoStrategy(Strategy):
@@ -85,5 +552,19 @@ class NoStrategy(Strategy):
     def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
         return
 
-    def d(self, t: str, *args, **kwargs):
+    def d(self, t: Message, *args, level: int = DEBUG, **kwargs):
         return
+
+
+def strategies() -> dict[str, Type[Strategy]]:
+    """
+    All the playable strategies, by class name
+    """
+    found = {}
+    classes = Strategy.__subclasses__()
+    while classes:
+        cls = classes.pop()
+        classes += cls.__subclasses__()
+        if cls is not NoStrategy:
+            found[cls.__name__] = cls
+    return found
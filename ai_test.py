@@ -0,0 +1,132 @@
+import random
+import numpy
+from ai import MonteCarlo, ParityHuntTarget, ProbabilityDensity
+from game import ai_game
+from placements import sample_consistent_layouts
+
+
+def test_ProbabilityDensity_targets_around_hits():
+    random.seed(0)
+    game = ai_game(ProbabilityDensity, ProbabilityDensity)
+    strategy = game.players[0].strategy
+
+    strategy.react_to_shot_result(5, 5, True)
+    assert strategy.choose_shot_location() in {(4, 5), (6, 5), (5, 4), (5, 6)}
+
+    strategy.react_to_shot_result(5, 6, True)
+    strategy.react_to_shot_result(4, 5, False)
+    strategy.react_to_shot_result(6, 5, False)
+    assert strategy.choose_shot_location() in {(5, 4), (5, 7)}
+
+
+def test_ProbabilityDensity_never_fires_twice():
+    random.seed(1)
+    game = ai_game(ProbabilityDensity, ProbabilityDensity, grid_size=6, fleet=[2, 3])
+    strategy = game.players[0].strategy
+    fired = set()
+    for _ in range(36):
+        x, y = strategy.choose_shot_location()
+        assert (x, y) not in fired
+        fired.add((x, y))
+        strategy.react_to_shot_result(x, y, False)
+
+
+def test_ProbabilityDensity_leaves_sunken_ships_alone():
+    random.seed(0)
+    game = ai_game(ProbabilityDensity, ProbabilityDensity)
+    strategy = game.players[0].strategy
+    destroyers = strategy.remaining[2]
+
+    strategy.react_to_shot_result(5, 5, True)
+    strategy.react_to_shot_result(5, 6, True)
+    strategy.react_to_shot_result(5, 4, False)
+    assert strategy.remaining[2] == destroyers
+
+    # Blocked at both ends: the destroyer is sunken, and no longer draws shots
+    strategy.react_to_shot_result(5, 7, False)
+    assert strategy.remaining[2] == destroyers - 1
+    assert strategy.sunken[5, 5] and strategy.sunken[5, 6]
+    for _ in range(10):
+        assert strategy.choose_shot_location() not in {(4, 5), (4, 6), (6, 5), (6, 6)}
+
+
+def test_ParityHuntTarget_sinks_fleet_without_repeating():
+    for seed in range(20):
+        random.seed(seed)
+        game = ai_game(ParityHuntTarget, ParityHuntTarget)
+        shooter = game.players[0]
+        fired = set()
+        while not shooter.won:
+            x, y = shooter.decide_coordinates()
+            assert (x, y) not in fired
+            fired.add((x, y))
+            shooter.ennemy_board.fire(x, y)
+        assert len(fired) < game.grid_size ** 2
+
+
+def test_ParityHuntTarget_keeps_its_lattice():
+    random.seed(0)
+    game = ai_game(ParityHuntTarget, ParityHuntTarget)
+    strategy = game.players[0].strategy
+    cell = strategy.choose_shot_location()
+    offset = sum(cell) % strategy.spacing
+    strategy.build_lattice()
+    lattice = [divmod(number, game.grid_size) for number in strategy.hunt_cells]
+    assert {sum(cell) % strategy.spacing for cell in lattice} == {offset}
+
+    # Miss every cell of the lattice: the ships left hide elsewhere
+    for x, y in lattice + [cell]:
+        strategy.react_to_shot_result(x, y, False)
+    builds = []
+    build_lattice = strategy.build_lattice
+    strategy.build_lattice = lambda: builds.append(build_lattice())
+    for _ in range(5):
+        x, y = strategy.choose_shot_location()
+        assert x * game.grid_size + y not in strategy.fired
+        strategy.react_to_shot_result(x, y, False)
+    assert len(builds) == 1 and strategy.spacing == 1
+
+
+def test_ParityHuntTarget_follows_lines():
+    random.seed(0)
+    game = ai_game(ParityHuntTarget, ParityHuntTarget)
+    strategy = game.players[0].strategy
+    strategy.react_to_shot_result(5, 5, True)
+    strategy.react_to_shot_result(5, 6, True)
+    assert strategy.choose_shot_location() in {(5, 4), (5, 7)}
+
+
+def test_sample_consistent_layouts():
+    misses = numpy.zeros(36, dtype=bool)
+    hits = numpy.zeros(36, dtype=bool)
+    misses[[0, 1, 2, 3, 4, 5]] = True
+    hits[[8, 14]] = True
+    counts, found = sample_consistent_layouts(
+        6, [2, 3], misses, hits, float("inf"), 500, numpy.random.default_rng(0)
+    )
+    assert found == 500
+    assert counts[8] == counts[14] == 500
+    assert not counts[:6].any()
+
+    # No layout of a single ship of 2 covers two hits that far apart
+    hits[:] = False
+    hits[[8, 35]] = True
+    counts, found = sample_consistent_layouts(
+        6, [2], misses, hits, float("inf"), 500, numpy.random.default_rng(0)
+    )
+    assert found == 0 and not counts.any()
+
+
+def test_MonteCarlo_targets_around_hits():
+    random.seed(0)
+    game = ai_game(MonteCarlo, MonteCarlo)
+    strategy = game.players[0].strategy
+    strategy.react_to_shot_result(5, 5, True)
+    strategy.react_to_shot_result(4, 5, False)
+    strategy.react_to_shot_result(6, 5, False)
+    strategy.react_to_shot_result(5, 4, False)
+    assert strategy.choose_shot_location() == (5, 6)
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
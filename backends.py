@@ -0,0 +1,549 @@
+from __future__ import annotations
+import mmap
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional, Sequence, Union
+from utils import lazy_import
+
+numpy = lazy_import("numpy")
+
+# Cells' states can be stored with 2 bits per cell (see dump() and MappedBackend):
+# bit i of a first "low" plane of bytes and of a second "high" plane hold cell
+# i = x * size + y's code, an index in a list of up to 4 states.
+MAX_CODES = 4
+# Bytes of the planes processed at once by numpy when scanning them
+CHUNK_BYTES = 1 << 22
+
+
+def plane_bytes(size: int) -> int:
+    """
+    Bytes taken by a bit plane of a board of the given size
+    """
+    return (size * size + 7) // 8
+
+
+def read_planes(buffer, offset: int, size: int) -> tuple[int, int]:
+    """
+    The low and high planes stored at `offset`, as integers
+    """
+    plane = plane_bytes(size)
+    return (
+        int.from_bytes(buffer[offset : offset + plane], "little"),
+        int.from_bytes(buffer[offset + plane : offset + 2 * plane], "little"),
+    )
+
+
+def write_planes(buffer, offset: int, size: int, low: int, high: int):
+    plane = plane_bytes(size)
+    buffer[offset : offset + plane] = low.to_bytes(plane, "little")
+    buffer[offset + plane : offset + 2 * plane] = high.to_bytes(plane, "little")
+
+
+def code_chunks(
+    buffer, offset: int, size: int, code: int
+) -> Iterator[tuple[int, numpy.ndarray]]:
+    """
+    Scans the planes stored at `offset` for the cells with the given code.
+    Yields the number of the first cell of each chunk, and a bit array of the
+    chunk's cells, 1 for those having the code.
+    """
+    plane = plane_bytes(size)
+    for start in range(0, plane, CHUNK_BYTES):
+        count = min(CHUNK_BYTES, plane - start)
+        low = numpy.frombuffer(buffer, numpy.uint8, count, offset + start)
+        high = numpy.frombuffer(buffer, numpy.uint8, count, offset + plane + start)
+        chunk = (low if code & 1 else ~low) & (high if code & 2 else ~high)
+        bits = numpy.unpackbits(chunk, bitorder="little")
+        # The last byte's padding bits are not cells
+        yield start * 8, bits[: size * size - start * 8]
+
+
+@lru_cache(maxsize=None)
+def state_digits(state: int) -> bytes:
+    """
+    bytes.translate() table of a byte to the digit "1" if it is the given state,
+    "0" otherwise
+    """
+    return bytes(b"01"[byte == state] for byte in range(256))
+
+
+@lru_cache(maxsize=None)
+def code_digits(codes: tuple[tuple[int, int], ...], bit: int) -> bytes:
+    """
+    bytes.translate() table of a state to the digit of the given bit of its code,
+    `codes` being (state, code) pairs
+    """
+    code_of = dict(codes)
+    return bytes(b"01"[code_of.get(byte, 0) >> bit & 1] for byte in range(256))
+
+
+# bytes.translate() tables of a digit of the low or high plane to its value in
+# cells' codes
+DIGIT_VALUES = bytes.maketrans(b"01", b"\0\1"), bytes.maketrans(b"01", b"\0\2")
+
+
+def planes_bytes(low: int, high: int, cells: int) -> bytes:
+    """
+    The cells' codes, one byte per cell, from their low and high planes
+    """
+    low, high = (
+        int.from_bytes(
+            bin(plane)[2:].zfill(cells)[::-1].encode().translate(values), "big"
+        )
+        for plane, values in zip((low, high), DIGIT_VALUES)
+    )
+    # A byte per cell of 0 or 1, plus another of 0 or 2: no carries
+    return (low + high).to_bytes(cells, "big")
+
+
+class GridBackend:
+    """
+    Stores a board's cells as a 2D list of state integers.
+    """
+
+    size: int
+    rows: list[list[int]]
+
+    def __init__(self, size: int, initial_state: int):
+        self.size = size
+        self.rows = [[initial_state] * size for _ in range(size)]
+
+    def get(self, x: int, y: int) -> int:
+        return self.rows[x][y]
+
+    def set(self, x: int, y: int, state: int) -> int:
+        """
+        Sets the state of cell (x, y) and returns its previous state
+        """
+        previous = self.rows[x][y]
+        self.rows[x][y] = state
+        return previous
+
+    def count(self, state: int) -> int:
+        """
+        Number of cells in the given state
+        """
+        return sum(row.count(state) for row in self.rows)
+
+    def mask(self, state: int) -> int:
+        """
+        Bitmask of the cells in the given state, cell (x, y) being bit x * size + y
+        """
+        mask = 0
+        for x, row in enumerate(self.rows):
+            for y, cell in enumerate(row):
+                if cell == state:
+                    mask |= 1 << (x * self.size + y)
+        return mask
+
+    def all_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        return all(self.rows[x][y] == state for x, y in coords)
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        """
+        Coordinates of the cells in the given state
+        """
+        return [
+            (x, y)
+            for x, row in enumerate(self.rows)
+            for y, cell in enumerate(row)
+            if cell == state
+        ]
+
+    def to_list(self) -> list[list[int]]:
+        return [list(row) for row in self.rows]
+
+    def dump(self, buffer, offset: int, codes: dict[int, int]):
+        """
+        Writes the cells' codes (see MAX_CODES) as two bit planes at `offset`.
+        The buffer has to be zeroed beforehand.
+        """
+        table = numpy.zeros(max(codes) + 1, numpy.uint8)
+        table[list(codes)] = list(codes.values())
+        cells = table[numpy.array(self.rows, numpy.intp).reshape(-1)]
+        plane = plane_bytes(self.size)
+        for shift in (0, 1):
+            packed = numpy.packbits(cells >> shift & 1, bitorder="little")
+            start = offset + shift * plane
+            buffer[start : start + plane] = packed.tobytes()
+
+    def load(self, buffer, offset: int, states: Sequence[int]):
+        """
+        Reads the cells' codes written by dump(), `states` giving each code's state
+        """
+        plane = plane_bytes(self.size)
+        cells = self.size * self.size
+        low, high = (
+            numpy.unpackbits(
+                numpy.frombuffer(buffer, numpy.uint8, plane, start), bitorder="little"
+            )[:cells]
+            for start in (offset, offset + plane)
+        )
+        table = numpy.array(list(states) + [0] * (MAX_CODES - len(states)))
+        self.rows = table[low | high << 1].reshape(self.size, self.size).tolist()
+
+
+class BitboardBackend:
+    """
+    Hands out bitmasks of the cells in each state, cell (x, y) being
+    bit x * size + y, so that sets of cells are checked with a few bitwise ops.
+    Cells' states are stored in a bytearray per row (states are below 256), which
+    reading or writing a cell only indexes: masks are derived from the bytes in C
+    (see state_digits) when needed, then cached until a cell changes.
+    """
+
+    size: int
+    rows: list[bytearray]
+    # Masks derived since the last cell change, by state
+    cached_masks: Optional[dict[int, int]]
+
+    def __init__(self, size: int, initial_state: int):
+        self.size = size
+        self.rows = [bytearray([initial_state]) * size for _ in range(size)]
+        self.cached_masks = None
+
+    def bit(self, x: int, y: int) -> int:
+        # (0, size) would otherwise be cell (1, 0)
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError(f"({x}, {y}) is out of the board")
+        return 1 << (x * self.size + y)
+
+    def get(self, x: int, y: int) -> int:
+        return self.rows[x][y]
+
+    def set(self, x: int, y: int, state: int) -> int:
+        row = self.rows[x]
+        previous = row[y]
+        row[y] = state
+        self.cached_masks = None
+        return previous
+
+    def count(self, state: int) -> int:
+        return sum(row.count(state) for row in self.rows)
+
+    def translated_masks(self, *digits: bytes) -> Iterator[int]:
+        """
+        For each table of `digits`, the bitmask whose bit i is the digit it
+        translates cell i's state to
+        """
+        # Most significant digit first: the last cell's
+        cells = b"".join(self.rows)[::-1]
+        return (int(cells.translate(table), 2) for table in digits)
+
+    def mask(self, state: int) -> int:
+        if self.cached_masks is None:
+            self.cached_masks = {}
+        mask = self.cached_masks.get(state)
+        if mask is None:
+            (mask,) = self.translated_masks(state_digits(state))
+            self.cached_masks[state] = mask
+        return mask
+
+    def coordinates_mask(self, coords: Iterable[tuple[int, int]]) -> int:
+        mask = 0
+        for x, y in coords:
+            mask |= self.bit(x, y)
+        return mask
+
+    def all_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        wanted = self.coordinates_mask(coords)
+        return wanted & self.mask(state) == wanted
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        cells = []
+        for x, row in enumerate(self.rows):
+            y = row.find(state)
+            while y != -1:
+                cells.append((x, y))
+                y = row.find(state, y + 1)
+        return cells
+
+    def to_list(self) -> list[list[int]]:
+        return [list(row) for row in self.rows]
+
+    def dump(self, buffer, offset: int, codes: dict[int, int]):
+        palette = tuple(codes.items())
+        low, high = self.translated_masks(
+            code_digits(palette, 0), code_digits(palette, 1)
+        )
+        write_planes(buffer, offset, self.size, low, high)
+
+    def load(self, buffer, offset: int, states: Sequence[int]):
+        low, high = read_planes(buffer, offset, self.size)
+        cells = bytearray(planes_bytes(low, high, self.size * self.size))
+        # Slices of a bytearray are bytearrays already
+        cells = cells.translate(bytes(states).ljust(256, b"\0"))
+        self.rows = [
+            cells[start : start + self.size]
+            for start in range(0, self.size * self.size, self.size)
+        ]
+        self.cached_masks = None
+
+
+class SparseBackend:
+    """
+    Stores only the cells that are not in the initial state, in a dict keyed by
+    cell number (x * size + y).
+    Meant for huge boards, where almost every cell keeps its initial state.
+    """
+
+    size: int
+    initial_state: int
+    changed: dict[int, int]
+
+    def __init__(self, size: int, initial_state: int):
+        self.size = size
+        self.initial_state = initial_state
+        self.changed = {}
+
+    def key(self, x: int, y: int) -> int:
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError(f"({x}, {y}) is out of the board")
+        return x * self.size + y
+
+    def get(self, x: int, y: int) -> int:
+        return self.changed.get(self.key(x, y), self.initial_state)
+
+    def set(self, x: int, y: int, state: int) -> int:
+        key = self.key(x, y)
+        if state == self.initial_state:
+            return self.changed.pop(key, self.initial_state)
+        previous = self.changed.get(key, self.initial_state)
+        self.changed[key] = state
+        return previous
+
+    def count(self, state: int) -> int:
+        if state == self.initial_state:
+            return self.size * self.size - len(self.changed)
+        return sum(1 for cell in self.changed.values() if cell == state)
+
+    def mask(self, state: int) -> int:
+        mask = 0
+        for key, cell in self.changed.items():
+            if cell == state or state == self.initial_state:
+                mask |= 1 << key
+        if state == self.initial_state:
+            return ((1 << (self.size * self.size)) - 1) ^ mask
+        return mask
+
+    def all_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        return all(self.get(x, y) == state for x, y in coords)
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        if state == self.initial_state:
+            return [
+                (x, y)
+                for x in range(self.size)
+                for y in range(self.size)
+                if x * self.size + y not in self.changed
+            ]
+        return [
+            divmod(key, self.size) for key, cell in self.changed.items() if cell == state
+        ]
+
+    def to_list(self) -> list[list[int]]:
+        return [[self.get(x, y) for y in range(self.size)] for x in range(self.size)]
+
+    def dump(self, buffer, offset: int, codes: dict[int, int]):
+        """
+        Only writes the changed cells, the initial state having to be code 0:
+        the planes of huge boards stay mostly zeroes (holes, in sparse files)
+        """
+        if codes[self.initial_state] != 0:
+            raise ValueError("The initial state has to be code 0")
+        plane = plane_bytes(self.size)
+        for key, state in self.changed.items():
+            code = codes[state]
+            byte = offset + (key >> 3)
+            if code & 1:
+                buffer[byte] |= 1 << (key & 7)
+            if code & 2:
+                buffer[byte + plane] |= 1 << (key & 7)
+
+    def load(self, buffer, offset: int, states: Sequence[int]):
+        changed = {}
+        for code, state in enumerate(states):
+            if state == self.initial_state:
+                continue
+            for first, bits in code_chunks(buffer, offset, self.size, code):
+                changed.update(
+                    dict.fromkeys((numpy.flatnonzero(bits) + first).tolist(), state)
+                )
+        self.changed = changed
+
+
+class MappedBackend:
+    """
+    Reads a board's cells from bit planes (see MAX_CODES) in a buffer, without
+    loading them: typically a read-only memory map of a snapshot file
+    (see snapshot.load), so that huge boards open in no time.
+    Cells changed since are stored in a dict keyed by cell number, like
+    SparseBackend's, and the buffer is never written to.
+    Without a buffer, e.g. for fresh boards, every cell starts in the initial state.
+    """
+
+    size: int
+    buffer: Optional[Union[mmap.mmap, bytes]]
+    offset: int
+    plane: int
+    # State of each code, and code of each state
+    states: list[int]
+    codes: dict[int, int]
+    changed: dict[int, int]
+
+    def __init__(
+        self,
+        size: int,
+        initial_state: int,
+        buffer: Optional[Union[mmap.mmap, bytes]] = None,
+        offset: int = 0,
+        states: Optional[Sequence[int]] = None,
+    ):
+        self.size = size
+        self.plane = plane_bytes(size)
+        self.buffer = buffer
+        self.offset = offset
+        self.states = list(states or [initial_state])
+        self.codes = {state: code for code, state in enumerate(self.states)}
+        self.changed = {}
+
+    def key(self, x: int, y: int) -> int:
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError(f"({x}, {y}) is out of the board")
+        return x * self.size + y
+
+    def stored(self, key: int) -> int:
+        """
+        State of the cell in the buffer, ignoring changes
+        """
+        if self.buffer is None:
+            return self.states[0]
+        byte, shift = self.offset + (key >> 3), key & 7
+        low = self.buffer[byte] >> shift & 1
+        high = self.buffer[byte + self.plane] >> shift & 1
+        return self.states[low | high << 1]
+
+    def get(self, x: int, y: int) -> int:
+        key = self.key(x, y)
+        state = self.changed.get(key)
+        return self.stored(key) if state is None else state
+
+    def set(self, x: int, y: int, state: int) -> int:
+        key = self.key(x, y)
+        stored = self.stored(key)
+        previous = self.changed.get(key, stored)
+        if state == stored:
+            self.changed.pop(key, None)
+        else:
+            self.changed[key] = state
+        return previous
+
+    def stored_keys(self, state: int) -> Iterator[numpy.ndarray]:
+        """
+        Numbers of the cells in the given state in the buffer, chunk by chunk
+        """
+        if state not in self.codes:
+            return
+        if self.buffer is None:
+            cells = self.size * self.size
+            for first in range(0, cells if self.codes[state] == 0 else 0, CHUNK_BYTES):
+                yield numpy.arange(first, min(first + CHUNK_BYTES, cells))
+            return
+        for first, bits in code_chunks(
+            self.buffer, self.offset, self.size, self.codes[state]
+        ):
+            yield numpy.flatnonzero(bits) + first
+
+    def count(self, state: int) -> int:
+        count = sum(len(keys) for keys in self.stored_keys(state))
+        for key, changed in self.changed.items():
+            count += (changed == state) - (self.stored(key) == state)
+        return count
+
+    def mask(self, state: int) -> int:
+        mask = 0
+        for keys in self.stored_keys(state):
+            cells = numpy.zeros(self.size * self.size, dtype=bool)
+            cells[keys] = True
+            mask |= int.from_bytes(
+                numpy.packbits(cells, bitorder="little").tobytes(), "little"
+            )
+        for key, changed in self.changed.items():
+            if changed == state:
+                mask |= 1 << key
+            else:
+                mask &= ~(1 << key)
+        return mask
+
+    def all_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        return all(self.get(x, y) == state for x, y in coords)
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        keys = [
+            key
+            for chunk in self.stored_keys(state)
+            for key in chunk.tolist()
+            if key not in self.changed
+        ]
+        keys += [key for key, changed in self.changed.items() if changed == state]
+        return [divmod(key, self.size) for key in keys]
+
+    def to_list(self) -> list[list[int]]:
+        return [[self.get(x, y) for y in range(self.size)] for x in range(self.size)]
+
+    def dump(self, buffer, offset: int, codes: dict[int, int]):
+        """
+        Copies the buffer's planes chunk by chunk (as they are if the codes match),
+        then writes the changed cells
+        """
+        if self.buffer is None:
+            if codes[self.states[0]] != 0:
+                raise ValueError("The initial state has to be code 0")
+        elif all(codes.get(state) == code for code, state in enumerate(self.states)):
+            for start in range(0, 2 * self.plane, CHUNK_BYTES):
+                count = min(CHUNK_BYTES, 2 * self.plane - start)
+                chunk = numpy.frombuffer(
+                    self.buffer, numpy.uint8, count, self.offset + start
+                )
+                # Zeroes are already there: don't touch those pages
+                if chunk.any():
+                    buffer[offset + start : offset + start + count] = chunk.tobytes()
+        else:
+            for code, state in enumerate(self.states):
+                if not codes.get(state):
+                    continue
+                for first, bits in code_chunks(
+                    self.buffer, self.offset, self.size, code
+                ):
+                    packed = numpy.packbits(bits, bitorder="little")
+                    for shift in (0, 1):
+                        if not codes[state] >> shift & 1:
+                            continue
+                        start = offset + shift * self.plane + first // 8
+                        chunk = numpy.frombuffer(
+                            buffer, numpy.uint8, len(packed), start
+                        )
+                        buffer[start : start + len(packed)] = (chunk | packed).tobytes()
+        for key, state in self.changed.items():
+            byte, bit = offset + (key >> 3), 1 << (key & 7)
+            code = codes[state]
+            for at, set_bit in ((byte, code & 1), (byte + self.plane, code & 2)):
+                buffer[at] = buffer[at] | bit if set_bit else buffer[at] & ~bit
+
+    def load(self, buffer, offset: int, states: Sequence[int]):
+        """
+        Copies the planes into an anonymous memory map
+        """
+        self.buffer = mmap.mmap(-1, max(2 * self.plane, 1))
+        for start in range(0, 2 * self.plane, CHUNK_BYTES):
+            count = min(CHUNK_BYTES, 2 * self.plane - start)
+            chunk = numpy.frombuffer(buffer, numpy.uint8, count, offset + start)
+            # The map is zeroed: only allocate pages for something else
+            if chunk.any():
+                self.buffer[start : start + count] = chunk.tobytes()
+        self.offset = 0
+        self.states = list(states)
+        self.codes = {state: code for code, state in enumerate(self.states)}
+        self.changed = {}
+
+
+Backend = Union[GridBackend, BitboardBackend, SparseBackend, MappedBackend]
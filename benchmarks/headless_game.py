@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Time a whole headless game takes on each backend, for each strategy.
+
+Run from the repository's root:
+
+    python -m benchmarks.headless_game [--games N] [--strategies NAME ...]
+
+Both backends play the same seeded games. Each game is set up --repeat times
+and played, the fastest play counting: setting it up (placing the ships) is not
+timed. Times are averaged over the games.
+"""
+import random
+from argparse import ArgumentParser
+from time import perf_counter
+from ai import strategies
+from backends import BitboardBackend, GridBackend
+from game import ai_game, GRID_SIZE
+
+BACKENDS = GridBackend, BitboardBackend
+DEFAULT_STRATEGIES = "HuntTarget", "ParityHuntTarget"
+
+
+def game_time(strategy, backend, seed: int, grid_size: int, repeat: int) -> float:
+    """
+    Seconds the fastest of `repeat` plays of the game seeded with `seed` took
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        random.seed(seed)
+        game = ai_game(strategy, strategy, grid_size=grid_size, backend=backend)
+        start = perf_counter()
+        game.play()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    available = strategies()
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--strategies", nargs="+", choices=available.keys(), default=DEFAULT_STRATEGIES
+    )
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--grid-size", type=int, default=GRID_SIZE)
+    args = parser.parse_args()
+
+    print(f"{'strategy':>20}" + "".join(f" {b.__name__:>15} (ms)" for b in BACKENDS))
+    for name in args.strategies:
+        times = {backend: 0.0 for backend in BACKENDS}
+        # Interleaved, so that both backends suffer the same machine load
+        for seed in range(args.games):
+            for backend in BACKENDS:
+                times[backend] += game_time(
+                    available[name], backend, seed, args.grid_size, args.repeat
+                )
+        print(
+            f"{name:>20}"
+            + "".join(f" {times[b] / args.games * 1e3:>20.3f}" for b in BACKENDS)
+        )
+
+
+if __name__ == "__main__":
+    main()
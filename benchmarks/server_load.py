@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Load-tests the game server with many concurrent games on localhost.
+
+Run from the repository's root:
+
+    python -m benchmarks.server_load --games 10000 --opponent HuntTarget
+    python -m benchmarks.server_load --games 5000 --opponent ""   # clients play each other
+    python -m benchmarks.server_load --port 9000                  # an already running server
+
+Unless --port is given, a server is started in a separate process, so that
+its memory and file descriptors are its own.
+Every client joins, and the game only starts once all of them are playing,
+so that all games are hosted at the same time. Clients fire at random cells,
+as fast as they can or after a random --think time, closer to real players:
+shooting as fast as possible measures throughput, latencies being mostly queueing.
+Reports the server's memory per game, and the percentiles of the time between
+sending a shot and receiving its result.
+"""
+import asyncio
+import random
+import subprocess
+import sys
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Optional
+import numpy
+from network import ProtocolError, frame, read_message
+from server import (
+    JOIN,
+    OVER,
+    PAYLOADS,
+    RESULT,
+    SHOOT,
+    SHOT,
+    STARTED,
+    STATISTICS,
+    STATS,
+    raise_open_files_limit,
+)
+
+
+class LoadClient:
+    """
+    A client playing one game, firing at random cells it did not fire at yet
+    """
+
+    def __init__(self, grid_size: int, think: float):
+        self.think = think
+        self.targets = random.sample(range(grid_size * grid_size), grid_size * grid_size)
+        self.grid_size = grid_size
+        self.latencies = []
+
+    async def connect(self, port: int, opponent: str, grid_size: int):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.writer.write(
+            frame(JOIN, grid_size, extra=opponent.encode(), payloads=PAYLOADS)
+        )
+
+    async def started(self) -> int:
+        kind, (index,), _ = await read_message(self.reader, PAYLOADS)
+        if kind != STARTED:
+            raise ProtocolError(f"Expected STARTED, got {kind}")
+        return index
+
+    async def play(self, index: int):
+        my_turn = index == 0
+        while True:
+            if my_turn:
+                if self.think:
+                    await asyncio.sleep(random.uniform(0, 2 * self.think))
+                x, y = divmod(self.targets.pop(), self.grid_size)
+                sent = perf_counter()
+                self.writer.write(frame(SHOOT, x, y, payloads=PAYLOADS))
+            kind, _, _ = await read_message(self.reader, PAYLOADS)
+            if kind == RESULT:
+                self.latencies.append(perf_counter() - sent)
+                my_turn = False
+            elif kind == SHOT:
+                my_turn = True
+            elif kind == OVER:
+                self.writer.close()
+                return
+            else:
+                raise ProtocolError(f"Unexpected message {kind}")
+
+
+async def statistics(port: int) -> tuple[int, ...]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(frame(STATS, payloads=PAYLOADS))
+    kind, values, _ = await read_message(reader, PAYLOADS)
+    writer.close()
+    assert kind == STATISTICS
+    return values
+
+
+async def load_test(
+    port: int,
+    games: int,
+    opponent: str,
+    grid_size: int,
+    connections_at_once: int,
+    think: float,
+):
+    clients_count = games if opponent else 2 * games
+    clients = [LoadClient(grid_size, think) for _ in range(clients_count)]
+    *_, memory_before = await statistics(port)
+
+    start = perf_counter()
+    limit = asyncio.Semaphore(connections_at_once)
+
+    async def connect(client: LoadClient):
+        async with limit:
+            await client.connect(port, opponent, grid_size)
+
+    await asyncio.gather(*(connect(client) for client in clients))
+    indexes = await asyncio.gather(*(client.started() for client in clients))
+    hosted, _, _, _, memory_during = await statistics(port)
+    print(
+        f"{hosted} games hosted at once, set up in {perf_counter() - start:.1f}s,"
+        f" {(memory_during - memory_before) / max(hosted, 1) / 1024:.1f} KiB per game",
+        file=sys.stderr,
+    )
+
+    start = perf_counter()
+    await asyncio.gather(
+        *(client.play(index) for client, index in zip(clients, indexes))
+    )
+    elapsed = perf_counter() - start
+    latencies = numpy.array([l for client in clients for l in client.latencies])
+    p50, p99, p999 = numpy.percentile(latencies, [50, 99, 99.9]) * 1e3
+    print(
+        f"{len(latencies)} shots in {elapsed:.1f}s ({len(latencies) / elapsed:.0f}/s),"
+        f" latency p50 {p50:.2f} ms, p99 {p99:.2f} ms, p99.9 {p999:.2f} ms",
+        file=sys.stderr,
+    )
+
+
+def start_server() -> tuple[subprocess.Popen, int]:
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--port", "0"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = server.stdout.readline()
+    return server, int(line.rsplit(" ", 1)[1])
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument(
+        "--opponent",
+        default="HuntTarget",
+        help="strategy of the server's AI, empty to pair clients together",
+    )
+    parser.add_argument("--grid-size", type=int, default=10)
+    parser.add_argument("--port", type=int, help="port of a running server")
+    parser.add_argument(
+        "--connections-at-once",
+        type=int,
+        default=500,
+        help="most connections being opened at the same time",
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=0,
+        help="mean seconds clients wait before each shot, 0 to not wait",
+    )
+    args = parser.parse_args()
+    raise_open_files_limit()
+
+    server: Optional[subprocess.Popen] = None
+    port = args.port
+    if port is None:
+        server, port = start_server()
+    try:
+        asyncio.run(
+            load_test(
+                port,
+                args.games,
+                args.opponent,
+                args.grid_size,
+                args.connections_at_once,
+                args.think,
+            )
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Mean number of shots each strategy needs to sink a whole fleet, over the same seeded layouts.
+
+    python -m benchmarks.shots_to_win ParityHuntTarget HuntTarget --games 100000
+"""
+import random
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from os import cpu_count
+from statistics import mean, stdev
+from time import perf_counter
+from ai import strategies
+from game import ai_game, GRID_SIZE
+
+
+def shots_to_win(task: tuple[str, int, int]) -> int:
+    """
+    Number of shots the strategy fires to sink a fleet laid out from `seed`
+    """
+    name, seed, grid_size = task
+    random.seed(seed)
+    strategy = strategies()[name]
+    game = ai_game(strategy, strategy, grid_size=grid_size)
+    shooter = game.players[0]
+    random.seed(seed + 1)
+    while not shooter.won:
+        shooter.ennemy_board.fire(*shooter.decide_coordinates())
+        game.current_player_index = 0
+    return shooter.ennemy_board.shots_fired
+
+
+def main():
+    available = strategies()
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("strategies", nargs="+", choices=available.keys())
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    parser.add_argument("--grid-size", type=int, default=GRID_SIZE)
+    args = parser.parse_args()
+
+    print(f"{'strategy':>20} {'mean shots':>11} {'stdev':>7} {'time (s)':>9}")
+    with Pool(args.workers) as pool:
+        for name in args.strategies:
+            start = perf_counter()
+            shots = pool.map(
+                shots_to_win,
+                (
+                    (name, args.seed + 2 * i, args.grid_size)
+                    for i in range(args.games)
+                ),
+                chunksize=max(1, args.games // (args.workers * 8)),
+            )
+            print(
+                f"{name:>20} {mean(shots):>11.2f} {stdev(shots) if len(shots) > 1 else 0:>7.2f}"
+                f" {perf_counter() - start:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Per-shot cost of ControlledBoard.fire, before and after reading cell states
+from the board's backend instead of decoding the widgets' text.
+
+Run from the repository's root:
+
+    python -m benchmarks.state_lookup [--shots N]
+
+The "before" column reproduces the old Board.state_of: it rebuilds the
+text -> state table on every call and reads the cell's text option. Without a
+display (or for boards too big to hold one Button per cell), the text is read
+from a dict instead of a Button, which leaves out the Tcl round-trip and thus
+underestimates the old cost.
+"""
+import random
+from argparse import ArgumentParser
+from timeit import timeit
+from backends import BitboardBackend, GridBackend
+from board import (
+    CELL_DISPLAY_STATES,
+    ControlledBoard,
+    MISSED,
+    SUNKEN,
+    WATER,
+    SHIP,
+)
+from utils import dict_reciprocal
+
+SIZES = 10, 1000
+MAX_WIDGET_CELLS = 10_000
+
+
+class LegacyBoard:
+    """
+    Fires the way ControlledBoard did when states were stored in the widgets
+    """
+
+    def __init__(self, board: ControlledBoard, root=None):
+        self.board = board
+        if root is not None and board.size ** 2 <= MAX_WIDGET_CELLS:
+            from tkinter import Button
+
+            self.cells = [
+                [
+                    Button(root, **CELL_DISPLAY_STATES[board @ (x, y)])
+                    for y in range(board.size)
+                ]
+                for x in range(board.size)
+            ]
+        else:
+            self.cells = [
+                [dict(CELL_DISPLAY_STATES[board @ (x, y)]) for y in range(board.size)]
+                for x in range(board.size)
+            ]
+
+    def state_of(self, x: int, y: int) -> int:
+        return dict_reciprocal(CELL_DISPLAY_STATES, key=lambda s: s["text"])[
+            self.cells[x][y]["text"]
+        ]
+
+    def change_cell(self, x: int, y: int, state: int):
+        cell = self.cells[x][y]
+        if isinstance(cell, dict):
+            cell.update(CELL_DISPLAY_STATES[state])
+        else:
+            cell.configure(**CELL_DISPLAY_STATES[state])
+
+    def fire(self, x: int, y: int) -> bool:
+        if self.state_of(x, y) in (WATER, MISSED):
+            self.change_cell(x, y, MISSED)
+            return False
+        self.change_cell(x, y, SUNKEN)
+        return True
+
+
+def make_board(size: int, backend) -> ControlledBoard:
+    board = ControlledBoard(None, size, fleet=[], backend=backend)
+    random.seed(size)
+    for _ in range(size):
+        board.change_cell(random.randrange(size), random.randrange(size), SHIP)
+    return board
+
+
+def tk_root():
+    try:
+        from tkinter import Tk
+
+        return Tk()
+    except Exception:
+        return None
+
+
+def per_shot(fire, size: int, shots: int) -> float:
+    targets = [(random.randrange(size), random.randrange(size)) for _ in range(shots)]
+    return (
+        timeit(lambda: [fire(x, y) for x, y in targets], number=1) / shots * 1e9
+    )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shots", type=int, default=100_000)
+    args = parser.parse_args()
+    root = tk_root()
+
+    print(f"{'size':>6} {'before (ns)':>12} {'grid (ns)':>10} {'bitboard (ns)':>14}")
+    for size in SIZES:
+        legacy = LegacyBoard(make_board(size, GridBackend), root)
+        grid = make_board(size, GridBackend)
+        bitboard = make_board(size, BitboardBackend)
+        print(
+            f"{size:>6} {per_shot(legacy.fire, size, args.shots):>12.0f}"
+            f" {per_shot(grid.fire, size, args.shots):>10.0f}"
+            f" {per_shot(bitboard.fire, size, args.shots):>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
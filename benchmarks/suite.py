@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""
+Times the engine, AI and GUI hot paths over several grid sizes.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --output new.json --compare results.json
+
+Results are saved as JSON, keyed by benchmark then grid size, so that two runs
+(e.g. on two commits) can be compared with --compare, which exits with status 1
+when a benchmark got slower than the threshold.
+"""
+import json
+import platform
+import random
+import subprocess
+import sys
+from argparse import ArgumentParser
+from functools import lru_cache
+from statistics import median
+from time import perf_counter
+from typing import Any, Callable, Optional
+from ai import MonteCarlo, strategies
+from backends import BitboardBackend, GridBackend, SparseBackend
+from board import ControlledBoard, SHIP
+from game import TurnScheduler, ai_game
+from player import FLEET
+import snapshot
+
+SIZES = 10, 100, 1000
+# Biggest boards to display with each view: BoardView holds one widget per cell,
+# CanvasBoardView two canvas items, ViewportBoardView only draws what fits on screen
+MAX_VIEW_CELLS = {
+    "BoardView": 100 * 100,
+    "CanvasBoardView": 1000 * 1000,
+    "ViewportBoardView": 10_000 * 10_000,
+}
+# Strategy whose full games stay tractable on the biggest boards
+GAME_STRATEGY = "ParityHuntTarget"
+# Layouts MonteCarlo samples per timed decision, which is reported per layout
+MONTE_CARLO_SAMPLES = 200
+
+Setup = Callable[[], Callable[[], Any]]
+# A benchmark's setup, and the number of operations each run does
+Prepared = tuple[Setup, int]
+
+
+def measure(setup: Setup, budget: float, operations: int = 1) -> dict[str, Any]:
+    """
+    Times run() as returned by setup(), as many times as the budget (in seconds)
+    allows, at least once. setup() itself is not timed.
+    Times are divided by `operations`, the number of operations one run does.
+    """
+    times = []
+    started = perf_counter()
+    while not times or (perf_counter() - started < budget and len(times) < 1000):
+        run = setup()
+        start = perf_counter()
+        run()
+        times.append((perf_counter() - start) / operations)
+    return {
+        "runs": len(times),
+        "min": min(times),
+        "median": median(times),
+        "mean": sum(times) / len(times),
+    }
+
+
+def game_setup(size: int, strategy: str = GAME_STRATEGY, seed: int = 0):
+    random.seed(seed)
+    available = strategies()
+    return ai_game(available[strategy], available[strategy], grid_size=size)
+
+
+def bench_fire(size: int) -> Prepared:
+    game = game_setup(size)
+    board = game.players[0].own_board
+    shots = 1000
+
+    def setup():
+        targets = [
+            (random.randrange(size), random.randrange(size)) for _ in range(shots)
+        ]
+        return lambda: [board.fire(x, y) for x, y in targets]
+
+    return setup, shots
+
+
+def bench_legal(size: int) -> Prepared:
+    board = game_setup(size).players[0].own_board
+    return (lambda: lambda: board.legal), 1
+
+
+def bench_place_ships(size: int) -> Prepared:
+    def setup():
+        game = game_setup(size)
+        player = game.players[0]
+        for x, y in player.own_board.cells(SHIP):
+            player.own_board.change_cell(x, y, 0)
+        player.own_board.locked = False
+        return player.place_ships
+
+    return setup, 1
+
+
+def bench_choose_shot_location(strategy: str) -> Callable[[int], Prepared]:
+    """
+    Times choosing a shot from the same position every time: strategies change
+    their state when choosing (e.g. popping targets), so it is restored before
+    each run. MonteCarlo is timed per layout sampled, without its time budget,
+    which would otherwise be all that gets measured.
+    """
+
+    def bench(size: int) -> Prepared:
+        game = game_setup(size, strategy)
+        shooter = game.players[0]
+        # Get into the middle of a game: a few misses and hits to reason about
+        for _ in range(min(size * 2, 60)):
+            shooter.ennemy_board.fire(*shooter.decide_coordinates())
+            game.current_player_index = 0
+        operations = 1
+        if isinstance(shooter.strategy, MonteCarlo):
+            shooter.strategy.time_budget = float("inf")
+            shooter.strategy.samples = operations = MONTE_CARLO_SAMPLES
+        position = snapshot.snapshot(game)
+
+        def setup():
+            snapshot.restore(game, position)
+            random.seed(0)
+            return shooter.decide_coordinates
+
+        return setup, operations
+
+    return bench
+
+
+def bench_headless_game(size: int) -> Prepared:
+    return (lambda: game_setup(size).play), 1
+
+
+def mid_game(size: int):
+    """
+    A game between bitboards, a few moves in
+    """
+    random.seed(0)
+    available = strategies()
+    game = ai_game(
+        available[GAME_STRATEGY],
+        available[GAME_STRATEGY],
+        grid_size=size,
+        backend=BitboardBackend,
+    )
+    scheduler = TurnScheduler(game)
+    for _ in range(min(size * 2, 60)):
+        scheduler.step()
+    return game
+
+
+def bench_snapshot(size: int) -> Prepared:
+    game = mid_game(size)
+    return (lambda: lambda: snapshot.snapshot(game)), 1
+
+
+def bench_restore(size: int) -> Prepared:
+    game = mid_game(size)
+    data = snapshot.snapshot(game)
+    return (lambda: lambda: snapshot.restore(game, data)), 1
+
+
+@lru_cache(maxsize=None)
+def tk_root():
+    """
+    The Tk root window, None if there is no display to open one on
+    """
+    try:
+        from tkinter import Tk
+
+        return Tk()
+    except Exception:
+        return None
+
+
+def view_backend(size: int) -> type:
+    """
+    Backend of the boards displayed by the view benchmarks, sparse for huge ones
+    """
+    return SparseBackend if size * size > 1000 * 1000 else GridBackend
+
+
+def bench_view_init(view_class: str) -> Callable[[int], Optional[Prepared]]:
+    def bench(size: int) -> Optional[Prepared]:
+        if size * size > MAX_VIEW_CELLS[view_class] or (root := tk_root()) is None:
+            return None
+        import view
+
+        board = ControlledBoard(None, size, FLEET, backend=view_backend(size))
+        views = []
+
+        def setup():
+            for old in views:
+                old.destroy()
+            views.clear()
+
+            def run():
+                views.append(getattr(view, view_class)(root, board))
+                root.update_idletasks()
+
+            return run
+
+        return setup, 1
+
+    return bench
+
+
+def bench_view_update(view_class: str) -> Callable[[int], Optional[Prepared]]:
+    def bench(size: int) -> Optional[Prepared]:
+        if size * size > MAX_VIEW_CELLS[view_class] or (root := tk_root()) is None:
+            return None
+        import view
+
+        board = ControlledBoard(None, size, FLEET, backend=view_backend(size))
+        # No refresh rate limit, so that all updates are repainted once Tk is idle
+        getattr(view, view_class)(root, board, max_fps=0).render(0, 0)
+        root.update()
+        updates = 1000
+
+        def setup():
+            targets = [
+                (random.randrange(size), random.randrange(size), random.randrange(5))
+                for _ in range(updates)
+            ]
+
+            def run():
+                for x, y, state in targets:
+                    board.change_cell(x, y, state)
+                root.update_idletasks()
+
+            return run
+
+        return setup, updates
+
+    return bench
+
+
+def benchmarks() -> dict[str, Callable[[int], Optional[Prepared]]]:
+    found = {
+        "ControlledBoard.fire": bench_fire,
+        "ControlledBoard.legal": bench_legal,
+        "AIPlayer.place_ships": bench_place_ships,
+    }
+    for name in sorted(strategies()):
+        found[f"{name}.choose_shot_location"] = bench_choose_shot_location(name)
+    found["headless game"] = bench_headless_game
+    found["snapshot"] = bench_snapshot
+    found["snapshot restore"] = bench_restore
+    for view_class in MAX_VIEW_CELLS:
+        found[f"{view_class}.__init__"] = bench_view_init(view_class)
+        found[f"{view_class} cell update"] = bench_view_update(view_class)
+    return found
+
+
+def run(
+    sizes: tuple[int, ...], budget: float, only: Optional[str] = None
+) -> dict[str, Any]:
+    results = {}
+    for name, bench in benchmarks().items():
+        if only and only not in name:
+            continue
+        results[name] = {}
+        for size in sizes:
+            prepared = bench(size)
+            if prepared is None:
+                print(f"{name:>45} {size:>5}  skipped", file=sys.stderr)
+                continue
+            setup, operations = prepared
+            result = measure(setup, budget, operations)
+            results[name][str(size)] = result
+            print(
+                f"{name:>45} {size:>5} {result['median'] * 1e6:>14.1f} µs"
+                f" ({result['runs']} runs)",
+                file=sys.stderr,
+            )
+    return results
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict[str, Any], new: dict[str, Any], threshold: float) -> bool:
+    """
+    Prints how each benchmark's median time changed, returns whether any regressed
+    """
+    regressed = False
+    for name, by_size in new["results"].items():
+        for size, result in by_size.items():
+            before = old["results"].get(name, {}).get(size)
+            if before is None:
+                continue
+            ratio = result["median"] / before["median"]
+            slower = ratio > 1 + threshold
+            regressed |= slower
+            print(
+                f"{name:>45} {size:>5} {ratio:>7.2f}x"
+                + ("  REGRESSION" if slower else "")
+            )
+    return regressed
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=1.0,
+        help="seconds to spend per benchmark and size",
+    )
+    parser.add_argument("--only", help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON file of previous results to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown reported as a regression",
+    )
+    args = parser.parse_args()
+
+    report = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": run(tuple(args.sizes), args.budget, args.only),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            if compare(json.load(file), report, args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
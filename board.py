@@ -1,10 +1,17 @@
-from tkinter import Place, Tk, Button, Frame, Label
-from tkinter.constants import VERTICAL
-from typing import Optional
+from time import perf_counter
+from typing import Callable, Iterable, Type
 from utils import *
-from functools import partial
-from ai import Strategy, NoStrategy
+from backends import (
+    MAX_CODES,
+    Backend,
+    GridBackend,
+    BitboardBackend,
+    MappedBackend,
+    SparseBackend,
+)
+from legality import FleetDiagnosis, diagnose_fleet
 from random import randint
+import metrics
 
 # Constantes
 WATER = 0  # Eau (case vide)
@@ -21,6 +28,8 @@ CELL_DISPLAY_STATES = {
     MISSED: {"text": "🌀", "bg": "cyan"},
     UNKNOWN: {"text": "❔", "bg": "grey"},
 }
+# Decodes a cell's displayed text back to its state
+CELL_STATES_BY_TEXT = dict_reciprocal(CELL_DISPLAY_STATES, key=lambda s: s["text"])
 
 DESTROYER = 2
 CRUISER = 3
@@ -33,53 +42,144 @@ VERTICAL = 20
 
 
 class Board:
+    """
+    The game state of a board, without any widget attached.
+    Views (see view.BoardView) subscribe to it to get notified of cell changes.
+    Cells are stored by a backend (see backends.py), a 2D list by default.
+    """
+
     size: int
-    cells: list[list[Button]]
-    state: list[list[int]]
+    initial_state: int
+    backend: Backend
     game: "Game"
     owner: "Player"
     locked: bool
+    subscribers: list[Callable[[int, int, int], Any]]
+    counts: dict[int, int]
 
     def __init__(
-        self, game: "Game", grid_size: int, initial_state: int, owner: "Player"
+        self,
+        game: "Game",
+        grid_size: int,
+        initial_state: int,
+        owner: "Player",
+        backend: Type[Backend] = GridBackend,
     ):
         self.size = grid_size
-        self.cells = []
-        self.state = []
-        self.mainframe = Frame(game.root)
+        self.initial_state = initial_state
+        self.backend = backend(grid_size, initial_state)
         self.game = game
         self.owner = owner
         self.locked = False
-
-        for x in range(self.size):
-            self.cells.append([])
-            self.state.append([])
-            for y in range(self.size):
-                cell = Button(self.mainframe, text=f"{x}:{y}")
-                cell.bind("<Button-1>", partial(handle, self.handle_cell_Button1, x, y))
-                cell.bind("<Button-3>", partial(handle, self.handle_cell_Button3, x, y))
-                self.cells[x].append(cell)
-                self.state[x].append(initial_state)
-                self.change_cell(x, y, initial_state)
-                cell.grid(row=x, column=y)
+        self.subscribers = []
+        # Number of cells in each state, kept up to date by change_cell
+        self.counts = {initial_state: grid_size * grid_size}
 
     def __matmul__(self, coords):
         """aesthetics: @ (x, y) to get cell state at (x, y)"""
-        return self.state[coords[0]][coords[1]]
+        return self.backend.get(*coords)
+
+    @property
+    def state(self) -> list[list[int]]:
+        """
+        A copy of the board's state, as a 2D array of state integers
+        """
+        return self.backend.to_list()
+
+    @state.setter
+    def state(self, new_state: list[list[int]]):
+        self.set_state(new_state)
+
+    def count(self, state: int) -> int:
+        """
+        Number of cells in the given state
+        """
+        return self.counts.get(state, 0)
+
+    def mask(self, state: int) -> int:
+        """
+        Bitmask of the cells in the given state, cell (x, y) being bit x * size + y
+        """
+        return self.backend.mask(state)
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        """
+        Coordinates of the cells in the given state
+        """
+        return self.backend.cells(state)
+
+    def all_cells_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        return self.backend.all_are(coords, state)
+
+    def subscribe(self, callback: Callable[[int, int, int], Any]):
+        """
+        Registers callback(x, y, state), called every time a cell changes state.
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[int, int, int], Any]):
+        self.subscribers.remove(callback)
 
     def handle_cell_Button1(self, x: int, y: int):
-        self.d(f"handling <Button 1> {x=}, {y=}")
+        self.d(lambda: f"handling <Button 1> {x=}, {y=}", level=TRACE)
 
     def handle_cell_Button3(self, x: int, y: int):
-        self.d(f"handling <Button 3> {x=}, {y=}")
+        self.d(lambda: f"handling <Button 3> {x=}, {y=}", level=TRACE)
 
     def set_state(self, new_state):
         """
         Sets the entire board's state to the one given.
         A state is represented as a 2D array of state integers (see Démineur.change_cell)
+        Only the cells whose state differs are changed, and notified to subscribers.
+        """
+        for x, y in doublerange(self.size):
+            if self.backend.get(x, y) != new_state[x][y]:
+                self.change_cell(x, y, new_state[x][y])
+
+    def palette(self) -> list[int]:
+        """
+        The states the board's cells are in, initial state first,
+        to store each cell as an index in this list (see backends.MAX_CODES)
+        """
+        states = [self.initial_state] + sorted(
+            state
+            for state, count in self.counts.items()
+            if count and state != self.initial_state
+        )
+        if len(states) > MAX_CODES:
+            raise ValueError(f"Cannot store cells in more than {MAX_CODES} states")
+        return states
+
+    def load_cells(
+        self,
+        buffer,
+        offset: int,
+        states: list[int],
+        counts: dict[int, int],
+        lazy: bool = False,
+    ):
+        """
+        Restores the cells' states from the bit planes at `offset` (see backends.py),
+        `states` giving the state of each code,
+        `counts` the number of cells in each state.
+        If `lazy`, cells are read from the buffer when needed, through a MappedBackend.
+        Subscribers are notified of the cells that changed, which needs reading all
+        of them: restore boards that no views display to keep it fast.
         """
+        previous = self.backend.to_list() if self.subscribers else None
+        if lazy:
+            self.backend = MappedBackend(
+                self.size, self.initial_state, buffer, offset, states
+            )
+        else:
+            self.backend.load(buffer, offset, states)
+        self.counts = dict(counts)
+        if previous is None:
+            return
         for x, y in doublerange(self.size):
-            self.change_cell(x, y, new_state[x][y])
+            if (state := self.backend.get(x, y)) != previous[x][y]:
+                for callback in self.subscribers:
+                    callback(x, y, state)
 
     def change_cell(self, x: int, y: int, state: int):
         """
@@ -90,25 +190,24 @@ class Board:
         - 0 (or WATER) represents a water (empty) spot
         - 3 (or UNKNOWN) represents a unknown spot (for ProjectiveBoards)
         """
-        self.cells[x][y].configure(**CELL_DISPLAY_STATES[state])
-        self.state[x][y] = state
+        previous = self.backend.set(x, y, state)
+        self.counts[previous] -= 1
+        self.counts[state] = self.counts.get(state, 0) + 1
+        for callback in self.subscribers:
+            callback(x, y, state)
 
     def state_of(self, x: int, y: int) -> int:
         """
-        Get state of cell at row x column y
+        Get state of cell at row x column y.
+        Reads the board's backend, never the widgets displaying it.
         """
-        return dict_reciprocal(CELL_DISPLAY_STATES, key=lambda s: s["text"])[
-            self.cells[x][y]["text"]
-        ]
+        return self.backend.get(x, y)
     
     def within_bounds(self, x: int, y: int) -> bool:
         """
         Check if the cell's coordinates are within bounds of the board
         """
-        return 0 <= x <= self.size and 0 <= y <= self.size
-
-    def render(self, column: int, row: int, span: int = 1):
-        self.mainframe.grid(column=column, row=row, columnspan=span, rowspan=span)
+        return 0 <= x < self.size and 0 <= y < self.size
 
     def random_coordinates(self) -> tuple[int, int]:
         return randint(0, self.size - 1), randint(0, self.size - 1)
@@ -150,14 +249,17 @@ class Board:
             *self.vertical_coordinates(y, x - 1, x + 1, 2),
         )
 
-    def d(self, t: str, *args, **kwargs):
+    def d(self, t: Message, *args, level: int = DEBUG, **kwargs):
+        if not logging_at(level):
+            return
         if self.owner is None:
-            return d(t, *args, **kwargs)
-        return d(
-            ("[green]" if self.owner.human else "[cyan]")
+            return log(level, t, *args, **kwargs)
+        return log(
+            level,
+            lambda: ("[green]" if self.owner.human else "[cyan]")
             + self.owner.name
             + "[/] "
-            + t,
+            + (t() if callable(t) else t),
             *args,
             **kwargs,
         )
@@ -165,6 +267,15 @@ class Board:
     def lock(self):
         self.locked = True
 
+    @property
+    def metric_labels(self) -> tuple[str, int]:
+        """
+        Labels of the metrics recorded about this board and its owner's moves
+        (see metrics.py): the owner's strategy and the board's size
+        """
+        strategy = "none" if self.owner is None else type(self.owner.strategy).__name__
+        return strategy, self.size
+
 
 class ControlledBoard(Board):
     """
@@ -183,8 +294,11 @@ class ControlledBoard(Board):
         grid_size: int,
         fleet: list[int],
         owner: "Player" = None,
+        backend: Type[Backend] = GridBackend,
     ):
-        super().__init__(game, grid_size, initial_state=WATER, owner=owner)
+        super().__init__(
+            game, grid_size, initial_state=WATER, owner=owner, backend=backend
+        )
         self.fleet = fleet
         self.total_ships = sum(fleet)
 
@@ -194,7 +308,29 @@ class ControlledBoard(Board):
 
     @property
     def placed_ships(self) -> int:
-        return sum(self @ (x, y) == SHIP for x, y in doublerange(self.size))
+        return self.count(SHIP)
+
+    @property
+    def remaining_ship_cells(self) -> int:
+        """
+        Number of ship cells that have not been hit yet
+        """
+        # Read for every turn played (see Player.won): spare a call to count()
+        return self.counts.get(SHIP, 0)
+
+    @property
+    def hits(self) -> int:
+        """
+        Number of shots that hit a ship on this board
+        """
+        return self.count(SUNKEN)
+
+    @property
+    def misses(self) -> int:
+        """
+        Number of shots that landed in water on this board
+        """
+        return self.count(MISSED)
 
     def handle_cell_Button1(self, x, y):
         super().handle_cell_Button1(x, y)
@@ -209,16 +345,18 @@ class ControlledBoard(Board):
         Switches between placing and removing a ship at row x column y.
         """
         if self.locked:
-            self.d(f"board is locked, not switching state of ({x}, {y})")
+            self.d(lambda: f"board is locked, not switching state of ({x}, {y})")
             return
         if not self.ships_left and self @ (x, y) == WATER:
-            self.d(f"no ships left!")
+            self.d("no ships left!")
             return
         if self @ (x, y) == WATER:
-            self.d(f"{self.ships_left=}, changing state of ({x}, {y}) to SHIP")
+            self.d(lambda: f"{self.ships_left=}, changing state of ({x}, {y}) to SHIP")
             self.change_cell(x, y, SHIP)
         else:
-            self.d(f"{self.ships_left=}, changing state of ({x}, {y}) to WATER")
+            self.d(
+                lambda: f"{self.ships_left=}, changing state of ({x}, {y}) to WATER"
+            )
             self.change_cell(x, y, WATER)
 
     def fire(self, x: int, y: int) -> bool:
@@ -226,87 +364,32 @@ class ControlledBoard(Board):
         Fires a shot at row x column y.
         Returns whether the shot hit a non-sunken ship or not
         """
-        if self.state_of(x, y) in (WATER, MISSED):
+        if self.backend.get(x, y) in (WATER, MISSED):
             self.change_cell(x, y, MISSED)
             return False
 
         self.change_cell(x, y, SUNKEN)
         return True
 
+    def diagnose(self) -> FleetDiagnosis:
+        """
+        Checks the placed ships against the fleet, see legality.diagnose_fleet
+        """
+        started = metrics.enabled and perf_counter()
+        diagnosis = diagnose_fleet(self.cells(SHIP), self.fleet)
+        if started:
+            metrics.observe(
+                "legality", perf_counter() - started, *self.metric_labels
+            )
+        return diagnosis
+
     @property
     def legal(self) -> bool:
         """
         Whether the current board's state is legal:
-        The number of SHIP slots should exactly match the fleet
-        """
-        ships_found = 0
-        for i, ship in enumerate(self.fleet):
-            self.d(f"recherche du bateau #{i} (de taille {ship})")
-            ship_found = False
-            for (x, y) in doublerange(self.size):
-                self.d(f"\tanalyse de la cellule {(x, y)}")
-                if self @ (x, y) == WATER:
-                    self.d(f"\tc'est de l'eau. cellule suivante...")
-                    continue
-
-                current_ship = ((x, y),)
-                self.d(f"\tle bateau est maintenant {current_ship!r}")
-
-                vertical_search_x = x
-                self.d(f"\tVerticalement:")
-                while len(current_ship) != ship:
-                    vertical_search_x += 1
-                    self.d(f"\t\tcellule ({vertical_search_x, y})")
-                    if (
-                        0 <= vertical_search_x <= self.size - 1
-                        and self @ (vertical_search_x, y) == SHIP
-                    ):
-                        current_ship = (*current_ship, (vertical_search_x, y))
-                        self.d(
-                            f"\t\tajoutée au bateau, qui est maintenant {current_ship}"
-                        )
-                    else:
-                        self.d(f"\t\tc'est de l'eau. Fin de la recherche verticale.")
-                        break
-
-                horizontal_search_y = y
-                self.d(f"\tHorizontalement:")
-                while len(current_ship) != ship:
-                    horizontal_search_y += 1
-                    self.d(f"\t\tcellule ({x, horizontal_search_y})")
-                    if (
-                        0 <= horizontal_search_y <= self.size - 1
-                        and self @ (x, horizontal_search_y) == SHIP
-                    ):
-                        current_ship = (*current_ship, (x, horizontal_search_y))
-                        self.d(
-                            f"\t\t\tajoutée au bateau, qui est maintenant {current_ship}"
-                        )
-                    else:
-                        self.d(f"\t\t\tc'est de leau.")
-                        self.d(f"\t\tFin de la recherche horizontale.")
-                        break
-
-                if len(current_ship) == ship:
-                    self.d(f"\t>> Le bateau a été trouvé!")
-                    ship_found = True
-                else:
-                    self.d(f"\tLe bateau n'a pas été trouvé à partir de cette cellule.")
-                    current_ship = ()
-
-                if ship_found:
-                    ships_found += 1
-                    break
-            if not ship_found:
-                self.d(
-                    f">> bateau #{i} non trouvé. le plateau n'est donc pas dans un état légal."
-                )
-                return False
-
-        # check if there was as much ship slots as the total number of ships as dictated by the board's fleet
-        return len(
-            [(x, y) for (x, y) in doublerange(self.size) if self @ (x, y) == SHIP]
-        ) == sum(self.fleet)
+        The SHIP cells should form exactly the ships of the fleet
+        """
+        return self.diagnose().legal
 
 
 class ProjectiveBoard(Board):
@@ -324,7 +407,11 @@ class ProjectiveBoard(Board):
         owner: "Player" = None,
     ):
         super().__init__(
-            game, grid_size, initial_state=UNKNOWN, owner=owner or represents.owner
+            game,
+            grid_size,
+            initial_state=UNKNOWN,
+            owner=owner or represents.owner,
+            backend=type(represents.backend),
         )
         self.real_board = represents
         self.shots_missed = 0
@@ -334,28 +421,39 @@ class ProjectiveBoard(Board):
         if self.locked:
             self.d("board is locked! not firing.")
             return
+        if not self.owner.turn_is_mine():
+            self.d("not my turn! not firing.")
+            return
         super().handle_cell_Button1(x, y)
-        self.fire(x, y)
+        self.owner.choose_move(x, y)
 
     def __xor__(self, coords):
         """aesthetics: ^ (x, y) to fire at (x, y)"""
         return self.fire(*coords)
 
-    def fire(self, x: int, y: int) -> None:
-        self.d(f"fire at {x=}, {y=}.")
+    def fire(self, x: int, y: int) -> bool:
+        """
+        Fires at (x, y) on the real board and records the result, returns whether
+        a ship was hit. Does not end the turn: the game does (see Game.apply_move).
+        """
+        started = metrics.enabled and perf_counter()
         # # Don't fire if the cell is already known (i.e. has already been shot)
         # if (board @ (x, y)) != UNKNOWN:
         #     self.d(f"state={board @ (x, y)} is already known, not firing.")
         #     return
 
         hit_a_ship = self.real_board.fire(x, y)
-        self.d(f"strategy is {self.owner.strategy}")
+        # A single message per shot: each costs a call, even when not logged
+        self.d(lambda: f"fired at {x=}, {y=}, {hit_a_ship=}")
         self.owner.strategy.react_to_shot_result(x, y, hit_a_ship)
-        self.d(f"fired, {hit_a_ship=}, changing cell state")
-
         self.change_cell(x, y, SUNKEN if hit_a_ship else MISSED)
         self.shots_fired += 1
         if not hit_a_ship:
             self.shots_missed += 1
-
-        self.game.end_turn()
+        if started:
+            labels = self.metric_labels
+            metrics.observe("shot", perf_counter() - started, *labels)
+            metrics.count("shots", *labels)
+            if hit_a_ship:
+                metrics.count("hits", *labels)
+        return hit_a_ship
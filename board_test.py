@@ -1,10 +1,30 @@
-from board import AIRCRAFT_CARRIER, ControlledBoard, DESTROYER, SUBMARINE, BATTLESHIP
-from main import Game
+from backends import BitboardBackend, GridBackend, SparseBackend
+from board import (
+    AIRCRAFT_CARRIER,
+    ControlledBoard,
+    DESTROYER,
+    SUBMARINE,
+    BATTLESHIP,
+    SHIP,
+    SUNKEN,
+    MISSED,
+    WATER,
+)
+from game import Game
+from legality import diagnose_fleet
+from placements import HORIZONTAL, VERTICAL, placement_index, random_layouts
+from player import place_fleet
+import numpy
 
 
 def test_ControlledBoard_legal():
+    for backend in (GridBackend, BitboardBackend):
+        check_ControlledBoard_legal(backend)
+
+
+def check_ControlledBoard_legal(backend):
     board = ControlledBoard(
-        Game(), grid_size=6, fleet={BATTLESHIP, DESTROYER, SUBMARINE}
+        Game(), grid_size=6, fleet={BATTLESHIP, DESTROYER, SUBMARINE}, backend=backend
     )
     board.state = [
         [0, 0, 0, 0, 0, 0],
@@ -40,5 +60,119 @@ def test_ControlledBoard_legal():
     assert not board.legal
 
 
+def test_ControlledBoard_diagnose():
+    board = ControlledBoard(Game(), grid_size=5, fleet=[DESTROYER, SUBMARINE])
+    # Two touching ships, which can be split in two different ways
+    board.state = [
+        [0, 1, 0, 0, 0],
+        [0, 1, 0, 0, 0],
+        [0, 1, 1, 1, 0],
+        [0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0],
+    ]
+    diagnosis = board.diagnose()
+    assert diagnosis.legal
+    assert sorted(map(len, diagnosis.ships)) == [DESTROYER, SUBMARINE]
+
+    board.state = [
+        [1, 1, 0, 0, 0],
+        [1, 1, 0, 0, 0],
+        [0, 0, 0, 0, 0],
+        [0, 0, 1, 1, 1],
+        [0, 0, 0, 0, 0],
+    ]
+    diagnosis = board.diagnose()
+    assert not diagnosis.legal
+    assert diagnosis.ships == [[(3, 2), (3, 3), (3, 4)]]
+    assert diagnosis.missing == [DESTROYER]
+    assert diagnosis.malformed == [[(0, 0), (0, 1), (1, 0), (1, 1)]]
+
+
+def test_backends_agree():
+    grid = ControlledBoard(Game(), grid_size=11, fleet=[DESTROYER])
+    bitboard = ControlledBoard(
+        Game(), grid_size=11, fleet=[DESTROYER], backend=BitboardBackend
+    )
+    sparse = ControlledBoard(
+        Game(), grid_size=11, fleet=[DESTROYER], backend=SparseBackend
+    )
+    for board in (grid, bitboard, sparse):
+        board.place_or_remove(3, 4)
+        board.place_or_remove(3, 5)
+        assert board ^ (3, 4)
+        assert not board ^ (10, 10)
+
+    assert grid.state == bitboard.state == sparse.state
+    for state in (WATER, SHIP, SUNKEN, MISSED):
+        for board in (grid, bitboard, sparse):
+            assert grid.count(state) == board.count(state)
+            assert board.count(state) == board.backend.count(state)
+            assert grid.mask(state) == board.mask(state)
+            assert sorted(grid.cells(state)) == sorted(board.cells(state))
+    assert bitboard.mask(SHIP) == 1 << (3 * 11 + 5)
+    assert (bitboard.remaining_ship_cells, bitboard.hits, bitboard.misses) == (1, 1, 1)
+    assert bitboard.all_cells_are([(3, 4)], SUNKEN)
+    assert not bitboard.all_cells_are([(3, 4), (3, 5)], SUNKEN)
+
+    for backend in (GridBackend, BitboardBackend, SparseBackend):
+        for x, y in ((0, 11), (11, 0)):
+            try:
+                backend(11, WATER).set(x, y, SHIP)
+            except IndexError:
+                pass
+            else:
+                raise AssertionError(f"{backend.__name__} set ({x}, {y})")
+
+
+def test_BitboardBackend_masks_follow_changes():
+    board = ControlledBoard(
+        Game(), grid_size=9, fleet=[DESTROYER], backend=BitboardBackend
+    )
+    assert board.mask(WATER) == (1 << 81) - 1
+    place_fleet(board, [4 * 9 + 7, 4 * 9 + 8])
+    assert board.mask(SHIP) == 0b11 << (4 * 9 + 7)
+    board.fire(4, 8)
+    assert board.mask(SHIP) == 1 << (4 * 9 + 7)
+    assert board.mask(SUNKEN) == 1 << (4 * 9 + 8)
+    assert board.backend.count(SUNKEN) == 1
+
+    try:
+        place_fleet(board, [4 * 9 + 6, 4 * 9 + 7])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ships placed over another one")
+    assert board.mask(SHIP) == 1 << (4 * 9 + 7)
+
+
+def test_placement_index():
+    index = placement_index(4, 3)
+    assert len(index) == 2 * 4 * 2
+    assert index.find(1, 2, HORIZONTAL) is None
+    assert index.coordinates(index.find(1, 1, HORIZONTAL)) == [(1, 1), (1, 2), (1, 3)]
+    assert index.coordinates(index.find(0, 2, VERTICAL)) == [(0, 2), (1, 2), (2, 2)]
+    for placement in range(len(index)):
+        for x, y in index.coordinates(placement):
+            assert placement in index.covering(x, y)
+        assert index.mask(placement) == sum(
+            1 << (x * 4 + y) for x, y in index.coordinates(placement)
+        )
+    assert sorted(map(len, (index.covering(0, 0), index.covering(1, 1)))) == [2, 4]
+
+    board = ControlledBoard(Game(), grid_size=4, fleet=[3], backend=BitboardBackend)
+    board.change_cell(1, 1, SHIP)
+    free = index.compatible(board.mask(SHIP))
+    assert set(free) == set(range(len(index))) - set(index.covering(1, 1))
+
+
+def test_random_layouts():
+    fleet = [AIRCRAFT_CARRIER, BATTLESHIP, SUBMARINE, DESTROYER]
+    layouts = random_layouts(200, 7, fleet, numpy.random.default_rng(0))
+    assert layouts.shape == (200, 49)
+    for layout in layouts:
+        cells = [divmod(int(cell), 7) for cell in numpy.flatnonzero(layout)]
+        assert diagnose_fleet(cells, fleet).legal
+
+
 if __name__ == "__main__":
     [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
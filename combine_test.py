@@ -0,0 +1,32 @@
+import ast
+import importlib.util
+import random
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from tools.combine import combine
+
+
+def test_combined_file_parses_and_plays():
+    source = combine(Path(__file__).parent)
+    ast.parse(source)
+    assert source.startswith("from __future__ import annotations\n")
+
+    with TemporaryDirectory() as directory:
+        path = Path(directory) / "onefile.py"
+        path.write_text(source, encoding="utf-8")
+        spec = importlib.util.spec_from_file_location("onefile", path)
+        onefile = importlib.util.module_from_spec(spec)
+        sys.modules["onefile"] = onefile
+        try:
+            spec.loader.exec_module(onefile)
+            assert onefile.metrics is onefile and onefile.HORIZONTAL == 10
+            random.seed(0)
+            game = onefile.ai_game(onefile.HuntTarget, onefile.ParityHuntTarget)
+            assert game.play() in game.players
+        finally:
+            del sys.modules["onefile"]
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
@@ -0,0 +1,217 @@
+from time import perf_counter, sleep
+from typing import Iterable, Optional, Sequence, Type
+from utils import *
+from board import *
+from ai import Strategy
+from player import Player, AIPlayer, PLACING, SHOOTING, FLEET, place_fleet
+import metrics
+
+GRID_SIZE = 10
+
+
+Move = tuple[int, int]
+
+
+class Game:
+    """
+    The rules and turn order of a game, without any window attached.
+    Graphical games (see main.GraphicalGame) extend this to display it.
+    Moves are played by a TurnScheduler, which asks players for them in turn.
+    """
+
+    phase: int
+    current_player_index: int
+    players: list[Player]
+    helptext: str
+    grid_size: int
+    fleet: list[int]
+    scheduler: Optional["TurnScheduler"]
+    move_listeners: list[Callable[[Player, int, int, bool], Any]]
+
+    def __init__(self, grid_size: int = GRID_SIZE, fleet: list[int] = FLEET) -> None:
+        self.grid_size = grid_size
+        self.fleet = fleet
+        self.phase = PLACING
+        self.current_player_index = 0
+        self.players = []
+        self.helptext = ""
+        self.scheduler = None
+        self.move_listeners = []
+
+    def play(self) -> Player:
+        """
+        Plays the game until someone wins, at full speed.
+        Every player has to have a move ready when asked, like AI players do.
+        Returns the winner.
+        """
+        return TurnScheduler(self).run()
+
+    def set_helptext(self, text: str):
+        """
+        Sets the message to show to the human player(s)
+        """
+        self.helptext = text
+
+    @property
+    def winner(self) -> Optional[Player]:
+        for player in self.players:
+            if player.won:
+                return player
+        return None
+
+    def subscribe_moves(self, callback: Callable[[Player, int, int, bool], Any]):
+        """
+        Registers callback(player, x, y, hit), called after every move played
+        """
+        self.move_listeners.append(callback)
+
+    def apply_move(self, x: int, y: int) -> bool:
+        """
+        Makes the current player fire at (x, y), then ends their turn.
+        Returns whether a ship was hit.
+        """
+        player = self.current_player
+        hit = player.ennemy_board.fire(x, y)
+        for callback in self.move_listeners:
+            callback(player, x, y, hit)
+        self.end_turn()
+        return hit
+
+    def move_ready(self):
+        """
+        Called by players when they get a move to play, e.g. when the user clicks,
+        or when they are done placing their ships
+        """
+        if self.scheduler is not None:
+            self.scheduler.wake()
+
+    def end_turn(self):
+        # Only the player who just fired may have won
+        winner = self.current_player
+        if winner.won:
+            self.set_helptext(
+                f"Bravo, {winner.name}! Vous avez gagné avec une précsion de {(winner.accuracy or 0)*100}%"
+            )
+            winner.ennemy_board.lock()
+            if metrics.enabled:
+                metrics.count("wins", *winner.own_board.metric_labels)
+        else:
+            self.current_player_index = (self.current_player_index + 1) % len(
+                self.players
+            )
+
+    @property
+    def current_player(self) -> Player:
+        return self.players[self.current_player_index]
+
+
+class Pacing:
+    """
+    How long to wait before playing a player's move, so that humans can follow
+    the game. The base class does not wait.
+    """
+
+    def delay(self, player: Player) -> float:
+        """
+        Seconds to wait before asking `player` for their move
+        """
+        return 0
+
+
+class AIPacing(Pacing):
+    """
+    Waits a fixed time before each AI move, letting humans play right away
+    """
+
+    seconds: float
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def delay(self, player: Player) -> float:
+        return 0 if player.human else self.seconds
+
+
+class TurnScheduler:
+    """
+    Asks the player whose turn it is for a move (see Player.next_move) and plays it,
+    in a loop: the stack does not grow with the number of moves played,
+    whoever the players are.
+    """
+
+    game: Game
+    pacing: Pacing
+
+    def __init__(self, game: Game, pacing: Pacing = None):
+        self.game = game
+        self.pacing = pacing or Pacing()
+        game.scheduler = self
+
+    def step(self) -> bool:
+        """
+        Plays the current player's move, returns False if they do not have one yet
+        """
+        started = metrics.enabled and perf_counter()
+        player = self.game.current_player
+        move = player.next_move()
+        if move is None:
+            return False
+        self.game.apply_move(*move)
+        if started:
+            metrics.observe(
+                "turn", perf_counter() - started, *player.own_board.metric_labels
+            )
+        return True
+
+    def run(self) -> Player:
+        """
+        Plays moves until someone wins, returns the winner
+        """
+        winner = self.game.winner
+        while winner is None:
+            player = self.game.current_player
+            if delay := self.pacing.delay(player):
+                sleep(delay)
+            if not self.step():
+                raise RuntimeError(f"{player.name} does not have a move to play")
+            # Only the player who just fired may have won
+            if player.won:
+                winner = player
+        return winner
+
+    def wake(self):
+        """
+        Called when the current player gets a move to play.
+        run() does not need it, event loop based schedulers (see main.TkTurnScheduler)
+        resume playing from there.
+        """
+
+
+def ai_game(
+    first: Type[Strategy],
+    second: Type[Strategy],
+    grid_size: int = GRID_SIZE,
+    fleet: list[int] = FLEET,
+    backend: Type[Backend] = GridBackend,
+    layouts: Optional[Sequence[Iterable[int]]] = None,
+) -> Game:
+    """
+    Sets up a game between two AI players with randomly placed ships,
+    ready to be played with Game.play().
+    `layouts` gives the cells of each player's ships instead (see player.place_fleet).
+    """
+    game = Game(grid_size, fleet)
+    first_board = ControlledBoard(game, grid_size, fleet, backend=backend)
+    second_board = ControlledBoard(game, grid_size, fleet, backend=backend)
+    game.players = [
+        AIPlayer(game, first_board, second_board, first, 0, first.__name__),
+        AIPlayer(game, second_board, first_board, second, 1, second.__name__),
+    ]
+    for index, player in enumerate(game.players):
+        if layouts is None:
+            player.place_ships()
+        else:
+            place_fleet(player.own_board, layouts[index])
+        player.own_board.lock()
+    game.phase = SHOOTING
+    return game
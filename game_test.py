@@ -0,0 +1,85 @@
+import random
+import sys
+from ai import HuntTarget
+from board import ControlledBoard, SHIP, UNKNOWN
+from game import Game, TurnScheduler, ai_game
+from player import AIPlayer, HumanPlayer
+from simulate import simulate
+
+
+def test_Game_headless_ai_vs_ai():
+    random.seed(0)
+    game = Game()
+    first_board = ControlledBoard(game, game.grid_size, game.fleet)
+    second_board = ControlledBoard(game, game.grid_size, game.fleet)
+    first = AIPlayer(game, first_board, second_board, HuntTarget, 0, "first")
+    second = AIPlayer(game, second_board, first_board, HuntTarget, 1, "second")
+    game.players = [first, second]
+    first.place_ships()
+    second.place_ships()
+
+    assert game.play() is game.winner
+    assert game.winner is not None
+    assert not any(
+        game.winner.ennemy_board.real_board @ (x, y) == SHIP
+        for x in range(game.grid_size)
+        for y in range(game.grid_size)
+    )
+
+
+def test_simulate_is_reproducible():
+    results = list(simulate("HuntTarget", "HuntTarget", games=4, seed=7, workers=1))
+    again = list(simulate("HuntTarget", "HuntTarget", games=4, seed=7, workers=1))
+    assert [r["game"] for r in results] == [0, 1, 2, 3]
+    assert [(r["winner"], r["shots"]) for r in results] == [
+        (r["winner"], r["shots"]) for r in again
+    ]
+    for result in results:
+        assert result["shots"][result["winner"]] >= 17
+
+
+def test_TurnScheduler_plays_clicks_during_the_players_turn_only():
+    random.seed(0)
+    game = Game()
+    user_board = ControlledBoard(game, game.grid_size, game.fleet)
+    bot_board = ControlledBoard(game, game.grid_size, game.fleet)
+    user = HumanPlayer(game, user_board, bot_board, 0, "user")
+    bot = AIPlayer(game, bot_board, user_board, HuntTarget, 1, "bot")
+    game.players = [user, bot]
+    bot.place_ships()
+    user_board.place_or_remove(5, 5)
+    scheduler = TurnScheduler(game)
+    board = user.ennemy_board
+
+    assert not scheduler.step()
+    game.current_player_index = 1
+    board.handle_cell_Button1(0, 0)
+    game.current_player_index = 0
+    assert not scheduler.step()
+    board.handle_cell_Button1(1, 2)
+    assert scheduler.step()
+    assert board @ (0, 0) == UNKNOWN
+    assert board @ (1, 2) != UNKNOWN
+    assert game.current_player_index == 1
+    assert scheduler.step()
+    assert game.current_player_index == 0
+
+
+def test_TurnScheduler_has_a_constant_stack_depth():
+    random.seed(0)
+    game = ai_game(HuntTarget, HuntTarget, grid_size=60)
+    moves = []
+    game.subscribe_moves(lambda player, x, y, hit: moves.append(player.index))
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(200)
+    try:
+        winner = game.play()
+    finally:
+        sys.setrecursionlimit(limit)
+    assert len(moves) > 200
+    assert moves[:4] == [0, 1, 0, 1]
+    assert winner.ennemy_board.real_board.remaining_ship_cells == 0
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+"""
+Plays a round-robin league between AI strategies, to rank them by Elo rating.
+
+    python league.py --results league.jsonl
+    python league.py HuntTarget ParityHuntTarget ProbabilityDensity --workers 8
+
+Strategies play each other in pairs of games on the same two fleet layouts,
+swapping them between games: each strategy shoots at the same fleets, which
+cuts the luck of the layouts out of the results.
+A pairing stops as soon as a sequential probability ratio test (SPRT) tells
+which of its strategies is the strongest, by at least --margin Elo points,
+so that lopsided pairings only take a few games. Others stop after --max-pairs.
+
+Results are appended to the --results file as they come, one JSON object per
+pair of games: run it again with the same file to resume an interrupted league.
+Ratings are updated incrementally, in the order of the results file.
+"""
+import json
+import os
+import random
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import combinations
+from math import log
+from os import cpu_count
+from typing import Any, Iterator, Optional
+import numpy
+from ai import strategies
+from game import GRID_SIZE, ai_game
+from placements import random_layout_cells
+from player import FLEET
+
+INITIAL_RATING = 1500
+# Rating points exchanged per game
+K_FACTOR = 16
+# Pairs of games played by a worker at once
+BATCH = 4
+# Verdicts of pairings
+FIRST_STRONGER = "first"
+SECOND_STRONGER = "second"
+INCONCLUSIVE = "inconclusive"
+
+
+def expected_score(elo: float) -> float:
+    """
+    Expected score of a player rated `elo` points more than their opponent
+    """
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+class SPRT:
+    """
+    Tests whether the first strategy of a pairing is `margin` Elo points stronger
+    than the second one (H1), or weaker by as much (H0), with error rates
+    `alpha` and `beta`: the probabilities to accept H1 under H0, and H0 under H1.
+    Pairs of games are scored like single games with draws: 1 if the first strategy
+    won both, 1/2 if both strategies won one, 0 otherwise.
+    Uses the normal approximation of the generalized SPRT's log-likelihood ratio,
+    as chess engines testing frameworks do.
+    """
+
+    margin: float
+    alpha: float
+    beta: float
+
+    def __init__(self, margin: float = 20, alpha: float = 0.05, beta: float = 0.05):
+        self.margin = margin
+        self.alpha = alpha
+        self.beta = beta
+
+    @property
+    def bounds(self) -> tuple[float, float]:
+        """
+        Log-likelihood ratios under which H0, and above which H1, is accepted
+        """
+        return (
+            log(self.beta / (1 - self.alpha)),
+            log((1 - self.beta) / self.alpha),
+        )
+
+    def llr(self, wins: int, draws: int, losses: int) -> float:
+        """
+        Log-likelihood ratio of H1 against H0, given the pairs' scores
+        """
+        # Half a pair of each score, so that a pairing only ever won by one
+        # strategy still has a variance
+        wins, draws, losses = wins + 0.5, draws + 0.5, losses + 0.5
+        pairs = wins + draws + losses
+        mean = (wins + draws / 2) / pairs
+        variance = (
+            wins * (1 - mean) ** 2 + draws * (0.5 - mean) ** 2 + losses * mean**2
+        ) / pairs
+        score0, score1 = expected_score(-self.margin), expected_score(self.margin)
+        return pairs * (score1 - score0) * (2 * mean - score0 - score1) / (2 * variance)
+
+    def verdict(self, wins: int, draws: int, losses: int) -> Optional[str]:
+        lower, upper = self.bounds
+        llr = self.llr(wins, draws, losses)
+        if llr >= upper:
+            return FIRST_STRONGER
+        if llr <= lower:
+            return SECOND_STRONGER
+        return None
+
+
+def play_pair(first: str, second: str, seed: int, grid_size: int) -> int:
+    """
+    Plays `first` against `second` on two fleet layouts drawn from `seed`, then
+    again with the layouts swapped. The player owning the first layout starts.
+    Returns the number of games the first strategy won.
+    """
+    available = strategies()
+    rng = numpy.random.default_rng(seed)
+    layouts = [
+        layout.tolist()
+        for layout in random_layout_cells(2, grid_size, FLEET, rng)
+    ]
+    won = 0
+    for first_index, players in enumerate(((first, second), (second, first))):
+        random.seed(seed)
+        game = ai_game(
+            *(available[name] for name in players),
+            grid_size=grid_size,
+            layouts=layouts,
+        )
+        won += game.play().index == first_index
+    return won
+
+
+def play_pairs(
+    task: tuple[str, str, list[int], int, int]
+) -> list[tuple[int, int]]:
+    """
+    Plays the pairs of games numbered `indexes`, pair i being played with
+    layouts drawn from seed + i.
+    Returns each pair's index and number of games the first strategy won.
+    """
+    first, second, indexes, seed, grid_size = task
+    return [
+        (index, play_pair(first, second, seed + index, grid_size))
+        for index in indexes
+    ]
+
+
+class Pairing:
+    """
+    The results of two strategies against each other so far
+    """
+
+    first: str
+    second: str
+    # Number of pairs of games the first strategy won twice, once, or never
+    wins: int
+    draws: int
+    losses: int
+    # Indexes of the pairs played, and of the next one to play
+    played: set[int]
+    next_index: int
+    verdict: Optional[str]
+
+    def __init__(self, first: str, second: str):
+        self.first = first
+        self.second = second
+        self.wins = self.draws = self.losses = 0
+        self.played = set()
+        self.next_index = 0
+        self.verdict = None
+
+    @property
+    def pairs(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def record(self, index: int, won: int, sprt: SPRT, max_pairs: int):
+        """
+        Records that the first strategy won `won` games of pair number `index`,
+        then concludes the pairing if it can
+        """
+        self.played.add(index)
+        if won == 2:
+            self.wins += 1
+        elif won == 1:
+            self.draws += 1
+        else:
+            self.losses += 1
+        self.verdict = sprt.verdict(self.wins, self.draws, self.losses)
+        if self.verdict is None and self.pairs >= max_pairs:
+            self.verdict = INCONCLUSIVE
+
+    def claim(self, count: int, max_pairs: int) -> list[int]:
+        """
+        Indexes of up to `count` pairs to play next, skipping the ones played
+        before the league was resumed
+        """
+        indexes = []
+        while len(indexes) < count and self.next_index < max_pairs:
+            if self.next_index not in self.played:
+                indexes.append(self.next_index)
+            self.next_index += 1
+        return indexes
+
+
+class League:
+    """
+    A round-robin league between strategies, saving its results to a file
+    """
+
+    names: list[str]
+    grid_size: int
+    seed: int
+    sprt: SPRT
+    max_pairs: int
+    pairings: dict[tuple[str, str], Pairing]
+    ratings: dict[str, float]
+    path: Optional[str]
+
+    def __init__(
+        self,
+        names: list[str],
+        grid_size: int = GRID_SIZE,
+        seed: int = 0,
+        sprt: SPRT = None,
+        max_pairs: int = 1000,
+        path: Optional[str] = None,
+    ):
+        self.names = names
+        self.grid_size = grid_size
+        self.seed = seed
+        self.sprt = sprt or SPRT()
+        self.max_pairs = max_pairs
+        self.pairings = {
+            (first, second): Pairing(first, second)
+            for first, second in combinations(names, 2)
+        }
+        self.ratings = {name: INITIAL_RATING for name in names}
+        self.path = path
+        if path is not None and os.path.exists(path):
+            self.resume(path)
+
+    @property
+    def settings(self) -> dict[str, Any]:
+        """
+        What results of the same league were played with
+        """
+        return {
+            "grid_size": self.grid_size,
+            "seed": self.seed,
+            "margin": self.sprt.margin,
+            "alpha": self.sprt.alpha,
+            "beta": self.sprt.beta,
+            "max_pairs": self.max_pairs,
+        }
+
+    def resume(self, path: str):
+        """
+        Replays the results saved to `path`.
+        Raises ValueError if they were played with other settings.
+        """
+        with open(path) as file:
+            lines = file.read().splitlines()
+        if not lines:
+            return
+        settings = json.loads(lines[0])["settings"]
+        if settings != self.settings:
+            raise ValueError(
+                f"{path} holds results of a league played with {settings}"
+            )
+        for line in lines[1:]:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Cut short by an interruption, that pair will be played again
+                continue
+            key = result["first"], result["second"]
+            if key in self.pairings and self.pairings[key].verdict is None:
+                self.record(self.pairings[key], result["pair"], result["won"])
+
+    def record(self, pairing: Pairing, index: int, won: int):
+        pairing.record(index, won, self.sprt, self.max_pairs)
+        # Both games at once, as one game scored 0, 1/2 or 1
+        difference = self.ratings[pairing.first] - self.ratings[pairing.second]
+        change = 2 * K_FACTOR * (won / 2 - expected_score(difference))
+        self.ratings[pairing.first] += change
+        self.ratings[pairing.second] -= change
+
+    def open_results(self):
+        """
+        Opens the results file to append to it, writing the settings first
+        """
+        if self.path is None:
+            return open(os.devnull, "w")
+        file = open(self.path, "a+")
+        if not file.tell():
+            file.write(json.dumps({"settings": self.settings}) + "\n")
+        else:
+            file.seek(file.tell() - 1)
+            if file.read(1) != "\n":
+                # End the line cut short by an interruption
+                file.write("\n")
+        return file
+
+    def tasks(self, count: int) -> Iterator[tuple[Pairing, tuple]]:
+        """
+        Up to `count` batches of pairs to play, taken from the pairings
+        still running in turn, so that they all progress at the same pace
+        """
+        running = [pairing for pairing in self.pairings.values() if not pairing.verdict]
+        while count and running:
+            for pairing in list(running):
+                indexes = pairing.claim(BATCH, self.max_pairs)
+                if not indexes:
+                    running.remove(pairing)
+                    continue
+                yield pairing, (
+                    pairing.first,
+                    pairing.second,
+                    indexes,
+                    self.seed,
+                    self.grid_size,
+                )
+                count -= 1
+                if not count:
+                    return
+
+    def save(self, file, pairing: Pairing, results: list[tuple[int, int]]):
+        """
+        Records and saves the results of a batch, up to the pairing's conclusion:
+        the pairs played meanwhile are dropped, so that resuming gives the same results
+        """
+        for index, won in results:
+            if pairing.verdict is not None:
+                break
+            self.record(pairing, index, won)
+            file.write(
+                json.dumps(
+                    {
+                        "first": pairing.first,
+                        "second": pairing.second,
+                        "pair": index,
+                        "won": won,
+                    }
+                )
+                + "\n"
+            )
+            if pairing.verdict is not None:
+                print(describe(pairing), file=sys.stderr)
+        file.flush()
+
+    def run(self, workers: int = None):
+        """
+        Plays the pairings until they are all concluded, on `workers` processes
+        """
+        workers = workers or cpu_count() or 1
+        with self.open_results() as file:
+            if workers == 1:
+                while batch := next(self.tasks(1), None):
+                    pairing, task = batch
+                    self.save(file, pairing, play_pairs(task))
+                return
+            with ProcessPoolExecutor(workers) as pool:
+                # Twice as many batches as workers, to keep them all busy
+                running = {}
+                while True:
+                    for pairing, task in self.tasks(2 * workers - len(running)):
+                        running[pool.submit(play_pairs, task)] = pairing
+                    if not running:
+                        return
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.save(file, running.pop(future), future.result())
+
+    def standings(self) -> list[tuple[str, float]]:
+        return sorted(self.ratings.items(), key=lambda rating: -rating[1])
+
+
+def describe(pairing: Pairing) -> str:
+    games = (
+        f"{pairing.pairs} pairs of games,"
+        f" +{pairing.wins} ={pairing.draws} -{pairing.losses}"
+    )
+    if pairing.verdict == FIRST_STRONGER:
+        return f"{pairing.first} > {pairing.second} after {games}"
+    if pairing.verdict == SECOND_STRONGER:
+        return f"{pairing.second} > {pairing.first} after {games}"
+    return f"{pairing.first} ~ {pairing.second}: no verdict after {games}"
+
+
+def main():
+    available = strategies()
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "strategies",
+        nargs="*",
+        help=f"some of {', '.join(available)}, defaults to all of them",
+    )
+    parser.add_argument("--results", metavar="FILE", default="league.jsonl")
+    parser.add_argument("--grid-size", type=int, default=GRID_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workers", type=int, help="number of processes, defaults to the CPU count"
+    )
+    parser.add_argument(
+        "--margin",
+        type=float,
+        default=20,
+        help="Elo difference between the hypotheses of the SPRT",
+    )
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument(
+        "--max-pairs",
+        type=int,
+        default=1000,
+        help="most pairs of games played by two strategies without a verdict",
+    )
+    args = parser.parse_args()
+    unknown = set(args.strategies) - set(available)
+    if unknown:
+        parser.error(f"unknown strategies: {', '.join(sorted(unknown))}")
+
+    try:
+        league = League(
+            args.strategies or sorted(available),
+            grid_size=args.grid_size,
+            seed=args.seed,
+            sprt=SPRT(args.margin, args.alpha, args.beta),
+            max_pairs=args.max_pairs,
+            path=args.results,
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    league.run(args.workers)
+
+    for pairing in league.pairings.values():
+        print(describe(pairing))
+    print()
+    for rank, (name, rating) in enumerate(league.standings(), start=1):
+        print(f"{rank:>2}. {name:<20} {rating:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
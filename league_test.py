@@ -0,0 +1,51 @@
+import os
+from tempfile import TemporaryDirectory
+from league import FIRST_STRONGER, SECOND_STRONGER, SPRT, League
+
+STRATEGIES = ["HuntTarget", "ParityHuntTarget"]
+
+
+def test_sprt_is_symmetric():
+    sprt = SPRT(margin=20)
+    assert abs(sprt.llr(30, 10, 5) + sprt.llr(5, 10, 30)) < 1e-9
+    assert sprt.verdict(0, 0, 0) is None
+    assert sprt.verdict(10, 0, 0) == FIRST_STRONGER
+    assert sprt.verdict(0, 0, 10) == SECOND_STRONGER
+
+
+def test_lopsided_pairings_stop_early():
+    league = League(STRATEGIES, max_pairs=100)
+    league.run(workers=1)
+    (pairing,) = league.pairings.values()
+    assert pairing.verdict == SECOND_STRONGER
+    assert pairing.pairs < 20
+    assert [name for name, _ in league.standings()] == STRATEGIES[::-1]
+
+
+def test_interrupted_leagues_resume():
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "league.jsonl")
+        complete = League(STRATEGIES, path=path)
+        complete.run(workers=1)
+        with open(path) as file:
+            lines = file.read().splitlines()
+
+        # Interrupted while writing its fourth result
+        with open(path, "w") as file:
+            file.write("\n".join(lines[:4]) + "\n" + lines[4][:10])
+        resumed = League(STRATEGIES, path=path)
+        assert resumed.pairings[tuple(STRATEGIES)].pairs == 3
+        resumed.run(workers=1)
+        assert resumed.ratings == complete.ratings
+        assert resumed.pairings[tuple(STRATEGIES)].played == set(range(len(lines) - 1))
+
+        try:
+            League(STRATEGIES, grid_size=8, path=path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("resumed a league played on another grid size")
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
@@ -0,0 +1,200 @@
+from collections import Counter
+from typing import Iterable, Optional
+from placements import HORIZONTAL, VERTICAL, placement_index
+
+Cell = tuple[int, int]
+Segment = list[Cell]
+
+
+class FleetDiagnosis:
+    """
+    Result of checking a board's ship cells against its fleet.
+    - ships: the ships that were recognized, as lists of cells
+    - missing: lengths of the fleet's ships that could not be found
+    - malformed: groups of touching cells that cannot be split into the fleet's ships
+    """
+
+    ships: list[Segment]
+    missing: list[int]
+    malformed: list[list[Cell]]
+
+    def __init__(
+        self, ships: list[Segment], missing: list[int], malformed: list[list[Cell]]
+    ):
+        self.ships = ships
+        self.missing = missing
+        self.malformed = malformed
+
+    @property
+    def legal(self) -> bool:
+        return not self.missing and not self.malformed
+
+    def __bool__(self) -> bool:
+        return self.legal
+
+    def __repr__(self) -> str:
+        return f"FleetDiagnosis(ships={self.ships!r}, missing={self.missing!r}, malformed={self.malformed!r})"
+
+
+def connected_components(cells: Iterable[Cell]) -> list[list[Cell]]:
+    """
+    Groups cells that touch each other horizontally or vertically.
+    Each group is sorted in row-major order.
+    """
+    remaining = set(cells)
+    components = []
+    while remaining:
+        stack = [remaining.pop()]
+        component = []
+        while stack:
+            x, y = stack.pop()
+            component.append((x, y))
+            for neighbour in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if neighbour in remaining:
+                    remaining.remove(neighbour)
+                    stack.append(neighbour)
+        components.append(sorted(component))
+    return components
+
+
+def tilings(
+    component: list[Cell], lengths: Counter
+) -> dict[tuple[int, ...], list[Segment]]:
+    """
+    All the ways to split a component into straight ships whose lengths are taken from `lengths`.
+    Returns a mapping of the (sorted) ship lengths used to one way of placing them.
+    """
+    if len(component) > sum(length * count for length, count in lengths.items()):
+        return {}
+    rows = [x for x, _ in component]
+    columns = [y for _, y in component]
+    if len(set(rows)) == 1 or len(set(columns)) == 1:
+        return line_tilings(component, lengths)
+    # Placements are looked up in the index of the smallest square board holding
+    # the component, so that its bitmasks stay small whatever the board's size
+    top, left = min(rows), min(columns)
+    size = max(max(rows) - top, max(columns) - left) + 1
+    found: dict[tuple[int, ...], list[tuple[int, int]]] = {}
+
+    def split(uncovered: int, placements: list[tuple[int, int]]):
+        if not uncovered:
+            found.setdefault(
+                tuple(sorted(length for length, _ in placements)), list(placements)
+            )
+            return
+        # The first uncovered cell (in row-major order) has to be
+        # the top end of a vertical ship or the left end of a horizontal one.
+        x, y = divmod((uncovered & -uncovered).bit_length() - 1, size)
+        for length in sorted(lengths):
+            if not lengths[length]:
+                continue
+            index = placement_index(size, length)
+            orientations = (HORIZONTAL,) if length == 1 else (HORIZONTAL, VERTICAL)
+            for orientation in orientations:
+                placement = index.find(x, y, orientation)
+                if placement is None:
+                    continue
+                mask = index.mask(placement)
+                if uncovered & mask == mask:
+                    lengths[length] -= 1
+                    placements.append((length, placement))
+                    split(uncovered & ~mask, placements)
+                    placements.pop()
+                    lengths[length] += 1
+
+    split(sum(1 << ((x - top) * size + y - left) for x, y in component), [])
+    return {
+        used: [
+            [
+                (top + x, left + y)
+                for x, y in placement_index(size, length).coordinates(placement)
+            ]
+            for length, placement in placements
+        ]
+        for used, placements in found.items()
+    }
+
+
+def line_tilings(
+    line: list[Cell], lengths: Counter
+) -> dict[tuple[int, ...], list[Segment]]:
+    """
+    tilings() for a component that is a single straight line:
+    only the ships' lengths matter, not the geometry.
+    """
+    available = sorted(length for length, count in lengths.items() if count)
+    found = {}
+
+    def partition(rest: int, smallest: int, used: list[int]):
+        if rest == 0:
+            segments, start = [], 0
+            for length in used:
+                segments.append(line[start : start + length])
+                start += length
+            found[tuple(used)] = segments
+            return
+        for length in available:
+            if smallest <= length <= rest and used.count(length) < lengths[length]:
+                used.append(length)
+                partition(rest - length, length, used)
+                used.pop()
+
+    partition(len(line), 0, [])
+    return found
+
+
+def assign(
+    options: list[dict[tuple[int, ...], list[Segment]]], fleet: Counter
+) -> Optional[list[Segment]]:
+    """
+    Picks one tiling per component so that all of them together use exactly the fleet.
+    Components with a single tiling are settled first, so backtracking only happens
+    between components that can be split in several ways.
+    """
+    order = sorted(range(len(options)), key=lambda i: len(options[i]))
+
+    def search(position: int, remaining: Counter) -> Optional[list[Segment]]:
+        if position == len(order):
+            return [] if not +remaining else None
+        for lengths, segments in options[order[position]].items():
+            used = Counter(lengths)
+            if any(remaining[length] < count for length, count in used.items()):
+                continue
+            rest = search(position + 1, remaining - used)
+            if rest is not None:
+                return segments + rest
+        return None
+
+    return search(0, fleet)
+
+
+def diagnose_fleet(
+    ship_cells: Iterable[Cell], fleet: Iterable[int]
+) -> FleetDiagnosis:
+    """
+    Checks that the ship cells form exactly the ships of the fleet:
+    straight lines of the right lengths, touching ships being allowed.
+    """
+    fleet = Counter(fleet)
+    components = connected_components(ship_cells)
+    options = [tilings(component, fleet.copy()) for component in components]
+
+    ships = assign(options, fleet)
+    if ships is not None:
+        return FleetDiagnosis(ships=ships, missing=[], malformed=[])
+
+    # No exact match: explain what we can, component by component.
+    remaining = fleet.copy()
+    ships, malformed = [], []
+    for component, tilings_of_component in zip(components, options):
+        for lengths, segments in tilings_of_component.items():
+            used = Counter(lengths)
+            if all(remaining[length] >= count for length, count in used.items()):
+                remaining -= used
+                ships += segments
+                break
+        else:
+            malformed.append(component)
+    return FleetDiagnosis(
+        ships=ships, missing=sorted(remaining.elements()), malformed=malformed
+    )
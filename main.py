@@ -1,13 +1,44 @@
+from __future__ import annotations
+
+# First, to time the imports below
+import startup
+from argparse import ArgumentParser
 from ai import HuntTarget
-from tkinter import StringVar, Tk, Label
-from typing import Optional
+from tkinter import Button, Event, StringVar, Tk, Label
+from typing import TYPE_CHECKING, Awaitable, Optional, Type, Union
 from utils import *
 from board import *
-from player import Player, HumanPlayer, AIPlayer, PLACING, HELPTEXT_PLACING
-from rich import print as pprint
+from game import Game, GRID_SIZE, AIPacing, Pacing, TurnScheduler
+from player import (
+    HumanPlayer,
+    AIPlayer,
+    FLEET,
+    HELPTEXT_PLACING,
+    HELPTEXT_SHOOTING,
+    SHOOTING,
+)
+from view import BoardView, CanvasBoardView, ViewportBoardView, MAX_FPS
+
+if TYPE_CHECKING:
+    # Only needed to play over the network: imported then
+    import asyncio
+    from concurrent.futures import Future
+    from network import PeerSession
+
+startup.milestone("imports done")
 
-FLEET = [DESTROYER, CRUISER, SUBMARINE, BATTLESHIP, AIRCRAFT_CARRIER]
-GRID_SIZE = 10
+RENDERERS = {
+    "buttons": BoardView,
+    "canvas": CanvasBoardView,
+    "viewport": ViewportBoardView,
+}
+# Boards with more cells than this only store the cells that changed
+SPARSE_BACKEND_CELLS = 1000 * 1000
+View = Union[BoardView, CanvasBoardView, ViewportBoardView]
+# Milliseconds between two checks of whether the AI made up its mind
+AI_POLL_INTERVAL = 10
+# Milliseconds between two runs of the network's event loop
+NETWORK_POLL_INTERVAL = 2
 
 
 class DummyPlayer:
@@ -16,28 +47,151 @@ class DummyPlayer:
         self.human = human
 
 
-class Game:
-    phase: int
-    current_player_index: int
-    players: list[Player]
+class TkTurnScheduler(TurnScheduler):
+    """
+    Plays the game's moves from tkinter's event loop, one callback per move.
+    AI players decide in a separate thread, the window staying responsive however
+    long they take; their move is played from the event loop once they are done,
+    since tkinter is not thread-safe.
+    """
+
+    game: "GraphicalGame"
+    root: Tk
+    # The move being decided by an AI player, if one is thinking
+    thinking: Optional[Future]
+    # Identifier of the next callback, if one is scheduled
+    after_id: Optional[str]
+    closed: bool
+
+    def __init__(self, game: "GraphicalGame", root: Tk, pacing: Pacing = None):
+        super().__init__(game, pacing)
+        self.root = root
+        self.thinking = None
+        self.after_id = None
+        self.closed = False
+
+    def wake(self):
+        if (
+            self.closed
+            or self.after_id is not None
+            or self.thinking is not None
+            or self.game.winner is not None
+        ):
+            return
+        delay = self.pacing.delay(self.game.current_player)
+        self.after_id = self.root.after(max(1, round(delay * 1000)), self.tick)
+
+    def tick(self):
+        self.after_id = None
+        player = self.game.current_player
+        if player.human:
+            if self.step():
+                self.wake()
+            return
+        self.game.set_helptext(f"{player.name} réfléchit…")
+        self.root.configure(cursor="watch")
+        self.thinking = run_in_thread(player.next_move, name="AI")
+        self.poll()
+
+    def poll(self):
+        """
+        Plays the AI's move once it is done thinking
+        """
+        self.after_id = None
+        if self.closed or self.thinking is None:
+            return
+        if not self.thinking.done():
+            self.after_id = self.root.after(AI_POLL_INTERVAL, self.poll)
+            return
+        decision, self.thinking = self.thinking, None
+        self.root.configure(cursor="")
+        try:
+            move = decision.result()
+        except Exception as error:
+            self.give_up(error)
+            return
+        self.game.set_helptext(HELPTEXT_SHOOTING)
+        self.game.apply_move(*move)
+        self.wake()
+
+    def give_up(self, error: Exception):
+        """
+        Ends the game when the AI could not decide its move
+        """
+        player = self.game.current_player
+        i(f"{player.name} could not decide where to fire: {error!r}")
+        self.game.set_helptext(
+            f"{player.name} n'a pas pu jouer ({error}).\nLa partie est terminée."
+        )
+        for each in self.game.players:
+            each.ennemy_board.lock()
+        self.close()
+
+    def close(self):
+        """
+        Stops playing, dropping the AI's decision if it is still thinking
+        """
+        self.closed = True
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+        if self.thinking is not None:
+            self.thinking.cancel()
+            self.thinking = None
+
+
+class GraphicalGame(Game):
+    """
+    A game between the user and the computer, displayed in a tkinter window.
+    `name` is the user's name.
+    """
+
     helptext_var: StringVar
+    renderer: Type[View]
+    max_fps: float
+    scheduler: TkTurnScheduler
+
+    def __init__(
+        self,
+        name: str,
+        renderer: Type[View] = BoardView,
+        grid_size: int = GRID_SIZE,
+        max_fps: float = MAX_FPS,
+        pacing: Pacing = None,
+    ) -> None:
+        super().__init__(grid_size=grid_size, fleet=FLEET)
+        self.renderer = renderer
+        self.max_fps = max_fps
+        with startup.phase("window"):
+            self.root = Tk()
+            self.root.columnconfigure(0, weight=1)
+            self.root.rowconfigure(0, weight=1)
+            self.helptext_var = StringVar()
+        self.create_scheduler(pacing)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        with startup.phase("players"):
+            self.create_players(
+                SparseBackend if grid_size**2 > SPARSE_BACKEND_CELLS else GridBackend,
+                name,
+            )
 
-    def __init__(self) -> None:
-        self.root = Tk()
-        self.root.columnconfigure(0, weight=1)
-        self.root.rowconfigure(0, weight=1)
-        self.phase = PLACING
-        self.current_player_index = 0
-        self.helptext_var = StringVar()
+    def create_scheduler(self, pacing: Optional[Pacing]):
+        TkTurnScheduler(self, self.root, pacing)
 
+    def create_players(self, backend: Type[Backend], name: str):
         user_board = ControlledBoard(
-            self, grid_size=GRID_SIZE, fleet=FLEET, owner=DummyPlayer("Chirex", True)
+            self,
+            grid_size=self.grid_size,
+            fleet=FLEET,
+            owner=DummyPlayer("Chirex", True),
+            backend=backend,
         )
         bot_board = ControlledBoard(
             self,
-            grid_size=GRID_SIZE,
+            grid_size=self.grid_size,
             fleet=FLEET,
             owner=DummyPlayer("Léonard de Vinci", False),
+            backend=backend,
         )
 
         self.user = HumanPlayer(
@@ -45,7 +199,7 @@ class Game:
             user_board,
             ennemy_board=bot_board,
             index=0,
-            name=input("Choisissez votre nom: "),
+            name=name,
         )
         self.bot = AIPlayer(
             self,
@@ -57,45 +211,225 @@ class Game:
         )
         self.players = [self.user, self.bot]
 
+    def place_fleets(self):
+        """
+        Places the computer's ships, once the window is shown
+        """
         self.bot.place_ships()
-        d("ennemy state is", end=" ")
-        pprint(self.bot.own_board.state)
+        d(lambda: f"ennemy state is {self.bot.own_board.state}")
+
+    def set_helptext(self, text: str):
+        super().set_helptext(text)
+        self.helptext_var.set(text)
+
+    def close(self):
+        """
+        Closes the window, dropping the AI's decision if it is still thinking
+        """
+        self.scheduler.close()
+        self.root.destroy()
 
     def start(self):
-        self.helptext_var.set(HELPTEXT_PLACING)
+        self.set_helptext(HELPTEXT_PLACING)
         Label(self.root, textvariable=self.helptext_var).grid(column=0, row=0)
+        # Show the window right away, the boards come next
+        self.root.bind("<Map>", self.handle_map)
+        self.root.mainloop()
 
-        Label(self.root, text=self.bot.name).grid(column=0, row=1)
-        self.user.ennemy_board.render(0, 2)
-        Label(self.root, text=self.user.name).grid(column=0, row=3)
-        self.user.own_board.render(0, 4)
+    def handle_map(self, event: Event):
+        """
+        Draws the boards once the window is shown
+        """
+        # Children of the window get their <Map> events handled here too
+        if event.widget is not self.root:
+            return
+        self.root.unbind("<Map>")
+        startup.milestone("window shown")
+        with startup.phase("boards"):
+            Label(self.root, text=self.bot.name).grid(column=0, row=1)
+            self.renderer(
+                self.root, self.user.ennemy_board, max_fps=self.max_fps
+            ).render(0, 2)
+            Label(self.root, text=self.user.name).grid(column=0, row=3)
+            self.renderer(
+                self.root, self.user.own_board, max_fps=self.max_fps
+            ).render(0, 4)
 
-        self.user.ok_button.grid(column=0, row=5)
-        self.root.mainloop()
+            ok_button = Button(self.root, text="OK")
+            ok_button.bind("<Button 1>", self.user.handle_click_ok)
+            ok_button.grid(column=0, row=5)
+            self.root.update_idletasks()
+        with startup.phase("fleets"):
+            self.place_fleets()
+        startup.report()
+
+
+class PeerGraphicalGame(GraphicalGame):
+    """
+    A game between the user and someone else, over the network (see network.py).
+    The peer's messages are handled by an asyncio event loop run from tkinter's:
+    every few milliseconds, it gets to run whatever is ready.
+    """
+
+    connect: Callable[[Game], Awaitable[PeerSession]]
+    local_index: int
+    loop: asyncio.AbstractEventLoop
+    session: Optional[asyncio.Task]
+    pump_id: Optional[str]
 
-    @property
-    def winner(self) -> Optional[Player]:
-        for _, player in enumerate(self.players):
-            if player.won:
-                return player
-        return None
-
-    def end_turn(self):
-        if self.winner is not None:
-            self.helptext_var.set(
-                f"Bravo, {self.winner.name}! Vous avez gagné avec une précsion de {(self.winner.accuracy or 0)*100}%"
+    def __init__(
+        self,
+        connect: Callable[[Game], Awaitable[PeerSession]],
+        local_index: int,
+        **kwargs,
+    ) -> None:
+        import asyncio
+
+        self.connect = connect
+        self.local_index = local_index
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.pump_id = None
+        super().__init__(**kwargs)
+
+    def create_scheduler(self, pacing: Optional[Pacing]):
+        # The PeerSession is the scheduler, once connected
+        pass
+
+    def create_players(self, backend: Type[Backend], name: str):
+        from network import peer_game
+
+        peer_game(
+            self.local_index,
+            self.grid_size,
+            self.fleet,
+            name=name,
+            game=self,
+            backend=backend,
+        )
+        self.user = self.players[self.local_index]
+        self.bot = self.players[1 - self.local_index]
+
+    def place_fleets(self):
+        # The peer places their own ships
+        pass
+
+    async def play_with_peer(self):
+        from network import ProtocolError
+
+        try:
+            self.set_helptext(f"Connexion…\n{HELPTEXT_PLACING}")
+            session = await self.connect(self)
+            self.set_helptext(
+                HELPTEXT_SHOOTING if self.phase == SHOOTING else HELPTEXT_PLACING
             )
-            self.winner.ennemy_board.lock()
-        else:
-            self.current_player_index = (self.current_player_index + 1) % 2
-            if self.bot.turn_is_mine():
-                self.bot.ennemy_board.fire(*self.bot.decide_coordinates())
+            await session.play()
+        except (ProtocolError, OSError) as error:
+            self.set_helptext(f"Partie interrompue : {error}")
 
-    @property
-    def current_player(self) -> Player:
-        return [self.user, self.bot][self.current_player_index]
+    def pump(self):
+        """
+        Runs the callbacks of the asyncio event loop that are ready
+        """
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+        self.pump_id = self.root.after(NETWORK_POLL_INTERVAL, self.pump)
+
+    def close(self):
+        if self.pump_id is not None:
+            self.root.after_cancel(self.pump_id)
+        if self.session is not None:
+            self.session.cancel()
+            self.loop.call_soon(self.loop.stop)
+            self.loop.run_forever()
+        self.loop.close()
+        self.root.destroy()
+
+    def start(self):
+        self.session = self.loop.create_task(self.play_with_peer())
+        self.pump_id = self.root.after(0, self.pump)
+        super().start()
 
 
 if __name__ == "__main__":
-    print(f"fleet is {FLEET}")
-    Game().start()
+    parser = ArgumentParser(description="Bataille navale")
+    parser.add_argument(
+        "--log-level",
+        choices=LOG_LEVELS.keys(),
+        help=f"defaults to the {LOG_LEVEL_ENV_VAR} environment variable, or off",
+    )
+    parser.add_argument(
+        "--background-log",
+        action="store_true",
+        help="print log messages from a separate thread",
+    )
+    parser.add_argument(
+        "--renderer",
+        choices=RENDERERS.keys(),
+        default="buttons",
+        help="draw boards as a grid of buttons, on a canvas,"
+        " or only their visible part (for huge boards)",
+    )
+    parser.add_argument("--grid-size", type=int, default=GRID_SIZE)
+    parser.add_argument(
+        "--ai-delay",
+        type=float,
+        default=0,
+        help="seconds to wait before each of the computer's moves",
+    )
+    parser.add_argument(
+        "--max-fps",
+        type=float,
+        default=MAX_FPS,
+        help="most times per second boards are repainted, 0 for no limit",
+    )
+    peer = parser.add_mutually_exclusive_group()
+    peer.add_argument(
+        "--listen",
+        type=int,
+        metavar="PORT",
+        help="play against someone connecting to this port, instead of the computer",
+    )
+    peer.add_argument(
+        "--connect",
+        metavar="HOST:PORT",
+        help="play against someone listening there, instead of the computer",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="print how long imports and each step of the startup took,"
+        " once the boards are drawn",
+    )
+    args = parser.parse_args()
+    if args.log_level:
+        set_log_level(args.log_level)
+    if args.background_log:
+        use_background_sink()
+
+    i(f"fleet is {FLEET}")
+    # Asked before the window opens, and left out of the startup's time
+    with startup.paused():
+        name = input("Choisissez votre nom: ")
+    options = dict(
+        name=name,
+        renderer=RENDERERS[args.renderer],
+        grid_size=args.grid_size,
+        max_fps=args.max_fps,
+        pacing=AIPacing(args.ai_delay),
+    )
+    if args.listen:
+        from network import host
+
+        PeerGraphicalGame(
+            lambda game: host(game, args.listen), local_index=0, **options
+        ).start()
+    elif args.connect:
+        from network import join
+
+        address, port = args.connect.rsplit(":", 1)
+        PeerGraphicalGame(
+            lambda game: join(game, address, int(port)), local_index=1, **options
+        ).start()
+    else:
+        GraphicalGame(**options).start()
@@ -0,0 +1,56 @@
+import random
+from time import sleep
+from ai import HuntTarget
+from game import ai_game
+from main import TkTurnScheduler
+
+
+class FakeRoot:
+    """
+    Runs the callbacks tkinter would, without a window
+    """
+
+    def __init__(self):
+        self.callbacks = []
+        self.cursor = ""
+
+    def after(self, milliseconds: int, callback) -> str:
+        self.callbacks.append(callback)
+        return str(len(self.callbacks))
+
+    def after_cancel(self, identifier: str):
+        pass
+
+    def configure(self, cursor: str):
+        self.cursor = cursor
+
+    def mainloop(self):
+        while self.callbacks:
+            self.callbacks.pop(0)()
+            sleep(0.001)
+
+
+def test_TkTurnScheduler_ends_the_game_when_the_AI_fails():
+    random.seed(0)
+    game = ai_game(HuntTarget, HuntTarget)
+    broken = game.players[1]
+
+    def choose_shot_location():
+        raise RuntimeError("out of ideas")
+
+    broken.strategy.choose_shot_location = choose_shot_location
+    root = FakeRoot()
+    scheduler = TkTurnScheduler(game, root)
+    scheduler.wake()
+    root.mainloop()
+
+    assert scheduler.closed and scheduler.thinking is None
+    assert root.cursor == ""
+    assert game.current_player is broken and game.winner is None
+    assert "out of ideas" in game.helptext
+    assert all(player.ennemy_board.locked for player in game.players)
+    assert sum(player.ennemy_board.shots_fired for player in game.players) == 1
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
@@ -0,0 +1,266 @@
+"""
+Counters and timing histograms of the engine's hot paths, to spot which strategy
+or board size got slower:
+
+    placement   AIPlayer.place_ships
+    decision    AIPlayer.decide_coordinates, i.e. Strategy.choose_shot_location
+    shot        ProjectiveBoard.fire, including the strategy's reaction
+    turn        TurnScheduler.step, from asking for a move to having played it
+    legality    ControlledBoard.diagnose
+
+Each is labelled with the player's strategy (its class name) and the grid size:
+"decision/HuntTarget/10". Counters count shots, hits and games won the same way.
+
+Recording is off by default, and then costs a check of `metrics.enabled` per call:
+
+    import metrics
+    metrics.enable("metrics.json", interval=10)  # dumps every 10 seconds, and at exit
+    ...
+    metrics.snapshot()  # or read metrics.json
+
+Snapshots of other processes can be merged in (see simulate.py's --metrics).
+"""
+import atexit
+import json
+import os
+from math import frexp
+import threading
+from typing import Any, Optional, Union
+
+# Seconds between two dumps of the metrics to a file
+DUMP_INTERVAL = 10
+QUANTILES = 0.5, 0.9, 0.99
+
+# Whether metrics are being recorded. Check it before timing anything.
+enabled = False
+
+Labels = tuple[Union[str, int], ...]
+
+
+def metric_key(name: str, labels: Labels) -> str:
+    return "/".join((name, *map(str, labels)))
+
+
+def parse_metric_key(key: str) -> tuple[str, Labels]:
+    """
+    The name and labels of a metric_key, labels made of digits being ints
+    """
+    name, *labels = key.split("/")
+    return name, tuple(int(label) if label.isdigit() else label for label in labels)
+
+
+class Histogram:
+    """
+    Durations, counted in buckets whose bounds are powers of 2 microseconds,
+    so that histograms of different processes can be added up
+    """
+
+    count: int
+    total: float
+    minimum: float
+    maximum: float
+    # Number of durations of less than 2**exponent µs, but not less than half that
+    buckets: dict[int, int]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = float("inf")
+        self.maximum = 0
+        self.buckets = {}
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        exponent = frexp(seconds * 1e6)[1]
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket the q-quantile falls into, in seconds
+        """
+        rank = q * self.count
+        seen = 0
+        for exponent in sorted(self.buckets):
+            seen += self.buckets[exponent]
+            if seen >= rank:
+                return min(2.0**exponent / 1e6, self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.minimum if self.count else 0,
+            "max": self.maximum,
+            "mean": self.total / self.count if self.count else 0,
+            **{f"p{round(q * 100)}": self.quantile(q) for q in QUANTILES},
+            "buckets": {
+                str(2**exponent): count
+                for exponent, count in sorted(self.buckets.items())
+            },
+        }
+
+    def merge(self, other: dict[str, Any]):
+        """
+        Adds the durations of another histogram, as returned by to_dict()
+        """
+        if not other["count"]:
+            return
+        self.count += other["count"]
+        self.total += other["total"]
+        self.minimum = min(self.minimum, other["min"])
+        self.maximum = max(self.maximum, other["max"])
+        for bound, count in other["buckets"].items():
+            exponent = frexp(float(bound))[1] - 1
+            self.buckets[exponent] = self.buckets.get(exponent, 0) + count
+
+
+class Metrics:
+    """
+    The counters and histograms recorded so far, by name and labels.
+    Snapshots key them by metric_key.
+    """
+
+    counters: dict[tuple[str, Labels], int]
+    histograms: dict[tuple[str, Labels], Histogram]
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, name: str, *labels, amount: int = 1):
+        key = name, labels
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, *labels):
+        key = name, labels
+        if (histogram := self.histograms.get(key)) is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        The metrics as JSON-serializable dicts, durations being in seconds.
+        Taken while other threads record, it may miss their latest records.
+        """
+        return {
+            "counters": {
+                metric_key(*key): amount for key, amount in list(self.counters.items())
+            },
+            "histograms": {
+                metric_key(*key): histogram.to_dict()
+                for key, histogram in list(self.histograms.items())
+            },
+        }
+
+    def merge(self, snapshot: dict[str, Any]):
+        """
+        Adds the metrics of a snapshot, e.g. taken by another process
+        """
+        for key, amount in snapshot["counters"].items():
+            key = parse_metric_key(key)
+            self.counters[key] = self.counters.get(key, 0) + amount
+        for key, histogram in snapshot["histograms"].items():
+            key = parse_metric_key(key)
+            self.histograms.setdefault(key, Histogram()).merge(histogram)
+
+    def dump(self, path: Union[str, os.PathLike]):
+        """
+        Writes a snapshot to a JSON file, replacing it at once so that readers
+        never see half of it
+        """
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+        os.replace(temporary, path)
+
+
+class PeriodicDump:
+    """
+    Dumps the metrics to a file every few seconds, from a daemon thread
+    """
+
+    def __init__(
+        self, metrics: Metrics, path: Union[str, os.PathLike], interval: float
+    ):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="metrics dump", daemon=True
+        )
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.metrics.dump(self.path)
+
+    def close(self):
+        """
+        Stops the thread, then dumps the metrics one last time
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.metrics.dump(self.path)
+
+
+recorded = Metrics()
+dumper: Optional[PeriodicDump] = None
+
+
+def enable(
+    path: Union[str, os.PathLike, None] = None, interval: float = DUMP_INTERVAL
+):
+    """
+    Starts recording metrics, and dumping them to `path` every `interval` seconds
+    and at exit if it is given
+    """
+    global enabled, dumper
+    enabled = True
+    if path is not None and dumper is None:
+        dumper = PeriodicDump(recorded, path, interval)
+        atexit.register(dumper.close)
+
+
+def disable():
+    """
+    Stops recording metrics, and dumping them after a last time
+    """
+    global enabled, dumper
+    enabled = False
+    if dumper is not None:
+        atexit.unregister(dumper.close)
+        dumper.close()
+        dumper = None
+
+
+def count(name: str, *labels, amount: int = 1):
+    recorded.count(name, *labels, amount=amount)
+
+
+def observe(name: str, seconds: float, *labels):
+    recorded.observe(name, seconds, *labels)
+
+
+def snapshot() -> dict[str, Any]:
+    return recorded.snapshot()
+
+
+def merge(snapshot: dict[str, Any]):
+    recorded.merge(snapshot)
+
+
+def reset():
+    """
+    Forgets the metrics recorded so far
+    """
+    global recorded
+    recorded = Metrics()
+    if dumper is not None:
+        dumper.metrics = recorded
@@ -0,0 +1,71 @@
+import json
+import os
+import random
+from tempfile import TemporaryDirectory
+from time import sleep
+from ai import HuntTarget, ParityHuntTarget
+from game import ai_game
+import metrics
+
+
+def play_measured() -> tuple:
+    random.seed(0)
+    metrics.reset()
+    metrics.enable()
+    try:
+        game = ai_game(HuntTarget, ParityHuntTarget, grid_size=8)
+        game.play()
+        game.players[0].own_board.legal
+    finally:
+        metrics.disable()
+    return game, metrics.snapshot()
+
+
+def test_games_are_measured_by_strategy_and_size():
+    game, snapshot = play_measured()
+    counters, histograms = snapshot["counters"], snapshot["histograms"]
+    for player in game.players:
+        strategy = type(player.strategy).__name__
+        shots = player.ennemy_board.shots_fired
+        assert counters[f"shots/{strategy}/8"] == shots
+        assert histograms[f"shot/{strategy}/8"]["count"] == shots
+        assert histograms[f"decision/{strategy}/8"]["count"] == shots
+        assert histograms[f"turn/{strategy}/8"]["count"] == shots
+        assert histograms[f"placement/{strategy}/8"]["count"] == 1
+    assert counters[f"wins/{type(game.winner.strategy).__name__}/8"] == 1
+    assert histograms["legality/HuntTarget/8"]["count"] == 1
+    turns = histograms["turn/HuntTarget/8"]
+    assert 0 < turns["min"] <= turns["p50"] <= turns["p99"] <= turns["max"]
+    assert sum(turns["buckets"].values()) == turns["count"]
+
+    metrics.reset()
+    ai_game(HuntTarget, HuntTarget).play()
+    assert metrics.snapshot() == {"counters": {}, "histograms": {}}
+
+
+def test_snapshots_merge_and_dump_periodically():
+    _, snapshot = play_measured()
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "metrics.json")
+        metrics.reset()
+        metrics.enable(path, interval=0.01)
+        metrics.merge(snapshot)
+        metrics.merge(json.loads(json.dumps(snapshot)))
+        sleep(0.1)
+        with open(path) as file:
+            dumped = json.load(file)
+        metrics.disable()
+
+    for key, amount in snapshot["counters"].items():
+        assert dumped["counters"][key] == 2 * amount
+    for key, histogram in snapshot["histograms"].items():
+        merged = dumped["histograms"][key]
+        assert merged["count"] == 2 * histogram["count"]
+        assert merged["buckets"] == {
+            bound: 2 * count for bound, count in histogram["buckets"].items()
+        }
+        assert (merged["min"], merged["max"]) == (histogram["min"], histogram["max"])
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
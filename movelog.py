@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+"""
+Records games as compact binary logs, and replays them.
+
+    python movelog.py game.bnlog              # replays the game at full speed
+    python movelog.py game.bnlog --gui --delay 0.2 --start 40
+    python movelog.py game.bnlog --fast       # jumps to the end, checking nothing
+
+A log is written as the game goes, only ever appending to the file:
+- a header: grid size, fleet, seed, and both players' ship layouts as bitmasks;
+- then one fixed-width record per shot: (cell << 2) | (player << 1) | hit,
+  cell being x * grid_size + y. Records take 2 bytes on boards up to 128x128,
+  4 bytes up to 32768x32768;
+- after every `keyframe_interval` shots, a keyframe: both players' shot counts
+  and hits and misses as bitmasks, to seek into a long game without replaying it all.
+"""
+import struct
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Any, Iterator, Optional, Type
+import numpy
+from backends import Backend, GridBackend
+from board import Board, ControlledBoard, MISSED, SHIP, SUNKEN, UNKNOWN, WATER
+from game import AIPacing, Game, Pacing, TurnScheduler
+from placements import array_to_mask
+from player import Player, ReplayPlayer, SHOOTING
+
+MAGIC = b"BNLOG"
+VERSION = 1
+KEYFRAME_INTERVAL = 1024
+# magic, version, flags, grid size, keyframe interval, record width, fleet size, seed
+HEADER = struct.Struct("<5sBBIIBBQ")
+# Header flags
+HAS_SEED = 1
+# shots fired and missed by each player, before the keyframe's bitmasks
+KEYFRAME_COUNTS = struct.Struct("<4I")
+RECORD_DTYPES = {2: "<u2", 4: "<u4", 8: "<u8"}
+
+
+def record_width(grid_size: int) -> int:
+    """
+    Number of bytes of a shot record
+    """
+    largest = (grid_size * grid_size - 1) << 2 | 0b11
+    return next(width for width in RECORD_DTYPES if largest < 1 << (8 * width))
+
+
+def mask_bytes(grid_size: int) -> int:
+    return (grid_size * grid_size + 7) // 8
+
+
+class MoveLogWriter:
+    """
+    Records the moves of a game to a log file, as they are played.
+    Create it once ships are placed, before the first shot.
+    Writes are buffered: close the writer (or use it as a context manager)
+    to make sure everything reaches the file.
+    """
+
+    game: Game
+    grid_size: int
+    keyframe_interval: int
+    record_width: int
+    moves: int
+    # Shots fired and missed by each player
+    shots: list[list[int]]
+    # Cells each player hit or missed, to write keyframes
+    hits: numpy.ndarray
+    misses: numpy.ndarray
+
+    def __init__(
+        self,
+        path: str,
+        game: Game,
+        seed: Optional[int] = None,
+        keyframe_interval: int = KEYFRAME_INTERVAL,
+        buffer_size: int = 1 << 16,
+    ):
+        if len(game.players) != 2:
+            raise ValueError("Only two-player games can be recorded")
+        self.game = game
+        self.grid_size = game.grid_size
+        self.keyframe_interval = keyframe_interval
+        self.record_width = record_width(self.grid_size)
+        self.moves = 0
+        self.shots = [[0, 0], [0, 0]]
+        cells = self.grid_size * self.grid_size
+        self.hits = numpy.zeros((2, cells), dtype=bool)
+        self.misses = numpy.zeros((2, cells), dtype=bool)
+
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                HAS_SEED if seed is not None else 0,
+                self.grid_size,
+                keyframe_interval,
+                self.record_width,
+                len(game.fleet),
+                (seed or 0) & ((1 << 64) - 1),
+            )
+        )
+        self.file.write(bytes(game.fleet))
+        for player in game.players:
+            board = player.own_board
+            self.write_mask(board.mask(SHIP) | board.mask(SUNKEN))
+        game.subscribe_moves(self.record)
+
+    def write_mask(self, mask: int):
+        self.file.write(mask.to_bytes(mask_bytes(self.grid_size), "little"))
+
+    def record(self, player: Player, x: int, y: int, hit: bool):
+        cell = x * self.grid_size + y
+        self.file.write(
+            (cell << 2 | player.index << 1 | hit).to_bytes(self.record_width, "little")
+        )
+        self.shots[player.index][0] += 1
+        self.shots[player.index][1] += not hit
+        (self.hits if hit else self.misses)[player.index, cell] = True
+        self.moves += 1
+        if self.moves % self.keyframe_interval == 0:
+            self.file.write(KEYFRAME_COUNTS.pack(*self.shots[0], *self.shots[1]))
+            for index in range(2):
+                self.write_mask(array_to_mask(self.hits[index]))
+                self.write_mask(array_to_mask(self.misses[index]))
+
+    def close(self):
+        self.game.move_listeners.remove(self.record)
+        self.file.close()
+
+    def __enter__(self) -> "MoveLogWriter":
+        return self
+
+    def __exit__(self, *_: Any):
+        self.close()
+
+
+def load_board(board: Board, states: list[int], codes: numpy.ndarray):
+    """
+    Sets all of the board's cells at once, cell i to states[codes[i]],
+    by loading them into its backend as bit planes (see Board.load_cells)
+    """
+    planes = numpy.concatenate(
+        [
+            numpy.packbits(codes & 1, bitorder="little"),
+            numpy.packbits(codes >> 1, bitorder="little"),
+        ]
+    )
+    counts = numpy.bincount(codes, minlength=len(states)).tolist()
+    board.load_cells(planes.tobytes(), 0, states, dict(zip(states, counts)))
+
+
+class MoveLogState:
+    """
+    What both players know after some moves of a logged game
+    """
+
+    # shots[player] = (fired, missed)
+    shots: numpy.ndarray
+    # hits[player, cell], misses[player, cell]
+    hits: numpy.ndarray
+    misses: numpy.ndarray
+
+    def __init__(
+        self, shots: numpy.ndarray, hits: numpy.ndarray, misses: numpy.ndarray
+    ):
+        self.shots = shots
+        self.hits = hits
+        self.misses = misses
+
+
+class MoveLog:
+    """
+    A log file being read. Shots are decoded in bulk, with numpy.
+    """
+
+    grid_size: int
+    fleet: list[int]
+    seed: Optional[int]
+    keyframe_interval: int
+    record_width: int
+    # layouts[player, cell], True for the player's ship cells
+    layouts: numpy.ndarray
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.data = file.read()
+        magic, version, flags, size, interval, width, fleet_size, seed = (
+            HEADER.unpack_from(self.data)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} move log")
+        self.grid_size = size
+        self.keyframe_interval = interval
+        self.record_width = width
+        self.seed = seed if flags & HAS_SEED else None
+        offset = HEADER.size
+        self.fleet = list(self.data[offset : offset + fleet_size])
+        offset += fleet_size
+        self.layouts = numpy.stack(
+            [self.read_mask(offset + i * self.mask_bytes) for i in range(2)]
+        )
+        self.moves_offset = offset + 2 * self.mask_bytes
+
+    @property
+    def mask_bytes(self) -> int:
+        return mask_bytes(self.grid_size)
+
+    @property
+    def keyframe_bytes(self) -> int:
+        return KEYFRAME_COUNTS.size + 4 * self.mask_bytes
+
+    @property
+    def chunk_bytes(self) -> int:
+        """
+        Size of the records between two keyframes, and of the keyframe
+        """
+        return self.keyframe_interval * self.record_width + self.keyframe_bytes
+
+    def read_mask(self, offset: int) -> numpy.ndarray:
+        raw = numpy.frombuffer(self.data, numpy.uint8, self.mask_bytes, offset)
+        return numpy.unpackbits(raw, bitorder="little")[
+            : self.grid_size * self.grid_size
+        ].astype(bool)
+
+    def __len__(self) -> int:
+        """
+        Number of moves recorded. Partly written records at the end are ignored.
+        """
+        chunks, rest = divmod(len(self.data) - self.moves_offset, self.chunk_bytes)
+        return chunks * self.keyframe_interval + min(
+            rest // self.record_width, self.keyframe_interval
+        )
+
+    @property
+    def keyframes(self) -> int:
+        """
+        Number of keyframes completely written
+        """
+        return (len(self.data) - self.moves_offset) // self.chunk_bytes
+
+    def offset(self, move: int) -> int:
+        """
+        Position in the file of the record of the given move
+        """
+        return (
+            self.moves_offset
+            + move * self.record_width
+            + move // self.keyframe_interval * self.keyframe_bytes
+        )
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> numpy.ndarray:
+        """
+        The raw records of moves start to stop (excluded)
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        dtype = RECORD_DTYPES[self.record_width]
+        chunks = []
+        while start < stop:
+            # Records are contiguous until the next keyframe
+            interval = self.keyframe_interval
+            count = min(stop, (start // interval + 1) * interval) - start
+            chunks.append(numpy.frombuffer(self.data, dtype, count, self.offset(start)))
+            start += count
+        return numpy.concatenate(chunks) if chunks else numpy.zeros(0, dtype)
+
+    def decode(
+        self, start: int = 0, stop: Optional[int] = None
+    ) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        Players, cells and whether they hit, of moves start to stop (excluded)
+        """
+        records = self.records(start, stop).astype(numpy.int64)
+        return (records >> 1) & 1, records >> 2, (records & 1).astype(bool)
+
+    def moves(
+        self, start: int = 0, stop: Optional[int] = None
+    ) -> Iterator[tuple[int, int, int, bool]]:
+        """
+        Yields the player, row, column and result of moves start to stop (excluded)
+        """
+        players, cells, hits = self.decode(start, stop)
+        rows, columns = numpy.divmod(cells, self.grid_size)
+        yield from zip(players.tolist(), rows.tolist(), columns.tolist(), hits.tolist())
+
+    def keyframe(self, number: int) -> MoveLogState:
+        """
+        The state after number * keyframe_interval moves, read from its keyframe
+        """
+        if number == 0:
+            cells = self.grid_size * self.grid_size
+            return MoveLogState(
+                numpy.zeros((2, 2), dtype=numpy.int64),
+                numpy.zeros((2, cells), dtype=bool),
+                numpy.zeros((2, cells), dtype=bool),
+            )
+        offset = self.offset(number * self.keyframe_interval) - self.keyframe_bytes
+        shots = numpy.array(KEYFRAME_COUNTS.unpack_from(self.data, offset))
+        shots = shots.reshape(2, 2)
+        offset += KEYFRAME_COUNTS.size
+        masks = [self.read_mask(offset + i * self.mask_bytes) for i in range(4)]
+        return MoveLogState(shots, numpy.stack(masks[0::2]), numpy.stack(masks[1::2]))
+
+    def state_at(self, move: int) -> MoveLogState:
+        """
+        The state after the given number of moves, from the closest keyframe before it
+        that was completely written
+        """
+        move = min(move, len(self))
+        number = min(move // self.keyframe_interval, self.keyframes)
+        state = self.keyframe(number)
+        players, cells, hits = self.decode(number * self.keyframe_interval, move)
+        state.hits[players[hits], cells[hits]] = True
+        state.misses[players[~hits], cells[~hits]] = True
+        numpy.add.at(state.shots[:, 0], players, 1)
+        numpy.add.at(state.shots[:, 1], players[~hits], 1)
+        return state
+
+    def game(self, start: int = 0, backend: Type[Backend] = GridBackend) -> Game:
+        """
+        Sets up the game as it was after `start` moves, with players replaying
+        the rest of the log: play it with a TurnScheduler, or Game.play()
+        """
+        game = Game(self.grid_size, self.fleet)
+        boards = [
+            ControlledBoard(game, self.grid_size, self.fleet, backend=backend)
+            for _ in range(2)
+        ]
+        players, cells, hits = self.decode(start)
+        rows, columns = numpy.divmod(cells, self.grid_size)
+        game.players = [
+            ReplayPlayer(
+                game,
+                boards[index],
+                boards[1 - index],
+                index,
+                zip(
+                    rows[players == index].tolist(),
+                    columns[players == index].tolist(),
+                    hits[players == index].tolist(),
+                ),
+            )
+            for index in range(2)
+        ]
+
+        # Boards are set in bulk, decoding moves being the only per-move work
+        state = self.state_at(start)
+        for index, player in enumerate(game.players):
+            shooter = 1 - index
+            own = self.layouts[index].astype(numpy.uint8)
+            own[state.hits[shooter]] = 2
+            own[state.misses[shooter]] = 3
+            load_board(player.own_board, [WATER, SHIP, SUNKEN, MISSED], own)
+            player.own_board.lock()
+
+            known = numpy.zeros(self.grid_size * self.grid_size, dtype=numpy.uint8)
+            known[state.hits[index]] = 1
+            known[state.misses[index]] = 2
+            board = player.ennemy_board
+            load_board(board, [UNKNOWN, SUNKEN, MISSED], known)
+            board.shots_fired, board.shots_missed = map(int, state.shots[index])
+
+        game.phase = SHOOTING
+        if len(players):
+            game.current_player_index = int(players[0])
+        return game
+
+
+def replay(log: MoveLog, start: int = 0, pacing: Pacing = None) -> Player:
+    """
+    Replays the log through the engine, from the given move, checking each shot's
+    result. Returns the winner, raises RuntimeError if the log ends before someone wins.
+    """
+    return TurnScheduler(log.game(start), pacing).run()
+
+
+def fast_forward(log: MoveLog) -> Player:
+    """
+    Sets up the game as it was at the end of the log, with the moves decoded in bulk
+    and applied straight to the boards (see MoveLog.game), instead of being
+    played one by one: results are not checked.
+    Returns the winner, raises RuntimeError if the log ends before someone wins.
+    """
+    winner = log.game(len(log)).winner
+    if winner is None:
+        raise RuntimeError("The log ends before someone wins")
+    return winner
+
+
+def replay_in_window(log: MoveLog, start: int = 0, delay: float = 0.1):
+    from tkinter import Label, Tk
+    from main import TkTurnScheduler
+    from view import CanvasBoardView
+
+    game = log.game(start)
+    root = Tk()
+    root.title("Bataille navale")
+    for index, player in enumerate(game.players):
+        Label(root, text=player.name).grid(column=index, row=0)
+        CanvasBoardView(root, player.ennemy_board).render(index, 1)
+    TkTurnScheduler(game, root, AIPacing(delay)).wake()
+    root.mainloop()
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("log")
+    parser.add_argument("--start", type=int, default=0, help="move to start from")
+    parser.add_argument(
+        "--gui", action="store_true", help="show the game in a window"
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0.1, help="seconds between moves, with --gui"
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="go straight to the end, without playing moves through the engine",
+    )
+    args = parser.parse_args()
+
+    log = MoveLog(args.log)
+    if args.gui:
+        replay_in_window(log, args.start, args.delay)
+        return
+    started = perf_counter()
+    winner = fast_forward(log) if args.fast else replay(log, args.start)
+    elapsed = perf_counter() - started
+    print(
+        f"{winner.name} won after {len(log)} moves,"
+        f" replayed in {elapsed:.3f}s"
+        f" ({(len(log) - args.start) / elapsed:.0f} moves/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
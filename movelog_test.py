@@ -0,0 +1,71 @@
+import os
+import random
+from tempfile import TemporaryDirectory
+from ai import HuntTarget
+from game import ai_game
+from game import TurnScheduler
+from movelog import MoveLog, MoveLogWriter, fast_forward, replay
+
+
+def test_MoveLog_replays_and_seeks():
+    random.seed(3)
+    game = ai_game(HuntTarget, HuntTarget, grid_size=30)
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "game.bnlog")
+        with MoveLogWriter(path, game, seed=3, keyframe_interval=50) as writer:
+            winner = game.play()
+        log = MoveLog(path)
+
+    moves = sum(player.ennemy_board.shots_fired for player in game.players)
+    assert len(log) == moves == writer.moves
+    assert (log.grid_size, log.fleet, log.seed) == (30, game.fleet, 3)
+    assert log.record_width == 2
+    for start in (0, 49, 50, 51, moves // 2, moves):
+        replayed = log.game(start)
+        assert TurnScheduler(replayed).run().index == winner.index
+        for original, player in zip(game.players, replayed.players):
+            assert player.own_board.state == original.own_board.state
+            assert player.ennemy_board.state == original.ennemy_board.state
+            assert player.ennemy_board.shots_fired == original.ennemy_board.shots_fired
+
+
+def test_MoveLog_ignores_partly_written_records():
+    random.seed(4)
+    game = ai_game(HuntTarget, HuntTarget)
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "game.bnlog")
+        with MoveLogWriter(path, game):
+            game.play()
+        with open(path, "ab") as file:
+            file.write(b"\x01")
+        log = MoveLog(path)
+    assert log.seed is None
+    assert len(log) == sum(p.ennemy_board.shots_fired for p in game.players)
+    assert replay(log).index == game.winner.index
+
+
+def test_MoveLog_ignores_partly_written_keyframes():
+    random.seed(5)
+    game = ai_game(HuntTarget, HuntTarget, grid_size=30)
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "game.bnlog")
+        with MoveLogWriter(path, game, keyframe_interval=50):
+            winner = game.play()
+        complete = MoveLog(path)
+        assert fast_forward(complete).index == winner.index
+        # Interrupted while writing the second keyframe
+        with open(path, "r+b") as file:
+            file.truncate(complete.offset(100) - complete.keyframe_bytes // 2)
+        log = MoveLog(path)
+
+    assert (len(log), log.keyframes) == (100, 1)
+    expected = complete.state_at(100)
+    state = log.state_at(100)
+    for name in ("shots", "hits", "misses"):
+        assert (getattr(state, name) == getattr(expected, name)).all()
+    for original, player in zip(complete.game(100).players, log.game(100).players):
+        assert player.ennemy_board.state == original.ennemy_board.state
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+"""
+Plays games between two computers over TCP, with asyncio.
+
+    python network.py --listen 9000 --strategy ParityHuntTarget
+    python network.py --connect localhost:9000 --strategy HuntTarget
+    python network.py --loopback --games 100
+
+Each peer runs its own Game, knowing its own ships only, and they talk directly
+to each other (see the "no middle-man" timeline in classes.puml):
+
+    P1 -> P2: Ready.                    P2 -> P1: Ready.
+    P1 -> P2: Shoot at (x, y)           P2 -> P1: Done. You HIT/MISSED
+    P1 -> P2: Finished updating my board (: You WON/LOST)
+    ... then P2 shoots, and so on.
+
+The peer that listens is player 1, and shoots first.
+Messages are framed as a 2-byte length, a 1-byte type and a fixed-size payload.
+"""
+import asyncio
+import random
+import struct
+from argparse import ArgumentParser
+from collections import deque
+from statistics import median
+from time import perf_counter
+from typing import Optional, Type
+from ai import Strategy, NoStrategy, strategies
+from backends import Backend, GridBackend
+from board import ControlledBoard, MISSED, SUNKEN
+from game import Game, GRID_SIZE, Pacing, TurnScheduler
+from player import AIPlayer, HumanPlayer, Player, FLEET, SHOOTING
+
+# Message types
+READY = 1
+SHOOT = 2
+RESULT = 3
+UPDATED = 4
+MESSAGE_NAMES = {READY: "READY", SHOOT: "SHOOT", RESULT: "RESULT", UPDATED: "UPDATED"}
+# Payloads: grid size and number of ships (followed by their lengths),
+# coordinates, HIT and WON flags, game over flag
+PAYLOADS = {
+    READY: struct.Struct("<IB"),
+    SHOOT: struct.Struct("<II"),
+    RESULT: struct.Struct("<B"),
+    UPDATED: struct.Struct("<B"),
+}
+LENGTH = struct.Struct("<H")
+# RESULT flags
+HIT = 1
+WON = 2
+
+
+class ProtocolError(Exception):
+    """
+    The peer sent something unexpected, or left in the middle of the game
+    """
+
+
+def frame(
+    kind: int,
+    *values: int,
+    extra: bytes = b"",
+    payloads: dict[int, struct.Struct] = PAYLOADS,
+) -> bytes:
+    payload = bytes((kind,)) + payloads[kind].pack(*values) + extra
+    return LENGTH.pack(len(payload)) + payload
+
+
+async def read_message(
+    reader: asyncio.StreamReader, payloads: dict[int, struct.Struct] = PAYLOADS
+) -> tuple[int, tuple, bytes]:
+    """
+    Reads a message, returns its type, its payload's values and the bytes after them.
+    `payloads` gives the format of the payload of each type of message.
+    """
+    try:
+        (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+        message = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError) as error:
+        raise ProtocolError("The peer left") from error
+    kind = message[0] if message else None
+    if kind not in payloads or length < 1 + payloads[kind].size:
+        raise ProtocolError(f"Malformed message {message!r}")
+    values = payloads[kind].unpack_from(message, 1)
+    return kind, values, message[1 + payloads[kind].size :]
+
+
+class RemoteBoard(ControlledBoard):
+    """
+    The peer's board, as far as we know it: shots' results are told by the peer,
+    which is the only one to know where its ships are.
+    """
+
+    # Results of shots told by the peer, until they are fired at
+    results: dict[tuple[int, int], bool]
+    # Whether the peer said all its ships were sunk
+    sunk: bool
+
+    def __init__(self, game: "Game", grid_size: int, fleet: list[int], **kwargs):
+        super().__init__(game, grid_size, fleet, **kwargs)
+        self.results = {}
+        self.sunk = False
+
+    def fire(self, x: int, y: int) -> bool:
+        hit = self.results.pop((x, y))
+        self.change_cell(x, y, SUNKEN if hit else MISSED)
+        return hit
+
+    @property
+    def remaining_ship_cells(self) -> int:
+        if self.sunk:
+            return 0
+        return max(self.total_ships - self.count(SUNKEN), 1)
+
+    @property
+    def legal(self) -> bool:
+        return True
+
+
+class RemotePlayer(Player):
+    """
+    A player on the other end of a connection: its moves are the shots received
+    from it, see PeerSession. Its board is a RemoteBoard when only the peer
+    knows where its ships are.
+    """
+
+    moves: deque[tuple[int, int]]
+
+    def __init__(
+        self,
+        game: "Game",
+        board: ControlledBoard,
+        ennemy_board: ControlledBoard,
+        index: int,
+        name: str = "Adversaire",
+    ) -> None:
+        super().__init__(game, board, ennemy_board, index, name, strategy=NoStrategy)
+        self.moves = deque()
+
+    def receive_move(self, x: int, y: int):
+        self.moves.append((x, y))
+        self.game.move_ready()
+
+    def next_move(self) -> Optional[tuple[int, int]]:
+        return self.moves.popleft() if self.moves else None
+
+    @property
+    def human(self) -> bool:
+        return False
+
+
+class PeerSession(TurnScheduler):
+    """
+    Plays a game against a peer over a stream connection, following the protocol
+    described at the top of this module: the local player's moves are sent to the
+    peer, the peer's are received and played through its RemotePlayer.
+    AI players decide in a thread, so that the event loop keeps running meanwhile.
+    """
+
+    local: Player
+    remote: RemotePlayer
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    # Set when a player got a move to play, see wake()
+    woken: Optional[asyncio.Event]
+    # Seconds between sending each shot and receiving its result
+    round_trips: list[float]
+
+    def __init__(
+        self,
+        game: Game,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        pacing: Pacing = None,
+    ):
+        super().__init__(game, pacing)
+        self.remote = next(p for p in game.players if isinstance(p, RemotePlayer))
+        self.local = next(p for p in game.players if p is not self.remote)
+        self.reader = reader
+        self.writer = writer
+        self.loop = None
+        self.woken = None
+        self.round_trips = []
+
+    def wake(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.woken.set)
+
+    async def wait(self):
+        await self.woken.wait()
+        self.woken.clear()
+
+    def send(self, kind: int, *values: int, extra: bytes = b""):
+        self.writer.write(frame(kind, *values, extra=extra))
+
+    async def expect(self, kind: int) -> tuple[tuple, bytes]:
+        received, values, extra = await read_message(self.reader)
+        if received != kind:
+            raise ProtocolError(
+                f"Expected {MESSAGE_NAMES[kind]}, got {MESSAGE_NAMES[received]}"
+            )
+        return values, extra
+
+    async def handshake(self):
+        """
+        Tells the peer we're ready once the local player placed their ships,
+        and waits until the peer is ready too
+        """
+        while self.game.phase != SHOOTING:
+            await self.wait()
+        fleet = self.game.fleet
+        self.send(READY, self.game.grid_size, len(fleet), extra=bytes(fleet))
+        (grid_size, _), peer_fleet = await self.expect(READY)
+        if grid_size != self.game.grid_size or list(peer_fleet) != list(fleet):
+            raise ProtocolError(
+                f"The peer plays on a {grid_size}x{grid_size} board"
+                f" with ships {list(peer_fleet)}"
+            )
+
+    async def local_move(self) -> tuple[int, int]:
+        while True:
+            if self.local.human:
+                move = self.local.next_move()
+            else:
+                move = await self.loop.run_in_executor(None, self.local.next_move)
+            if move is not None:
+                return move
+            await self.wait()
+
+    async def play_local_move(self):
+        x, y = await self.local_move()
+        started = perf_counter()
+        self.send(SHOOT, x, y)
+        ((flags,), _) = await self.expect(RESULT)
+        self.round_trips.append(perf_counter() - started)
+        self.remote.own_board.results[(x, y)] = bool(flags & HIT)
+        self.remote.own_board.sunk = bool(flags & WON)
+        self.game.apply_move(x, y)
+        self.send(UPDATED, self.game.winner is not None)
+
+    async def play_remote_move(self):
+        (x, y), _ = await self.expect(SHOOT)
+        if not self.local.own_board.within_bounds(x, y):
+            raise ProtocolError(f"The peer shot outside of the board, at {(x, y)}")
+        self.remote.receive_move(x, y)
+        hit = self.game.apply_move(*self.remote.next_move())
+        self.send(RESULT, hit * HIT | (self.remote.won * WON))
+        await self.expect(UPDATED)
+
+    async def play(self) -> Player:
+        """
+        Plays the game until someone wins, returns the winner
+        """
+        self.loop = asyncio.get_running_loop()
+        self.woken = asyncio.Event()
+        try:
+            await self.handshake()
+            while (winner := self.game.winner) is None:
+                if delay := self.pacing.delay(self.game.current_player):
+                    await asyncio.sleep(delay)
+                if self.game.current_player is self.local:
+                    await self.play_local_move()
+                else:
+                    await self.play_remote_move()
+            await self.writer.drain()
+            return winner
+        finally:
+            self.writer.close()
+
+
+def peer_game(
+    local_index: int,
+    grid_size: int = GRID_SIZE,
+    fleet: list[int] = FLEET,
+    strategy: Optional[Type[Strategy]] = None,
+    name: str = None,
+    game: Game = None,
+    backend: Type[Backend] = GridBackend,
+) -> Game:
+    """
+    Sets up a game between a local player, an AI playing `strategy` or a human
+    if it is None, and a RemotePlayer. The AI places its ships right away.
+    Players are added to `game` if given, to a new Game otherwise.
+    """
+    game = game or Game(grid_size, fleet)
+    local_board = ControlledBoard(game, grid_size, fleet, backend=backend)
+    remote_board = RemoteBoard(game, grid_size, fleet, backend=backend)
+    if strategy is None:
+        local = HumanPlayer(
+            game, local_board, remote_board, local_index, name or "Vous"
+        )
+    else:
+        local = AIPlayer(
+            game,
+            local_board,
+            remote_board,
+            strategy,
+            local_index,
+            name or strategy.__name__,
+        )
+    remote = RemotePlayer(game, remote_board, local_board, 1 - local_index)
+    game.players = sorted([local, remote], key=lambda player: player.index)
+    remote_board.lock()
+    if strategy is not None:
+        local.place_ships()
+        local_board.lock()
+        game.phase = SHOOTING
+    return game
+
+
+async def host(game: Game, port: int, address: str = "0.0.0.0") -> PeerSession:
+    """
+    Waits for a peer to connect, the local player being player 1
+    """
+    connected = asyncio.get_running_loop().create_future()
+    def accept(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if connected.done():
+            writer.close()
+        else:
+            connected.set_result((reader, writer))
+
+    server = await asyncio.start_server(accept, address, port)
+    async with server:
+        reader, writer = await connected
+    return PeerSession(game, reader, writer)
+
+
+async def join(game: Game, address: str, port: int) -> PeerSession:
+    """
+    Connects to a peer waiting with host(), the local player being player 2
+    """
+    reader, writer = await asyncio.open_connection(address, port)
+    return PeerSession(game, reader, writer)
+
+
+async def loopback(
+    first: Type[Strategy],
+    second: Type[Strategy],
+    grid_size: int = GRID_SIZE,
+    fleet: list[int] = FLEET,
+) -> tuple[PeerSession, PeerSession]:
+    """
+    Plays a game between two AIs connected through localhost, in this event loop.
+    Returns both sides' sessions, their games being over.
+    """
+    connected = asyncio.get_running_loop().create_future()
+    server = await asyncio.start_server(
+        lambda reader, writer: connected.set_result((reader, writer)), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        joined = await asyncio.open_connection("127.0.0.1", port)
+        hosted = await connected
+    sessions = (
+        PeerSession(peer_game(0, grid_size, fleet, first), *hosted),
+        PeerSession(peer_game(1, grid_size, fleet, second), *joined),
+    )
+    await asyncio.gather(*(session.play() for session in sessions))
+    return sessions
+
+
+def main():
+    available = strategies()
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--listen", type=int, metavar="PORT")
+    mode.add_argument("--connect", metavar="HOST:PORT")
+    mode.add_argument(
+        "--loopback",
+        action="store_true",
+        help="play against itself through localhost",
+    )
+    parser.add_argument("--strategy", choices=available.keys(), default="HuntTarget")
+    parser.add_argument("--opponent", choices=available.keys(), default="HuntTarget")
+    parser.add_argument("--games", type=int, default=1, help="with --loopback")
+    parser.add_argument("--grid-size", type=int, default=GRID_SIZE)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    strategy = available[args.strategy]
+
+    async def run():
+        if args.loopback:
+            round_trips = []
+            for _ in range(args.games):
+                sessions = await loopback(
+                    strategy, available[args.opponent], args.grid_size
+                )
+                round_trips += sessions[0].round_trips + sessions[1].round_trips
+            print(
+                f"{args.games} games, {len(round_trips)} moves,"
+                f" median round trip {median(round_trips) * 1e6:.0f} µs,"
+                f" slowest {max(round_trips) * 1e6:.0f} µs"
+            )
+            return
+        if args.listen:
+            print(f"Waiting for a peer on port {args.listen}…")
+            game = peer_game(0, args.grid_size, strategy=strategy)
+            session = await host(game, args.listen)
+        else:
+            address, port = args.connect.rsplit(":", 1)
+            session = await join(
+                peer_game(1, args.grid_size, strategy=strategy), address, int(port)
+            )
+        winner = await session.play()
+        print(f"{winner.name} won")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import asyncio
+import random
+from statistics import median
+from ai import HuntTarget, ParityHuntTarget
+from board import MISSED, SUNKEN
+from network import PeerSession, ProtocolError, loopback, peer_game
+
+
+def test_loopback_peers_agree():
+    random.seed(0)
+    hosted, joined = asyncio.run(loopback(HuntTarget, ParityHuntTarget))
+    assert hosted.game.winner.index == joined.game.winner.index
+    for session, other in ((hosted, joined), (joined, hosted)):
+        seen = session.remote.own_board
+        real = other.local.own_board
+        assert sorted(seen.cells(SUNKEN)) == sorted(real.cells(SUNKEN))
+        assert sorted(seen.cells(MISSED)) == sorted(real.cells(MISSED))
+    assert median(hosted.round_trips + joined.round_trips) < 0.01
+
+
+def test_peers_must_play_the_same_game():
+    async def play():
+        connected = asyncio.get_running_loop().create_future()
+        server = await asyncio.start_server(
+            lambda *streams: connected.set_result(streams), "127.0.0.1", 0
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            joined = await asyncio.open_connection("127.0.0.1", port)
+            hosted = await connected
+        sessions = (
+            PeerSession(peer_game(0, 10, strategy=HuntTarget), *hosted),
+            PeerSession(peer_game(1, 12, strategy=HuntTarget), *joined),
+        )
+        return await asyncio.gather(
+            *(session.play() for session in sessions), return_exceptions=True
+        )
+
+    results = asyncio.run(play())
+    assert all(isinstance(result, ProtocolError) for result in results)
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
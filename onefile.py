@@ -1,19 +1,225 @@
+from __future__ import annotations
+import sys
+import atexit
+import importlib.util
+import os
+import json
+import threading
+import mmap
 import random
-import tkinter
-from functools import partial
+from contextlib import contextmanager
+from time import perf_counter, sleep
+from typing import Iterator, Optional, TYPE_CHECKING, Callable, Any, TypeVar, Union, Iterable, Sequence, Type, Awaitable
+from queue import SimpleQueue
+from threading import Thread
+from types import ModuleType
+from math import frexp, sqrt
+from functools import lru_cache, cached_property, partial
+from collections import Counter
 from random import randint
-from tkinter import Button, Frame, Label, Place, StringVar, Tk
-from tkinter.constants import VERTICAL
-from typing import *
+from tkinter import Button, Canvas, Event, Frame, Misc, Scrollbar, StringVar, Tk, Label
+from argparse import ArgumentParser
+
+metrics = sys.modules[__name__]
+startup = sys.modules[__name__]
+
+
+## Startup
+
+"""
+Measures how long the game takes to start, when main.py is given --startup-profile:
+the time spent importing each module, and in each phase of the initialization.
+The report is printed once the boards are drawn.
+
+Imports are timed from the moment this module is imported,
+which is why main.py imports it before anything else.
+"""
+
+FLAG = "--startup-profile"
+# Number of modules listed in the report, slowest first
+SHOWN_MODULES = 15
+
+
+class ImportTimer:
+    """
+    Times the execution of the modules found by the other finders of sys.meta_path.
+    A module's own time excludes the modules it imports.
+    Finders and loaders are duck-typed: importing importlib.abc takes longer
+    than most of the game's own imports.
+    """
+
+    # Module name, milliseconds spent importing it and its own ones
+    timings: list[tuple[str, float, float]]
+    # Time spent in the modules being imported that they imported, innermost last
+    nested: list[float]
+
+    def __init__(self):
+        self.timings = []
+        self.nested = []
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = TimedLoader(spec.loader, self)
+        return spec
+
+    def time(self, name: str, execute):
+        self.nested.append(0)
+        start = perf_counter()
+        try:
+            execute()
+        finally:
+            elapsed = (perf_counter() - start) * 1000
+            children = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+            self.timings.append((name, elapsed, elapsed - children))
+
+
+class TimedLoader:
+    """
+    Wraps a module's loader, to time it with an ImportTimer
+    """
+
+    def __init__(self, loader, timer: ImportTimer):
+        self.loader = loader
+        self.timer = timer
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.timer.time(module.__name__, lambda: self.loader.exec_module(module))
+
+    def __getattr__(self, name: str):
+        return getattr(self.loader, name)
+
+
+class StartupProfile:
+    """
+    Phases of the initialization and imports, in milliseconds since the profile started
+    """
+
+    started: float
+    timer: ImportTimer
+    # Name, start and duration of each phase, in order
+    phases: list[tuple[str, float, float]]
+    reported: bool
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.timer = ImportTimer()
+        self.phases = []
+        self.reported = False
+        sys.meta_path.insert(0, self.timer)
+
+    def since_start(self) -> float:
+        return (perf_counter() - self.started) * 1000
+
+    def report(self) -> str:
+        lines = [f"{'phase':<30} {'start':>10} {'duration':>10}"]
+        for name, start, duration in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"{name:<30} {start:>8.1f}ms {duration:>8.1f}ms")
+        lines.append("")
+        lines.append(f"{'import':<30} {'total':>10} {'own':>10}")
+        slowest = sorted(self.timer.timings, key=lambda timing: -timing[1])
+        for name, total, own in slowest[:SHOWN_MODULES]:
+            lines.append(f"{name:<30} {total:>8.1f}ms {own:>8.1f}ms")
+        return "\n".join(lines)
+
+
+profile: Optional[StartupProfile] = StartupProfile() if FLAG in sys.argv else None
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Times what runs in the block as a phase of the startup, if it is being profiled
+    """
+    if profile is None:
+        yield
+        return
+    start = profile.since_start()
+    try:
+        yield
+    finally:
+        profile.phases.append((name, start, profile.since_start() - start))
+
+
+@contextmanager
+def paused() -> Iterator[None]:
+    """
+    Leaves what runs in the block out of the startup's time, e.g. waiting for the user
+    """
+    if profile is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        profile.started += perf_counter() - start
+
+
+def milestone(name: str):
+    """
+    Records that the startup reached some point, e.g. the window being shown
+    """
+    if profile is not None:
+        profile.phases.append((name, profile.since_start(), 0))
+
+
+def report():
+    """
+    Prints the startup profile to stderr, the first time it is called
+    """
+    if profile is None or profile.reported:
+        return
+    profile.reported = True
+    sys.meta_path.remove(profile.timer)
+    print(profile.report(), file=sys.stderr)
 
-try:
-    from rich import print
-    from rich import print as pprint
-except ImportError:
-    from pprint import pprint
 
 ## Utils
 
+if TYPE_CHECKING:
+    import tkinter
+    from concurrent.futures import Future
+
+
+def print(*args, **kwargs):
+    """
+    rich's print, which is only imported once something gets printed
+    """
+    from rich import print
+
+    print(*args, **kwargs)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Imports a module the first time one of its attributes is used, to start faster.
+    Annotations using it have to be postponed (see PEP 563).
+    Use it from a single thread first: loading is not thread-safe before Python 3.12.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
 def handle(
     method: Callable[[int, int], Any],
     x: int,
@@ -32,7 +238,7 @@ def handle(
 K, V, H = TypeVar("K"), TypeVar("T"), TypeVar("Hashable_V")
 
 
-def dict_reciprocal(o, key: Callable[[V], H] = lambda x: x) :
+def dict_reciprocal(o: dict[K, V], key: Callable[[V], H] = lambda x: x) -> dict[V, H]:
     return {key(v): k for k, v in o.items()}
 
 
@@ -47,645 +253,3559 @@ def doublerange(outer, inner=None):
             yield a, b
 
 
-def d(text: str, *args, **kwargs):
-    print("[dim]\[debug][/] " + text, *args, **kwargs)
+# Log levels
+OFF = 0
+INFO = 1
+DEBUG = 2
+TRACE = 3
+LOG_LEVELS = {"off": OFF, "info": INFO, "debug": DEBUG, "trace": TRACE}
+LOG_LEVEL_NAMES = dict_reciprocal(LOG_LEVELS)
+LOG_LEVEL_ENV_VAR = "BATAILLE_NAVALE_LOG"
 
+Message = Union[str, Callable[[], str]]
 
-def french_join(elements: Union[list, tuple]) -> str:
-    return ", ".join(map(str, elements[:-1])) + " et " + str(elements[-1])
-## Board
+log_level = LOG_LEVELS.get(os.environ.get(LOG_LEVEL_ENV_VAR, "off").lower(), OFF)
 
-# Constantes
-WATER = 0  # Eau (case vide)
-SHIP = 1  # Occupé (case avec un bateau non coulé, pour les ControlledBoards seulement)
-SUNKEN = 2  # Coulé
-UNKNOWN = 3  # Pour les ProjectiveBoards seulement
-MISSED = 4 # Case d'eau mais touchée
 
-# Les états à afficher par rapport à leur code
-CELL_DISPLAY_STATES = {
-    SUNKEN: {"text": "T️", "bg": "red"}, # T comme touché
-    SHIP: {"text": "B", "bg": "white"}, # B comme bateau
-    WATER: {"text": "E", "bg": "blue"}, # E comme eau
-    MISSED: {"text": "M", "bg": "cyan"}, # M comme manqué
-    UNKNOWN: {"text": "?", "bg": "grey"}, 
-}
+def set_log_level(level: Union[int, str]):
+    """
+    Sets the most verbose level that gets logged, as an integer or one of LOG_LEVELS' names
+    """
+    global log_level
+    log_level = LOG_LEVELS[level.lower()] if isinstance(level, str) else level
 
-DESTROYER = 2
-CRUISER = 3
-SUBMARINE = 3
-BATTLESHIP = 4
-AIRCRAFT_CARRIER = 5
 
-HORIZONTAL = 10
-VERTICAL = 20
+def logging_at(level: int) -> bool:
+    """
+    Whether messages of that level are logged.
+    Use it to skip whole blocks of logging code in hot loops.
+    """
+    return level <= log_level
 
 
-class Board:
-    size: int
-    game: "Game"
-    owner: "Player"
-    locked: bool
+def print_sink(text: str, args: tuple, kwargs: dict):
+    print(text, *args, **kwargs)
 
-    def __init__(
-        self, game: "Game", grid_size: int, initial_state: int, owner: "Player"
-    ):
-        self.size = grid_size
-        self.cells = []
-        self.state = []
-        self.mainframe = Frame(game.root)
-        self.game = game
-        self.owner = owner
-        self.locked = False
 
-        for x in range(self.size):
-            self.cells.append([])
-            self.state.append([])
-            for y in range(self.size):
-                cell = Button(self.mainframe, text=f"{x}:{y}")
-                cell.bind("<Button-1>", partial(handle, self.handle_cell_Button1, x, y))
-                cell.bind("<Button-3>", partial(handle, self.handle_cell_Button3, x, y))
-                self.cells[x].append(cell)
-                self.state[x].append(initial_state)
-                self.change_cell(x, y, initial_state)
-                cell.grid(row=x, column=y)
+class BackgroundSink:
+    """
+    Prints log messages from a daemon thread,
+    so that logging never blocks the tkinter event loop or a simulation.
+    """
 
-    def __matmul__(self, coords):
-        """aesthetics: @ (x, y) to get cell state at (x, y)"""
-        return self.state[coords[0]][coords[1]]
+    def __init__(self):
+        self.queue = SimpleQueue()
+        self.thread = Thread(target=self.run, name="log sink", daemon=True)
+        self.thread.start()
 
-    def handle_cell_Button1(self, x: int, y: int):
-        self.d(f"handling <Button 1> x={x}, y={y}")
+    def __call__(self, text: str, args: tuple, kwargs: dict):
+        self.queue.put((text, args, kwargs))
 
-    def handle_cell_Button3(self, x: int, y: int):
-        self.d(f"handling <Button 3> x={x}, y={y}")
+    def run(self):
+        while (message := self.queue.get()) is not None:
+            print_sink(*message)
 
-    def set_state(self, new_state):
+    def close(self):
         """
-        Sets the entire board's state to the one given.
-        A state is represented as a 2D array of state integers (see Démineur.change_cell)
+        Prints the remaining messages and stops the thread
         """
-        for x, y in doublerange(self.size):
-            self.change_cell(x, y, new_state[x][y])
+        self.queue.put(None)
+        self.thread.join()
 
-    def change_cell(self, x: int, y: int, state: int):
-        """
-        Sets the state of the specified cell at row x column y.
-        A state is represented as an integer:
-        - 2 (or SUNKEN) represents a sunken spot
-        - 1 (or SHIP) represents a ship spot (for ControlledBoards)
-        - 0 (or WATER) represents a water (empty) spot
-        - 3 (or UNKNOWN) represents a unknown spot (for ProjectiveBoards)
-        """
-        self.cells[x][y].configure(**CELL_DISPLAY_STATES[state])
-        self.state[x][y] = state
 
-    def state_of(self, x: int, y: int) -> int:
-        """
-        Get state of cell at row x column y
-        """
-        return dict_reciprocal(CELL_DISPLAY_STATES, key=lambda s: s["text"])[
-            self.cells[x][y]["text"]
-        ]
-    
-    def within_bounds(self, x: int, y: int) -> bool:
-        """
-        Check if the cell's coordinates are within bounds of the board
-        """
-        return 0 <= x <= self.size and 0 <= y <= self.size
+sink: Callable[[str, tuple, dict], Any] = print_sink
 
-    def render(self, column: int, row: int, span: int = 1):
-        self.mainframe.grid(column=column, row=row, columnspan=span, rowspan=span)
 
-    def random_coordinates(self) :
-        return randint(0, self.size - 1), randint(0, self.size - 1)
+def use_background_sink():
+    global sink
+    if isinstance(sink, BackgroundSink):
+        return
+    sink = BackgroundSink()
+    atexit.register(sink.close)
 
-    def vertical_coordinates(
-        self, y: int, start_x: int, stop_x: int, step: int = 1
-    ):
-        """
-        Return a list of vertical coordinates, spanning from (start_x, y) to (stop_x, y).
-        stop_x will be clamped to self.size - 1.
-        """
 
-        stop_x = min(stop_x, self.size - 1)
-        return [(x, y) for x in range(start_x, stop_x, step)]
+def log(level: int, message: Message, *args, **kwargs):
+    """
+    Logs a message if its level is enabled.
+    The message can be a function returning the text, which is only called
+    when the message is actually logged: use `lambda: f"..."` for costly messages.
+    """
+    if level > log_level:
+        return
+    if callable(message):
+        message = message()
+    sink(f"[dim]\\[{LOG_LEVEL_NAMES[level]}][/] " + message, args, kwargs)
 
-    def horizontal_coordinates(
-        self, x: int, start_y: int, stop_y: int, step: int = 1
-    ):
-        """
-        Return a list of horizontal coordinates, spanning from (x, start_y) to (x, stop_y).
-        stop_y will be clamped to self.size - 1.
-        """
 
-        stop_y = min(stop_y, self.size - 1)
-        return [(x, y) for y in range(start_y, stop_y + 1, step)]
+def i(text: Message, *args, **kwargs):
+    log(INFO, text, *args, **kwargs)
 
-    def cardinal_coordinates(
-        self, x: int, y: int
-    ):
-        """
-        Given a center C at coordinates (x, y), it returns coordinates of N, S, W, E in:
 
-                N
-            W   C   E
-                S
-        """
-        return (
-            *self.horizontal_coordinates(x, y - 1, y + 1, 2),
-            *self.vertical_coordinates(y, x - 1, x + 1, 2),
-        )
+def d(text: Message, *args, **kwargs):
+    log(DEBUG, text, *args, **kwargs)
 
-    def d(self, t: str, *args, **kwargs):
-        if self.owner is None:
-            return d(t, *args, **kwargs)
-        return d(
-            ("[green]" if self.owner.human else "[cyan]")
-            + self.owner.name
-            + "[/] "
-            + t,
-            *args,
-            **kwargs,
-        )
 
-    def lock(self):
-        self.locked = True
+def t(text: Message, *args, **kwargs):
+    log(TRACE, text, *args, **kwargs)
 
 
-class ControlledBoard(Board):
+def french_join(elements: Union[list, tuple]) -> str:
+    return ", ".join(map(str, elements[:-1])) + " et " + str(elements[-1])
+
+
+def run_in_thread(function: Callable[[], Any], name: str = None) -> Future:
     """
-    A board that is controlled by the player.
-    Will be "locked" after the initial "hiding" phase,
-    when the shooting phase starts.
+    Calls function() in a new daemon thread, which does not keep the program
+    running when it exits. Returns a future of its result.
+    Cancelling the future only works before the thread starts calling the function.
     """
+    from concurrent.futures import Future
 
-    total_ships: int
-    owner: "Player"
+    future = Future()
 
-    def __init__(
-        self,
-        game: "Game",
-        grid_size: int,
-        fleet,
-        owner: "Player" = None,
-    ):
-        super().__init__(game, grid_size, initial_state=WATER, owner=owner)
-        self.fleet = fleet
-        self.total_ships = sum(fleet)
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function())
+        except BaseException as error:
+            future.set_exception(error)
 
-    @property
-    def ships_left(self) -> int:
-        return max(self.total_ships - self.placed_ships, 0)
+    Thread(target=run, name=name, daemon=True).start()
+    return future
 
-    @property
-    def placed_ships(self) -> int:
-        return sum(self @ (x, y) == SHIP for x, y in doublerange(self.size))
 
-    def handle_cell_Button1(self, x, y):
-        super().handle_cell_Button1(x, y)
-        self.place_or_remove(x, y)
+## Metrics
 
-    def __xor__(self, coords):
-        """aesthetics: ^ (x, y) to fire at (x, y)"""
-        return self.fire(*coords)
+"""
+Counters and timing histograms of the engine's hot paths, to spot which strategy
+or board size got slower:
 
-    def place_or_remove(self, x: int, y: int):
-        """
-        Switches between placing and removing a ship at row x column y.
-        """
-        if self.locked:
-            self.d(f"board is locked, not switching state of ({x}, {y})")
-            return
-        if not self.ships_left and self @ (x, y) == WATER:
-            self.d(f"no ships left!")
-            return
-        if self @ (x, y) == WATER:
-            self.d(f"self.ships_left={self.ships_left}, changing state of ({x}, {y}) to SHIP")
-            self.change_cell(x, y, SHIP)
-        else:
-            self.d(f"self.ships_left={self.ships_left}, changing state of ({x}, {y}) to WATER")
-            self.change_cell(x, y, WATER)
+    placement   AIPlayer.place_ships
+    decision    AIPlayer.decide_coordinates, i.e. Strategy.choose_shot_location
+    shot        ProjectiveBoard.fire, including the strategy's reaction
+    turn        TurnScheduler.step, from asking for a move to having played it
+    legality    ControlledBoard.diagnose
 
-    def fire(self, x: int, y: int) -> bool:
-        """
-        Fires a shot at row x column y.
-        Returns whether the shot hit a non-sunken ship or not
-        """
-        if self.state_of(x, y) in (WATER, MISSED):
-            self.change_cell(x, y, MISSED)
-            return False
+Each is labelled with the player's strategy (its class name) and the grid size:
+"decision/HuntTarget/10". Counters count shots, hits and games won the same way.
 
-        self.change_cell(x, y, SUNKEN)
-        return True
+Recording is off by default, and then costs a check of `metrics.enabled` per call:
 
-    @property
-    def legal(self) -> bool:
-        """
-        Whether the current board's state is legal:
-        The number of SHIP slots should exactly match the fleet
-        """
-        ships_found = 0
-        for i, ship in enumerate(self.fleet):
-            self.d(f"recherche du bateau #{i} (de taille {ship})")
-            ship_found = False
-            for (x, y) in doublerange(self.size):
-                self.d(f"\tanalyse de la cellule {(x, y)}")
-                if self @ (x, y) == WATER:
-                    self.d(f"\tc'est de l'eau. cellule suivante...")
-                    continue
+    import metrics
+    metrics.enable("metrics.json", interval=10)  # dumps every 10 seconds, and at exit
+    ...
+    metrics.snapshot()  # or read metrics.json
 
-                current_ship = ((x, y),)
-                self.d(f"\tle bateau est maintenant {current_ship!r}")
+Snapshots of other processes can be merged in (see simulate.py's --metrics).
+"""
 
-                vertical_search_x = x
-                self.d(f"\tVerticalement:")
-                while len(current_ship) != ship:
-                    vertical_search_x += 1
-                    self.d(f"\t\tcellule ({vertical_search_x, y})")
-                    if (
-                        0 <= vertical_search_x <= self.size - 1
-                        and self @ (vertical_search_x, y) == SHIP
-                    ):
-                        current_ship = (*current_ship, (vertical_search_x, y))
-                        self.d(
-                            f"\t\tajoutée au bateau, qui est maintenant {current_ship}"
-                        )
-                    else:
-                        self.d(f"\t\tc'est de l'eau. Fin de la recherche verticale.")
-                        break
-
-                horizontal_search_y = y
-                self.d(f"\tHorizontalement:")
-                while len(current_ship) != ship:
-                    horizontal_search_y += 1
-                    self.d(f"\t\tcellule ({x, horizontal_search_y})")
-                    if (
-                        0 <= horizontal_search_y <= self.size - 1
-                        and self @ (x, horizontal_search_y) == SHIP
-                    ):
-                        current_ship = (*current_ship, (x, horizontal_search_y))
-                        self.d(
-                            f"\t\t\tajoutée au bateau, qui est maintenant {current_ship}"
-                        )
-                    else:
-                        self.d(f"\t\t\tc'est de leau.")
-                        self.d(f"\t\tFin de la recherche horizontale.")
-                        break
-
-                if len(current_ship) == ship:
-                    self.d(f"\t>> Le bateau a été trouvé!")
-                    ship_found = True
-                else:
-                    self.d(f"\tLe bateau n'a pas été trouvé à partir de cette cellule.")
-                    current_ship = ()
-
-                if ship_found:
-                    ships_found += 1
-                    break
-            if not ship_found:
-                self.d(
-                    f">> bateau #{i} non trouvé. le plateau n'est donc pas dans un état légal."
-                )
-                return False
+# Seconds between two dumps of the metrics to a file
+DUMP_INTERVAL = 10
+QUANTILES = 0.5, 0.9, 0.99
 
-        # check if there was as much ship slots as the total number of ships as dictated by the board's fleet
-        return len(
-            [(x, y) for (x, y) in doublerange(self.size) if self @ (x, y) == SHIP]
-        ) == sum(self.fleet)
+# Whether metrics are being recorded. Check it before timing anything.
+enabled = False
 
+Labels = tuple[Union[str, int], ...]
 
-class ProjectiveBoard(Board):
 
-    real_board: ControlledBoard
-    shots_fired: int
-    shots_missed: int
-    owner: "Player"
+def metric_key(name: str, labels: Labels) -> str:
+    return "/".join((name, *map(str, labels)))
 
-    def __init__(
-        self,
-        game: "Game",
-        grid_size: int,
-        represents: ControlledBoard,
+
+def parse_metric_key(key: str) -> tuple[str, Labels]:
+    """
+    The name and labels of a metric_key, labels made of digits being ints
+    """
+    name, *labels = key.split("/")
+    return name, tuple(int(label) if label.isdigit() else label for label in labels)
+
+
+class Histogram:
+    """
+    Durations, counted in buckets whose bounds are powers of 2 microseconds,
+    so that histograms of different processes can be added up
+    """
+
+    count: int
+    total: float
+    minimum: float
+    maximum: float
+    # Number of durations of less than 2**exponent µs, but not less than half that
+    buckets: dict[int, int]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = float("inf")
+        self.maximum = 0
+        self.buckets = {}
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        exponent = frexp(seconds * 1e6)[1]
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket the q-quantile falls into, in seconds
+        """
+        rank = q * self.count
+        seen = 0
+        for exponent in sorted(self.buckets):
+            seen += self.buckets[exponent]
+            if seen >= rank:
+                return min(2.0**exponent / 1e6, self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.minimum if self.count else 0,
+            "max": self.maximum,
+            "mean": self.total / self.count if self.count else 0,
+            **{f"p{round(q * 100)}": self.quantile(q) for q in QUANTILES},
+            "buckets": {
+                str(2**exponent): count
+                for exponent, count in sorted(self.buckets.items())
+            },
+        }
+
+    def merge(self, other: dict[str, Any]):
+        """
+        Adds the durations of another histogram, as returned by to_dict()
+        """
+        if not other["count"]:
+            return
+        self.count += other["count"]
+        self.total += other["total"]
+        self.minimum = min(self.minimum, other["min"])
+        self.maximum = max(self.maximum, other["max"])
+        for bound, count in other["buckets"].items():
+            exponent = frexp(float(bound))[1] - 1
+            self.buckets[exponent] = self.buckets.get(exponent, 0) + count
+
+
+class Metrics:
+    """
+    The counters and histograms recorded so far, by name and labels.
+    Snapshots key them by metric_key.
+    """
+
+    counters: dict[tuple[str, Labels], int]
+    histograms: dict[tuple[str, Labels], Histogram]
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, name: str, *labels, amount: int = 1):
+        key = name, labels
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, *labels):
+        key = name, labels
+        if (histogram := self.histograms.get(key)) is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        The metrics as JSON-serializable dicts, durations being in seconds.
+        Taken while other threads record, it may miss their latest records.
+        """
+        return {
+            "counters": {
+                metric_key(*key): amount for key, amount in list(self.counters.items())
+            },
+            "histograms": {
+                metric_key(*key): histogram.to_dict()
+                for key, histogram in list(self.histograms.items())
+            },
+        }
+
+    def merge(self, snapshot: dict[str, Any]):
+        """
+        Adds the metrics of a snapshot, e.g. taken by another process
+        """
+        for key, amount in snapshot["counters"].items():
+            key = parse_metric_key(key)
+            self.counters[key] = self.counters.get(key, 0) + amount
+        for key, histogram in snapshot["histograms"].items():
+            key = parse_metric_key(key)
+            self.histograms.setdefault(key, Histogram()).merge(histogram)
+
+    def dump(self, path: Union[str, os.PathLike]):
+        """
+        Writes a snapshot to a JSON file, replacing it at once so that readers
+        never see half of it
+        """
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+        os.replace(temporary, path)
+
+
+class PeriodicDump:
+    """
+    Dumps the metrics to a file every few seconds, from a daemon thread
+    """
+
+    def __init__(
+        self, metrics: Metrics, path: Union[str, os.PathLike], interval: float
+    ):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="metrics dump", daemon=True
+        )
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.metrics.dump(self.path)
+
+    def close(self):
+        """
+        Stops the thread, then dumps the metrics one last time
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.metrics.dump(self.path)
+
+
+recorded = Metrics()
+dumper: Optional[PeriodicDump] = None
+
+
+def enable(
+    path: Union[str, os.PathLike, None] = None, interval: float = DUMP_INTERVAL
+):
+    """
+    Starts recording metrics, and dumping them to `path` every `interval` seconds
+    and at exit if it is given
+    """
+    global enabled, dumper
+    enabled = True
+    if path is not None and dumper is None:
+        dumper = PeriodicDump(recorded, path, interval)
+        atexit.register(dumper.close)
+
+
+def disable():
+    """
+    Stops recording metrics, and dumping them after a last time
+    """
+    global enabled, dumper
+    enabled = False
+    if dumper is not None:
+        atexit.unregister(dumper.close)
+        dumper.close()
+        dumper = None
+
+
+def count(name: str, *labels, amount: int = 1):
+    recorded.count(name, *labels, amount=amount)
+
+
+def observe(name: str, seconds: float, *labels):
+    recorded.observe(name, seconds, *labels)
+
+
+def snapshot() -> dict[str, Any]:
+    return recorded.snapshot()
+
+
+def merge(snapshot: dict[str, Any]):
+    recorded.merge(snapshot)
+
+
+def reset():
+    """
+    Forgets the metrics recorded so far
+    """
+    global recorded
+    recorded = Metrics()
+    if dumper is not None:
+        dumper.metrics = recorded
+
+
+## Backends
+
+numpy = lazy_import("numpy")
+
+# Cells' states can be stored with 2 bits per cell (see dump() and MappedBackend):
+# bit i of a first "low" plane of bytes and of a second "high" plane hold cell
+# i = x * size + y's code, an index in a list of up to 4 states.
+MAX_CODES = 4
+# Bytes of the planes processed at once by numpy when scanning them
+CHUNK_BYTES = 1 << 22
+
+
+def plane_bytes(size: int) -> int:
+    """
+    Bytes taken by a bit plane of a board of the given size
+    """
+    return (size * size + 7) // 8
+
+
+def read_planes(buffer, offset: int, size: int) -> tuple[int, int]:
+    """
+    The low and high planes stored at `offset`, as integers
+    """
+    plane = plane_bytes(size)
+    return (
+        int.from_bytes(buffer[offset : offset + plane], "little"),
+        int.from_bytes(buffer[offset + plane : offset + 2 * plane], "little"),
+    )
+
+
+def write_planes(buffer, offset: int, size: int, low: int, high: int):
+    plane = plane_bytes(size)
+    buffer[offset : offset + plane] = low.to_bytes(plane, "little")
+    buffer[offset + plane : offset + 2 * plane] = high.to_bytes(plane, "little")
+
+
+def code_chunks(
+    buffer, offset: int, size: int, code: int
+) -> Iterator[tuple[int, numpy.ndarray]]:
+    """
+    Scans the planes stored at `offset` for the cells with the given code.
+    Yields the number of the first cell of each chunk, and a bit array of the
+    chunk's cells, 1 for those having the code.
+    """
+    plane = plane_bytes(size)
+    for start in range(0, plane, CHUNK_BYTES):
+        count = min(CHUNK_BYTES, plane - start)
+        low = numpy.frombuffer(buffer, numpy.uint8, count, offset + start)
+        high = numpy.frombuffer(buffer, numpy.uint8, count, offset + plane + start)
+        chunk = (low if code & 1 else ~low) & (high if code & 2 else ~high)
+        bits = numpy.unpackbits(chunk, bitorder="little")
+        # The last byte's padding bits are not cells
+        yield start * 8, bits[: size * size - start * 8]
+
+
+@lru_cache(maxsize=None)
+def state_digits(state: int) -> bytes:
+    """
+    bytes.translate() table of a byte to the digit "1" if it is the given state,
+    "0" otherwise
+    """
+    return bytes(b"01"[byte == state] for byte in range(256))
+
+
+@lru_cache(maxsize=None)
+def code_digits(codes: tuple[tuple[int, int], ...], bit: int) -> bytes:
+    """
+    bytes.translate() table of a state to the digit of the given bit of its code,
+    `codes` being (state, code) pairs
+    """
+    code_of = dict(codes)
+    return bytes(b"01"[code_of.get(byte, 0) >> bit & 1] for byte in range(256))
+
+
+# bytes.translate() tables of a digit of the low or high plane to its value in
+# cells' codes
+DIGIT_VALUES = bytes.maketrans(b"01", b"\0\1"), bytes.maketrans(b"01", b"\0\2")
+
+
+def planes_bytes(low: int, high: int, cells: int) -> bytes:
+    """
+    The cells' codes, one byte per cell, from their low and high planes
+    """
+    low, high = (
+        int.from_bytes(
+            bin(plane)[2:].zfill(cells)[::-1].encode().translate(values), "big"
+        )
+        for plane, values in zip((low, high), DIGIT_VALUES)
+    )
+    # A byte per cell of 0 or 1, plus another of 0 or 2: no carries
+    return (low + high).to_bytes(cells, "big")
+
+
+class GridBackend:
+    """
+    Stores a board's cells as a 2D list of state integers.
+    """
+
+    size: int
+    rows: list[list[int]]
+
+    def __init__(self, size: int, initial_state: int):
+        self.size = size
+        self.rows = [[initial_state] * size for _ in range(size)]
+
+    def get(self, x: int, y: int) -> int:
+        return self.rows[x][y]
+
+    def set(self, x: int, y: int, state: int) -> int:
+        """
+        Sets the state of cell (x, y) and returns its previous state
+        """
+        previous = self.rows[x][y]
+        self.rows[x][y] = state
+        return previous
+
+    def count(self, state: int) -> int:
+        """
+        Number of cells in the given state
+        """
+        return sum(row.count(state) for row in self.rows)
+
+    def mask(self, state: int) -> int:
+        """
+        Bitmask of the cells in the given state, cell (x, y) being bit x * size + y
+        """
+        mask = 0
+        for x, row in enumerate(self.rows):
+            for y, cell in enumerate(row):
+                if cell == state:
+                    mask |= 1 << (x * self.size + y)
+        return mask
+
+    def all_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        return all(self.rows[x][y] == state for x, y in coords)
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        """
+        Coordinates of the cells in the given state
+        """
+        return [
+            (x, y)
+            for x, row in enumerate(self.rows)
+            for y, cell in enumerate(row)
+            if cell == state
+        ]
+
+    def to_list(self) -> list[list[int]]:
+        return [list(row) for row in self.rows]
+
+    def dump(self, buffer, offset: int, codes: dict[int, int]):
+        """
+        Writes the cells' codes (see MAX_CODES) as two bit planes at `offset`.
+        The buffer has to be zeroed beforehand.
+        """
+        table = numpy.zeros(max(codes) + 1, numpy.uint8)
+        table[list(codes)] = list(codes.values())
+        cells = table[numpy.array(self.rows, numpy.intp).reshape(-1)]
+        plane = plane_bytes(self.size)
+        for shift in (0, 1):
+            packed = numpy.packbits(cells >> shift & 1, bitorder="little")
+            start = offset + shift * plane
+            buffer[start : start + plane] = packed.tobytes()
+
+    def load(self, buffer, offset: int, states: Sequence[int]):
+        """
+        Reads the cells' codes written by dump(), `states` giving each code's state
+        """
+        plane = plane_bytes(self.size)
+        cells = self.size * self.size
+        low, high = (
+            numpy.unpackbits(
+                numpy.frombuffer(buffer, numpy.uint8, plane, start), bitorder="little"
+            )[:cells]
+            for start in (offset, offset + plane)
+        )
+        table = numpy.array(list(states) + [0] * (MAX_CODES - len(states)))
+        self.rows = table[low | high << 1].reshape(self.size, self.size).tolist()
+
+
+class BitboardBackend:
+    """
+    Hands out bitmasks of the cells in each state, cell (x, y) being
+    bit x * size + y, so that sets of cells are checked with a few bitwise ops.
+    Cells' states are stored in a bytearray per row (states are below 256), which
+    reading or writing a cell only indexes: masks are derived from the bytes in C
+    (see state_digits) when needed, then cached until a cell changes.
+    """
+
+    size: int
+    rows: list[bytearray]
+    # Masks derived since the last cell change, by state
+    cached_masks: Optional[dict[int, int]]
+
+    def __init__(self, size: int, initial_state: int):
+        self.size = size
+        self.rows = [bytearray([initial_state]) * size for _ in range(size)]
+        self.cached_masks = None
+
+    def bit(self, x: int, y: int) -> int:
+        # (0, size) would otherwise be cell (1, 0)
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError(f"({x}, {y}) is out of the board")
+        return 1 << (x * self.size + y)
+
+    def get(self, x: int, y: int) -> int:
+        return self.rows[x][y]
+
+    def set(self, x: int, y: int, state: int) -> int:
+        row = self.rows[x]
+        previous = row[y]
+        row[y] = state
+        self.cached_masks = None
+        return previous
+
+    def count(self, state: int) -> int:
+        return sum(row.count(state) for row in self.rows)
+
+    def translated_masks(self, *digits: bytes) -> Iterator[int]:
+        """
+        For each table of `digits`, the bitmask whose bit i is the digit it
+        translates cell i's state to
+        """
+        # Most significant digit first: the last cell's
+        cells = b"".join(self.rows)[::-1]
+        return (int(cells.translate(table), 2) for table in digits)
+
+    def mask(self, state: int) -> int:
+        if self.cached_masks is None:
+            self.cached_masks = {}
+        mask = self.cached_masks.get(state)
+        if mask is None:
+            (mask,) = self.translated_masks(state_digits(state))
+            self.cached_masks[state] = mask
+        return mask
+
+    def coordinates_mask(self, coords: Iterable[tuple[int, int]]) -> int:
+        mask = 0
+        for x, y in coords:
+            mask |= self.bit(x, y)
+        return mask
+
+    def all_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        wanted = self.coordinates_mask(coords)
+        return wanted & self.mask(state) == wanted
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        cells = []
+        for x, row in enumerate(self.rows):
+            y = row.find(state)
+            while y != -1:
+                cells.append((x, y))
+                y = row.find(state, y + 1)
+        return cells
+
+    def to_list(self) -> list[list[int]]:
+        return [list(row) for row in self.rows]
+
+    def dump(self, buffer, offset: int, codes: dict[int, int]):
+        palette = tuple(codes.items())
+        low, high = self.translated_masks(
+            code_digits(palette, 0), code_digits(palette, 1)
+        )
+        write_planes(buffer, offset, self.size, low, high)
+
+    def load(self, buffer, offset: int, states: Sequence[int]):
+        low, high = read_planes(buffer, offset, self.size)
+        cells = bytearray(planes_bytes(low, high, self.size * self.size))
+        # Slices of a bytearray are bytearrays already
+        cells = cells.translate(bytes(states).ljust(256, b"\0"))
+        self.rows = [
+            cells[start : start + self.size]
+            for start in range(0, self.size * self.size, self.size)
+        ]
+        self.cached_masks = None
+
+
+class SparseBackend:
+    """
+    Stores only the cells that are not in the initial state, in a dict keyed by
+    cell number (x * size + y).
+    Meant for huge boards, where almost every cell keeps its initial state.
+    """
+
+    size: int
+    initial_state: int
+    changed: dict[int, int]
+
+    def __init__(self, size: int, initial_state: int):
+        self.size = size
+        self.initial_state = initial_state
+        self.changed = {}
+
+    def key(self, x: int, y: int) -> int:
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError(f"({x}, {y}) is out of the board")
+        return x * self.size + y
+
+    def get(self, x: int, y: int) -> int:
+        return self.changed.get(self.key(x, y), self.initial_state)
+
+    def set(self, x: int, y: int, state: int) -> int:
+        key = self.key(x, y)
+        if state == self.initial_state:
+            return self.changed.pop(key, self.initial_state)
+        previous = self.changed.get(key, self.initial_state)
+        self.changed[key] = state
+        return previous
+
+    def count(self, state: int) -> int:
+        if state == self.initial_state:
+            return self.size * self.size - len(self.changed)
+        return sum(1 for cell in self.changed.values() if cell == state)
+
+    def mask(self, state: int) -> int:
+        mask = 0
+        for key, cell in self.changed.items():
+            if cell == state or state == self.initial_state:
+                mask |= 1 << key
+        if state == self.initial_state:
+            return ((1 << (self.size * self.size)) - 1) ^ mask
+        return mask
+
+    def all_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        return all(self.get(x, y) == state for x, y in coords)
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        if state == self.initial_state:
+            return [
+                (x, y)
+                for x in range(self.size)
+                for y in range(self.size)
+                if x * self.size + y not in self.changed
+            ]
+        return [
+            divmod(key, self.size) for key, cell in self.changed.items() if cell == state
+        ]
+
+    def to_list(self) -> list[list[int]]:
+        return [[self.get(x, y) for y in range(self.size)] for x in range(self.size)]
+
+    def dump(self, buffer, offset: int, codes: dict[int, int]):
+        """
+        Only writes the changed cells, the initial state having to be code 0:
+        the planes of huge boards stay mostly zeroes (holes, in sparse files)
+        """
+        if codes[self.initial_state] != 0:
+            raise ValueError("The initial state has to be code 0")
+        plane = plane_bytes(self.size)
+        for key, state in self.changed.items():
+            code = codes[state]
+            byte = offset + (key >> 3)
+            if code & 1:
+                buffer[byte] |= 1 << (key & 7)
+            if code & 2:
+                buffer[byte + plane] |= 1 << (key & 7)
+
+    def load(self, buffer, offset: int, states: Sequence[int]):
+        changed = {}
+        for code, state in enumerate(states):
+            if state == self.initial_state:
+                continue
+            for first, bits in code_chunks(buffer, offset, self.size, code):
+                changed.update(
+                    dict.fromkeys((numpy.flatnonzero(bits) + first).tolist(), state)
+                )
+        self.changed = changed
+
+
+class MappedBackend:
+    """
+    Reads a board's cells from bit planes (see MAX_CODES) in a buffer, without
+    loading them: typically a read-only memory map of a snapshot file
+    (see snapshot.load), so that huge boards open in no time.
+    Cells changed since are stored in a dict keyed by cell number, like
+    SparseBackend's, and the buffer is never written to.
+    Without a buffer, e.g. for fresh boards, every cell starts in the initial state.
+    """
+
+    size: int
+    buffer: Optional[Union[mmap.mmap, bytes]]
+    offset: int
+    plane: int
+    # State of each code, and code of each state
+    states: list[int]
+    codes: dict[int, int]
+    changed: dict[int, int]
+
+    def __init__(
+        self,
+        size: int,
+        initial_state: int,
+        buffer: Optional[Union[mmap.mmap, bytes]] = None,
+        offset: int = 0,
+        states: Optional[Sequence[int]] = None,
+    ):
+        self.size = size
+        self.plane = plane_bytes(size)
+        self.buffer = buffer
+        self.offset = offset
+        self.states = list(states or [initial_state])
+        self.codes = {state: code for code, state in enumerate(self.states)}
+        self.changed = {}
+
+    def key(self, x: int, y: int) -> int:
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError(f"({x}, {y}) is out of the board")
+        return x * self.size + y
+
+    def stored(self, key: int) -> int:
+        """
+        State of the cell in the buffer, ignoring changes
+        """
+        if self.buffer is None:
+            return self.states[0]
+        byte, shift = self.offset + (key >> 3), key & 7
+        low = self.buffer[byte] >> shift & 1
+        high = self.buffer[byte + self.plane] >> shift & 1
+        return self.states[low | high << 1]
+
+    def get(self, x: int, y: int) -> int:
+        key = self.key(x, y)
+        state = self.changed.get(key)
+        return self.stored(key) if state is None else state
+
+    def set(self, x: int, y: int, state: int) -> int:
+        key = self.key(x, y)
+        stored = self.stored(key)
+        previous = self.changed.get(key, stored)
+        if state == stored:
+            self.changed.pop(key, None)
+        else:
+            self.changed[key] = state
+        return previous
+
+    def stored_keys(self, state: int) -> Iterator[numpy.ndarray]:
+        """
+        Numbers of the cells in the given state in the buffer, chunk by chunk
+        """
+        if state not in self.codes:
+            return
+        if self.buffer is None:
+            cells = self.size * self.size
+            for first in range(0, cells if self.codes[state] == 0 else 0, CHUNK_BYTES):
+                yield numpy.arange(first, min(first + CHUNK_BYTES, cells))
+            return
+        for first, bits in code_chunks(
+            self.buffer, self.offset, self.size, self.codes[state]
+        ):
+            yield numpy.flatnonzero(bits) + first
+
+    def count(self, state: int) -> int:
+        count = sum(len(keys) for keys in self.stored_keys(state))
+        for key, changed in self.changed.items():
+            count += (changed == state) - (self.stored(key) == state)
+        return count
+
+    def mask(self, state: int) -> int:
+        mask = 0
+        for keys in self.stored_keys(state):
+            cells = numpy.zeros(self.size * self.size, dtype=bool)
+            cells[keys] = True
+            mask |= int.from_bytes(
+                numpy.packbits(cells, bitorder="little").tobytes(), "little"
+            )
+        for key, changed in self.changed.items():
+            if changed == state:
+                mask |= 1 << key
+            else:
+                mask &= ~(1 << key)
+        return mask
+
+    def all_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        return all(self.get(x, y) == state for x, y in coords)
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        keys = [
+            key
+            for chunk in self.stored_keys(state)
+            for key in chunk.tolist()
+            if key not in self.changed
+        ]
+        keys += [key for key, changed in self.changed.items() if changed == state]
+        return [divmod(key, self.size) for key in keys]
+
+    def to_list(self) -> list[list[int]]:
+        return [[self.get(x, y) for y in range(self.size)] for x in range(self.size)]
+
+    def dump(self, buffer, offset: int, codes: dict[int, int]):
+        """
+        Copies the buffer's planes chunk by chunk (as they are if the codes match),
+        then writes the changed cells
+        """
+        if self.buffer is None:
+            if codes[self.states[0]] != 0:
+                raise ValueError("The initial state has to be code 0")
+        elif all(codes.get(state) == code for code, state in enumerate(self.states)):
+            for start in range(0, 2 * self.plane, CHUNK_BYTES):
+                count = min(CHUNK_BYTES, 2 * self.plane - start)
+                chunk = numpy.frombuffer(
+                    self.buffer, numpy.uint8, count, self.offset + start
+                )
+                # Zeroes are already there: don't touch those pages
+                if chunk.any():
+                    buffer[offset + start : offset + start + count] = chunk.tobytes()
+        else:
+            for code, state in enumerate(self.states):
+                if not codes.get(state):
+                    continue
+                for first, bits in code_chunks(
+                    self.buffer, self.offset, self.size, code
+                ):
+                    packed = numpy.packbits(bits, bitorder="little")
+                    for shift in (0, 1):
+                        if not codes[state] >> shift & 1:
+                            continue
+                        start = offset + shift * self.plane + first // 8
+                        chunk = numpy.frombuffer(
+                            buffer, numpy.uint8, len(packed), start
+                        )
+                        buffer[start : start + len(packed)] = (chunk | packed).tobytes()
+        for key, state in self.changed.items():
+            byte, bit = offset + (key >> 3), 1 << (key & 7)
+            code = codes[state]
+            for at, set_bit in ((byte, code & 1), (byte + self.plane, code & 2)):
+                buffer[at] = buffer[at] | bit if set_bit else buffer[at] & ~bit
+
+    def load(self, buffer, offset: int, states: Sequence[int]):
+        """
+        Copies the planes into an anonymous memory map
+        """
+        self.buffer = mmap.mmap(-1, max(2 * self.plane, 1))
+        for start in range(0, 2 * self.plane, CHUNK_BYTES):
+            count = min(CHUNK_BYTES, 2 * self.plane - start)
+            chunk = numpy.frombuffer(buffer, numpy.uint8, count, offset + start)
+            # The map is zeroed: only allocate pages for something else
+            if chunk.any():
+                self.buffer[start : start + count] = chunk.tobytes()
+        self.offset = 0
+        self.states = list(states)
+        self.codes = {state: code for code, state in enumerate(self.states)}
+        self.changed = {}
+
+
+Backend = Union[GridBackend, BitboardBackend, SparseBackend, MappedBackend]
+
+
+## Legality
+
+Cell = tuple[int, int]
+Segment = list[Cell]
+
+
+class FleetDiagnosis:
+    """
+    Result of checking a board's ship cells against its fleet.
+    - ships: the ships that were recognized, as lists of cells
+    - missing: lengths of the fleet's ships that could not be found
+    - malformed: groups of touching cells that cannot be split into the fleet's ships
+    """
+
+    ships: list[Segment]
+    missing: list[int]
+    malformed: list[list[Cell]]
+
+    def __init__(
+        self, ships: list[Segment], missing: list[int], malformed: list[list[Cell]]
+    ):
+        self.ships = ships
+        self.missing = missing
+        self.malformed = malformed
+
+    @property
+    def legal(self) -> bool:
+        return not self.missing and not self.malformed
+
+    def __bool__(self) -> bool:
+        return self.legal
+
+    def __repr__(self) -> str:
+        return f"FleetDiagnosis(ships={self.ships!r}, missing={self.missing!r}, malformed={self.malformed!r})"
+
+
+def connected_components(cells: Iterable[Cell]) -> list[list[Cell]]:
+    """
+    Groups cells that touch each other horizontally or vertically.
+    Each group is sorted in row-major order.
+    """
+    remaining = set(cells)
+    components = []
+    while remaining:
+        stack = [remaining.pop()]
+        component = []
+        while stack:
+            x, y = stack.pop()
+            component.append((x, y))
+            for neighbour in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if neighbour in remaining:
+                    remaining.remove(neighbour)
+                    stack.append(neighbour)
+        components.append(sorted(component))
+    return components
+
+
+def tilings(
+    component: list[Cell], lengths: Counter
+) -> dict[tuple[int, ...], list[Segment]]:
+    """
+    All the ways to split a component into straight ships whose lengths are taken from `lengths`.
+    Returns a mapping of the (sorted) ship lengths used to one way of placing them.
+    """
+    if len(component) > sum(length * count for length, count in lengths.items()):
+        return {}
+    rows = [x for x, _ in component]
+    columns = [y for _, y in component]
+    if len(set(rows)) == 1 or len(set(columns)) == 1:
+        return line_tilings(component, lengths)
+    # Placements are looked up in the index of the smallest square board holding
+    # the component, so that its bitmasks stay small whatever the board's size
+    top, left = min(rows), min(columns)
+    size = max(max(rows) - top, max(columns) - left) + 1
+    found: dict[tuple[int, ...], list[tuple[int, int]]] = {}
+
+    def split(uncovered: int, placements: list[tuple[int, int]]):
+        if not uncovered:
+            found.setdefault(
+                tuple(sorted(length for length, _ in placements)), list(placements)
+            )
+            return
+        # The first uncovered cell (in row-major order) has to be
+        # the top end of a vertical ship or the left end of a horizontal one.
+        x, y = divmod((uncovered & -uncovered).bit_length() - 1, size)
+        for length in sorted(lengths):
+            if not lengths[length]:
+                continue
+            index = placement_index(size, length)
+            orientations = (HORIZONTAL,) if length == 1 else (HORIZONTAL, VERTICAL)
+            for orientation in orientations:
+                placement = index.find(x, y, orientation)
+                if placement is None:
+                    continue
+                mask = index.mask(placement)
+                if uncovered & mask == mask:
+                    lengths[length] -= 1
+                    placements.append((length, placement))
+                    split(uncovered & ~mask, placements)
+                    placements.pop()
+                    lengths[length] += 1
+
+    split(sum(1 << ((x - top) * size + y - left) for x, y in component), [])
+    return {
+        used: [
+            [
+                (top + x, left + y)
+                for x, y in placement_index(size, length).coordinates(placement)
+            ]
+            for length, placement in placements
+        ]
+        for used, placements in found.items()
+    }
+
+
+def line_tilings(
+    line: list[Cell], lengths: Counter
+) -> dict[tuple[int, ...], list[Segment]]:
+    """
+    tilings() for a component that is a single straight line:
+    only the ships' lengths matter, not the geometry.
+    """
+    available = sorted(length for length, count in lengths.items() if count)
+    found = {}
+
+    def partition(rest: int, smallest: int, used: list[int]):
+        if rest == 0:
+            segments, start = [], 0
+            for length in used:
+                segments.append(line[start : start + length])
+                start += length
+            found[tuple(used)] = segments
+            return
+        for length in available:
+            if smallest <= length <= rest and used.count(length) < lengths[length]:
+                used.append(length)
+                partition(rest - length, length, used)
+                used.pop()
+
+    partition(len(line), 0, [])
+    return found
+
+
+def assign(
+    options: list[dict[tuple[int, ...], list[Segment]]], fleet: Counter
+) -> Optional[list[Segment]]:
+    """
+    Picks one tiling per component so that all of them together use exactly the fleet.
+    Components with a single tiling are settled first, so backtracking only happens
+    between components that can be split in several ways.
+    """
+    order = sorted(range(len(options)), key=lambda i: len(options[i]))
+
+    def search(position: int, remaining: Counter) -> Optional[list[Segment]]:
+        if position == len(order):
+            return [] if not +remaining else None
+        for lengths, segments in options[order[position]].items():
+            used = Counter(lengths)
+            if any(remaining[length] < count for length, count in used.items()):
+                continue
+            rest = search(position + 1, remaining - used)
+            if rest is not None:
+                return segments + rest
+        return None
+
+    return search(0, fleet)
+
+
+def diagnose_fleet(
+    ship_cells: Iterable[Cell], fleet: Iterable[int]
+) -> FleetDiagnosis:
+    """
+    Checks that the ship cells form exactly the ships of the fleet:
+    straight lines of the right lengths, touching ships being allowed.
+    """
+    fleet = Counter(fleet)
+    components = connected_components(ship_cells)
+    options = [tilings(component, fleet.copy()) for component in components]
+
+    ships = assign(options, fleet)
+    if ships is not None:
+        return FleetDiagnosis(ships=ships, missing=[], malformed=[])
+
+    # No exact match: explain what we can, component by component.
+    remaining = fleet.copy()
+    ships, malformed = [], []
+    for component, tilings_of_component in zip(components, options):
+        for lengths, segments in tilings_of_component.items():
+            used = Counter(lengths)
+            if all(remaining[length] >= count for length, count in used.items()):
+                remaining -= used
+                ships += segments
+                break
+        else:
+            malformed.append(component)
+    return FleetDiagnosis(
+        ships=ships, missing=sorted(remaining.elements()), malformed=malformed
+    )
+
+
+## Placements
+
+numpy = lazy_import("numpy")
+
+# Same values as board.HORIZONTAL and board.VERTICAL
+HORIZONTAL = 10
+VERTICAL = 20
+# Layouts sample_consistent_layouts tries to build over hits per layout it still needs,
+# before giving up: they may fail every time when the observations are inconsistent
+ANCHORED_ATTEMPTS = 20
+
+
+class PlacementIndex:
+    """
+    All the ways to place a ship of a given length on a square board of a given size.
+    Placements are numbered: horizontal ones first, row by row, then vertical ones.
+    Cells are numbered x * size + y, like the bits of the boards' bitmasks.
+
+    Use placement_index() to get one: indexes are cached, and shared with the
+    processes forked after they were built.
+    """
+
+    size: int
+    length: int
+    starts_per_line: int
+    horizontal_count: int
+
+    def __init__(self, size: int, length: int):
+        self.size = size
+        self.length = length
+        self.starts_per_line = max(size - length + 1, 0)
+        self.horizontal_count = size * self.starts_per_line
+
+    def __len__(self) -> int:
+        return 2 * self.horizontal_count
+
+    def cells_of(self, placements: numpy.ndarray) -> numpy.ndarray:
+        """
+        The cells covered by each of the given placements, as an array of shape
+        placements.shape + (length,)
+        """
+        placements = numpy.asarray(placements, dtype=numpy.int64)
+        horizontal = placements < self.horizontal_count
+        vertical_start = placements - self.horizontal_count
+        per_line = max(self.starts_per_line, 1)
+        start = numpy.where(
+            horizontal,
+            (placements // per_line) * self.size + placements % per_line,
+            vertical_start,
+        )
+        step = numpy.where(horizontal, 1, self.size)
+        return start[..., None] + step[..., None] * numpy.arange(self.length)
+
+    @cached_property
+    def cells(self) -> numpy.ndarray:
+        """
+        cells[p] lists the cells covered by placement p.
+        Built on first use: that's size ** 2 * length integers.
+        """
+        return self.cells_of(numpy.arange(len(self)))
+
+    def find(self, x: int, y: int, orientation: int) -> Optional[int]:
+        """
+        The placement starting at (x, y) (its top or left end), None if it does not fit
+        """
+        last = self.size - self.length
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            return None
+        if orientation == HORIZONTAL:
+            return x * (last + 1) + y if y <= last else None
+        if orientation == VERTICAL:
+            return self.horizontal_count + x * self.size + y if x <= last else None
+        raise ValueError(f"Unknown orientation {orientation!r}")
+
+    def coordinates(self, placement: int) -> list[tuple[int, int]]:
+        return [divmod(int(cell), self.size) for cell in self.cells_of(placement)]
+
+    def mask(self, placement: int) -> int:
+        """
+        Bitmask of the cells covered by the placement
+        """
+        if placement < self.horizontal_count:
+            x, y = divmod(placement, self.starts_per_line)
+            return ((1 << self.length) - 1) << (x * self.size + y)
+        return self.column_mask << (placement - self.horizontal_count)
+
+    @cached_property
+    def column_mask(self) -> int:
+        """
+        Bitmask of the vertical placement starting at (0, 0)
+        """
+        return sum(1 << (i * self.size) for i in range(self.length))
+
+    def covering(self, x: int, y: int) -> list[int]:
+        """
+        The placements covering cell (x, y)
+        """
+        last = self.size - self.length
+        return [
+            *(
+                self.find(x, start, HORIZONTAL)
+                for start in range(max(y - self.length + 1, 0), min(y, last) + 1)
+            ),
+            *(
+                self.find(start, y, VERTICAL)
+                for start in range(max(x - self.length + 1, 0), min(x, last) + 1)
+            ),
+        ]
+
+    def compatible(self, occupied: Union[int, numpy.ndarray]) -> numpy.ndarray:
+        """
+        The placements that do not cover any of the occupied cells,
+        given as a bitmask or as a boolean array indexed by cell number
+        """
+        if not isinstance(occupied, numpy.ndarray):
+            occupied = mask_to_array(occupied, self.size * self.size)
+        return numpy.flatnonzero(~occupied.reshape(-1)[self.cells].any(axis=1))
+
+
+@lru_cache(maxsize=None)
+def placement_index(size: int, length: int) -> PlacementIndex:
+    return PlacementIndex(size, length)
+
+
+def mask_to_array(mask: int, cells_count: int) -> numpy.ndarray:
+    """
+    Converts a bitmask to a boolean array, bit i being item i
+    """
+    raw = numpy.frombuffer(mask.to_bytes((cells_count + 7) // 8, "little"), numpy.uint8)
+    return numpy.unpackbits(raw, bitorder="little")[:cells_count].astype(bool)
+
+
+def array_to_mask(cells: numpy.ndarray) -> int:
+    """
+    Converts a boolean array to a bitmask, item i being bit i
+    """
+    packed = numpy.packbits(cells.reshape(-1).astype(bool), bitorder="little")
+    return int.from_bytes(packed.tobytes(), "little")
+
+
+def random_layouts(
+    count: int,
+    grid_size: int,
+    fleet: list[int],
+    rng: Optional[numpy.random.Generator] = None,
+) -> numpy.ndarray:
+    """
+    Generates `count` independent fleet layouts, uniformly distributed among all the
+    legal ones (see random_layout_cells).
+    Returns a boolean array of shape (count, grid_size ** 2), True for ship cells.
+    Raises ValueError if the fleet does not seem to fit in the board.
+    """
+    cells = random_layout_cells(count, grid_size, fleet, rng)
+    layouts = numpy.zeros((count, grid_size * grid_size), dtype=bool)
+    layouts[numpy.arange(count)[:, None], cells] = True
+    return layouts
+
+
+def random_layout_cells(
+    count: int,
+    grid_size: int,
+    fleet: list[int],
+    rng: Optional[numpy.random.Generator] = None,
+) -> numpy.ndarray:
+    """
+    Generates `count` independent fleet layouts, uniformly distributed among all the
+    legal ones: each ship is placed uniformly at random and layouts where ships
+    overlap are rejected.
+    Returns the cell numbers of each layout's ships, as an array of shape
+    (count, sum(fleet)): unlike random_layouts, it fits huge boards.
+    Raises ValueError if the fleet does not seem to fit in the board.
+    """
+    rng = rng or numpy.random.default_rng()
+    layouts = numpy.zeros((count, sum(fleet)), dtype=numpy.int64)
+    if not fleet:
+        return layouts
+    indexes = [placement_index(grid_size, ship) for ship in fleet]
+    if any(len(index) == 0 for index in indexes):
+        raise ValueError(f"Cannot fit a {max(fleet)}-cell-long ship in the board")
+
+    filled, tried, accepted = 0, 0, 0
+    while filled < count:
+        # Draw enough candidates to (probably) fill what is left,
+        # given the acceptance rate so far
+        acceptance = (accepted + 1) / (tried + 1)
+        batch = min(max(int((count - filled) / acceptance * 1.1), 16), 1 << 20)
+        cells = numpy.concatenate(
+            [index.cells_of(rng.integers(len(index), size=batch)) for index in indexes],
+            axis=1,
+        )
+        ordered = numpy.sort(cells, axis=1)
+        overlapping = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+        valid = cells[~overlapping][: count - filled]
+
+        tried += batch
+        accepted += len(valid)
+        if not accepted and tried > 1 << 22:
+            raise ValueError(f"Cannot fit the fleet {fleet} in the board")
+        layouts[filled : filled + len(valid)] = valid
+        filled += len(valid)
+    return layouts
+
+
+def sample_consistent_layouts(
+    grid_size: int,
+    fleet: list[int],
+    misses: numpy.ndarray,
+    hits: numpy.ndarray,
+    deadline: float,
+    max_samples: int,
+    rng: numpy.random.Generator,
+    batch: int = 256,
+) -> tuple[numpy.ndarray, int]:
+    """
+    Samples fleet layouts where no ship covers a miss and every hit is covered,
+    until `max_samples` are found or time.perf_counter() reaches `deadline`.
+    misses and hits are boolean arrays indexed by cell number.
+    Returns how many samples have a ship on each cell, and the number of samples.
+
+    Layouts are first drawn by rejection, which samples exactly the layouts
+    consistent with the observations. When hits make that too unlikely to succeed,
+    the remaining samples are built by placing ships over uncovered hits first,
+    which is much faster but only approximately uniform. Those stop after
+    ANCHORED_ATTEMPTS failed tries per sample, e.g. for inconsistent observations.
+    """
+    counts = numpy.zeros(grid_size * grid_size, dtype=numpy.int64)
+    found = 0
+    hits_count = int(hits.sum())
+    indexes = [placement_index(grid_size, ship) for ship in fleet]
+    allowed = [index.cells[index.compatible(misses)] for index in indexes]
+    if not fleet or any(len(cells) == 0 for cells in allowed):
+        return counts, 0
+
+    tried = 0
+    while found < max_samples and perf_counter() < deadline:
+        cells = numpy.concatenate(
+            [choices[rng.integers(len(choices), size=batch)] for choices in allowed],
+            axis=1,
+        )
+        ordered = numpy.sort(cells, axis=1)
+        valid = ~(ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+        valid &= hits[cells].sum(axis=1) == hits_count
+        accepted = cells[valid][: max_samples - found]
+        numpy.add.at(counts, accepted.reshape(-1), 1)
+        found += len(accepted)
+        tried += batch
+        if tried >= 16 * batch and found * 100 < tried:
+            break
+
+    attempts = ANCHORED_ATTEMPTS * (max_samples - found)
+    while found < max_samples and attempts and perf_counter() < deadline:
+        attempts -= 1
+        layout = anchored_layout(grid_size, fleet, misses, hits, rng)
+        if layout is not None:
+            counts[layout] += 1
+            found += 1
+    return counts, found
+
+
+def anchored_layout(
+    grid_size: int,
+    fleet: list[int],
+    misses: numpy.ndarray,
+    hits: numpy.ndarray,
+    rng: numpy.random.Generator,
+) -> Optional[numpy.ndarray]:
+    """
+    Builds a layout by repeatedly placing a random remaining ship over a random
+    uncovered hit, then placing the other ships anywhere they fit.
+    Returns the cells of the layout, or None when it got stuck.
+    """
+    blocked = misses.copy()
+    uncovered = set(numpy.flatnonzero(hits).tolist())
+    ships = list(fleet)
+    layout = []
+    while uncovered and ships:
+        cell = sorted(uncovered)[rng.integers(len(uncovered))]
+        x, y = divmod(cell, grid_size)
+        candidates = [
+            (position, placement)
+            for position, ship in enumerate(ships)
+            for placement in placement_index(grid_size, ship).covering(x, y)
+            if not blocked[placement_index(grid_size, ship).cells_of(placement)].any()
+        ]
+        if not candidates:
+            return None
+        position, placement = candidates[rng.integers(len(candidates))]
+        cells = placement_index(grid_size, ships.pop(position)).cells_of(placement)
+        blocked[cells] = True
+        uncovered.difference_update(cells.tolist())
+        layout.append(cells)
+    if uncovered:
+        return None
+    for ship in ships:
+        index = placement_index(grid_size, ship)
+        free = index.compatible(blocked)
+        if not len(free):
+            return None
+        cells = index.cells_of(free[rng.integers(len(free))])
+        blocked[cells] = True
+        layout.append(cells)
+    return numpy.concatenate(layout) if layout else numpy.zeros(0, dtype=numpy.int64)
+
+
+## Board
+
+# Constantes
+WATER = 0  # Eau (case vide)
+SHIP = 1  # Occupé (case avec un bateau non coulé, pour les ControlledBoards seulement)
+SUNKEN = 2  # Coulé
+UNKNOWN = 3  # Pour les ProjectiveBoards seulement
+MISSED = 4 # Case d'eau mais touchée
+
+# Les états à afficher par rapport à leur code
+CELL_DISPLAY_STATES = {
+    SUNKEN: {"text": "🏳️", "bg": "red"},
+    SHIP: {"text": "⛵", "bg": "white"},
+    WATER: {"text": "🌊", "bg": "blue"},
+    MISSED: {"text": "🌀", "bg": "cyan"},
+    UNKNOWN: {"text": "❔", "bg": "grey"},
+}
+# Decodes a cell's displayed text back to its state
+CELL_STATES_BY_TEXT = dict_reciprocal(CELL_DISPLAY_STATES, key=lambda s: s["text"])
+
+DESTROYER = 2
+CRUISER = 3
+SUBMARINE = 3
+BATTLESHIP = 4
+AIRCRAFT_CARRIER = 5
+
+HORIZONTAL = 10
+VERTICAL = 20
+
+
+class Board:
+    """
+    The game state of a board, without any widget attached.
+    Views (see view.BoardView) subscribe to it to get notified of cell changes.
+    Cells are stored by a backend (see backends.py), a 2D list by default.
+    """
+
+    size: int
+    initial_state: int
+    backend: Backend
+    game: "Game"
+    owner: "Player"
+    locked: bool
+    subscribers: list[Callable[[int, int, int], Any]]
+    counts: dict[int, int]
+
+    def __init__(
+        self,
+        game: "Game",
+        grid_size: int,
+        initial_state: int,
+        owner: "Player",
+        backend: Type[Backend] = GridBackend,
+    ):
+        self.size = grid_size
+        self.initial_state = initial_state
+        self.backend = backend(grid_size, initial_state)
+        self.game = game
+        self.owner = owner
+        self.locked = False
+        self.subscribers = []
+        # Number of cells in each state, kept up to date by change_cell
+        self.counts = {initial_state: grid_size * grid_size}
+
+    def __matmul__(self, coords):
+        """aesthetics: @ (x, y) to get cell state at (x, y)"""
+        return self.backend.get(*coords)
+
+    @property
+    def state(self) -> list[list[int]]:
+        """
+        A copy of the board's state, as a 2D array of state integers
+        """
+        return self.backend.to_list()
+
+    @state.setter
+    def state(self, new_state: list[list[int]]):
+        self.set_state(new_state)
+
+    def count(self, state: int) -> int:
+        """
+        Number of cells in the given state
+        """
+        return self.counts.get(state, 0)
+
+    def mask(self, state: int) -> int:
+        """
+        Bitmask of the cells in the given state, cell (x, y) being bit x * size + y
+        """
+        return self.backend.mask(state)
+
+    def cells(self, state: int) -> list[tuple[int, int]]:
+        """
+        Coordinates of the cells in the given state
+        """
+        return self.backend.cells(state)
+
+    def all_cells_are(self, coords: Iterable[tuple[int, int]], state: int) -> bool:
+        return self.backend.all_are(coords, state)
+
+    def subscribe(self, callback: Callable[[int, int, int], Any]):
+        """
+        Registers callback(x, y, state), called every time a cell changes state.
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[int, int, int], Any]):
+        self.subscribers.remove(callback)
+
+    def handle_cell_Button1(self, x: int, y: int):
+        self.d(lambda: f"handling <Button 1> {x=}, {y=}", level=TRACE)
+
+    def handle_cell_Button3(self, x: int, y: int):
+        self.d(lambda: f"handling <Button 3> {x=}, {y=}", level=TRACE)
+
+    def set_state(self, new_state):
+        """
+        Sets the entire board's state to the one given.
+        A state is represented as a 2D array of state integers (see Démineur.change_cell)
+        Only the cells whose state differs are changed, and notified to subscribers.
+        """
+        for x, y in doublerange(self.size):
+            if self.backend.get(x, y) != new_state[x][y]:
+                self.change_cell(x, y, new_state[x][y])
+
+    def palette(self) -> list[int]:
+        """
+        The states the board's cells are in, initial state first,
+        to store each cell as an index in this list (see backends.MAX_CODES)
+        """
+        states = [self.initial_state] + sorted(
+            state
+            for state, count in self.counts.items()
+            if count and state != self.initial_state
+        )
+        if len(states) > MAX_CODES:
+            raise ValueError(f"Cannot store cells in more than {MAX_CODES} states")
+        return states
+
+    def load_cells(
+        self,
+        buffer,
+        offset: int,
+        states: list[int],
+        counts: dict[int, int],
+        lazy: bool = False,
+    ):
+        """
+        Restores the cells' states from the bit planes at `offset` (see backends.py),
+        `states` giving the state of each code,
+        `counts` the number of cells in each state.
+        If `lazy`, cells are read from the buffer when needed, through a MappedBackend.
+        Subscribers are notified of the cells that changed, which needs reading all
+        of them: restore boards that no views display to keep it fast.
+        """
+        previous = self.backend.to_list() if self.subscribers else None
+        if lazy:
+            self.backend = MappedBackend(
+                self.size, self.initial_state, buffer, offset, states
+            )
+        else:
+            self.backend.load(buffer, offset, states)
+        self.counts = dict(counts)
+        if previous is None:
+            return
+        for x, y in doublerange(self.size):
+            if (state := self.backend.get(x, y)) != previous[x][y]:
+                for callback in self.subscribers:
+                    callback(x, y, state)
+
+    def change_cell(self, x: int, y: int, state: int):
+        """
+        Sets the state of the specified cell at row x column y.
+        A state is represented as an integer:
+        - 2 (or SUNKEN) represents a sunken spot
+        - 1 (or SHIP) represents a ship spot (for ControlledBoards)
+        - 0 (or WATER) represents a water (empty) spot
+        - 3 (or UNKNOWN) represents a unknown spot (for ProjectiveBoards)
+        """
+        previous = self.backend.set(x, y, state)
+        self.counts[previous] -= 1
+        self.counts[state] = self.counts.get(state, 0) + 1
+        for callback in self.subscribers:
+            callback(x, y, state)
+
+    def state_of(self, x: int, y: int) -> int:
+        """
+        Get state of cell at row x column y.
+        Reads the board's backend, never the widgets displaying it.
+        """
+        return self.backend.get(x, y)
+    
+    def within_bounds(self, x: int, y: int) -> bool:
+        """
+        Check if the cell's coordinates are within bounds of the board
+        """
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def random_coordinates(self) -> tuple[int, int]:
+        return randint(0, self.size - 1), randint(0, self.size - 1)
+
+    def vertical_coordinates(
+        self, y: int, start_x: int, stop_x: int, step: int = 1
+    ) -> list[tuple[int, int]]:
+        """
+        Return a list of vertical coordinates, spanning from (start_x, y) to (stop_x, y).
+        stop_x will be clamped to self.size - 1.
+        """
+
+        stop_x = min(stop_x, self.size - 1)
+        return [(x, y) for x in range(start_x, stop_x, step)]
+
+    def horizontal_coordinates(
+        self, x: int, start_y: int, stop_y: int, step: int = 1
+    ) -> list[tuple[int, int]]:
+        """
+        Return a list of horizontal coordinates, spanning from (x, start_y) to (x, stop_y).
+        stop_y will be clamped to self.size - 1.
+        """
+
+        stop_y = min(stop_y, self.size - 1)
+        return [(x, y) for y in range(start_y, stop_y + 1, step)]
+
+    def cardinal_coordinates(
+        self, x: int, y: int
+    ) -> tuple[tuple[int, int], tuple[int, int], tuple[int, int], tuple[int, int]]:
+        """
+        Given a center C at coordinates (x, y), it returns coordinates of N, S, W, E in:
+
+                N
+            W   C   E
+                S
+        """
+        return (
+            *self.horizontal_coordinates(x, y - 1, y + 1, 2),
+            *self.vertical_coordinates(y, x - 1, x + 1, 2),
+        )
+
+    def d(self, t: Message, *args, level: int = DEBUG, **kwargs):
+        if not logging_at(level):
+            return
+        if self.owner is None:
+            return log(level, t, *args, **kwargs)
+        return log(
+            level,
+            lambda: ("[green]" if self.owner.human else "[cyan]")
+            + self.owner.name
+            + "[/] "
+            + (t() if callable(t) else t),
+            *args,
+            **kwargs,
+        )
+
+    def lock(self):
+        self.locked = True
+
+    @property
+    def metric_labels(self) -> tuple[str, int]:
+        """
+        Labels of the metrics recorded about this board and its owner's moves
+        (see metrics.py): the owner's strategy and the board's size
+        """
+        strategy = "none" if self.owner is None else type(self.owner.strategy).__name__
+        return strategy, self.size
+
+
+class ControlledBoard(Board):
+    """
+    A board that is controlled by the player.
+    Will be "locked" after the initial "hiding" phase,
+    when the shooting phase starts.
+    """
+
+    total_ships: int
+    fleet: list[int]
+    owner: "Player"
+
+    def __init__(
+        self,
+        game: "Game",
+        grid_size: int,
+        fleet: list[int],
+        owner: "Player" = None,
+        backend: Type[Backend] = GridBackend,
+    ):
+        super().__init__(
+            game, grid_size, initial_state=WATER, owner=owner, backend=backend
+        )
+        self.fleet = fleet
+        self.total_ships = sum(fleet)
+
+    @property
+    def ships_left(self) -> int:
+        return max(self.total_ships - self.placed_ships, 0)
+
+    @property
+    def placed_ships(self) -> int:
+        return self.count(SHIP)
+
+    @property
+    def remaining_ship_cells(self) -> int:
+        """
+        Number of ship cells that have not been hit yet
+        """
+        # Read for every turn played (see Player.won): spare a call to count()
+        return self.counts.get(SHIP, 0)
+
+    @property
+    def hits(self) -> int:
+        """
+        Number of shots that hit a ship on this board
+        """
+        return self.count(SUNKEN)
+
+    @property
+    def misses(self) -> int:
+        """
+        Number of shots that landed in water on this board
+        """
+        return self.count(MISSED)
+
+    def handle_cell_Button1(self, x, y):
+        super().handle_cell_Button1(x, y)
+        self.place_or_remove(x, y)
+
+    def __xor__(self, coords):
+        """aesthetics: ^ (x, y) to fire at (x, y)"""
+        return self.fire(*coords)
+
+    def place_or_remove(self, x: int, y: int):
+        """
+        Switches between placing and removing a ship at row x column y.
+        """
+        if self.locked:
+            self.d(lambda: f"board is locked, not switching state of ({x}, {y})")
+            return
+        if not self.ships_left and self @ (x, y) == WATER:
+            self.d("no ships left!")
+            return
+        if self @ (x, y) == WATER:
+            self.d(lambda: f"{self.ships_left=}, changing state of ({x}, {y}) to SHIP")
+            self.change_cell(x, y, SHIP)
+        else:
+            self.d(
+                lambda: f"{self.ships_left=}, changing state of ({x}, {y}) to WATER"
+            )
+            self.change_cell(x, y, WATER)
+
+    def fire(self, x: int, y: int) -> bool:
+        """
+        Fires a shot at row x column y.
+        Returns whether the shot hit a non-sunken ship or not
+        """
+        if self.backend.get(x, y) in (WATER, MISSED):
+            self.change_cell(x, y, MISSED)
+            return False
+
+        self.change_cell(x, y, SUNKEN)
+        return True
+
+    def diagnose(self) -> FleetDiagnosis:
+        """
+        Checks the placed ships against the fleet, see legality.diagnose_fleet
+        """
+        started = metrics.enabled and perf_counter()
+        diagnosis = diagnose_fleet(self.cells(SHIP), self.fleet)
+        if started:
+            metrics.observe(
+                "legality", perf_counter() - started, *self.metric_labels
+            )
+        return diagnosis
+
+    @property
+    def legal(self) -> bool:
+        """
+        Whether the current board's state is legal:
+        The SHIP cells should form exactly the ships of the fleet
+        """
+        return self.diagnose().legal
+
+
+class ProjectiveBoard(Board):
+
+    real_board: ControlledBoard
+    shots_fired: int
+    shots_missed: int
+    owner: "Player"
+
+    def __init__(
+        self,
+        game: "Game",
+        grid_size: int,
+        represents: ControlledBoard,
         owner: "Player" = None,
     ):
-        super().__init__(
-            game, grid_size, initial_state=UNKNOWN, owner=owner or represents.owner
+        super().__init__(
+            game,
+            grid_size,
+            initial_state=UNKNOWN,
+            owner=owner or represents.owner,
+            backend=type(represents.backend),
+        )
+        self.real_board = represents
+        self.shots_missed = 0
+        self.shots_fired = 0
+
+    def handle_cell_Button1(self, x, y):
+        if self.locked:
+            self.d("board is locked! not firing.")
+            return
+        if not self.owner.turn_is_mine():
+            self.d("not my turn! not firing.")
+            return
+        super().handle_cell_Button1(x, y)
+        self.owner.choose_move(x, y)
+
+    def __xor__(self, coords):
+        """aesthetics: ^ (x, y) to fire at (x, y)"""
+        return self.fire(*coords)
+
+    def fire(self, x: int, y: int) -> bool:
+        """
+        Fires at (x, y) on the real board and records the result, returns whether
+        a ship was hit. Does not end the turn: the game does (see Game.apply_move).
+        """
+        started = metrics.enabled and perf_counter()
+        # # Don't fire if the cell is already known (i.e. has already been shot)
+        # if (board @ (x, y)) != UNKNOWN:
+        #     self.d(f"state={board @ (x, y)} is already known, not firing.")
+        #     return
+
+        hit_a_ship = self.real_board.fire(x, y)
+        # A single message per shot: each costs a call, even when not logged
+        self.d(lambda: f"fired at {x=}, {y=}, {hit_a_ship=}")
+        self.owner.strategy.react_to_shot_result(x, y, hit_a_ship)
+        self.change_cell(x, y, SUNKEN if hit_a_ship else MISSED)
+        self.shots_fired += 1
+        if not hit_a_ship:
+            self.shots_missed += 1
+        if started:
+            labels = self.metric_labels
+            metrics.observe("shot", perf_counter() - started, *labels)
+            metrics.count("shots", *labels)
+            if hit_a_ship:
+                metrics.count("hits", *labels)
+        return hit_a_ship
+
+
+## Ai
+
+if TYPE_CHECKING:
+    # Imported when sampling with processes: it takes longer than the rest of ai.py
+    from concurrent.futures import ProcessPoolExecutor
+
+numpy = lazy_import("numpy")
+
+
+class Strategy:
+    name: str
+    own_board: "ControlledBoard"
+    ennemy_board: "ProjectiveBoard"
+    # Whether choosing a shot takes milliseconds even on small boards, so that
+    # event loops have to choose it in a thread (see server.HostedGame)
+    slow: bool = False
+
+    def __init__(
+        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+    ) -> None:
+        self.name = name
+        self.own_board = own_board
+        self.ennemy_board = ennemy_board
+
+    def choose_shot_location(self) -> tuple[int, int]:
+        """
+        Chooses where to fire the next shot
+        """
+        raise NotImplementedError("Please implement choose_shot_location.")
+
+    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
+        """
+        A hook that will be called once a shot is fired.
+        Has access to whether the shot was successful (hit a ship) or not.
+        """
+        raise NotImplementedError("Please implement react_to_shot_result.")
+
+    def save_state(self) -> Any:
+        """
+        What the strategy knows about the game so far, to save it (see snapshot.py):
+        its attributes, except for the boards it plays on.
+        The state is pickled: strategies knowing a lot store cells as numbers
+        (x * size + y) rather than tuples, or pack their state into bytes.
+        """
+        return {
+            name: value
+            for name, value in vars(self).items()
+            if name not in ("own_board", "ennemy_board")
+        }
+
+    def restore_state(self, state: Any):
+        """
+        Restores a state returned by save_state(), which it may then modify
+        """
+        vars(self).update(state)
+
+    def d(self, t: Message, *args, level: int = DEBUG, **kwargs):
+        if not logging_at(level):
+            return
+        return self.own_board.d(
+            lambda: f"[bold]{{Strategy [i]{self.name}[/i]}}[/bold] "
+            + (t() if callable(t) else t),
+            *args,
+            level=level,
+            **kwargs,
+        )
+
+
+class HuntTarget(Strategy):
+
+    potential_targets: list[tuple[int, int]]
+    # Numbers (x * size + y) of the cells fired at
+    already_hit: set[int]
+    name: str = "Hunt & Target"
+
+    def __init__(
+        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+    ) -> None:
+        super().__init__(name, own_board, ennemy_board)
+        self.potential_targets = []
+        self.already_hit = set()
+        self.name = "Hunt & Target"
+
+    def choose_shot_location(self) -> tuple[int, int]:
+        if self.potential_targets == []:
+            return self.ennemy_board.random_coordinates()
+        else:
+            return self.potential_targets.pop()
+
+    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
+        size = self.ennemy_board.size
+        self.already_hit.add(x * size + y)
+
+        if hit_a_ship:
+            self.potential_targets += [
+                target for target in
+                self.ennemy_board.cardinal_coordinates(x, y)
+                if self.ennemy_board.within_bounds(*target)
+                and target[0] * size + target[1] not in self.already_hit
+            ]
+            self.d(
+                lambda: f"potential targets are {self.potential_targets}", level=TRACE
+            )
+
+
+class ParityHuntTarget(Strategy):
+    """
+    Hunts on a checkerboard-like lattice spaced by the smallest ship that may
+    still be afloat, then targets around hits, following lines of aligned hits.
+    A line that is blocked at both ends is assumed to be a sunken ship when a
+    ship of that length remains, which lets the lattice grow sparser.
+    Never fires twice at the same cell.
+    """
+
+    name: str = "Parity Hunt & Target"
+
+    # Numbers (x * size + y) of the cells fired at
+    fired: set[int]
+    # Hits that do not belong to a ship known to be sunken, most recent last
+    cluster: list[tuple[int, int]]
+    # Orientations (as (dx, dy)) already fully explored through each hit
+    exhausted: dict[tuple[int, int], set[tuple[int, int]]]
+    remaining: list[int]
+    spacing: int
+    # Lattices hold the cells where (x + y) % spacing == offset % spacing
+    offset: int
+    # Numbers of the lattice's cells, popped from the end
+    hunt_cells: list[int]
+
+    def __init__(
+        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+    ) -> None:
+        super().__init__(name, own_board, ennemy_board)
+        self.fired = set()
+        self.cluster = []
+        self.exhausted = {}
+        self.remaining = sorted(ennemy_board.real_board.fleet)
+        self.spacing = 0
+        self.offset = random.randrange(self.remaining[-1] if self.remaining else 1)
+        self.hunt_cells = []
+
+    def choose_shot_location(self) -> tuple[int, int]:
+        return self.target() or self.hunt()
+
+    def hunt(self) -> tuple[int, int]:
+        # Once down to every cell left, stay there rather than rebuilding lattices
+        if self.spacing != 1:
+            spacing = self.remaining[0] if self.remaining else 1
+            if spacing != self.spacing:
+                self.spacing = spacing
+                self.build_lattice()
+        size = self.ennemy_board.size
+        while self.hunt_cells:
+            cell = self.hunt_cells.pop()
+            if cell not in self.fired:
+                return divmod(cell, size)
+        # Ships hiding off the lattice: fall back to every cell left, for good
+        self.spacing = 1
+        self.build_lattice()
+        return divmod(self.hunt_cells.pop(), size)
+
+    def build_lattice(self):
+        size = self.ennemy_board.size
+        offset = self.offset % self.spacing
+        self.hunt_cells = [
+            x * size + y
+            for x in range(size)
+            for y in range(size)
+            if (x + y) % self.spacing == offset and x * size + y not in self.fired
+        ]
+        random.shuffle(self.hunt_cells)
+
+    def target(self) -> Optional[tuple[int, int]]:
+        """
+        Next cell to fire at around the hits of the cluster, None if there is none left
+        """
+        size = self.ennemy_board.size
+        while self.cluster:
+            hit = self.cluster[-1]
+            cluster = set(self.cluster)
+            lines = {
+                orientation: self.line(hit, orientation, cluster)
+                for orientation in {(0, 1), (1, 0)}
+                - self.exhausted.setdefault(hit, set())
+            }
+            # Follow lines of at least two hits first
+            for orientation in sorted(lines, key=lambda o: -len(lines[o])):
+                line = lines[orientation]
+                dx, dy = orientation
+                (first_x, first_y), (last_x, last_y) = line[0], line[-1]
+                for end in ((last_x + dx, last_y + dy), (first_x - dx, first_y - dy)):
+                    if (
+                        self.ennemy_board.within_bounds(*end)
+                        and end[0] * size + end[1] not in self.fired
+                    ):
+                        return end
+                # Both ends are blocked
+                for cell in line:
+                    self.exhausted.setdefault(cell, set()).add(orientation)
+                if len(line) > 1 and len(line) in self.remaining:
+                    self.d(lambda: f"assuming ship {line} is sunken", level=TRACE)
+                    self.remaining.remove(len(line))
+                    self.cluster = [cell for cell in self.cluster if cell not in line]
+                break
+            else:
+                self.cluster.pop()
+        return None
+
+    def line(
+        self,
+        hit: tuple[int, int],
+        orientation: tuple[int, int],
+        cluster: set[tuple[int, int]],
+    ) -> list[tuple[int, int]]:
+        """
+        The hits of the cluster (given as a set) aligned with `hit` without gaps,
+        in order
+        """
+        dx, dy = orientation
+        x, y = hit
+        while (x - dx, y - dy) in cluster:
+            x, y = x - dx, y - dy
+        line = []
+        while (x, y) in cluster:
+            line.append((x, y))
+            x, y = x + dx, y + dy
+        return line
+
+    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
+        self.fired.add(x * self.ennemy_board.size + y)
+        if hit_a_ship:
+            self.cluster.append((x, y))
+
+
+class ProbabilityDensity(Strategy):
+    """
+    Fires at the cell that the most ship placements go through.
+    Placements cannot cover a miss, and placements going through hits are
+    favored, so the strategy naturally finishes off ships it has found.
+    Like ParityHuntTarget, a line of hits blocked at both ends is assumed to be
+    a sunken ship when one of that length remains: its cells then block placements
+    instead of attracting them, and the ship is left out of the fleet.
+    """
+
+    name: str = "Probability density"
+    # How much more likely a placement becomes for each hit it goes through
+    hit_weight: int = 20
+
+    unknown: numpy.ndarray
+    hits: numpy.ndarray
+    misses: numpy.ndarray
+    # Hits of the ships assumed to be sunken
+    sunken: numpy.ndarray
+    # Lengths of the ships that may still be afloat
+    remaining: Counter
+
+    def __init__(
+        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+    ) -> None:
+        super().__init__(name, own_board, ennemy_board)
+        size = ennemy_board.size
+        self.unknown = numpy.ones((size, size), dtype=bool)
+        self.hits = numpy.zeros((size, size), dtype=numpy.int64)
+        self.misses = numpy.zeros((size, size), dtype=numpy.int64)
+        self.sunken = numpy.zeros((size, size), dtype=numpy.int64)
+        self.remaining = Counter(ennemy_board.real_board.fleet)
+
+    def save_state(self) -> tuple[bytes, tuple[tuple[int, int], ...]]:
+        """
+        A byte per cell, with bit 0 set for hits, 1 for misses and 2 for sunken
+        hits, and the number of remaining ships of each length
+        """
+        cells = self.hits + 2 * self.misses + 4 * self.sunken
+        return cells.astype(numpy.uint8).tobytes(), tuple(self.remaining.items())
+
+    def restore_state(self, state: tuple[bytes, tuple[tuple[int, int], ...]]):
+        packed, remaining = state
+        size = self.ennemy_board.size
+        cells = numpy.frombuffer(packed, numpy.uint8).reshape(size, size)
+        self.hits = (cells & 1).astype(numpy.int64)
+        self.misses = (cells >> 1 & 1).astype(numpy.int64)
+        self.sunken = (cells >> 2 & 1).astype(numpy.int64)
+        # Cells are known once fired at, hit or missed
+        self.unknown = cells & 3 == 0
+        self.remaining = Counter(dict(remaining))
+
+    def density(self) -> numpy.ndarray:
+        """
+        For every cell, the (weighted) number of placements of the remaining ships
+        covering it
+        """
+        blocked = self.misses + self.sunken
+        hits = self.hits - self.sunken
+        fleet = +self.remaining
+        return self.line_density(blocked, hits, fleet) + self.line_density(
+            blocked.T, hits.T, fleet
+        ).T
+
+    def line_density(
+        self, misses: numpy.ndarray, hits: numpy.ndarray, fleet: Counter
+    ) -> numpy.ndarray:
+        """
+        Density of horizontal placements of the fleet's ships
+        """
+        rows, columns = misses.shape
+        cumulated_misses = cumulative_sums(misses)
+        cumulated_hits = cumulative_sums(hits)
+        density = numpy.zeros((rows, columns), dtype=numpy.int64)
+        spread = numpy.zeros((rows, columns + 1), dtype=numpy.int64)
+        for length, count in fleet.items():
+            if length > columns:
+                continue
+            # Placements starting at each column: can't cover a miss, favored by hits
+            blocked = cumulated_misses[:, length:] - cumulated_misses[:, :-length]
+            through_hits = cumulated_hits[:, length:] - cumulated_hits[:, :-length]
+            weights = (blocked == 0) * (count + count * self.hit_weight * through_hits)
+            # Spread each placement's weight on the `length` cells it covers:
+            # +weight where it starts, -weight right after it ends, then cumulate.
+            spread[:] = 0
+            spread[:, : columns - length + 1] += weights
+            spread[:, length:] -= weights
+            density += numpy.cumsum(spread[:, :columns], axis=1)
+        return density
+
+    def choose_shot_location(self) -> tuple[int, int]:
+        density = numpy.where(self.unknown, self.density(), -1)
+        best = numpy.flatnonzero(density == density.max())
+        return divmod(int(random.choice(best)), self.unknown.shape[1])
+
+    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
+        self.unknown[x, y] = False
+        if hit_a_ship:
+            self.hits[x, y] = 1
+        else:
+            self.misses[x, y] = 1
+        # The shot may have closed a line of hits, through it or ending next to it
+        for dx, dy in (0, 1), (1, 0):
+            for cell in (x, y), (x - dx, y - dy), (x + dx, y + dy):
+                line = self.closed_line(cell, (dx, dy))
+                if line is not None and self.remaining[len(line)]:
+                    self.d(lambda: f"assuming ship {line} is sunken", level=TRACE)
+                    self.remaining[len(line)] -= 1
+                    for hit in line:
+                        self.sunken[hit] = 1
+
+    def closed_line(
+        self, cell: tuple[int, int], orientation: tuple[int, int]
+    ) -> Optional[list[tuple[int, int]]]:
+        """
+        The line of hits through `cell` along `orientation`, if it is at least
+        two hits long, blocked at both ends, and no other hit touches it sideways.
+        None otherwise.
+        """
+        dx, dy = orientation
+        size = self.ennemy_board.size
+
+        def afloat(x: int, y: int) -> bool:
+            return (
+                0 <= x < size
+                and 0 <= y < size
+                and self.hits[x, y]
+                and not self.sunken[x, y]
+            )
+
+        x, y = cell
+        if not afloat(x, y):
+            return None
+        while afloat(x - dx, y - dy):
+            x, y = x - dx, y - dy
+        line = []
+        while afloat(x, y):
+            line.append((x, y))
+            x, y = x + dx, y + dy
+        first_x, first_y = line[0]
+        ends = (first_x - dx, first_y - dy), (x, y)
+        if len(line) < 2 or any(
+            0 <= end_x < size and 0 <= end_y < size and self.unknown[end_x, end_y]
+            for end_x, end_y in ends
+        ):
+            return None
+        if any(
+            afloat(x + dy * side, y + dx * side) for x, y in line for side in (-1, 1)
+        ):
+            return None
+        return line
+
+
+class MonteCarlo(ProbabilityDensity):
+    """
+    Samples enemy fleet layouts consistent with every hit and miss so far,
+    and fires at the cell most likely to hold a ship.
+    Sampling stops after `samples` layouts or `time_budget` seconds, whichever comes first;
+    without any sample, it falls back to ProbabilityDensity.
+    """
+
+    name: str = "Monte Carlo"
+    slow: bool = True
+    samples: int = 5000
+    time_budget: float = 0.05
+    # Number of processes sampling in parallel, 0 to sample in the calling process,
+    # None for one per CPU (see sampling_workers)
+    workers: Optional[int] = None
+
+    def __init__(
+        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+    ) -> None:
+        super().__init__(name, own_board, ennemy_board)
+        if workers := sampling_workers(self.workers):
+            # Starting the processes takes longer than a decision's time budget
+            sampling_pool(workers)
+
+    def choose_shot_location(self) -> tuple[int, int]:
+        size = self.ennemy_board.size
+        counts, found = self.sample(perf_counter() + self.time_budget)
+        self.d(lambda: f"sampled {found} layouts", level=TRACE)
+        if not found:
+            return super().choose_shot_location()
+        likelihood = numpy.where(self.unknown.reshape(-1), counts, -1)
+        best = numpy.flatnonzero(likelihood == likelihood.max())
+        return divmod(int(random.choice(best)), size)
+
+    def sample(self, deadline: float) -> tuple[numpy.ndarray, int]:
+        """
+        Number of sampled layouts with a ship on each cell, and number of samples
+        """
+        arguments = (
+            self.ennemy_board.size,
+            list(self.ennemy_board.real_board.fleet),
+            self.misses.reshape(-1).astype(bool),
+            self.hits.reshape(-1).astype(bool),
+        )
+        workers = sampling_workers(self.workers)
+        if not workers:
+            return sample_consistent_layouts(
+                *arguments,
+                deadline=deadline,
+                max_samples=self.samples,
+                rng=numpy.random.default_rng(random.getrandbits(64)),
+            )
+
+        from concurrent.futures import wait
+
+        pool = sampling_pool(workers)
+        # Workers get their own deadline, measured from when they start
+        budget = max(deadline - perf_counter(), 0)
+        jobs = [
+            pool.submit(
+                sample_in_worker,
+                *arguments,
+                budget,
+                -(-self.samples // workers),
+                random.getrandbits(64),
+            )
+            for _ in range(workers)
+        ]
+        done, late = wait(jobs, timeout=budget + 0.01)
+        # Late samples are left out. Jobs still queued are cancelled so as not to hold
+        # up the next decision's; running ones stop at their own deadline.
+        for job in late:
+            job.cancel()
+        counts = numpy.zeros(self.unknown.size, dtype=numpy.int64)
+        found = 0
+        for job in done:
+            job_counts, job_found = job.result()
+            counts += job_counts
+            found += job_found
+        return counts, found
+
+
+sampling_pools: dict[int, ProcessPoolExecutor] = {}
+
+
+def sampling_workers(workers: Optional[int]) -> int:
+    """
+    The number of processes to sample with, `workers` if given.
+    By default, one per CPU, but none on a single CPU, or in a process started by
+    another: simulate.py's and league.py's already keep every CPU busy, and those of
+    a multiprocessing.Pool cannot start processes.
+    """
+    if workers is not None:
+        return workers
+    from multiprocessing import parent_process
+    from os import cpu_count
+
+    cpus = cpu_count() or 1
+    return cpus if cpus > 1 and parent_process() is None else 0
+
+
+def sampling_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    The process pool used by MonteCarlo strategies, created and started on first use
+    """
+    from concurrent.futures import ProcessPoolExecutor, wait
+
+    if workers not in sampling_pools:
+        pool = sampling_pools[workers] = ProcessPoolExecutor(workers)
+        wait([pool.submit(int) for _ in range(workers)])
+    return sampling_pools[workers]
+
+
+def sample_in_worker(
+    grid_size: int,
+    fleet: list[int],
+    misses: numpy.ndarray,
+    hits: numpy.ndarray,
+    budget: float,
+    max_samples: int,
+    seed: int,
+) -> tuple[numpy.ndarray, int]:
+    return sample_consistent_layouts(
+        grid_size,
+        fleet,
+        misses,
+        hits,
+        deadline=perf_counter() + budget,
+        max_samples=max_samples,
+        rng=numpy.random.default_rng(seed),
+    )
+
+
+def cumulative_sums(grid: numpy.ndarray) -> numpy.ndarray:
+    """
+    Cumulative sums along each row of grid, starting with a column of zeros,
+    so that the sum of grid[:, a:b] is result[:, b] - result[:, a]
+    """
+    cumulated = numpy.zeros((grid.shape[0], grid.shape[1] + 1), dtype=numpy.int64)
+    numpy.cumsum(grid, axis=1, out=cumulated[:, 1:])
+    return cumulated
+
+
+class NoStrategy(Strategy):
+
+    name = "None"
+
+    def __init__(
+        self,
+        name: str = "None",
+        own_board: "ControlledBoard" = None,
+        ennemy_board: "ProjectiveBoard" = None,
+    ):
+        return
+
+    def choose_shot_location(self) -> tuple[int, int]:
+        return (0, 0)
+
+    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
+        return
+
+    def d(self, t: Message, *args, level: int = DEBUG, **kwargs):
+        return
+
+
+def strategies() -> dict[str, Type[Strategy]]:
+    """
+    All the playable strategies, by class name
+    """
+    found = {}
+    classes = Strategy.__subclasses__()
+    while classes:
+        cls = classes.pop()
+        classes += cls.__subclasses__()
+        if cls is not NoStrategy:
+            found[cls.__name__] = cls
+    return found
+
+
+## Player
+
+numpy = lazy_import("numpy")
+
+
+# Constantes
+PLACING = 4
+SHOOTING = 5
+DECIDING = 6
+
+FLEET = [DESTROYER, CRUISER, SUBMARINE, BATTLESHIP, AIRCRAFT_CARRIER]
+HELPTEXT_PLACING = (
+    f"Placez vos bateaux (de longueurs {french_join(FLEET)}),\npuis cliquez sur OK."
+)
+HELPTEXT_WRONG = f"Veuillez placer tout les bateaux correctement\n{HELPTEXT_PLACING}"
+HELPTEXT_SHOOTING = "Cliquez sur une case '?' pour tirer à cet endroit."
+
+
+def place_fleet_randomly(board: ControlledBoard) -> None:
+    """
+    Places the board's fleet, every legal layout being equally likely
+    """
+    # Seeded from the random module, so that random.seed() makes games reproducible
+    rng = numpy.random.default_rng(random.getrandbits(64))
+    (layout,) = random_layout_cells(1, board.size, list(board.fleet), rng)
+    place_fleet(board, layout.tolist())
+
+
+def place_fleet(board: ControlledBoard, cells: Iterable[int]) -> None:
+    """
+    Places ships on the given cells, numbered x * size + y, of an empty board.
+    Raises ValueError if some of them already hold a ship.
+    """
+    coordinates = [divmod(cell, board.size) for cell in sorted(cells)]
+    # A couple of bitwise operations on bitboards
+    if not board.all_cells_are(coordinates, WATER):
+        raise ValueError("Ships cannot overlap")
+    for x, y in coordinates:
+        board.change_cell(x, y, SHIP)
+
+
+class Player:
+    own_board: ControlledBoard
+    ennemy_board: ProjectiveBoard
+    game: "Game"
+    index: int
+    selected_coordinates: tuple[int, int]
+    strategy: Strategy
+    name: str
+
+    def __init__(
+        self,
+        game: "Game",
+        board: ControlledBoard,
+        ennemy_board: ControlledBoard,
+        index: int,
+        name: str,
+        strategy: Type[Strategy],
+    ) -> None:
+        if board.size != ennemy_board.size:
+            raise TypeError("The two boards should have the same size")
+
+        self.game = game
+        self.index = index
+        self.name = name
+        self.own_board = board
+        self.own_board.owner = self
+        self.ennemy_board = ProjectiveBoard(
+            game, board.size, represents=ennemy_board, owner=self
         )
-        self.real_board = represents
-        self.shots_missed = 0
-        self.shots_fired = 0
+        self.strategy = strategy(strategy.name, self.own_board, self.ennemy_board)
 
-    def handle_cell_Button1(self, x, y):
-        if self.locked:
-            self.d("board is locked! not firing.")
+    def handle_click_ok(self, event=None) -> Any:
+        """
+        Handles a click on the OK button
+        """
+        raise NotImplementedError("Please implement handle_click_ok.")
+
+    @property
+    def accuracy(self) -> Optional[float]:
+        """
+        Proportion of shots fired that hit a ship.
+        None if no shots have been fired.
+        """
+        try:
+            return (
+                self.ennemy_board.shots_fired - self.ennemy_board.shots_missed
+            ) / self.ennemy_board.shots_fired
+        except ZeroDivisionError:
+            return None
+
+    @property
+    def won(self) -> bool:
+        """
+        Returns True if none the cell's of the ennemy's (controlled) board are ships (i.e. all are sunken or water)
+        """
+        return self.ennemy_board.real_board.remaining_ship_cells == 0
+
+    def next_move(self) -> Optional[tuple[int, int]]:
+        """
+        Where to fire next, None if the player has not decided yet.
+        Called by the game's TurnScheduler when it's this player's turn.
+        """
+        raise NotImplementedError("Please implement next_move.")
+
+    def choose_move(self, x: int, y: int):
+        """
+        Handles a click on (x, y) of the ennemy board, during this player's turn
+        """
+        self.d(lambda: f"ignoring click on {x=}, {y=}", level=TRACE)
+
+    def turn_is_mine(self) -> bool:
+        return self.index == self.game.current_player_index
+
+    @property
+    def human(self) -> bool:
+        raise NotImplementedError("Please implement human property")
+
+    def d(self, t: Message, *args, level: int = DEBUG, **kwargs):
+        if not logging_at(level):
             return
-        super().handle_cell_Button1(x, y)
-        self.fire(x, y)
+        return log(
+            level,
+            lambda: ("[green]" if self.human else "[cyan]")
+            + self.name
+            + "[/] "
+            + (t() if callable(t) else t),
+            *args,
+            **kwargs,
+        )
 
-    def __xor__(self, coords):
-        """aesthetics: ^ (x, y) to fire at (x, y)"""
-        return self.fire(*coords)
 
-    def fire(self, x: int, y: int) -> None:
-        self.d(f"fire at x={x}, y={y}.")
-        # # Don't fire if the cell is already known (i.e. has already been shot)
-        # if (board @ (x, y)) != UNKNOWN:
-        #     self.d(f"state={board @ (x, y)} is already known, not firing.")
-        #     return
+class HumanPlayer(Player):
+    # Where the user clicked last, until the game plays it
+    chosen_move: Optional[tuple[int, int]]
 
-        hit_a_ship = self.real_board.fire(x, y)
-        self.d(f"strategy is {self.owner.strategy}")
-        self.owner.strategy.react_to_shot_result(x, y, hit_a_ship)
-        self.d(f"fired, hit_a_ship={hit_a_ship}, changing cell state")
+    def __init__(
+        self,
+        game: "Game",
+        board: ControlledBoard,
+        ennemy_board: ControlledBoard,
+        index: int,
+        name: str,
+    ) -> None:
+        super().__init__(game, board, ennemy_board, index, name, strategy=NoStrategy)
+        self.chosen_move = None
 
-        self.change_cell(x, y, SUNKEN if hit_a_ship else MISSED)
-        self.shots_fired += 1
-        if not hit_a_ship:
-            self.shots_missed += 1
+    def choose_move(self, x: int, y: int):
+        self.chosen_move = (x, y)
+        self.game.move_ready()
 
-        self.game.end_turn()
-## Ai
+    def next_move(self) -> Optional[tuple[int, int]]:
+        move, self.chosen_move = self.chosen_move, None
+        return move
+
+    def handle_click_ok(self, event=None) -> Any:
+        if self.game.phase == PLACING:
+            self.d(
+                "handling OK button click: locking board, switching to shooting phase"
+            )
+            if not self.own_board.legal:
+                self.d(
+                    lambda: f"board is not legal! not locking & switching phase: {self.own_board.diagnose()}"
+                )
+                self.game.set_helptext(HELPTEXT_WRONG)
+                return
+            self.own_board.lock()
+            self.game.phase = SHOOTING
+            self.game.set_helptext(HELPTEXT_SHOOTING)
+            self.game.move_ready()
+
+    @property
+    def human(self) -> bool:
+        return True
 
-class Strategy:
-    name: str
-    own_board: "ControlledBoard"
-    ennemy_board: "ProjectiveBoard"
 
+class AIPlayer(Player):
     def __init__(
-        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+        self,
+        game: "Game",
+        board: ControlledBoard,
+        ennemy_board: ControlledBoard,
+        strategy: Type[Strategy],
+        index: int,
+        name: str,
     ) -> None:
-        self.name = name
-        self.own_board = own_board
-        self.ennemy_board = ennemy_board
+        super().__init__(
+            game, board, ennemy_board, index, name=f"[AI] {name}", strategy=strategy
+        )
 
-    def choose_shot_location(self) :
+    def decide_coordinates(self) -> tuple[int, int]:
         """
-        Chooses where to fire the next shot
+        Decide coordinates where to shoot.
         """
-        raise NotImplementedError("Please implement choose_shot_location.")
+        started = metrics.enabled and perf_counter()
+        move = self.strategy.choose_shot_location()
+        if started:
+            metrics.observe(
+                "decision", perf_counter() - started, *self.own_board.metric_labels
+            )
+        return move
 
-    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
+    def next_move(self) -> tuple[int, int]:
+        return self.decide_coordinates()
+
+    def place_ships(self) -> None:
         """
-        A hook that will be called once a shot is fired.
-        Has access to whether the shot was successful (hit a ship) or not.
+        Fill own board with ship spots, every legal layout being equally likely
         """
-        raise NotImplementedError("Please implement react_to_shot_result.")
+        started = metrics.enabled and perf_counter()
+        place_fleet_randomly(self.own_board)
+        if started:
+            metrics.observe(
+                "placement", perf_counter() - started, *self.own_board.metric_labels
+            )
 
-    def d(self, t: str, *args, **kwargs):
-        return self.own_board.d(
-            f"[bold]{{Strategy [i]{self.name}[/i]}}[/bold] " + t, *args, **kwargs
-        )
+    @property
+    def human(self) -> bool:
+        return False
 
 
-class HuntTarget(Strategy):
-    name: str = "Hunt & Target"
+class ReplayPlayer(Player):
+    """
+    Plays moves recorded beforehand (see movelog.py), in order.
+    Checks that each shot has the recorded result, raising ValueError otherwise.
+    """
+
+    moves: Iterator[tuple[int, int, bool]]
+    expected_hit: Optional[bool]
 
     def __init__(
-        self, name: str, own_board: "ControlledBoard", ennemy_board: "ProjectiveBoard"
+        self,
+        game: "Game",
+        board: ControlledBoard,
+        ennemy_board: ControlledBoard,
+        index: int,
+        moves: Iterable[tuple[int, int, bool]],
+        name: str = None,
     ) -> None:
-        super().__init__(name, own_board, ennemy_board)
-        self.potential_targets = []
-        self.already_hit = []
-        self.name = "Hunt & Target"
+        super().__init__(
+            game,
+            board,
+            ennemy_board,
+            index,
+            name=name or f"Joueur {index + 1}",
+            strategy=NoStrategy,
+        )
+        self.moves = iter(moves)
+        self.expected_hit = None
+        game.subscribe_moves(self.check_move)
 
-    def choose_shot_location(self) :
-        if self.potential_targets == []:
-            return self.ennemy_board.random_coordinates()
+    def next_move(self) -> Optional[tuple[int, int]]:
+        x, y, self.expected_hit = next(self.moves, (None, None, None))
+        return None if x is None else (x, y)
+
+    def check_move(self, player: Player, x: int, y: int, hit: bool):
+        if player is self and hit != self.expected_hit:
+            raise ValueError(
+                f"Shot at {(x, y)} {'hit' if hit else 'missed'}, unlike when recorded"
+            )
+
+    @property
+    def human(self) -> bool:
+        return False
+
+
+## Game
+
+GRID_SIZE = 10
+
+
+Move = tuple[int, int]
+
+
+class Game:
+    """
+    The rules and turn order of a game, without any window attached.
+    Graphical games (see main.GraphicalGame) extend this to display it.
+    Moves are played by a TurnScheduler, which asks players for them in turn.
+    """
+
+    phase: int
+    current_player_index: int
+    players: list[Player]
+    helptext: str
+    grid_size: int
+    fleet: list[int]
+    scheduler: Optional["TurnScheduler"]
+    move_listeners: list[Callable[[Player, int, int, bool], Any]]
+
+    def __init__(self, grid_size: int = GRID_SIZE, fleet: list[int] = FLEET) -> None:
+        self.grid_size = grid_size
+        self.fleet = fleet
+        self.phase = PLACING
+        self.current_player_index = 0
+        self.players = []
+        self.helptext = ""
+        self.scheduler = None
+        self.move_listeners = []
+
+    def play(self) -> Player:
+        """
+        Plays the game until someone wins, at full speed.
+        Every player has to have a move ready when asked, like AI players do.
+        Returns the winner.
+        """
+        return TurnScheduler(self).run()
+
+    def set_helptext(self, text: str):
+        """
+        Sets the message to show to the human player(s)
+        """
+        self.helptext = text
+
+    @property
+    def winner(self) -> Optional[Player]:
+        for player in self.players:
+            if player.won:
+                return player
+        return None
+
+    def subscribe_moves(self, callback: Callable[[Player, int, int, bool], Any]):
+        """
+        Registers callback(player, x, y, hit), called after every move played
+        """
+        self.move_listeners.append(callback)
+
+    def apply_move(self, x: int, y: int) -> bool:
+        """
+        Makes the current player fire at (x, y), then ends their turn.
+        Returns whether a ship was hit.
+        """
+        player = self.current_player
+        hit = player.ennemy_board.fire(x, y)
+        for callback in self.move_listeners:
+            callback(player, x, y, hit)
+        self.end_turn()
+        return hit
+
+    def move_ready(self):
+        """
+        Called by players when they get a move to play, e.g. when the user clicks,
+        or when they are done placing their ships
+        """
+        if self.scheduler is not None:
+            self.scheduler.wake()
+
+    def end_turn(self):
+        # Only the player who just fired may have won
+        winner = self.current_player
+        if winner.won:
+            self.set_helptext(
+                f"Bravo, {winner.name}! Vous avez gagné avec une précsion de {(winner.accuracy or 0)*100}%"
+            )
+            winner.ennemy_board.lock()
+            if metrics.enabled:
+                metrics.count("wins", *winner.own_board.metric_labels)
         else:
-            return self.potential_targets.pop()
+            self.current_player_index = (self.current_player_index + 1) % len(
+                self.players
+            )
 
-    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
-        self.already_hit.append((x, y))
+    @property
+    def current_player(self) -> Player:
+        return self.players[self.current_player_index]
 
-        if hit_a_ship:
-            self.potential_targets += [
-                target for target in
-                self.ennemy_board.cardinal_coordinates(x, y)
-                if self.ennemy_board.within_bounds(*target)
-                and target not in self.already_hit
-            ]
-            self.d(f"potential targets are {self.potential_targets}")
 
+class Pacing:
+    """
+    How long to wait before playing a player's move, so that humans can follow
+    the game. The base class does not wait.
+    """
+
+    def delay(self, player: Player) -> float:
+        """
+        Seconds to wait before asking `player` for their move
+        """
+        return 0
+
+
+class AIPacing(Pacing):
+    """
+    Waits a fixed time before each AI move, letting humans play right away
+    """
+
+    seconds: float
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def delay(self, player: Player) -> float:
+        return 0 if player.human else self.seconds
+
+
+class TurnScheduler:
+    """
+    Asks the player whose turn it is for a move (see Player.next_move) and plays it,
+    in a loop: the stack does not grow with the number of moves played,
+    whoever the players are.
+    """
+
+    game: Game
+    pacing: Pacing
+
+    def __init__(self, game: Game, pacing: Pacing = None):
+        self.game = game
+        self.pacing = pacing or Pacing()
+        game.scheduler = self
+
+    def step(self) -> bool:
+        """
+        Plays the current player's move, returns False if they do not have one yet
+        """
+        started = metrics.enabled and perf_counter()
+        player = self.game.current_player
+        move = player.next_move()
+        if move is None:
+            return False
+        self.game.apply_move(*move)
+        if started:
+            metrics.observe(
+                "turn", perf_counter() - started, *player.own_board.metric_labels
+            )
+        return True
+
+    def run(self) -> Player:
+        """
+        Plays moves until someone wins, returns the winner
+        """
+        winner = self.game.winner
+        while winner is None:
+            player = self.game.current_player
+            if delay := self.pacing.delay(player):
+                sleep(delay)
+            if not self.step():
+                raise RuntimeError(f"{player.name} does not have a move to play")
+            # Only the player who just fired may have won
+            if player.won:
+                winner = player
+        return winner
+
+    def wake(self):
+        """
+        Called when the current player gets a move to play.
+        run() does not need it, event loop based schedulers (see main.TkTurnScheduler)
+        resume playing from there.
+        """
+
+
+def ai_game(
+    first: Type[Strategy],
+    second: Type[Strategy],
+    grid_size: int = GRID_SIZE,
+    fleet: list[int] = FLEET,
+    backend: Type[Backend] = GridBackend,
+    layouts: Optional[Sequence[Iterable[int]]] = None,
+) -> Game:
+    """
+    Sets up a game between two AI players with randomly placed ships,
+    ready to be played with Game.play().
+    `layouts` gives the cells of each player's ships instead (see player.place_fleet).
+    """
+    game = Game(grid_size, fleet)
+    first_board = ControlledBoard(game, grid_size, fleet, backend=backend)
+    second_board = ControlledBoard(game, grid_size, fleet, backend=backend)
+    game.players = [
+        AIPlayer(game, first_board, second_board, first, 0, first.__name__),
+        AIPlayer(game, second_board, first_board, second, 1, second.__name__),
+    ]
+    for index, player in enumerate(game.players):
+        if layouts is None:
+            player.place_ships()
+        else:
+            place_fleet(player.own_board, layouts[index])
+        player.own_board.lock()
+    game.phase = SHOOTING
+    return game
+
+
+## View
+
+# Most times per second a view repaints, 0 for as often as Tk is idle
+MAX_FPS = 60
+
+
+class CoalescedUpdates:
+    """
+    Collects the cells a board changes and hands them over to `flush`, at most
+    `max_fps` times per second, from Tk's event loop.
+    A cell changed several times between two flushes is only repainted once,
+    in its latest state, so that the board can change thousands of cells per second
+    while the view only repaints what changed, once per frame.
+    """
+
+    board: Board
+    widget: Misc
+    flush_callback: Callable[[dict[tuple[int, int], int]], Any]
+    max_fps: float
+    # Latest state of the cells changed since the last flush
+    dirty: dict[tuple[int, int], int]
+    # Identifier of the scheduled flush, if there is one
+    scheduled: Optional[str]
+    last_flush: float
+
+    def __init__(
+        self,
+        widget: Misc,
+        board: Board,
+        flush: Callable[[dict[tuple[int, int], int]], Any],
+        max_fps: float = MAX_FPS,
+    ):
+        self.widget = widget
+        self.board = board
+        self.flush_callback = flush
+        self.max_fps = max_fps
+        self.dirty = {}
+        self.scheduled = None
+        self.last_flush = 0
+        board.subscribe(self.mark)
+
+    def mark(self, x: int, y: int, state: int):
+        self.dirty[(x, y)] = state
+        if self.scheduled is None:
+            wait = 0
+            if self.max_fps:
+                wait = self.last_flush + 1 / self.max_fps - perf_counter()
+            if wait > 0:
+                self.scheduled = self.widget.after(int(wait * 1000) + 1, self.flush)
+            else:
+                self.scheduled = self.widget.after_idle(self.flush)
+
+    def flush(self):
+        self.scheduled = None
+        self.last_flush = perf_counter()
+        changes, self.dirty = self.dirty, {}
+        if changes:
+            self.flush_callback(changes)
+
+    def close(self):
+        """
+        Stops listening to the board, dropping the changes that were not flushed yet
+        """
+        self.board.unsubscribe(self.mark)
+        if self.scheduled is not None:
+            self.widget.after_cancel(self.scheduled)
+            self.scheduled = None
+        self.dirty = {}
+
+
+class BoardView:
+    """
+    Displays a Board as a grid of buttons.
+    The view only mirrors the board's state: every change goes through the board,
+    which notifies the view back.
+    Changes are repainted in batches, see CoalescedUpdates.
+    """
+
+    board: Board
+    mainframe: Frame
+    cells: list[list[Button]]
+    updates: CoalescedUpdates
+
+    def __init__(self, master: Misc, board: Board, max_fps: float = MAX_FPS):
+        self.board = board
+        self.mainframe = Frame(master)
+        self.cells = []
+
+        for x in range(board.size):
+            self.cells.append([])
+            for y in range(board.size):
+                cell = Button(self.mainframe, **CELL_DISPLAY_STATES[board @ (x, y)])
+                cell.bind("<Button-1>", partial(handle, board.handle_cell_Button1, x, y))
+                cell.bind("<Button-3>", partial(handle, board.handle_cell_Button3, x, y))
+                self.cells[x].append(cell)
+                cell.grid(row=x, column=y)
+
+        self.updates = CoalescedUpdates(
+            self.mainframe, board, self.update_cells, max_fps
+        )
+
+    def update_cell(self, x: int, y: int, state: int):
+        self.cells[x][y].configure(**CELL_DISPLAY_STATES[state])
+
+    def update_cells(self, changes: dict[tuple[int, int], int]):
+        for (x, y), state in changes.items():
+            self.update_cell(x, y, state)
+
+    def displayed_state(self, x: int, y: int) -> int:
+        """
+        State shown by the cell at row x column y, decoded from its text
+        """
+        return CELL_STATES_BY_TEXT[self.cells[x][y]["text"]]
+
+    def render(self, column: int, row: int, span: int = 1):
+        self.mainframe.grid(column=column, row=row, columnspan=span, rowspan=span)
+
+    def destroy(self):
+        self.updates.close()
+        self.mainframe.destroy()
+
+
+CELL_SIZE = 32  # pixels
+
+
+class CanvasBoardView:
+    """
+    Displays a Board on a single Canvas, with a rectangle and a text item per cell.
+    Clicks are handled by one binding on the canvas, mapping pixels to cells,
+    which makes it much cheaper to build than BoardView's grid of buttons.
+    """
+
+    board: Board
+    canvas: Canvas
+    cell_size: int
+    # Canvas items of the cell x * board.size + y
+    rectangles: list[int]
+    texts: list[int]
+    updates: CoalescedUpdates
+
+    def __init__(
+        self,
+        master: Misc,
+        board: Board,
+        cell_size: int = CELL_SIZE,
+        max_fps: float = MAX_FPS,
+    ):
+        self.board = board
+        self.cell_size = cell_size
+        self.canvas = Canvas(
+            master,
+            width=board.size * cell_size,
+            height=board.size * cell_size,
+            highlightthickness=0,
+        )
+        self.rectangles = []
+        self.texts = []
+
+        for x, y in doublerange(board.size):
+            display = CELL_DISPLAY_STATES[board @ (x, y)]
+            top, left = x * cell_size, y * cell_size
+            self.rectangles.append(
+                self.canvas.create_rectangle(
+                    left,
+                    top,
+                    left + cell_size,
+                    top + cell_size,
+                    fill=display["bg"],
+                    outline="black",
+                )
+            )
+            self.texts.append(
+                self.canvas.create_text(
+                    left + cell_size / 2, top + cell_size / 2, text=display["text"]
+                )
+            )
+
+        self.canvas.bind(
+            "<Button-1>", partial(self.handle_click, board.handle_cell_Button1)
+        )
+        self.canvas.bind(
+            "<Button-3>", partial(self.handle_click, board.handle_cell_Button3)
+        )
+        self.updates = CoalescedUpdates(self.canvas, board, self.update_cells, max_fps)
+
+    def cell_at(self, pixel_x: float, pixel_y: float) -> Optional[tuple[int, int]]:
+        """
+        Coordinates of the cell under the given point of the canvas, None if there is none
+        """
+        x, y = int(pixel_y // self.cell_size), int(pixel_x // self.cell_size)
+        return (x, y) if self.board.within_bounds(x, y) else None
 
-class NoStrategy(Strategy):
+    def handle_click(self, method: Callable[[int, int], Any], event: Event) -> Any:
+        cell = self.cell_at(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        if cell is not None:
+            return method(*cell)
 
-    name = "None"
+    def update_cell(self, x: int, y: int, state: int):
+        display = CELL_DISPLAY_STATES[state]
+        index = x * self.board.size + y
+        self.canvas.itemconfigure(self.rectangles[index], fill=display["bg"])
+        self.canvas.itemconfigure(self.texts[index], text=display["text"])
 
-    def __init__(
-        self,
-        name: str = "None",
-        own_board: "ControlledBoard" = None,
-        ennemy_board: "ProjectiveBoard" = None,
-    ):
-        return
+    def update_cells(self, changes: dict[tuple[int, int], int]):
+        for (x, y), state in changes.items():
+            self.update_cell(x, y, state)
 
-    def choose_shot_location(self) :
-        return (0, 0)
+    def displayed_state(self, x: int, y: int) -> int:
+        """
+        State shown by the cell at row x column y, decoded from its text
+        """
+        return CELL_STATES_BY_TEXT[
+            self.canvas.itemcget(self.texts[x * self.board.size + y], "text")
+        ]
 
-    def react_to_shot_result(self, x: int, y: int, hit_a_ship: bool) -> Any:
-        return
+    def render(self, column: int, row: int, span: int = 1):
+        self.canvas.grid(column=column, row=row, columnspan=span, rowspan=span)
 
-    def d(self, t: str, *args, **kwargs):
-        return
-## Player
+    def destroy(self):
+        self.updates.close()
+        self.canvas.destroy()
 
-# Constantes
-PLACING = 4
-SHOOTING = 5
-DECIDING = 6
 
-FLEET = [DESTROYER, CRUISER, SUBMARINE, BATTLESHIP, AIRCRAFT_CARRIER]
-HELPTEXT_PLACING = (
-    f"Placez vos bateaux (de longueurs {french_join(FLEET)}),\npuis cliquez sur OK.\nE = Eau, B = Bateau, T = Touché, M = Manqué.\n"
-)
-HELPTEXT_WRONG = f"Veuillez placer tout les bateaux correctement\n\n{HELPTEXT_PLACING}"
-HELPTEXT_SHOOTING = "Cliquez sur une case '?' pour tirer à cet endroit."
+# Colors of CELL_DISPLAY_STATES' backgrounds, to blend them into summary tiles
+STATE_COLORS = {
+    SUNKEN: (255, 0, 0),
+    SHIP: (255, 255, 255),
+    WATER: (0, 0, 255),
+    MISSED: (0, 255, 255),
+    UNKNOWN: (190, 190, 190),
+}
+# Below this many pixels per cell, cells are grouped into summary tiles
+MIN_CELL_PIXELS = 12
+# Below this many pixels per cell, cells don't show their text
+MIN_TEXT_PIXELS = 20
+# Smallest size of a summary tile, in pixels
+MIN_TILE_PIXELS = 12
 
 
-class Player:
-    own_board: ControlledBoard
-    ennemy_board: ProjectiveBoard
-    ok_button: Button
-    game: "Game"
-    index: int
-    strategy: Strategy
-    name: str
+class BlockSummary:
+    """
+    Counts the cells of a board that are not in its initial state, for square blocks
+    of 2, 4, 8... cells wide, kept up to date as the board changes.
+    Only blocks holding such cells are stored, so that a huge, mostly untouched
+    board costs next to nothing.
+    """
 
-    def __init__(
-        self,
-        game: "Game",
-        board: ControlledBoard,
-        ennemy_board: ControlledBoard,
-        index: int,
-        name: str,
-        strategy: Type[Strategy],
-    ) -> None:
-        if board.size != ennemy_board.size:
-            raise TypeError("The two boards should have the same size")
+    board: Board
+    # counts[level][(block_x, block_y)][state], for blocks 2 ** level cells wide
+    counts: list[dict[tuple[int, int], dict[int, int]]]
+    # States of the cells that are not in the initial state
+    known: dict[tuple[int, int], int]
 
-        self.game = game
-        self.index = index
-        self.name = name
-        self.own_board = board
-        self.own_board.owner = self
-        self.ennemy_board = ProjectiveBoard(
-            game, board.size, represents=ennemy_board, owner=self
-        )
-        self.strategy = strategy(strategy.name, self.own_board, self.ennemy_board)
-        self.ok_button = Button(text="OK")
-        self.ok_button.bind("<Button 1>", self.handle_click_ok)
+    def __init__(self, board: Board):
+        self.board = board
+        self.levels = max(1, (board.size - 1).bit_length())
+        self.counts = [{} for _ in range(self.levels + 1)]
+        self.known = {}
+        for state in CELL_DISPLAY_STATES:
+            if state != board.initial_state:
+                for x, y in board.cells(state):
+                    self.update(x, y, state)
+        board.subscribe(self.update)
 
-    def handle_click_ok(self, event) -> Any:
-        """
-        Handles a click on the OK button
-        """
-        raise NotImplementedError("Please implement handle_click_ok.")
+    def update(self, x: int, y: int, state: int):
+        previous = self.known.get((x, y), self.board.initial_state)
+        if previous == state:
+            return
+        if state == self.board.initial_state:
+            del self.known[(x, y)]
+        else:
+            self.known[(x, y)] = state
+        for level in range(1, self.levels + 1):
+            key = (x >> level, y >> level)
+            block = self.counts[level].setdefault(key, {})
+            if previous != self.board.initial_state:
+                block[previous] -= 1
+                if not block[previous]:
+                    del block[previous]
+            if state != self.board.initial_state:
+                block[state] = block.get(state, 0) + 1
+            if not block:
+                del self.counts[level][key]
 
-    @property
-    def accuracy(self) -> Optional[float]:
+    def block(self, level: int, block_x: int, block_y: int) -> dict[int, int]:
         """
-        Proportion of shots fired that hit a ship.
-        None if no shots have been fired.
+        Number of cells in each state in the block, the initial state included
         """
-        try:
-            return (
-                self.ennemy_board.shots_fired - self.ennemy_board.shots_missed
-            ) / self.ennemy_board.shots_fired
-        except ZeroDivisionError:
-            return None
+        width = 1 << level
+        area = min(width, self.board.size - block_x * width) * min(
+            width, self.board.size - block_y * width
+        )
+        counts = dict(self.counts[level].get((block_x, block_y), {}))
+        counts[self.board.initial_state] = area - sum(counts.values())
+        return counts
 
-    @property
-    def won(self) -> bool:
+    def color(self, level: int, block_x: int, block_y: int) -> str:
         """
-        Returns True if none the cell's of the ennemy's (controlled) board are ships (i.e. all are sunken or water)
+        Color of the block's tile: its states' colors blended, rare states
+        (like a few hits in a big block) being boosted to remain visible
         """
-        return all(
-            self.ennemy_board.real_board @ (x, y) != SHIP
-            for x, y in doublerange(self.ennemy_board.size)
+        counts = self.block(level, block_x, block_y)
+        area = sum(counts.values())
+        weights = {
+            state: sqrt(count / area)
+            for state, count in counts.items()
+            if state != self.board.initial_state
+        }
+        weights[self.board.initial_state] = max(0, 1 - sum(weights.values()))
+        total = sum(weights.values())
+        red, green, blue = (
+            round(
+                sum(
+                    STATE_COLORS[state][channel] * weight
+                    for state, weight in weights.items()
+                )
+                / total
+            )
+            for channel in range(3)
         )
+        return f"#{red:02x}{green:02x}{blue:02x}"
 
-    def turn_is_mine(self) -> bool:
-        return self.index == self.game.current_player_index
 
-    @property
-    def human(self) -> bool:
-        raise NotImplementedError("Please implement human property")
+class ViewportBoardView:
+    """
+    Displays the part of a board visible in a scrollable, zoomable viewport.
+    Only the cells on screen get canvas items, drawn from the board's state on demand;
+    when zoomed out, cells are grouped into tiles colored after a BlockSummary.
+    This makes the cost of the view independent of the board's size.
 
-    def d(self, t: str, *args, **kwargs):
-        return d(
-            ("[green]" if self.human else "[cyan]") + self.name + "[/] " + t,
-            *args,
-            **kwargs,
-        )
+    Scroll with the scrollbars, the arrow keys or by dragging with the middle button,
+    zoom with the mouse wheel or +/-. Clicking on a tile zooms in on it.
+    """
 
+    board: Board
+    summary: BlockSummary
+    canvas: Canvas
+    # Zoom level
+    cell_pixels: float
+    # Coordinates (in cells) of the viewport's top left corner
+    origin_x: float
+    origin_y: float
+    # Items of the cells, or tiles, on screen
+    items: dict[tuple[int, int], tuple[int, ...]]
+    # Level of the tiles on screen, 0 when showing cells
+    level: int
+    updates: CoalescedUpdates
 
-class HumanPlayer(Player):
     def __init__(
         self,
-        game: "Game",
-        board: ControlledBoard,
-        ennemy_board: ControlledBoard,
-        index: int,
-        name: str,
-    ) -> None:
-        super().__init__(game, board, ennemy_board, index, name, strategy=NoStrategy)
+        master: Misc,
+        board: Board,
+        width: int = 640,
+        height: int = 640,
+        max_fps: float = MAX_FPS,
+    ):
+        self.board = board
+        self.summary = BlockSummary(board)
+        self.mainframe = Frame(master)
+        self.canvas = Canvas(
+            self.mainframe, width=width, height=height, highlightthickness=0
+        )
+        self.vertical_scrollbar = Scrollbar(
+            self.mainframe, orient="vertical", command=partial(self.scroll, "x")
+        )
+        self.horizontal_scrollbar = Scrollbar(
+            self.mainframe, orient="horizontal", command=partial(self.scroll, "y")
+        )
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.vertical_scrollbar.grid(row=0, column=1, sticky="ns")
+        self.horizontal_scrollbar.grid(row=1, column=0, sticky="ew")
+        self.mainframe.rowconfigure(0, weight=1)
+        self.mainframe.columnconfigure(0, weight=1)
 
-    def render(self):
-        self.own_board.render(0, 2)
-        self.ennemy_board.render(0, 1)
-        self.ok_button.grid(column=1, row=2)
+        self.cell_pixels = min(width, height) / board.size
+        self.origin_x = self.origin_y = 0
+        self.items = {}
+        self.level = 0
 
-    def handle_click_ok(self, event) -> Any:
-        if self.game.phase == PLACING:
-            self.d(
-                f"handling OK button click: locking board, switching to shooting phase"
-            )
-            if not self.own_board.legal:
-                self.d(f"board is not legal! not locking & switching phase.")
-                self.game.helptext_var.set(HELPTEXT_WRONG)
-                return
-            self.own_board.lock()
-            self.game.phase = SHOOTING
-            self.game.helptext_var.set(HELPTEXT_SHOOTING)
+        self.canvas.bind("<Configure>", lambda _: self.redraw())
+        for button in 1, 3:
+            handler = getattr(board, f"handle_cell_Button{button}")
+            self.canvas.bind(f"<Button-{button}>", partial(self.handle_click, handler))
+        self.canvas.bind("<ButtonPress-2>", self.start_drag)
+        self.canvas.bind("<B2-Motion>", self.drag)
+        self.canvas.bind("<MouseWheel>", self.handle_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.zoom(1.25, e.x, e.y))
+        self.canvas.bind("<Button-5>", lambda e: self.zoom(0.8, e.x, e.y))
+        self.canvas.bind("<Enter>", lambda _: self.canvas.focus_set())
+        for key, (dx, dy) in {
+            "<Up>": (-1, 0),
+            "<Down>": (1, 0),
+            "<Left>": (0, -1),
+            "<Right>": (0, 1),
+        }.items():
+            self.canvas.bind(key, partial(self.pan_by_screen, dx / 4, dy / 4))
+        self.canvas.bind("<plus>", lambda _: self.zoom(1.25))
+        self.canvas.bind("<minus>", lambda _: self.zoom(0.8))
+        self.updates = CoalescedUpdates(self.canvas, board, self.update_cells, max_fps)
 
     @property
-    def human(self) -> bool:
-        return True
+    def viewport_size(self) -> tuple[float, float]:
+        """
+        Number of cells (rows, columns) fitting in the canvas
+        """
+        return (
+            max(self.canvas.winfo_height(), 1) / self.cell_pixels,
+            max(self.canvas.winfo_width(), 1) / self.cell_pixels,
+        )
 
+    def redraw(self):
+        self.canvas.delete("all")
+        self.items = {}
+        rows, columns = self.viewport_size
+        first_x, first_y = int(self.origin_x), int(self.origin_y)
+        last_x = min(int(self.origin_x + rows) + 1, self.board.size)
+        last_y = min(int(self.origin_y + columns) + 1, self.board.size)
 
-class AIPlayer(Player):
-    def __init__(
-        self,
-        game: "Game",
-        board: ControlledBoard,
-        ennemy_board: ControlledBoard,
-        strategy: Type[Strategy],
-        index: int,
-        name: str,
-    ) -> None:
-        super().__init__(
-            game, board, ennemy_board, index, name=f"[AI] {name}", strategy=strategy
+        if self.cell_pixels >= MIN_CELL_PIXELS:
+            self.level = 0
+            for x in range(first_x, last_x):
+                for y in range(first_y, last_y):
+                    self.draw_cell(x, y)
+        else:
+            self.level = 1
+            while (1 << self.level) * self.cell_pixels < MIN_TILE_PIXELS:
+                self.level += 1
+            self.level = min(self.level, self.summary.levels)
+            shift = self.level
+            for block_x in range(first_x >> shift, ((last_x - 1) >> shift) + 1):
+                for block_y in range(first_y >> shift, ((last_y - 1) >> shift) + 1):
+                    self.draw_tile(block_x, block_y)
+
+        self.vertical_scrollbar.set(
+            self.origin_x / self.board.size, (self.origin_x + rows) / self.board.size
+        )
+        self.horizontal_scrollbar.set(
+            self.origin_y / self.board.size,
+            (self.origin_y + columns) / self.board.size,
         )
 
-    def decide_coordinates(self) :
+    def pixel(self, x: float, y: float) -> tuple[float, float]:
         """
-        Decide coordinates where to shoot.
+        Position on the canvas (left, top) of the top left corner of cell (x, y)
         """
-        return self.strategy.choose_shot_location()
+        return (
+            (y - self.origin_y) * self.cell_pixels,
+            (x - self.origin_x) * self.cell_pixels,
+        )
 
-    def place_ships(self) -> None:
+    def draw_cell(self, x: int, y: int):
+        display = CELL_DISPLAY_STATES[self.board @ (x, y)]
+        left, top = self.pixel(x, y)
+        items = (
+            self.canvas.create_rectangle(
+                left,
+                top,
+                left + self.cell_pixels,
+                top + self.cell_pixels,
+                fill=display["bg"],
+                outline="black",
+            ),
+        )
+        if self.cell_pixels >= MIN_TEXT_PIXELS:
+            items += (
+                self.canvas.create_text(
+                    left + self.cell_pixels / 2,
+                    top + self.cell_pixels / 2,
+                    text=display["text"],
+                ),
+            )
+        self.items[(x, y)] = items
+
+    def draw_tile(self, block_x: int, block_y: int):
+        width = 1 << self.level
+        left, top = self.pixel(block_x * width, block_y * width)
+        right, bottom = self.pixel(
+            min((block_x + 1) * width, self.board.size),
+            min((block_y + 1) * width, self.board.size),
+        )
+        self.items[(block_x, block_y)] = (
+            self.canvas.create_rectangle(
+                left,
+                top,
+                right,
+                bottom,
+                fill=self.summary.color(self.level, block_x, block_y),
+                outline="",
+            ),
+        )
+
+    def update_cells(self, changes: dict[tuple[int, int], int]):
+        if self.level:
+            # Recolor each tile once, however many of its cells changed
+            for key in {(x >> self.level, y >> self.level) for x, y in changes}:
+                if key in self.items:
+                    self.canvas.itemconfigure(
+                        self.items[key][0], fill=self.summary.color(self.level, *key)
+                    )
+            return
+        for (x, y), state in changes.items():
+            self.update_cell(x, y, state)
+
+    def update_cell(self, x: int, y: int, state: int):
+        if (x, y) in self.items:
+            display = CELL_DISPLAY_STATES[state]
+            rectangle, *text = self.items[(x, y)]
+            self.canvas.itemconfigure(rectangle, fill=display["bg"])
+            if text:
+                self.canvas.itemconfigure(text[0], text=display["text"])
+
+    def cell_at(self, pixel_x: float, pixel_y: float) -> Optional[tuple[int, int]]:
         """
-        Fill own board with ship spots
+        Coordinates of the cell under the given point of the canvas, if any
         """
-        for ship in self.own_board.fleet:
-            self.place_ship_randomly(ship)
+        x = int(self.origin_x + pixel_y / self.cell_pixels)
+        y = int(self.origin_y + pixel_x / self.cell_pixels)
+        return (x, y) if self.board.within_bounds(x, y) else None
 
-    def place_ship(self, coords) -> None:
-        for (x, y) in coords:
-            self.own_board.place_or_remove(x, y)
+    def handle_click(self, method: Callable[[int, int], Any], event: Event) -> Any:
+        if self.level:
+            return self.zoom(MIN_CELL_PIXELS / self.cell_pixels, event.x, event.y)
+        cell = self.cell_at(event.x, event.y)
+        if cell is not None:
+            return method(*cell)
 
-    def can_place_ship_at(self, x: int, y: int, ship: int, orientation: int):
+    def scroll(self, axis: str, action: str, amount: str, unit: str = None):
         """
-        Returns whether placing a ship at (x, y) in orientation `orientation` (`VERTICAL` or `HORIZONTAL`)
-        is possible.
+        Handles the scrollbars' commands, scrolling along x (rows) or y (columns)
         """
-        if orientation == HORIZONTAL:
-            return [
-                self.own_board @ (x, y)
-                for (x, y) in self.own_board.horizontal_coordinates(x, y, y + ship)
-            ] == [WATER] * ship
-        if orientation == VERTICAL:
-            return [
-                self.own_board @ (x, y)
-                for (x, y) in self.own_board.vertical_coordinates(y, x, x + ship)
-            ] == [WATER] * ship
-        raise ValueError(f"Unknown orientation {orientation!r}")
+        rows, columns = self.viewport_size
+        visible = rows if axis == "x" else columns
+        if action == "moveto":
+            target = float(amount) * self.board.size
+        else:
+            step = visible if unit == "pages" else max(visible / 10, 1)
+            target = getattr(self, f"origin_{axis}") + int(amount) * step
+        setattr(self, f"origin_{axis}", self.clamp(target, visible))
+        self.redraw()
+
+    def clamp(self, origin: float, visible: float) -> float:
+        return max(0, min(origin, self.board.size - visible))
 
-    def place_ship_randomly(self, ship: int) -> None:
+    def pan_by_screen(self, rows: float, columns: float, _: Event = None):
         """
-        Returns an available spot for a ship of length `ship`.
-        Raises ValueError if the board does not have room for one.
+        Moves the viewport by a fraction of its size
         """
+        visible_rows, visible_columns = self.viewport_size
+        self.origin_x = self.clamp(self.origin_x + rows * visible_rows, visible_rows)
+        self.origin_y = self.clamp(
+            self.origin_y + columns * visible_columns, visible_columns
+        )
+        self.redraw()
+
+    def start_drag(self, event: Event):
+        self.drag_start = (event.x, event.y, self.origin_x, self.origin_y)
+
+    def drag(self, event: Event):
+        start_x, start_y, origin_x, origin_y = self.drag_start
+        rows, columns = self.viewport_size
+        self.origin_x = self.clamp(
+            origin_x - (event.y - start_y) / self.cell_pixels, rows
+        )
+        self.origin_y = self.clamp(
+            origin_y - (event.x - start_x) / self.cell_pixels, columns
+        )
+        self.redraw()
+
+    def handle_wheel(self, event: Event):
+        self.zoom(1.25 if event.delta > 0 else 0.8, event.x, event.y)
+
+    def zoom(self, factor: float, pixel_x: float = None, pixel_y: float = None):
+        """
+        Zooms by `factor`, keeping the point under (pixel_x, pixel_y) in place
+        (the center of the canvas by default)
+        """
+        if pixel_x is None:
+            pixel_x = self.canvas.winfo_width() / 2
+            pixel_y = self.canvas.winfo_height() / 2
+        fit = (
+            min(self.canvas.winfo_width(), self.canvas.winfo_height()) / self.board.size
+        )
+        # Don't zoom out past the whole board, nor in past a few cells
+        cell_pixels = max(fit, min(self.cell_pixels * factor, 128))
+        x = self.origin_x + pixel_y / self.cell_pixels
+        y = self.origin_y + pixel_x / self.cell_pixels
+        self.cell_pixels = cell_pixels
+        rows, columns = self.viewport_size
+        self.origin_x = self.clamp(x - pixel_y / cell_pixels, rows)
+        self.origin_y = self.clamp(y - pixel_x / cell_pixels, columns)
+        self.redraw()
+
+    def render(self, column: int, row: int, span: int = 1):
+        self.mainframe.grid(column=column, row=row, columnspan=span, rowspan=span)
+
+    def destroy(self):
+        self.updates.close()
+        self.board.unsubscribe(self.summary.update)
+        self.mainframe.destroy()
 
-        coords = list(doublerange(self.own_board.size))
-        random.shuffle(coords)
-        for (x, y) in coords:
-            if self.can_place_ship_at(x, y, ship, VERTICAL):
-                self.place_ship(self.own_board.vertical_coordinates(y, x, x + ship))
-                return
-            elif self.can_place_ship_at(x, y, ship, HORIZONTAL):
-                self.place_ship(self.own_board.horizontal_coordinates(x, y, y + ship))
-                return
-        raise ValueError(f"Cannot fit a {ship}-cell-long ship in this player's board")
 
-    @property
-    def human(self) -> bool:
-        return False
 ## Main
 
-FLEET = [DESTROYER, CRUISER, SUBMARINE, BATTLESHIP, AIRCRAFT_CARRIER]
-GRID_SIZE = 10
+if TYPE_CHECKING:
+    # Only needed to play over the network: imported then
+    import asyncio
+    from concurrent.futures import Future
+    from network import PeerSession
+
+startup.milestone("imports done")
+
+RENDERERS = {
+    "buttons": BoardView,
+    "canvas": CanvasBoardView,
+    "viewport": ViewportBoardView,
+}
+# Boards with more cells than this only store the cells that changed
+SPARSE_BACKEND_CELLS = 1000 * 1000
+View = Union[BoardView, CanvasBoardView, ViewportBoardView]
+# Milliseconds between two checks of whether the AI made up its mind
+AI_POLL_INTERVAL = 10
+# Milliseconds between two runs of the network's event loop
+NETWORK_POLL_INTERVAL = 2
 
 
 class DummyPlayer:
@@ -694,27 +3814,151 @@ class DummyPlayer:
         self.human = human
 
 
-class Game:
-    phase: int
-    current_player_index: int
+class TkTurnScheduler(TurnScheduler):
+    """
+    Plays the game's moves from tkinter's event loop, one callback per move.
+    AI players decide in a separate thread, the window staying responsive however
+    long they take; their move is played from the event loop once they are done,
+    since tkinter is not thread-safe.
+    """
+
+    game: "GraphicalGame"
+    root: Tk
+    # The move being decided by an AI player, if one is thinking
+    thinking: Optional[Future]
+    # Identifier of the next callback, if one is scheduled
+    after_id: Optional[str]
+    closed: bool
+
+    def __init__(self, game: "GraphicalGame", root: Tk, pacing: Pacing = None):
+        super().__init__(game, pacing)
+        self.root = root
+        self.thinking = None
+        self.after_id = None
+        self.closed = False
+
+    def wake(self):
+        if (
+            self.closed
+            or self.after_id is not None
+            or self.thinking is not None
+            or self.game.winner is not None
+        ):
+            return
+        delay = self.pacing.delay(self.game.current_player)
+        self.after_id = self.root.after(max(1, round(delay * 1000)), self.tick)
+
+    def tick(self):
+        self.after_id = None
+        player = self.game.current_player
+        if player.human:
+            if self.step():
+                self.wake()
+            return
+        self.game.set_helptext(f"{player.name} réfléchit…")
+        self.root.configure(cursor="watch")
+        self.thinking = run_in_thread(player.next_move, name="AI")
+        self.poll()
+
+    def poll(self):
+        """
+        Plays the AI's move once it is done thinking
+        """
+        self.after_id = None
+        if self.closed or self.thinking is None:
+            return
+        if not self.thinking.done():
+            self.after_id = self.root.after(AI_POLL_INTERVAL, self.poll)
+            return
+        decision, self.thinking = self.thinking, None
+        self.root.configure(cursor="")
+        try:
+            move = decision.result()
+        except Exception as error:
+            self.give_up(error)
+            return
+        self.game.set_helptext(HELPTEXT_SHOOTING)
+        self.game.apply_move(*move)
+        self.wake()
+
+    def give_up(self, error: Exception):
+        """
+        Ends the game when the AI could not decide its move
+        """
+        player = self.game.current_player
+        i(f"{player.name} could not decide where to fire: {error!r}")
+        self.game.set_helptext(
+            f"{player.name} n'a pas pu jouer ({error}).\nLa partie est terminée."
+        )
+        for each in self.game.players:
+            each.ennemy_board.lock()
+        self.close()
+
+    def close(self):
+        """
+        Stops playing, dropping the AI's decision if it is still thinking
+        """
+        self.closed = True
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+        if self.thinking is not None:
+            self.thinking.cancel()
+            self.thinking = None
+
+
+class GraphicalGame(Game):
+    """
+    A game between the user and the computer, displayed in a tkinter window.
+    `name` is the user's name.
+    """
+
     helptext_var: StringVar
+    renderer: Type[View]
+    max_fps: float
+    scheduler: TkTurnScheduler
 
-    def __init__(self) -> None:
-        self.root = Tk()
-        self.root.columnconfigure(0, weight=1)
-        self.root.rowconfigure(0, weight=1)
-        self.phase = PLACING
-        self.current_player_index = 0
-        self.helptext_var = StringVar()
+    def __init__(
+        self,
+        name: str,
+        renderer: Type[View] = BoardView,
+        grid_size: int = GRID_SIZE,
+        max_fps: float = MAX_FPS,
+        pacing: Pacing = None,
+    ) -> None:
+        super().__init__(grid_size=grid_size, fleet=FLEET)
+        self.renderer = renderer
+        self.max_fps = max_fps
+        with startup.phase("window"):
+            self.root = Tk()
+            self.root.columnconfigure(0, weight=1)
+            self.root.rowconfigure(0, weight=1)
+            self.helptext_var = StringVar()
+        self.create_scheduler(pacing)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        with startup.phase("players"):
+            self.create_players(
+                SparseBackend if grid_size**2 > SPARSE_BACKEND_CELLS else GridBackend,
+                name,
+            )
+
+    def create_scheduler(self, pacing: Optional[Pacing]):
+        TkTurnScheduler(self, self.root, pacing)
 
+    def create_players(self, backend: Type[Backend], name: str):
         user_board = ControlledBoard(
-            self, grid_size=GRID_SIZE, fleet=FLEET, owner=DummyPlayer("Chirex", True)
+            self,
+            grid_size=self.grid_size,
+            fleet=FLEET,
+            owner=DummyPlayer("Chirex", True),
+            backend=backend,
         )
         bot_board = ControlledBoard(
             self,
-            grid_size=GRID_SIZE,
+            grid_size=self.grid_size,
             fleet=FLEET,
             owner=DummyPlayer("Léonard de Vinci", False),
+            backend=backend,
         )
 
         self.user = HumanPlayer(
@@ -722,7 +3966,7 @@ class Game:
             user_board,
             ennemy_board=bot_board,
             index=0,
-            name=input("Choisissez votre nom: "),
+            name=name,
         )
         self.bot = AIPlayer(
             self,
@@ -734,45 +3978,225 @@ class Game:
         )
         self.players = [self.user, self.bot]
 
+    def place_fleets(self):
+        """
+        Places the computer's ships, once the window is shown
+        """
         self.bot.place_ships()
-        d("ennemy state is", end=" ")
-        pprint(self.bot.own_board.state)
+        d(lambda: f"ennemy state is {self.bot.own_board.state}")
+
+    def set_helptext(self, text: str):
+        super().set_helptext(text)
+        self.helptext_var.set(text)
+
+    def close(self):
+        """
+        Closes the window, dropping the AI's decision if it is still thinking
+        """
+        self.scheduler.close()
+        self.root.destroy()
 
     def start(self):
-        self.helptext_var.set(HELPTEXT_PLACING)
+        self.set_helptext(HELPTEXT_PLACING)
         Label(self.root, textvariable=self.helptext_var).grid(column=0, row=0)
+        # Show the window right away, the boards come next
+        self.root.bind("<Map>", self.handle_map)
+        self.root.mainloop()
 
-        Label(self.root, text=self.bot.name).grid(column=0, row=1)
-        self.user.ennemy_board.render(0, 2)
-        Label(self.root, text=self.user.name).grid(column=0, row=3)
-        self.user.own_board.render(0, 4)
+    def handle_map(self, event: Event):
+        """
+        Draws the boards once the window is shown
+        """
+        # Children of the window get their <Map> events handled here too
+        if event.widget is not self.root:
+            return
+        self.root.unbind("<Map>")
+        startup.milestone("window shown")
+        with startup.phase("boards"):
+            Label(self.root, text=self.bot.name).grid(column=0, row=1)
+            self.renderer(
+                self.root, self.user.ennemy_board, max_fps=self.max_fps
+            ).render(0, 2)
+            Label(self.root, text=self.user.name).grid(column=0, row=3)
+            self.renderer(
+                self.root, self.user.own_board, max_fps=self.max_fps
+            ).render(0, 4)
 
-        self.user.ok_button.grid(column=0, row=5)
-        self.root.mainloop()
+            ok_button = Button(self.root, text="OK")
+            ok_button.bind("<Button 1>", self.user.handle_click_ok)
+            ok_button.grid(column=0, row=5)
+            self.root.update_idletasks()
+        with startup.phase("fleets"):
+            self.place_fleets()
+        startup.report()
 
-    @property
-    def winner(self) -> Optional[Player]:
-        for _, player in enumerate(self.players):
-            if player.won:
-                return player
-        return None
 
-    def end_turn(self):
-        if self.winner is not None:
-            self.helptext_var.set(
-                f"Bravo, {self.winner.name}! Vous avez gagné avec une précsion de {(self.winner.accuracy or 0)*100}%"
+class PeerGraphicalGame(GraphicalGame):
+    """
+    A game between the user and someone else, over the network (see network.py).
+    The peer's messages are handled by an asyncio event loop run from tkinter's:
+    every few milliseconds, it gets to run whatever is ready.
+    """
+
+    connect: Callable[[Game], Awaitable[PeerSession]]
+    local_index: int
+    loop: asyncio.AbstractEventLoop
+    session: Optional[asyncio.Task]
+    pump_id: Optional[str]
+
+    def __init__(
+        self,
+        connect: Callable[[Game], Awaitable[PeerSession]],
+        local_index: int,
+        **kwargs,
+    ) -> None:
+        import asyncio
+
+        self.connect = connect
+        self.local_index = local_index
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.pump_id = None
+        super().__init__(**kwargs)
+
+    def create_scheduler(self, pacing: Optional[Pacing]):
+        # The PeerSession is the scheduler, once connected
+        pass
+
+    def create_players(self, backend: Type[Backend], name: str):
+        from network import peer_game
+
+        peer_game(
+            self.local_index,
+            self.grid_size,
+            self.fleet,
+            name=name,
+            game=self,
+            backend=backend,
+        )
+        self.user = self.players[self.local_index]
+        self.bot = self.players[1 - self.local_index]
+
+    def place_fleets(self):
+        # The peer places their own ships
+        pass
+
+    async def play_with_peer(self):
+        from network import ProtocolError
+
+        try:
+            self.set_helptext(f"Connexion…\n{HELPTEXT_PLACING}")
+            session = await self.connect(self)
+            self.set_helptext(
+                HELPTEXT_SHOOTING if self.phase == SHOOTING else HELPTEXT_PLACING
             )
-            self.winner.ennemy_board.lock()
-        else:
-            self.current_player_index = (self.current_player_index + 1) % 2
-            if self.bot.turn_is_mine():
-                self.bot.ennemy_board.fire(*self.bot.decide_coordinates())
+            await session.play()
+        except (ProtocolError, OSError) as error:
+            self.set_helptext(f"Partie interrompue : {error}")
 
-    @property
-    def current_player(self) -> Player:
-        return [self.user, self.bot][self.current_player_index]
+    def pump(self):
+        """
+        Runs the callbacks of the asyncio event loop that are ready
+        """
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+        self.pump_id = self.root.after(NETWORK_POLL_INTERVAL, self.pump)
+
+    def close(self):
+        if self.pump_id is not None:
+            self.root.after_cancel(self.pump_id)
+        if self.session is not None:
+            self.session.cancel()
+            self.loop.call_soon(self.loop.stop)
+            self.loop.run_forever()
+        self.loop.close()
+        self.root.destroy()
+
+    def start(self):
+        self.session = self.loop.create_task(self.play_with_peer())
+        self.pump_id = self.root.after(0, self.pump)
+        super().start()
 
 
 if __name__ == "__main__":
-    print(f"fleet is {FLEET}")
-    Game().start()
+    parser = ArgumentParser(description="Bataille navale")
+    parser.add_argument(
+        "--log-level",
+        choices=LOG_LEVELS.keys(),
+        help=f"defaults to the {LOG_LEVEL_ENV_VAR} environment variable, or off",
+    )
+    parser.add_argument(
+        "--background-log",
+        action="store_true",
+        help="print log messages from a separate thread",
+    )
+    parser.add_argument(
+        "--renderer",
+        choices=RENDERERS.keys(),
+        default="buttons",
+        help="draw boards as a grid of buttons, on a canvas,"
+        " or only their visible part (for huge boards)",
+    )
+    parser.add_argument("--grid-size", type=int, default=GRID_SIZE)
+    parser.add_argument(
+        "--ai-delay",
+        type=float,
+        default=0,
+        help="seconds to wait before each of the computer's moves",
+    )
+    parser.add_argument(
+        "--max-fps",
+        type=float,
+        default=MAX_FPS,
+        help="most times per second boards are repainted, 0 for no limit",
+    )
+    peer = parser.add_mutually_exclusive_group()
+    peer.add_argument(
+        "--listen",
+        type=int,
+        metavar="PORT",
+        help="play against someone connecting to this port, instead of the computer",
+    )
+    peer.add_argument(
+        "--connect",
+        metavar="HOST:PORT",
+        help="play against someone listening there, instead of the computer",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="print how long imports and each step of the startup took,"
+        " once the boards are drawn",
+    )
+    args = parser.parse_args()
+    if args.log_level:
+        set_log_level(args.log_level)
+    if args.background_log:
+        use_background_sink()
+
+    i(f"fleet is {FLEET}")
+    # Asked before the window opens, and left out of the startup's time
+    with startup.paused():
+        name = input("Choisissez votre nom: ")
+    options = dict(
+        name=name,
+        renderer=RENDERERS[args.renderer],
+        grid_size=args.grid_size,
+        max_fps=args.max_fps,
+        pacing=AIPacing(args.ai_delay),
+    )
+    if args.listen:
+        from network import host
+
+        PeerGraphicalGame(
+            lambda game: host(game, args.listen), local_index=0, **options
+        ).start()
+    elif args.connect:
+        from network import join
+
+        address, port = args.connect.rsplit(":", 1)
+        PeerGraphicalGame(
+            lambda game: join(game, address, int(port)), local_index=1, **options
+        ).start()
+    else:
+        GraphicalGame(**options).start()
@@ -0,0 +1,306 @@
+from __future__ import annotations
+from functools import cached_property, lru_cache
+from time import perf_counter
+from typing import Optional, Union
+from utils import lazy_import
+
+numpy = lazy_import("numpy")
+
+# Same values as board.HORIZONTAL and board.VERTICAL
+HORIZONTAL = 10
+VERTICAL = 20
+# Layouts sample_consistent_layouts tries to build over hits per layout it still needs,
+# before giving up: they may fail every time when the observations are inconsistent
+ANCHORED_ATTEMPTS = 20
+
+
+class PlacementIndex:
+    """
+    All the ways to place a ship of a given length on a square board of a given size.
+    Placements are numbered: horizontal ones first, row by row, then vertical ones.
+    Cells are numbered x * size + y, like the bits of the boards' bitmasks.
+
+    Use placement_index() to get one: indexes are cached, and shared with the
+    processes forked after they were built.
+    """
+
+    size: int
+    length: int
+    starts_per_line: int
+    horizontal_count: int
+
+    def __init__(self, size: int, length: int):
+        self.size = size
+        self.length = length
+        self.starts_per_line = max(size - length + 1, 0)
+        self.horizontal_count = size * self.starts_per_line
+
+    def __len__(self) -> int:
+        return 2 * self.horizontal_count
+
+    def cells_of(self, placements: numpy.ndarray) -> numpy.ndarray:
+        """
+        The cells covered by each of the given placements, as an array of shape
+        placements.shape + (length,)
+        """
+        placements = numpy.asarray(placements, dtype=numpy.int64)
+        horizontal = placements < self.horizontal_count
+        vertical_start = placements - self.horizontal_count
+        per_line = max(self.starts_per_line, 1)
+        start = numpy.where(
+            horizontal,
+            (placements // per_line) * self.size + placements % per_line,
+            vertical_start,
+        )
+        step = numpy.where(horizontal, 1, self.size)
+        return start[..., None] + step[..., None] * numpy.arange(self.length)
+
+    @cached_property
+    def cells(self) -> numpy.ndarray:
+        """
+        cells[p] lists the cells covered by placement p.
+        Built on first use: that's size ** 2 * length integers.
+        """
+        return self.cells_of(numpy.arange(len(self)))
+
+    def find(self, x: int, y: int, orientation: int) -> Optional[int]:
+        """
+        The placement starting at (x, y) (its top or left end), None if it does not fit
+        """
+        last = self.size - self.length
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            return None
+        if orientation == HORIZONTAL:
+            return x * (last + 1) + y if y <= last else None
+        if orientation == VERTICAL:
+            return self.horizontal_count + x * self.size + y if x <= last else None
+        raise ValueError(f"Unknown orientation {orientation!r}")
+
+    def coordinates(self, placement: int) -> list[tuple[int, int]]:
+        return [divmod(int(cell), self.size) for cell in self.cells_of(placement)]
+
+    def mask(self, placement: int) -> int:
+        """
+        Bitmask of the cells covered by the placement
+        """
+        if placement < self.horizontal_count:
+            x, y = divmod(placement, self.starts_per_line)
+            return ((1 << self.length) - 1) << (x * self.size + y)
+        return self.column_mask << (placement - self.horizontal_count)
+
+    @cached_property
+    def column_mask(self) -> int:
+        """
+        Bitmask of the vertical placement starting at (0, 0)
+        """
+        return sum(1 << (i * self.size) for i in range(self.length))
+
+    def covering(self, x: int, y: int) -> list[int]:
+        """
+        The placements covering cell (x, y)
+        """
+        last = self.size - self.length
+        return [
+            *(
+                self.find(x, start, HORIZONTAL)
+                for start in range(max(y - self.length + 1, 0), min(y, last) + 1)
+            ),
+            *(
+                self.find(start, y, VERTICAL)
+                for start in range(max(x - self.length + 1, 0), min(x, last) + 1)
+            ),
+        ]
+
+    def compatible(self, occupied: Union[int, numpy.ndarray]) -> numpy.ndarray:
+        """
+        The placements that do not cover any of the occupied cells,
+        given as a bitmask or as a boolean array indexed by cell number
+        """
+        if not isinstance(occupied, numpy.ndarray):
+            occupied = mask_to_array(occupied, self.size * self.size)
+        return numpy.flatnonzero(~occupied.reshape(-1)[self.cells].any(axis=1))
+
+
+@lru_cache(maxsize=None)
+def placement_index(size: int, length: int) -> PlacementIndex:
+    return PlacementIndex(size, length)
+
+
+def mask_to_array(mask: int, cells_count: int) -> numpy.ndarray:
+    """
+    Converts a bitmask to a boolean array, bit i being item i
+    """
+    raw = numpy.frombuffer(mask.to_bytes((cells_count + 7) // 8, "little"), numpy.uint8)
+    return numpy.unpackbits(raw, bitorder="little")[:cells_count].astype(bool)
+
+
+def array_to_mask(cells: numpy.ndarray) -> int:
+    """
+    Converts a boolean array to a bitmask, item i being bit i
+    """
+    packed = numpy.packbits(cells.reshape(-1).astype(bool), bitorder="little")
+    return int.from_bytes(packed.tobytes(), "little")
+
+
+def random_layouts(
+    count: int,
+    grid_size: int,
+    fleet: list[int],
+    rng: Optional[numpy.random.Generator] = None,
+) -> numpy.ndarray:
+    """
+    Generates `count` independent fleet layouts, uniformly distributed among all the
+    legal ones (see random_layout_cells).
+    Returns a boolean array of shape (count, grid_size ** 2), True for ship cells.
+    Raises ValueError if the fleet does not seem to fit in the board.
+    """
+    cells = random_layout_cells(count, grid_size, fleet, rng)
+    layouts = numpy.zeros((count, grid_size * grid_size), dtype=bool)
+    layouts[numpy.arange(count)[:, None], cells] = True
+    return layouts
+
+
+def random_layout_cells(
+    count: int,
+    grid_size: int,
+    fleet: list[int],
+    rng: Optional[numpy.random.Generator] = None,
+) -> numpy.ndarray:
+    """
+    Generates `count` independent fleet layouts, uniformly distributed among all the
+    legal ones: each ship is placed uniformly at random and layouts where ships
+    overlap are rejected.
+    Returns the cell numbers of each layout's ships, as an array of shape
+    (count, sum(fleet)): unlike random_layouts, it fits huge boards.
+    Raises ValueError if the fleet does not seem to fit in the board.
+    """
+    rng = rng or numpy.random.default_rng()
+    layouts = numpy.zeros((count, sum(fleet)), dtype=numpy.int64)
+    if not fleet:
+        return layouts
+    indexes = [placement_index(grid_size, ship) for ship in fleet]
+    if any(len(index) == 0 for index in indexes):
+        raise ValueError(f"Cannot fit a {max(fleet)}-cell-long ship in the board")
+
+    filled, tried, accepted = 0, 0, 0
+    while filled < count:
+        # Draw enough candidates to (probably) fill what is left,
+        # given the acceptance rate so far
+        acceptance = (accepted + 1) / (tried + 1)
+        batch = min(max(int((count - filled) / acceptance * 1.1), 16), 1 << 20)
+        cells = numpy.concatenate(
+            [index.cells_of(rng.integers(len(index), size=batch)) for index in indexes],
+            axis=1,
+        )
+        ordered = numpy.sort(cells, axis=1)
+        overlapping = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+        valid = cells[~overlapping][: count - filled]
+
+        tried += batch
+        accepted += len(valid)
+        if not accepted and tried > 1 << 22:
+            raise ValueError(f"Cannot fit the fleet {fleet} in the board")
+        layouts[filled : filled + len(valid)] = valid
+        filled += len(valid)
+    return layouts
+
+
+def sample_consistent_layouts(
+    grid_size: int,
+    fleet: list[int],
+    misses: numpy.ndarray,
+    hits: numpy.ndarray,
+    deadline: float,
+    max_samples: int,
+    rng: numpy.random.Generator,
+    batch: int = 256,
+) -> tuple[numpy.ndarray, int]:
+    """
+    Samples fleet layouts where no ship covers a miss and every hit is covered,
+    until `max_samples` are found or time.perf_counter() reaches `deadline`.
+    misses and hits are boolean arrays indexed by cell number.
+    Returns how many samples have a ship on each cell, and the number of samples.
+
+    Layouts are first drawn by rejection, which samples exactly the layouts
+    consistent with the observations. When hits make that too unlikely to succeed,
+    the remaining samples are built by placing ships over uncovered hits first,
+    which is much faster but only approximately uniform. Those stop after
+    ANCHORED_ATTEMPTS failed tries per sample, e.g. for inconsistent observations.
+    """
+    counts = numpy.zeros(grid_size * grid_size, dtype=numpy.int64)
+    found = 0
+    hits_count = int(hits.sum())
+    indexes = [placement_index(grid_size, ship) for ship in fleet]
+    allowed = [index.cells[index.compatible(misses)] for index in indexes]
+    if not fleet or any(len(cells) == 0 for cells in allowed):
+        return counts, 0
+
+    tried = 0
+    while found < max_samples and perf_counter() < deadline:
+        cells = numpy.concatenate(
+            [choices[rng.integers(len(choices), size=batch)] for choices in allowed],
+            axis=1,
+        )
+        ordered = numpy.sort(cells, axis=1)
+        valid = ~(ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+        valid &= hits[cells].sum(axis=1) == hits_count
+        accepted = cells[valid][: max_samples - found]
+        numpy.add.at(counts, accepted.reshape(-1), 1)
+        found += len(accepted)
+        tried += batch
+        if tried >= 16 * batch and found * 100 < tried:
+            break
+
+    attempts = ANCHORED_ATTEMPTS * (max_samples - found)
+    while found < max_samples and attempts and perf_counter() < deadline:
+        attempts -= 1
+        layout = anchored_layout(grid_size, fleet, misses, hits, rng)
+        if layout is not None:
+            counts[layout] += 1
+            found += 1
+    return counts, found
+
+
+def anchored_layout(
+    grid_size: int,
+    fleet: list[int],
+    misses: numpy.ndarray,
+    hits: numpy.ndarray,
+    rng: numpy.random.Generator,
+) -> Optional[numpy.ndarray]:
+    """
+    Builds a layout by repeatedly placing a random remaining ship over a random
+    uncovered hit, then placing the other ships anywhere they fit.
+    Returns the cells of the layout, or None when it got stuck.
+    """
+    blocked = misses.copy()
+    uncovered = set(numpy.flatnonzero(hits).tolist())
+    ships = list(fleet)
+    layout = []
+    while uncovered and ships:
+        cell = sorted(uncovered)[rng.integers(len(uncovered))]
+        x, y = divmod(cell, grid_size)
+        candidates = [
+            (position, placement)
+            for position, ship in enumerate(ships)
+            for placement in placement_index(grid_size, ship).covering(x, y)
+            if not blocked[placement_index(grid_size, ship).cells_of(placement)].any()
+        ]
+        if not candidates:
+            return None
+        position, placement = candidates[rng.integers(len(candidates))]
+        cells = placement_index(grid_size, ships.pop(position)).cells_of(placement)
+        blocked[cells] = True
+        uncovered.difference_update(cells.tolist())
+        layout.append(cells)
+    if uncovered:
+        return None
+    for ship in ships:
+        index = placement_index(grid_size, ship)
+        free = index.compatible(blocked)
+        if not len(free):
+            return None
+        cells = index.cells_of(free[rng.integers(len(free))])
+        blocked[cells] = True
+        layout.append(cells)
+    return numpy.concatenate(layout) if layout else numpy.zeros(0, dtype=numpy.int64)
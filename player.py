@@ -1,10 +1,13 @@
 from ai import NoStrategy, Strategy
-from tkinter.constants import VERTICAL
 from board import *
 from utils import *
-from typing import Any, Optional, Type
-from tkinter import Button
+from placements import random_layout_cells
+from time import perf_counter
+from typing import Any, Iterable, Iterator, Optional, Type
 import random
+import metrics
+
+numpy = lazy_import("numpy")
 
 
 # Constantes
@@ -20,10 +23,32 @@ HELPTEXT_WRONG = f"Veuillez placer tout les bateaux correctement\n{HELPTEXT_PLAC
 HELPTEXT_SHOOTING = "Cliquez sur une case '?' pour tirer à cet endroit."
 
 
+def place_fleet_randomly(board: ControlledBoard) -> None:
+    """
+    Places the board's fleet, every legal layout being equally likely
+    """
+    # Seeded from the random module, so that random.seed() makes games reproducible
+    rng = numpy.random.default_rng(random.getrandbits(64))
+    (layout,) = random_layout_cells(1, board.size, list(board.fleet), rng)
+    place_fleet(board, layout.tolist())
+
+
+def place_fleet(board: ControlledBoard, cells: Iterable[int]) -> None:
+    """
+    Places ships on the given cells, numbered x * size + y, of an empty board.
+    Raises ValueError if some of them already hold a ship.
+    """
+    coordinates = [divmod(cell, board.size) for cell in sorted(cells)]
+    # A couple of bitwise operations on bitboards
+    if not board.all_cells_are(coordinates, WATER):
+        raise ValueError("Ships cannot overlap")
+    for x, y in coordinates:
+        board.change_cell(x, y, SHIP)
+
+
 class Player:
     own_board: ControlledBoard
     ennemy_board: ProjectiveBoard
-    ok_button: Button
     game: "Game"
     index: int
     selected_coordinates: tuple[int, int]
@@ -51,10 +76,8 @@ class Player:
             game, board.size, represents=ennemy_board, owner=self
         )
         self.strategy = strategy(strategy.name, self.own_board, self.ennemy_board)
-        self.ok_button = Button(text="OK")
-        self.ok_button.bind("<Button 1>", self.handle_click_ok)
 
-    def handle_click_ok(self, event) -> Any:
+    def handle_click_ok(self, event=None) -> Any:
         """
         Handles a click on the OK button
         """
@@ -78,10 +101,20 @@ class Player:
         """
         Returns True if none the cell's of the ennemy's (controlled) board are ships (i.e. all are sunken or water)
         """
-        return all(
-            self.ennemy_board.real_board @ (x, y) != SHIP
-            for x, y in doublerange(self.ennemy_board.size)
-        )
+        return self.ennemy_board.real_board.remaining_ship_cells == 0
+
+    def next_move(self) -> Optional[tuple[int, int]]:
+        """
+        Where to fire next, None if the player has not decided yet.
+        Called by the game's TurnScheduler when it's this player's turn.
+        """
+        raise NotImplementedError("Please implement next_move.")
+
+    def choose_move(self, x: int, y: int):
+        """
+        Handles a click on (x, y) of the ennemy board, during this player's turn
+        """
+        self.d(lambda: f"ignoring click on {x=}, {y=}", level=TRACE)
 
     def turn_is_mine(self) -> bool:
         return self.index == self.game.current_player_index
@@ -90,15 +123,24 @@ class Player:
     def human(self) -> bool:
         raise NotImplementedError("Please implement human property")
 
-    def d(self, t: str, *args, **kwargs):
-        return d(
-            ("[green]" if self.human else "[cyan]") + self.name + "[/] " + t,
+    def d(self, t: Message, *args, level: int = DEBUG, **kwargs):
+        if not logging_at(level):
+            return
+        return log(
+            level,
+            lambda: ("[green]" if self.human else "[cyan]")
+            + self.name
+            + "[/] "
+            + (t() if callable(t) else t),
             *args,
             **kwargs,
         )
 
 
 class HumanPlayer(Player):
+    # Where the user clicked last, until the game plays it
+    chosen_move: Optional[tuple[int, int]]
+
     def __init__(
         self,
         game: "Game",
@@ -108,24 +150,31 @@ class HumanPlayer(Player):
         name: str,
     ) -> None:
         super().__init__(game, board, ennemy_board, index, name, strategy=NoStrategy)
+        self.chosen_move = None
 
-    def render(self):
-        self.own_board.render(0, 2)
-        self.ennemy_board.render(0, 1)
-        self.ok_button.grid(column=1, row=2)
+    def choose_move(self, x: int, y: int):
+        self.chosen_move = (x, y)
+        self.game.move_ready()
 
-    def handle_click_ok(self, event) -> Any:
+    def next_move(self) -> Optional[tuple[int, int]]:
+        move, self.chosen_move = self.chosen_move, None
+        return move
+
+    def handle_click_ok(self, event=None) -> Any:
         if self.game.phase == PLACING:
             self.d(
-                f"handling OK button click: locking board, switching to shooting phase"
+                "handling OK button click: locking board, switching to shooting phase"
             )
             if not self.own_board.legal:
-                self.d(f"board is not legal! not locking & switching phase.")
-                self.game.helptext_var.set(HELPTEXT_WRONG)
+                self.d(
+                    lambda: f"board is not legal! not locking & switching phase: {self.own_board.diagnose()}"
+                )
+                self.game.set_helptext(HELPTEXT_WRONG)
                 return
             self.own_board.lock()
             self.game.phase = SHOOTING
-            self.game.helptext_var.set(HELPTEXT_SHOOTING)
+            self.game.set_helptext(HELPTEXT_SHOOTING)
+            self.game.move_ready()
 
     @property
     def human(self) -> bool:
@@ -150,52 +199,72 @@ class AIPlayer(Player):
         """
         Decide coordinates where to shoot.
         """
-        return self.strategy.choose_shot_location()
+        started = metrics.enabled and perf_counter()
+        move = self.strategy.choose_shot_location()
+        if started:
+            metrics.observe(
+                "decision", perf_counter() - started, *self.own_board.metric_labels
+            )
+        return move
+
+    def next_move(self) -> tuple[int, int]:
+        return self.decide_coordinates()
 
     def place_ships(self) -> None:
         """
-        Fill own board with ship spots
+        Fill own board with ship spots, every legal layout being equally likely
         """
-        for ship in self.own_board.fleet:
-            self.place_ship_randomly(ship)
+        started = metrics.enabled and perf_counter()
+        place_fleet_randomly(self.own_board)
+        if started:
+            metrics.observe(
+                "placement", perf_counter() - started, *self.own_board.metric_labels
+            )
+
+    @property
+    def human(self) -> bool:
+        return False
 
-    def place_ship(self, coords: list[tuple[int, int]]) -> None:
-        for (x, y) in coords:
-            self.own_board.place_or_remove(x, y)
 
-    def can_place_ship_at(self, x: int, y: int, ship: int, orientation: int):
-        """
-        Returns whether placing a ship at (x, y) in orientation `orientation` (`VERTICAL` or `HORIZONTAL`)
-        is possible.
-        """
-        if orientation == HORIZONTAL:
-            return [
-                self.own_board @ (x, y)
-                for (x, y) in self.own_board.horizontal_coordinates(x, y, y + ship)
-            ] == [WATER] * ship
-        if orientation == VERTICAL:
-            return [
-                self.own_board @ (x, y)
-                for (x, y) in self.own_board.vertical_coordinates(y, x, x + ship)
-            ] == [WATER] * ship
-        raise ValueError(f"Unknown orientation {orientation!r}")
-
-    def place_ship_randomly(self, ship: int) -> None:
-        """
-        Returns an available spot for a ship of length `ship`.
-        Raises ValueError if the board does not have room for one.
-        """
+class ReplayPlayer(Player):
+    """
+    Plays moves recorded beforehand (see movelog.py), in order.
+    Checks that each shot has the recorded result, raising ValueError otherwise.
+    """
 
-        coords = list(doublerange(self.own_board.size))
-        random.shuffle(coords)
-        for (x, y) in coords:
-            if self.can_place_ship_at(x, y, ship, VERTICAL):
-                self.place_ship(self.own_board.vertical_coordinates(y, x, x + ship))
-                return
-            elif self.can_place_ship_at(x, y, ship, HORIZONTAL):
-                self.place_ship(self.own_board.horizontal_coordinates(x, y, y + ship))
-                return
-        raise ValueError(f"Cannot fit a {ship}-cell-long ship in this player's board")
+    moves: Iterator[tuple[int, int, bool]]
+    expected_hit: Optional[bool]
+
+    def __init__(
+        self,
+        game: "Game",
+        board: ControlledBoard,
+        ennemy_board: ControlledBoard,
+        index: int,
+        moves: Iterable[tuple[int, int, bool]],
+        name: str = None,
+    ) -> None:
+        super().__init__(
+            game,
+            board,
+            ennemy_board,
+            index,
+            name=name or f"Joueur {index + 1}",
+            strategy=NoStrategy,
+        )
+        self.moves = iter(moves)
+        self.expected_hit = None
+        game.subscribe_moves(self.check_move)
+
+    def next_move(self) -> Optional[tuple[int, int]]:
+        x, y, self.expected_hit = next(self.moves, (None, None, None))
+        return None if x is None else (x, y)
+
+    def check_move(self, player: Player, x: int, y: int, hit: bool):
+        if player is self and hit != self.expected_hit:
+            raise ValueError(
+                f"Shot at {(x, y)} {'hit' if hit else 'missed'}, unlike when recorded"
+            )
 
     @property
     def human(self) -> bool:
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+"""
+Hosts many games at once on a single asyncio event loop, for clients connecting
+over TCP to play against the computer or against each other.
+
+    python server.py --port 9000 --idle-timeout 300
+
+The server is the referee: it places every player's ships at random and knows all
+the boards. Clients join, then shoot when it's their turn:
+
+    client -> server: JOIN grid_size [strategy]  (no strategy: wait for another client)
+    server -> client: STARTED index              (player 0 shoots first)
+    client -> server: SHOOT x y
+    server -> client: RESULT HIT/WON             (of the client's shot)
+    server -> client: SHOT x y HIT/WON           (the opponent shot there)
+    server -> client: OVER reason                (won, lost, opponent left, idle,
+                                                  the AI could not play)
+
+A client can JOIN again once its game is over.
+Messages are framed like network.py's, with their own types.
+"""
+import asyncio
+import os
+import resource
+import sys
+from argparse import ArgumentParser
+from collections import deque
+from struct import Struct
+from traceback import print_exception
+from typing import Any, Callable, Optional
+from ai import strategies
+from backends import BitboardBackend
+from board import ControlledBoard
+from game import Game, TurnScheduler
+from network import ProtocolError, RemotePlayer, frame, read_message
+from player import AIPlayer, Player, FLEET, SHOOTING, place_fleet_randomly
+
+# Client messages
+JOIN = 1
+SHOOT = 2
+STATS = 3
+# Server messages
+STARTED = 11
+RESULT = 12
+SHOT = 13
+OVER = 14
+ERROR = 15
+STATISTICS = 16
+PAYLOADS = {
+    # grid size, followed by the opponent strategy's name
+    JOIN: Struct("<I"),
+    SHOOT: Struct("<II"),
+    STATS: Struct(""),
+    # player index
+    STARTED: Struct("<B"),
+    # HIT and WON flags
+    RESULT: Struct("<B"),
+    # coordinates, HIT and WON flags
+    SHOT: Struct("<IIB"),
+    # reason, see below
+    OVER: Struct("<B"),
+    # error code, see below
+    ERROR: Struct("<B"),
+    # games being played, clients waiting for an opponent,
+    # games played and evicted so far, resident memory (bytes)
+    STATISTICS: Struct("<IIQQQ"),
+}
+# RESULT and SHOT flags
+HIT = 1
+WON = 2
+# OVER reasons
+YOU_WON, YOU_LOST, OPPONENT_LEFT, IDLE, AI_FAILED = range(5)
+# ERROR codes
+NOT_PLAYING, NOT_YOUR_TURN, OUT_OF_BOUNDS, UNKNOWN_STRATEGY, BAD_GRID_SIZE = range(5)
+MAX_GRID_SIZE = 1000
+# Biggest boards on which AI players that are not slow (see ai.Strategy.slow)
+# decide their moves right away, in well under a millisecond
+INLINE_GRID_SIZE = 32
+IDLE_TIMEOUT = 300  # seconds
+
+
+class Client:
+    """
+    A connection to the server, and the game it plays in, if any.
+    Messages sent during the same event loop iteration (typically a shot's result
+    and the AI's reply) are written to the socket together.
+    """
+
+    writer: asyncio.StreamWriter
+    game: Optional["HostedGame"]
+    # Index of the client's player in its game
+    index: int
+    # Messages not written to the socket yet
+    outgoing: bytearray
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.game = None
+        self.index = 0
+        self.outgoing = bytearray()
+
+    def send(self, kind: int, *values: int):
+        if not self.outgoing:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.outgoing += frame(kind, *values, payloads=PAYLOADS)
+
+    def flush(self):
+        if not self.writer.is_closing():
+            self.writer.write(bytes(self.outgoing))
+        self.outgoing.clear()
+
+
+class HostedGame:
+    """
+    A game played on the server. Boards are bitboards, a few integers each,
+    so that thousands of games fit in little memory.
+    Moves are played as soon as they're known: right after a client's shot,
+    an AI opponent's reply is played too, and sent along. Unless deciding it
+    is quick, the AI decides in the event loop's default executor, like
+    network.PeerSession's: a costly strategy on a big board would otherwise
+    stall every other game meanwhile.
+    """
+
+    game: Game
+    scheduler: TurnScheduler
+    # Client playing each player, None for AI players
+    clients: list[Optional[Client]]
+    # Event loop time of the last move (or of the start)
+    last_activity: float
+    # The AI player's move being decided, if any
+    thinking: Optional[asyncio.Task]
+    over: bool
+    # Called with the OVER reason of each player, once someone won
+    # or the AI player could not play
+    ended: Callable[["HostedGame", dict[int, int]], Any]
+
+    def __init__(
+        self,
+        grid_size: int,
+        clients: list[Optional[Client]],
+        ended: Callable[["HostedGame", dict[int, int]], Any],
+        strategy=None,
+    ):
+        self.game = Game(grid_size, FLEET)
+        boards = [
+            ControlledBoard(self.game, grid_size, FLEET, backend=BitboardBackend)
+            for _ in clients
+        ]
+        self.game.players = [
+            RemotePlayer(self.game, boards[index], boards[1 - index], index)
+            if client is not None
+            else AIPlayer(
+                self.game,
+                boards[index],
+                boards[1 - index],
+                strategy,
+                index,
+                strategy.__name__,
+            )
+            for index, client in enumerate(clients)
+        ]
+        for board in boards:
+            place_fleet_randomly(board)
+            board.lock()
+        self.game.phase = SHOOTING
+        self.scheduler = TurnScheduler(self.game)
+        self.clients = clients
+        self.game.subscribe_moves(self.tell_clients)
+        for index, client in enumerate(clients):
+            if client is not None:
+                client.game = self
+                client.index = index
+        self.last_activity = asyncio.get_running_loop().time()
+        self.thinking = None
+        self.over = False
+        self.ended = ended
+
+    def tell_clients(self, player: Player, x: int, y: int, hit: bool):
+        flags = hit * HIT | player.won * WON
+        for client in self.clients:
+            if client is None:
+                continue
+            if client.index == player.index:
+                client.send(RESULT, flags)
+            else:
+                client.send(SHOT, x, y, flags)
+
+    def play(self, client: Client, x: int, y: int):
+        """
+        Plays the client's shot, then the AI's reply if it plays against one
+        """
+        self.game.players[client.index].moves.append((x, y))
+        self.last_activity = asyncio.get_running_loop().time()
+        self.advance()
+
+    def advance(self):
+        """
+        Plays the clients' moves that can be played right away, until it's an AI
+        player's turn: it then starts deciding its move
+        """
+        while self.game.winner is None and not self.over:
+            player = self.game.current_player
+            if isinstance(player, AIPlayer) and not self.decides_inline(player):
+                if self.thinking is None:
+                    self.thinking = asyncio.create_task(self.think(player))
+                return
+            try:
+                if not self.scheduler.step():
+                    return
+            except Exception as error:
+                if not isinstance(player, AIPlayer):
+                    raise
+                return self.fail(player, error)
+        if (winner := self.game.winner) is not None and not self.over:
+            self.ended(self, {winner.index: YOU_WON, 1 - winner.index: YOU_LOST})
+
+    def decides_inline(self, player: AIPlayer) -> bool:
+        return not player.strategy.slow and self.game.grid_size <= INLINE_GRID_SIZE
+
+    async def think(self, player: AIPlayer):
+        """
+        Plays the AI player's move, decided in a thread
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            move = await loop.run_in_executor(None, player.next_move)
+        except Exception as error:
+            if not self.over:
+                self.fail(player, error)
+            return
+        finally:
+            self.thinking = None
+        if self.over:
+            return
+        self.game.apply_move(*move)
+        self.last_activity = loop.time()
+        self.advance()
+
+    def fail(self, player: AIPlayer, error: Exception):
+        """
+        Ends the game when the AI player could not decide its move,
+        printing why to stderr
+        """
+        print(
+            f"{player.strategy.name} could not play in a {self.game.grid_size}x"
+            f"{self.game.grid_size} game:",
+            file=sys.stderr,
+        )
+        print_exception(error)
+        self.ended(self, {0: AI_FAILED, 1: AI_FAILED})
+
+    def end(self, reasons: dict[int, int]):
+        """
+        Tells the clients the game is over, `reasons` giving the OVER reason
+        of each player
+        """
+        self.over = True
+        for client in self.clients:
+            if client is not None:
+                client.send(OVER, reasons[client.index])
+                client.game = None
+
+
+class GameServer:
+    """
+    Accepts clients, pairs them up or with AI players, and hosts their games
+    """
+
+    games: set[HostedGame]
+    # Clients waiting for an opponent, by grid size, with the time they started to
+    waiting: dict[int, deque[tuple[Client, float]]]
+    idle_timeout: float
+    games_played: int
+    games_evicted: int
+
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT):
+        self.games = set()
+        self.waiting = {}
+        self.idle_timeout = idle_timeout
+        self.games_played = 0
+        self.games_evicted = 0
+        self.strategies = strategies()
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        client = Client(writer)
+        try:
+            while True:
+                kind, values, extra = await read_message(reader, PAYLOADS)
+                if kind == JOIN:
+                    try:
+                        strategy = extra.decode()
+                    except UnicodeDecodeError:
+                        client.send(ERROR, UNKNOWN_STRATEGY)
+                        continue
+                    self.join(client, values[0], strategy)
+                elif kind == SHOOT:
+                    self.shoot(client, *values)
+                elif kind == STATS:
+                    client.send(STATISTICS, *self.statistics())
+                else:
+                    raise ProtocolError(f"Unexpected message {kind}")
+        except ProtocolError:
+            pass
+        finally:
+            self.leave(client)
+            writer.close()
+
+    def join(self, client: Client, grid_size: int, strategy: str):
+        # Out of its game, or of the queue: it would be paired with itself
+        self.leave(client)
+        if not 5 <= grid_size <= MAX_GRID_SIZE:
+            return client.send(ERROR, BAD_GRID_SIZE)
+        if strategy:
+            if strategy not in self.strategies:
+                return client.send(ERROR, UNKNOWN_STRATEGY)
+            return self.start(grid_size, [client, None], self.strategies[strategy])
+        queue = self.waiting.setdefault(grid_size, deque())
+        if queue:
+            opponent, _ = queue.popleft()
+            return self.start(grid_size, [opponent, client])
+        queue.append((client, asyncio.get_running_loop().time()))
+
+    def start(self, grid_size: int, clients: list[Optional[Client]], strategy=None):
+        hosted = HostedGame(grid_size, clients, self.end, strategy)
+        self.games.add(hosted)
+        for client in clients:
+            if client is not None:
+                client.send(STARTED, client.index)
+        hosted.advance()
+
+    def shoot(self, client: Client, x: int, y: int):
+        hosted = client.game
+        if hosted is None:
+            return client.send(ERROR, NOT_PLAYING)
+        if hosted.game.current_player_index != client.index:
+            return client.send(ERROR, NOT_YOUR_TURN)
+        if not hosted.game.players[client.index].own_board.within_bounds(x, y):
+            return client.send(ERROR, OUT_OF_BOUNDS)
+        hosted.play(client, x, y)
+
+    def end(self, hosted: HostedGame, reasons: dict[int, int]):
+        hosted.end(reasons)
+        self.games.discard(hosted)
+        self.games_played += 1
+
+    def leave(self, client: Client):
+        if client.game is not None:
+            self.end(
+                client.game, {1 - client.index: OPPONENT_LEFT, client.index: YOU_LOST}
+            )
+        for queue in self.waiting.values():
+            for entry in queue:
+                if entry[0] is client:
+                    queue.remove(entry)
+                    break
+
+    def evict_idle(self):
+        """
+        Ends the games nobody played in for idle_timeout seconds,
+        and stops waiting for an opponent for that long
+        """
+        now = asyncio.get_running_loop().time()
+        idle = [g for g in self.games if now - g.last_activity > self.idle_timeout]
+        for hosted in idle:
+            self.end(hosted, {0: IDLE, 1: IDLE})
+            self.games_evicted += 1
+        for queue in self.waiting.values():
+            while queue and now - queue[0][1] > self.idle_timeout:
+                client, _ = queue.popleft()
+                client.send(OVER, IDLE)
+
+    async def evict_idle_forever(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 4, 0.01))
+            self.evict_idle()
+
+    def statistics(self) -> tuple[int, int, int, int, int]:
+        return (
+            len(self.games),
+            sum(len(queue) for queue in self.waiting.values()),
+            self.games_played,
+            self.games_evicted,
+            resident_memory(),
+        )
+
+    async def serve(self, address: str, port: int, ready: asyncio.Future = None):
+        """
+        Serves clients until cancelled. `ready` gets the port listened on.
+        """
+        server = await asyncio.start_server(self.handle, address, port, backlog=4096)
+        evictor = asyncio.create_task(self.evict_idle_forever())
+        if ready is not None:
+            ready.set_result(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            evictor.cancel()
+
+
+def resident_memory() -> int:
+    """
+    Memory used by this process, in bytes
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is the peak, in kilobytes (bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def raise_open_files_limit():
+    """
+    Allows as many open files (sockets included) as the system lets us
+    """
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--address", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000, help="0 for any free port")
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=IDLE_TIMEOUT,
+        help="seconds after which games nobody plays in are ended",
+    )
+    args = parser.parse_args()
+    raise_open_files_limit()
+
+    async def run():
+        ready = asyncio.get_running_loop().create_future()
+        serving = asyncio.create_task(
+            GameServer(args.idle_timeout).serve(args.address, args.port, ready)
+        )
+        print(f"Listening on port {await ready}", flush=True)
+        await serving
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
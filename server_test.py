@@ -0,0 +1,175 @@
+import asyncio
+import random
+from ai import HuntTarget
+from network import frame, read_message
+from server import (
+    AI_FAILED,
+    ERROR,
+    IDLE,
+    JOIN,
+    NOT_YOUR_TURN,
+    OVER,
+    PAYLOADS,
+    RESULT,
+    SHOOT,
+    SHOT,
+    STARTED,
+    STATISTICS,
+    STATS,
+    UNKNOWN_STRATEGY,
+    WON,
+    YOU_LOST,
+    YOU_WON,
+    GameServer,
+)
+
+
+async def serving(server: GameServer) -> tuple[asyncio.Task, int]:
+    ready = asyncio.get_running_loop().create_future()
+    task = asyncio.create_task(server.serve("127.0.0.1", 0, ready))
+    return task, await ready
+
+
+async def stop(task: asyncio.Task, writers: list[asyncio.StreamWriter]):
+    for writer in writers:
+        writer.close()
+        await writer.wait_closed()
+    # Let the server see the clients leave before it stops
+    await asyncio.sleep(0.01)
+    task.cancel()
+
+
+def test_client_plays_against_the_computer():
+    random.seed(0)
+
+    async def play():
+        server = GameServer()
+        task, port = await serving(server)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(frame(JOIN, 10, extra=b"HuntTarget", payloads=PAYLOADS))
+        kind, (index,), _ = await read_message(reader, PAYLOADS)
+        assert (kind, index) == (STARTED, 0)
+
+        targets = [(x, y) for x in range(10) for y in range(10)]
+        while True:
+            writer.write(frame(SHOOT, *targets.pop(0), payloads=PAYLOADS))
+            kind, values, _ = await read_message(reader, PAYLOADS)
+            assert kind == RESULT
+            # The computer's reply, or the end of the game
+            kind, values, _ = await read_message(reader, PAYLOADS)
+            if kind == SHOT and values[2] & WON:
+                kind, values, _ = await read_message(reader, PAYLOADS)
+            if kind == OVER:
+                break
+            assert kind == SHOT
+        await stop(task, [writer])
+        return values[0], server.games_played
+
+    reason, played = asyncio.run(play())
+    assert reason in (YOU_WON, YOU_LOST)
+    assert played == 1
+
+
+def test_big_games_are_decided_in_threads():
+    async def play():
+        server = GameServer()
+        task, port = await serving(server)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(frame(JOIN, 40, extra=b"HuntTarget", payloads=PAYLOADS))
+        assert (await read_message(reader, PAYLOADS))[0] == STARTED
+        kinds = []
+        for x in range(3):
+            writer.write(frame(SHOOT, x, 0, payloads=PAYLOADS))
+            kinds.append((await read_message(reader, PAYLOADS))[0])
+            kinds.append((await read_message(reader, PAYLOADS))[0])
+        await stop(task, [writer])
+        return kinds
+
+    assert asyncio.run(play()) == [RESULT, SHOT] * 3
+
+
+def test_idle_games_are_evicted_and_turns_enforced():
+    async def play():
+        server = GameServer(idle_timeout=0.05)
+        task, port = await serving(server)
+        streams = [await asyncio.open_connection("127.0.0.1", port) for _ in range(2)]
+        for _, writer in streams:
+            writer.write(frame(JOIN, 10, payloads=PAYLOADS))
+        for reader, _ in streams:
+            assert (await read_message(reader, PAYLOADS))[0] == STARTED
+        reader, writer = streams[1]
+        writer.write(frame(SHOOT, 0, 0, payloads=PAYLOADS))
+        assert (await read_message(reader, PAYLOADS))[:2] == (ERROR, (NOT_YOUR_TURN,))
+        messages = [await read_message(reader, PAYLOADS) for reader, _ in streams]
+        await stop(task, [writer for _, writer in streams])
+        return messages, server.games_evicted
+
+    messages, evicted = asyncio.run(play())
+    assert [message[:2] for message in messages] == [(OVER, (IDLE,))] * 2
+    assert evicted == 1
+
+
+def test_clients_joining_twice_are_not_paired_with_themselves():
+    async def play():
+        server = GameServer()
+        task, port = await serving(server)
+        first = await asyncio.open_connection("127.0.0.1", port)
+        second = await asyncio.open_connection("127.0.0.1", port)
+        reader, writer = first
+        writer.write(frame(JOIN, 10, extra=b"\xff", payloads=PAYLOADS))
+        assert (await read_message(reader, PAYLOADS))[:2] == (
+            ERROR,
+            (UNKNOWN_STRATEGY,),
+        )
+        writer.write(frame(JOIN, 10, payloads=PAYLOADS))
+        writer.write(frame(JOIN, 10, payloads=PAYLOADS))
+        writer.write(frame(STATS, payloads=PAYLOADS))
+        kind, (playing, waiting, *_), _ = await read_message(reader, PAYLOADS)
+        assert (kind, playing, waiting) == (STATISTICS, 0, 1)
+
+        second[1].write(frame(JOIN, 10, payloads=PAYLOADS))
+        started = [
+            await read_message(reader, PAYLOADS) for reader, _ in (first, second)
+        ]
+        await stop(task, [first[1], second[1]])
+        return started
+
+    started = asyncio.run(play())
+    assert [message[:2] for message in started] == [(STARTED, (0,)), (STARTED, (1,))]
+
+
+class BrokenStrategy(HuntTarget):
+    def choose_shot_location(self):
+        raise RuntimeError("out of ideas")
+
+
+class SlowBrokenStrategy(BrokenStrategy):
+    slow = True
+
+
+def test_games_end_when_the_AI_cannot_play():
+    async def play():
+        server = GameServer()
+        server.strategies.update(Broken=BrokenStrategy, SlowBroken=SlowBrokenStrategy)
+        task, port = await serving(server)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        messages = []
+        # Decided right away, then in a thread
+        for strategy in b"Broken", b"SlowBroken":
+            writer.write(frame(JOIN, 10, extra=strategy, payloads=PAYLOADS))
+            writer.write(frame(SHOOT, 0, 0, payloads=PAYLOADS))
+            for _ in range(3):
+                messages.append((await read_message(reader, PAYLOADS))[:2])
+        writer.write(frame(STATS, payloads=PAYLOADS))
+        kind, (playing, _, played, *_), _ = await read_message(reader, PAYLOADS)
+        await stop(task, [writer])
+        return messages, playing, played
+
+    messages, playing, played = asyncio.run(play())
+    assert [kind for kind, _ in messages] == [STARTED, RESULT, OVER] * 2
+    assert messages[2] == messages[5] == (OVER, (AI_FAILED,))
+    assert (playing, played) == (0, 2)
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Plays many games between two AI strategies, spread over a pool of processes.
+
+    python simulate.py HuntTarget HuntTarget --games 100000 --workers 16
+
+Prints one JSON object per game, as soon as it finishes (in completion order),
+then a summary on stderr. With --metrics, the engine's metrics (see metrics.py)
+of every worker are added up and dumped to a JSON file as games finish.
+"""
+import json
+import os
+import random
+import sys
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from os import cpu_count
+from time import perf_counter
+from typing import Any, Iterator, Optional
+from ai import strategies
+from game import ai_game, GRID_SIZE
+from movelog import MoveLogWriter
+import metrics
+
+
+def play_one(
+    task: tuple[int, str, str, int, int, Optional[str], bool]
+) -> dict[str, Any]:
+    """
+    Plays game number `index` with the given seed.
+    Players take turns to start, so that neither strategy gets the first shot every time.
+    The game is recorded to `record`/game-<index>.bnlog if `record` is a directory.
+    If `measure`, the game's metrics are returned under "metrics", for the parent
+    process to add them up.
+    """
+    index, first, second, seed, grid_size, record, measure = task
+    if measure:
+        metrics.enable()
+    random.seed(seed)
+    available = strategies()
+    game = ai_game(available[first], available[second], grid_size=grid_size)
+    game.current_player_index = index % 2
+    writer = None
+    if record:
+        path = os.path.join(record, f"game-{index}.bnlog")
+        writer = MoveLogWriter(path, game, seed=seed)
+
+    start = perf_counter()
+    winner = game.play()
+    duration = perf_counter() - start
+    if writer:
+        writer.close()
+
+    result = {
+        "game": index,
+        "seed": seed,
+        "winner": winner.index,
+        "winner_strategy": (first, second)[winner.index],
+        "starting_player": index % 2,
+        "shots": [player.ennemy_board.shots_fired for player in game.players],
+        "accuracy": [player.accuracy for player in game.players],
+        "duration": duration,
+    }
+    if measure:
+        result["metrics"] = metrics.snapshot()
+        metrics.reset()
+    return result
+
+
+def simulate(
+    first: str,
+    second: str,
+    games: int,
+    seed: int = 0,
+    workers: int = None,
+    grid_size: int = GRID_SIZE,
+    chunksize: int = None,
+    record: Optional[str] = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Yields the results of `games` games as they complete.
+    Game number i is played with seed `seed + i`, so results are reproducible
+    regardless of the number of workers.
+    If metrics are enabled, the workers' are added to this process'.
+    """
+    workers = workers or cpu_count() or 1
+    # Games played here record their metrics themselves
+    measure = metrics.enabled and workers > 1
+    tasks = (
+        (i, first, second, seed + i, grid_size, record, measure) for i in range(games)
+    )
+    if workers == 1:
+        yield from map(play_one, tasks)
+        return
+    # Big enough chunks to amortize inter-process communication,
+    # small enough to keep every worker busy until the end.
+    chunksize = chunksize or max(1, min(1000, games // (workers * 8)))
+    with Pool(workers) as pool:
+        for result in pool.imap_unordered(play_one, tasks, chunksize=chunksize):
+            if measure:
+                metrics.merge(result.pop("metrics"))
+            yield result
+
+
+def main():
+    available = strategies()
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("first", choices=available.keys())
+    parser.add_argument("second", choices=available.keys())
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workers", type=int, help="number of processes, defaults to the CPU count"
+    )
+    parser.add_argument("--grid-size", type=int, default=GRID_SIZE)
+    parser.add_argument("--chunksize", type=int)
+    parser.add_argument(
+        "--record", metavar="DIRECTORY", help="save a move log of each game there"
+    )
+    parser.add_argument(
+        "--quiet", action="store_true", help="only print the summary"
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="record the engine's metrics, dumping them there as JSON",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=metrics.DUMP_INTERVAL,
+        help="seconds between two dumps of the metrics",
+    )
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics, args.metrics_interval)
+
+    wins = [0, 0]
+    shots = [0, 0]
+    start = perf_counter()
+    for result in simulate(
+        args.first,
+        args.second,
+        args.games,
+        seed=args.seed,
+        workers=args.workers,
+        grid_size=args.grid_size,
+        chunksize=args.chunksize,
+        record=args.record,
+    ):
+        wins[result["winner"]] += 1
+        shots[result["winner"]] += result["shots"][result["winner"]]
+        if not args.quiet:
+            print(json.dumps(result))
+    elapsed = perf_counter() - start
+
+    for index, name in enumerate((args.first, args.second)):
+        print(
+            f"player {index} ({name}): {wins[index]} wins"
+            f" ({wins[index] / args.games:.1%}),"
+            f" {shots[index] / (wins[index] or 1):.1f} shots per win",
+            file=sys.stderr,
+        )
+    print(
+        f"{args.games} games in {elapsed:.1f}s ({args.games / elapsed:.0f} games/s)",
+        file=sys.stderr,
+    )
+    if args.metrics:
+        metrics.disable()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Saves and restores the complete state of a game: its phase and turn, every board's
+cells, shot counters and what the players' strategies know.
+
+Snapshots are compact: cells take 2 bits each (see backends.py), so that
+AIs can snapshot and restore a 10x10 game in microseconds, e.g. to search moves.
+Saved to a file, they can be loaded lazily: boards then read their cells from
+a memory map of the file (see backends.MappedBackend), so that even a
+100,000x100,000 board opens in no time and without reading it all.
+
+    data = snapshot(game)
+    ...  # play some moves
+    restore(game, data)
+
+    save(game, "game.snapshot")
+    load(other_game, "game.snapshot")
+
+Snapshots are restored into games set up the same way, with the same grid size
+and players using the same strategies, like movelog.replay's.
+Strategies' states are pickled: only load snapshots you trust.
+
+Layout, integers being little-endian:
+    header: magic, version, grid size, phase, current player's index, players count
+    for each player: whether their own and projective boards are locked,
+        shots fired and missed, length of the pickled strategy state, the state
+    for each player, their own board then their projective one:
+        palette (state of each of the up to 4 codes, 255 when unused),
+        number of cells in each of those states, then the low and high bit planes
+"""
+import mmap
+import pickle
+from os import PathLike
+from struct import Struct
+from typing import Iterator, Union
+from backends import MAX_CODES, plane_bytes
+from board import Board
+from game import Game
+
+MAGIC = b"BNSNAP"
+VERSION = 2
+HEADER = Struct("<6sBIBBB")
+PLAYER = Struct("<BBQQI")
+BOARD = Struct(f"<{MAX_CODES}B{MAX_CODES}Q")
+UNUSED_CODE = 255
+
+
+def boards(game: Game) -> Iterator[Board]:
+    for player in game.players:
+        yield player.own_board
+        yield player.ennemy_board
+
+
+def strategy_states(game: Game) -> list[bytes]:
+    return [
+        pickle.dumps(player.strategy.save_state(), pickle.HIGHEST_PROTOCOL)
+        for player in game.players
+    ]
+
+
+def snapshot_size(game: Game, states: list[bytes]) -> int:
+    planes = 2 * plane_bytes(game.grid_size)
+    return (
+        HEADER.size
+        + sum(PLAYER.size + len(state) for state in states)
+        + 2 * len(game.players) * (BOARD.size + planes)
+    )
+
+
+def write(game: Game, states: list[bytes], buffer):
+    """
+    Writes the snapshot to `buffer`, which has to be zeroed beforehand
+    """
+    HEADER.pack_into(
+        buffer,
+        0,
+        MAGIC,
+        VERSION,
+        game.grid_size,
+        game.phase,
+        game.current_player_index,
+        len(game.players),
+    )
+    offset = HEADER.size
+    for player, state in zip(game.players, states):
+        PLAYER.pack_into(
+            buffer,
+            offset,
+            player.own_board.locked,
+            player.ennemy_board.locked,
+            player.ennemy_board.shots_fired,
+            player.ennemy_board.shots_missed,
+            len(state),
+        )
+        offset += PLAYER.size
+        buffer[offset : offset + len(state)] = state
+        offset += len(state)
+    planes = 2 * plane_bytes(game.grid_size)
+    for board in boards(game):
+        palette = board.palette()
+        unused = MAX_CODES - len(palette)
+        BOARD.pack_into(
+            buffer,
+            offset,
+            *palette,
+            *[UNUSED_CODE] * unused,
+            *[board.count(state) for state in palette],
+            *[0] * unused,
+        )
+        offset += BOARD.size
+        board.backend.dump(
+            buffer, offset, {state: code for code, state in enumerate(palette)}
+        )
+        offset += planes
+
+
+def read(game: Game, buffer, lazy: bool = False):
+    """
+    Restores the snapshot in `buffer` into the game, see Board.load_cells for `lazy`.
+    Raises ValueError if it is not a snapshot of a game like this one.
+    """
+    magic, version, grid_size, phase, current, players = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a game snapshot, or of an unsupported version")
+    if grid_size != game.grid_size or players != len(game.players):
+        raise ValueError(
+            f"Snapshot of a {players}-player game on a {grid_size}x{grid_size} grid"
+        )
+    game.phase = phase
+    game.current_player_index = current
+    offset = HEADER.size
+    for player in game.players:
+        own_locked, ennemy_locked, fired, missed, length = PLAYER.unpack_from(
+            buffer, offset
+        )
+        offset += PLAYER.size
+        player.own_board.locked = bool(own_locked)
+        player.ennemy_board.locked = bool(ennemy_locked)
+        player.ennemy_board.shots_fired = fired
+        player.ennemy_board.shots_missed = missed
+        player.strategy.restore_state(pickle.loads(buffer[offset : offset + length]))
+        offset += length
+    planes = 2 * plane_bytes(grid_size)
+    for board in boards(game):
+        values = BOARD.unpack_from(buffer, offset)
+        palette = [state for state in values[:MAX_CODES] if state != UNUSED_CODE]
+        counts = dict(zip(palette, values[MAX_CODES:]))
+        board.load_cells(buffer, offset + BOARD.size, palette, counts, lazy)
+        offset += BOARD.size + planes
+
+
+def snapshot(game: Game) -> bytes:
+    states = strategy_states(game)
+    buffer = bytearray(snapshot_size(game, states))
+    write(game, states, buffer)
+    return bytes(buffer)
+
+
+def restore(game: Game, data: bytes):
+    """
+    Restores a snapshot() of a game like this one, copying its cells into the
+    game's board backends
+    """
+    read(game, data)
+
+
+def save(game: Game, path: Union[str, PathLike]):
+    """
+    Saves a snapshot of the game to a file.
+    The file is written through a memory map, where only the pages holding
+    something else than zeroes are touched: the untouched ones stay holes,
+    on file systems supporting sparse files.
+    """
+    states = strategy_states(game)
+    size = snapshot_size(game, states)
+    with open(path, "w+b") as file:
+        file.truncate(size)
+        with mmap.mmap(file.fileno(), size) as buffer:
+            if hasattr(buffer, "madvise"):
+                # Changed cells are written here and there, don't read around them
+                buffer.madvise(mmap.MADV_RANDOM)
+            write(game, states, buffer)
+
+
+def load(game: Game, path: Union[str, PathLike], lazy: bool = True):
+    """
+    Restores a snapshot saved to a file into a game like the one saved.
+    Unless `lazy` is False, boards read their cells from a read-only memory
+    map of the file (see backends.MappedBackend): playing on never modifies it.
+    """
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if lazy and hasattr(buffer, "madvise"):
+        # Cells are read here and there: reading ahead would only waste memory
+        buffer.madvise(mmap.MADV_RANDOM)
+    if not lazy:
+        with buffer:
+            return read(game, buffer)
+    read(game, buffer, lazy=True)
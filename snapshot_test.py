@@ -0,0 +1,100 @@
+import os
+import random
+from tempfile import TemporaryDirectory
+from ai import HuntTarget, ParityHuntTarget, ProbabilityDensity
+from backends import BitboardBackend, GridBackend, MappedBackend, SparseBackend
+from board import MISSED, SHIP, SUNKEN, UNKNOWN, WATER
+from game import TurnScheduler, ai_game
+from snapshot import load, restore, save, snapshot
+
+
+def boards_states(game) -> list[list[list[int]]]:
+    return [
+        board.state
+        for player in game.players
+        for board in (player.own_board, player.ennemy_board)
+    ]
+
+
+def play(game, moves: int, seed: int):
+    random.seed(seed)
+    scheduler = TurnScheduler(game)
+    for _ in range(moves):
+        scheduler.step()
+
+
+def test_restored_games_play_on_the_same():
+    for backend in (GridBackend, BitboardBackend, SparseBackend, MappedBackend):
+        random.seed(0)
+        game = ai_game(ParityHuntTarget, HuntTarget, backend=backend)
+        play(game, 30, seed=1)
+        before = boards_states(game)
+        data = snapshot(game)
+        play(game, 20, seed=2)
+        after = boards_states(game)
+
+        restore(game, data)
+        assert boards_states(game) == before
+        assert game.players[0].own_board.count(SHIP) == sum(
+            row.count(SHIP) for row in before[0]
+        )
+        play(game, 20, seed=2)
+        assert boards_states(game) == after
+
+
+def test_restored_strategies_know_the_same():
+    random.seed(0)
+    game = ai_game(ProbabilityDensity, ParityHuntTarget)
+    play(game, 60, seed=1)
+    data = snapshot(game)
+    play(game, 20, seed=2)
+    after = boards_states(game)
+
+    restore(game, data)
+    play(game, 20, seed=2)
+    assert boards_states(game) == after
+
+
+def test_saved_huge_boards_load_lazily():
+    random.seed(0)
+    size = 20_000
+    game = ai_game(HuntTarget, HuntTarget, grid_size=size, backend=SparseBackend)
+    play(game, 100, seed=1)
+    shooter = game.players[0].ennemy_board
+    fired = shooter.cells(SUNKEN) + shooter.cells(MISSED)
+
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "huge.snapshot")
+        save(game, path)
+        # Only the pages with shots were written
+        assert os.stat(path).st_blocks * 512 < 100 * 4096 * 8
+
+        loaded = ai_game(HuntTarget, HuntTarget, grid_size=size, backend=SparseBackend)
+        load(loaded, path)
+        board = loaded.players[0].ennemy_board
+        assert isinstance(board.backend, MappedBackend)
+        assert [board @ cell for cell in fired] == [shooter @ cell for cell in fired]
+        assert board.count(UNKNOWN) == size * size - len(fired)
+        assert loaded.players[1].own_board.count(WATER) == shooter.real_board.count(
+            WATER
+        )
+
+        play(loaded, 100, seed=2)
+        assert board.shots_fired == shooter.shots_fired + 50
+        # Playing did not modify the file
+        load(loaded, path)
+        assert board.shots_fired == shooter.shots_fired
+
+
+def test_snapshots_of_other_games_are_refused():
+    data = snapshot(ai_game(HuntTarget, HuntTarget, grid_size=10))
+    try:
+        restore(ai_game(HuntTarget, HuntTarget, grid_size=12), data)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("restored a snapshot of a smaller game")
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]
@@ -0,0 +1,163 @@
+"""
+Measures how long the game takes to start, when main.py is given --startup-profile:
+the time spent importing each module, and in each phase of the initialization.
+The report is printed once the boards are drawn.
+
+Imports are timed from the moment this module is imported,
+which is why main.py imports it before anything else.
+"""
+import sys
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Iterator, Optional
+
+FLAG = "--startup-profile"
+# Number of modules listed in the report, slowest first
+SHOWN_MODULES = 15
+
+
+class ImportTimer:
+    """
+    Times the execution of the modules found by the other finders of sys.meta_path.
+    A module's own time excludes the modules it imports.
+    Finders and loaders are duck-typed: importing importlib.abc takes longer
+    than most of the game's own imports.
+    """
+
+    # Module name, milliseconds spent importing it and its own ones
+    timings: list[tuple[str, float, float]]
+    # Time spent in the modules being imported that they imported, innermost last
+    nested: list[float]
+
+    def __init__(self):
+        self.timings = []
+        self.nested = []
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = TimedLoader(spec.loader, self)
+        return spec
+
+    def time(self, name: str, execute):
+        self.nested.append(0)
+        start = perf_counter()
+        try:
+            execute()
+        finally:
+            elapsed = (perf_counter() - start) * 1000
+            children = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+            self.timings.append((name, elapsed, elapsed - children))
+
+
+class TimedLoader:
+    """
+    Wraps a module's loader, to time it with an ImportTimer
+    """
+
+    def __init__(self, loader, timer: ImportTimer):
+        self.loader = loader
+        self.timer = timer
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.timer.time(module.__name__, lambda: self.loader.exec_module(module))
+
+    def __getattr__(self, name: str):
+        return getattr(self.loader, name)
+
+
+class StartupProfile:
+    """
+    Phases of the initialization and imports, in milliseconds since the profile started
+    """
+
+    started: float
+    timer: ImportTimer
+    # Name, start and duration of each phase, in order
+    phases: list[tuple[str, float, float]]
+    reported: bool
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.timer = ImportTimer()
+        self.phases = []
+        self.reported = False
+        sys.meta_path.insert(0, self.timer)
+
+    def since_start(self) -> float:
+        return (perf_counter() - self.started) * 1000
+
+    def report(self) -> str:
+        lines = [f"{'phase':<30} {'start':>10} {'duration':>10}"]
+        for name, start, duration in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"{name:<30} {start:>8.1f}ms {duration:>8.1f}ms")
+        lines.append("")
+        lines.append(f"{'import':<30} {'total':>10} {'own':>10}")
+        slowest = sorted(self.timer.timings, key=lambda timing: -timing[1])
+        for name, total, own in slowest[:SHOWN_MODULES]:
+            lines.append(f"{name:<30} {total:>8.1f}ms {own:>8.1f}ms")
+        return "\n".join(lines)
+
+
+profile: Optional[StartupProfile] = StartupProfile() if FLAG in sys.argv else None
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Times what runs in the block as a phase of the startup, if it is being profiled
+    """
+    if profile is None:
+        yield
+        return
+    start = profile.since_start()
+    try:
+        yield
+    finally:
+        profile.phases.append((name, start, profile.since_start() - start))
+
+
+@contextmanager
+def paused() -> Iterator[None]:
+    """
+    Leaves what runs in the block out of the startup's time, e.g. waiting for the user
+    """
+    if profile is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        profile.started += perf_counter() - start
+
+
+def milestone(name: str):
+    """
+    Records that the startup reached some point, e.g. the window being shown
+    """
+    if profile is not None:
+        profile.phases.append((name, profile.since_start(), 0))
+
+
+def report():
+    """
+    Prints the startup profile to stderr, the first time it is called
+    """
+    if profile is None or profile.reported:
+        return
+    profile.reported = True
+    sys.meta_path.remove(profile.timer)
+    print(profile.report(), file=sys.stderr)
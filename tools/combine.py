@@ -1,40 +1,155 @@
 #!/usr/bin/env python
 # combine all python files into a single one
+import ast
 from pathlib import Path
 
-ORDER = "utils", "board", "ai", "player", "main"
+ORDER = (
+    "startup",
+    "utils",
+    "metrics",
+    "backends",
+    "legality",
+    "placements",
+    "board",
+    "ai",
+    "player",
+    "game",
+    "view",
+    "main",
+)
 
-def separate(text: str) -> tuple[str, str]:
+
+def imported_module(node: ast.stmt) -> str:
+    if isinstance(node, ast.ImportFrom):
+        return (node.module or "").split(".")[0]
+    return node.names[0].name.split(".")[0]
+
+
+def is_main_block(node: ast.stmt) -> bool:
+    return isinstance(node, ast.If) and ast.unparse(node.test) in (
+        "__name__ == '__main__'",
+        "'__main__' == __name__",
+    )
+
+
+def bindings(node: ast.stmt) -> dict[str, str]:
+    """
+    Global names a top-level statement binds, with what they are bound to:
+    the imported object, or the statement itself
+    """
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        prefix = f"{node.module}." if isinstance(node, ast.ImportFrom) else ""
+        return {
+            (alias.asname or alias.name).split(".")[0]: prefix + alias.name
+            for alias in node.names
+            if alias.name != "*"
+        }
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {node.name: ast.unparse(node)}
+    targets = []
+    if isinstance(node, ast.Assign):
+        targets = node.targets
+    elif isinstance(node, (ast.AnnAssign, ast.AugAssign)):
+        targets = [node.target]
+    statement = ast.unparse(node)
+    return {
+        name.id: statement
+        for target in targets
+        for name in ast.walk(target)
+        if isinstance(name, ast.Name)
+    }
+
+
+class Combined:
+    """
+    The modules' imports and contents, merged into a single namespace
     """
-    Separate text into (imports_text, contents_text)
+
+    def __init__(self):
+        self.futures: list[str] = []
+        # `import x` statements, and the names imported `from x`, by module
+        self.imports: list[str] = []
+        self.imported_from: dict[str, list[str]] = {}
+        # Combined modules used as namespaces (`import metrics`)
+        self.namespaces: list[str] = []
+        self.contents: list[str] = []
+        # Where each global name is bound, and to what (see bindings)
+        self.bound: dict[str, tuple[str, str]] = {}
+
+    def bind(self, module: str, node: ast.stmt):
+        for name, value in bindings(node).items():
+            previous = self.bound.setdefault(name, (module, value))
+            # The same value may be bound twice, like numpy = lazy_import("numpy")
+            if previous[0] != module and previous[1] != value:
+                raise ValueError(
+                    f"{module} and {previous[0]} both define {name}:"
+                    " they cannot share a single file"
+                )
+
+    def add(self, module: str, text: str, last: bool):
+        lines = text.splitlines()
+        kept = []
+        end = 0
+        for node in ast.parse(text).body:
+            # Along with the comments and blank lines before it
+            source = "\n".join(lines[end : node.end_lineno])
+            end = node.end_lineno
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                self.add_import(module, node)
+            elif not is_main_block(node) or last:
+                self.bind(module, node)
+                kept.append(source)
+        kept.append("\n".join(lines[end:]))
+        self.contents.append(f"## {module.title()}\n\n" + "\n".join(kept).strip())
+
+    def add_import(self, module: str, node: ast.stmt):
+        name = imported_module(node)
+        if name == "__future__":
+            statement = ast.unparse(node)
+            if statement not in self.futures:
+                self.futures.append(statement)
+            return
+        if name in ORDER:
+            # Everything is defined in the combined file itself
+            if isinstance(node, ast.Import) and name not in self.namespaces:
+                self.namespaces.append(name)
+            return
+        self.bind(module, node)
+        if isinstance(node, ast.Import):
+            statement = ast.unparse(node)
+            if statement not in self.imports:
+                self.imports.append(statement)
+            return
+        names = self.imported_from.setdefault(node.module, [])
+        for alias in node.names:
+            name = ast.unparse(alias)
+            if name not in names:
+                names.append(name)
+
+    def text(self) -> str:
+        header = self.futures + self.imports
+        header += [
+            f"from {module} import {', '.join(names)}"
+            for module, names in self.imported_from.items()
+        ]
+        if self.namespaces:
+            if "import sys" not in self.imports:
+                header.append("import sys")
+            header.append("")
+            header += [f"{name} = sys.modules[__name__]" for name in self.namespaces]
+        return "\n".join(header) + "\n\n\n" + "\n\n\n".join(self.contents) + "\n"
+
+
+def combine(directory: Path = Path(".")) -> str:
+    """
+    The source of the combined file, made of the modules of `directory`
     """
-    imports, contents = [], []
-    inside_imports = True
-
-    for line in text.splitlines():
-        if inside_imports and (line.startswith("from ") or line.startswith("import ")):
-            # Don't import local files since they'll all be here directly
-            if line.split(' ')[1] in ORDER:
-                continue
-            imports.append(line)
-        elif line.strip() == "":
-            if inside_imports:
-                imports.append(line)
-            else:
-                contents.append(line)
-        else:
-            inside_imports = False
-            contents.append(line)
-    
-    return "\n".join(imports), "\n".join(contents)
-
-all_imports = []
-contents = ""
-
-for module in ORDER:
-    raw = Path(module+".py").read_text(encoding="utf-8")
-    imports, other = separate(raw)
-    all_imports += imports.splitlines()
-    contents += f"\n## {module.title()}\n\n{other}"
-
-Path("onefile.py").write_text("\n".join(set(all_imports))+ "\n\n" + contents)
+    combined = Combined()
+    for module in ORDER:
+        text = (directory / f"{module}.py").read_text(encoding="utf-8")
+        combined.add(module, text, last=module == ORDER[-1])
+    return combined.text()
+
+
+if __name__ == "__main__":
+    Path("onefile.py").write_text(combine(), encoding="utf-8")
@@ -1,6 +1,42 @@
-import tkinter
-from typing import Callable, Any, Iterable, TypeVar, Union
-from rich import print
+from __future__ import annotations
+import atexit
+import importlib.util
+import os
+import sys
+from queue import SimpleQueue
+from threading import Thread
+from types import ModuleType
+from typing import TYPE_CHECKING, Callable, Any, TypeVar, Union
+
+if TYPE_CHECKING:
+    import tkinter
+    from concurrent.futures import Future
+
+
+def print(*args, **kwargs):
+    """
+    rich's print, which is only imported once something gets printed
+    """
+    from rich import print
+
+    print(*args, **kwargs)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Imports a module the first time one of its attributes is used, to start faster.
+    Annotations using it have to be postponed (see PEP 563).
+    Use it from a single thread first: loading is not thread-safe before Python 3.12.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
 
 
 def handle(
@@ -36,9 +72,123 @@ def doublerange(outer, inner=None):
             yield a, b
 
 
-def d(text: str, *args, **kwargs):
-    print("[dim]\[debug][/] " + text, *args, **kwargs)
+# Log levels
+OFF = 0
+INFO = 1
+DEBUG = 2
+TRACE = 3
+LOG_LEVELS = {"off": OFF, "info": INFO, "debug": DEBUG, "trace": TRACE}
+LOG_LEVEL_NAMES = dict_reciprocal(LOG_LEVELS)
+LOG_LEVEL_ENV_VAR = "BATAILLE_NAVALE_LOG"
+
+Message = Union[str, Callable[[], str]]
+
+log_level = LOG_LEVELS.get(os.environ.get(LOG_LEVEL_ENV_VAR, "off").lower(), OFF)
+
+
+def set_log_level(level: Union[int, str]):
+    """
+    Sets the most verbose level that gets logged, as an integer or one of LOG_LEVELS' names
+    """
+    global log_level
+    log_level = LOG_LEVELS[level.lower()] if isinstance(level, str) else level
+
+
+def logging_at(level: int) -> bool:
+    """
+    Whether messages of that level are logged.
+    Use it to skip whole blocks of logging code in hot loops.
+    """
+    return level <= log_level
+
+
+def print_sink(text: str, args: tuple, kwargs: dict):
+    print(text, *args, **kwargs)
+
+
+class BackgroundSink:
+    """
+    Prints log messages from a daemon thread,
+    so that logging never blocks the tkinter event loop or a simulation.
+    """
+
+    def __init__(self):
+        self.queue = SimpleQueue()
+        self.thread = Thread(target=self.run, name="log sink", daemon=True)
+        self.thread.start()
+
+    def __call__(self, text: str, args: tuple, kwargs: dict):
+        self.queue.put((text, args, kwargs))
+
+    def run(self):
+        while (message := self.queue.get()) is not None:
+            print_sink(*message)
+
+    def close(self):
+        """
+        Prints the remaining messages and stops the thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+
+sink: Callable[[str, tuple, dict], Any] = print_sink
+
+
+def use_background_sink():
+    global sink
+    if isinstance(sink, BackgroundSink):
+        return
+    sink = BackgroundSink()
+    atexit.register(sink.close)
+
+
+def log(level: int, message: Message, *args, **kwargs):
+    """
+    Logs a message if its level is enabled.
+    The message can be a function returning the text, which is only called
+    when the message is actually logged: use `lambda: f"..."` for costly messages.
+    """
+    if level > log_level:
+        return
+    if callable(message):
+        message = message()
+    sink(f"[dim]\\[{LOG_LEVEL_NAMES[level]}][/] " + message, args, kwargs)
+
+
+def i(text: Message, *args, **kwargs):
+    log(INFO, text, *args, **kwargs)
+
+
+def d(text: Message, *args, **kwargs):
+    log(DEBUG, text, *args, **kwargs)
+
+
+def t(text: Message, *args, **kwargs):
+    log(TRACE, text, *args, **kwargs)
 
 
 def french_join(elements: Union[list, tuple]) -> str:
     return ", ".join(map(str, elements[:-1])) + " et " + str(elements[-1])
+
+
+def run_in_thread(function: Callable[[], Any], name: str = None) -> Future:
+    """
+    Calls function() in a new daemon thread, which does not keep the program
+    running when it exits. Returns a future of its result.
+    Cancelling the future only works before the thread starts calling the function.
+    """
+    from concurrent.futures import Future
+
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function())
+        except BaseException as error:
+            future.set_exception(error)
+
+    Thread(target=run, name=name, daemon=True).start()
+    return future
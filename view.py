@@ -0,0 +1,614 @@
+from tkinter import Button, Canvas, Event, Frame, Misc, Scrollbar
+from functools import partial
+from math import sqrt
+from time import perf_counter
+from typing import Callable, Optional
+from utils import *
+from board import (
+    Board,
+    CELL_DISPLAY_STATES,
+    CELL_STATES_BY_TEXT,
+    MISSED,
+    SHIP,
+    SUNKEN,
+    UNKNOWN,
+    WATER,
+)
+
+# Most times per second a view repaints, 0 for as often as Tk is idle
+MAX_FPS = 60
+
+
+class CoalescedUpdates:
+    """
+    Collects the cells a board changes and hands them over to `flush`, at most
+    `max_fps` times per second, from Tk's event loop.
+    A cell changed several times between two flushes is only repainted once,
+    in its latest state, so that the board can change thousands of cells per second
+    while the view only repaints what changed, once per frame.
+    """
+
+    board: Board
+    widget: Misc
+    flush_callback: Callable[[dict[tuple[int, int], int]], Any]
+    max_fps: float
+    # Latest state of the cells changed since the last flush
+    dirty: dict[tuple[int, int], int]
+    # Identifier of the scheduled flush, if there is one
+    scheduled: Optional[str]
+    last_flush: float
+
+    def __init__(
+        self,
+        widget: Misc,
+        board: Board,
+        flush: Callable[[dict[tuple[int, int], int]], Any],
+        max_fps: float = MAX_FPS,
+    ):
+        self.widget = widget
+        self.board = board
+        self.flush_callback = flush
+        self.max_fps = max_fps
+        self.dirty = {}
+        self.scheduled = None
+        self.last_flush = 0
+        board.subscribe(self.mark)
+
+    def mark(self, x: int, y: int, state: int):
+        self.dirty[(x, y)] = state
+        if self.scheduled is None:
+            wait = 0
+            if self.max_fps:
+                wait = self.last_flush + 1 / self.max_fps - perf_counter()
+            if wait > 0:
+                self.scheduled = self.widget.after(int(wait * 1000) + 1, self.flush)
+            else:
+                self.scheduled = self.widget.after_idle(self.flush)
+
+    def flush(self):
+        self.scheduled = None
+        self.last_flush = perf_counter()
+        changes, self.dirty = self.dirty, {}
+        if changes:
+            self.flush_callback(changes)
+
+    def close(self):
+        """
+        Stops listening to the board, dropping the changes that were not flushed yet
+        """
+        self.board.unsubscribe(self.mark)
+        if self.scheduled is not None:
+            self.widget.after_cancel(self.scheduled)
+            self.scheduled = None
+        self.dirty = {}
+
+
+class BoardView:
+    """
+    Displays a Board as a grid of buttons.
+    The view only mirrors the board's state: every change goes through the board,
+    which notifies the view back.
+    Changes are repainted in batches, see CoalescedUpdates.
+    """
+
+    board: Board
+    mainframe: Frame
+    cells: list[list[Button]]
+    updates: CoalescedUpdates
+
+    def __init__(self, master: Misc, board: Board, max_fps: float = MAX_FPS):
+        self.board = board
+        self.mainframe = Frame(master)
+        self.cells = []
+
+        for x in range(board.size):
+            self.cells.append([])
+            for y in range(board.size):
+                cell = Button(self.mainframe, **CELL_DISPLAY_STATES[board @ (x, y)])
+                cell.bind("<Button-1>", partial(handle, board.handle_cell_Button1, x, y))
+                cell.bind("<Button-3>", partial(handle, board.handle_cell_Button3, x, y))
+                self.cells[x].append(cell)
+                cell.grid(row=x, column=y)
+
+        self.updates = CoalescedUpdates(
+            self.mainframe, board, self.update_cells, max_fps
+        )
+
+    def update_cell(self, x: int, y: int, state: int):
+        self.cells[x][y].configure(**CELL_DISPLAY_STATES[state])
+
+    def update_cells(self, changes: dict[tuple[int, int], int]):
+        for (x, y), state in changes.items():
+            self.update_cell(x, y, state)
+
+    def displayed_state(self, x: int, y: int) -> int:
+        """
+        State shown by the cell at row x column y, decoded from its text
+        """
+        return CELL_STATES_BY_TEXT[self.cells[x][y]["text"]]
+
+    def render(self, column: int, row: int, span: int = 1):
+        self.mainframe.grid(column=column, row=row, columnspan=span, rowspan=span)
+
+    def destroy(self):
+        self.updates.close()
+        self.mainframe.destroy()
+
+
+CELL_SIZE = 32  # pixels
+
+
+class CanvasBoardView:
+    """
+    Displays a Board on a single Canvas, with a rectangle and a text item per cell.
+    Clicks are handled by one binding on the canvas, mapping pixels to cells,
+    which makes it much cheaper to build than BoardView's grid of buttons.
+    """
+
+    board: Board
+    canvas: Canvas
+    cell_size: int
+    # Canvas items of the cell x * board.size + y
+    rectangles: list[int]
+    texts: list[int]
+    updates: CoalescedUpdates
+
+    def __init__(
+        self,
+        master: Misc,
+        board: Board,
+        cell_size: int = CELL_SIZE,
+        max_fps: float = MAX_FPS,
+    ):
+        self.board = board
+        self.cell_size = cell_size
+        self.canvas = Canvas(
+            master,
+            width=board.size * cell_size,
+            height=board.size * cell_size,
+            highlightthickness=0,
+        )
+        self.rectangles = []
+        self.texts = []
+
+        for x, y in doublerange(board.size):
+            display = CELL_DISPLAY_STATES[board @ (x, y)]
+            top, left = x * cell_size, y * cell_size
+            self.rectangles.append(
+                self.canvas.create_rectangle(
+                    left,
+                    top,
+                    left + cell_size,
+                    top + cell_size,
+                    fill=display["bg"],
+                    outline="black",
+                )
+            )
+            self.texts.append(
+                self.canvas.create_text(
+                    left + cell_size / 2, top + cell_size / 2, text=display["text"]
+                )
+            )
+
+        self.canvas.bind(
+            "<Button-1>", partial(self.handle_click, board.handle_cell_Button1)
+        )
+        self.canvas.bind(
+            "<Button-3>", partial(self.handle_click, board.handle_cell_Button3)
+        )
+        self.updates = CoalescedUpdates(self.canvas, board, self.update_cells, max_fps)
+
+    def cell_at(self, pixel_x: float, pixel_y: float) -> Optional[tuple[int, int]]:
+        """
+        Coordinates of the cell under the given point of the canvas, None if there is none
+        """
+        x, y = int(pixel_y // self.cell_size), int(pixel_x // self.cell_size)
+        return (x, y) if self.board.within_bounds(x, y) else None
+
+    def handle_click(self, method: Callable[[int, int], Any], event: Event) -> Any:
+        cell = self.cell_at(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        if cell is not None:
+            return method(*cell)
+
+    def update_cell(self, x: int, y: int, state: int):
+        display = CELL_DISPLAY_STATES[state]
+        index = x * self.board.size + y
+        self.canvas.itemconfigure(self.rectangles[index], fill=display["bg"])
+        self.canvas.itemconfigure(self.texts[index], text=display["text"])
+
+    def update_cells(self, changes: dict[tuple[int, int], int]):
+        for (x, y), state in changes.items():
+            self.update_cell(x, y, state)
+
+    def displayed_state(self, x: int, y: int) -> int:
+        """
+        State shown by the cell at row x column y, decoded from its text
+        """
+        return CELL_STATES_BY_TEXT[
+            self.canvas.itemcget(self.texts[x * self.board.size + y], "text")
+        ]
+
+    def render(self, column: int, row: int, span: int = 1):
+        self.canvas.grid(column=column, row=row, columnspan=span, rowspan=span)
+
+    def destroy(self):
+        self.updates.close()
+        self.canvas.destroy()
+
+
+# Colors of CELL_DISPLAY_STATES' backgrounds, to blend them into summary tiles
+STATE_COLORS = {
+    SUNKEN: (255, 0, 0),
+    SHIP: (255, 255, 255),
+    WATER: (0, 0, 255),
+    MISSED: (0, 255, 255),
+    UNKNOWN: (190, 190, 190),
+}
+# Below this many pixels per cell, cells are grouped into summary tiles
+MIN_CELL_PIXELS = 12
+# Below this many pixels per cell, cells don't show their text
+MIN_TEXT_PIXELS = 20
+# Smallest size of a summary tile, in pixels
+MIN_TILE_PIXELS = 12
+
+
+class BlockSummary:
+    """
+    Counts the cells of a board that are not in its initial state, for square blocks
+    of 2, 4, 8... cells wide, kept up to date as the board changes.
+    Only blocks holding such cells are stored, so that a huge, mostly untouched
+    board costs next to nothing.
+    """
+
+    board: Board
+    # counts[level][(block_x, block_y)][state], for blocks 2 ** level cells wide
+    counts: list[dict[tuple[int, int], dict[int, int]]]
+    # States of the cells that are not in the initial state
+    known: dict[tuple[int, int], int]
+
+    def __init__(self, board: Board):
+        self.board = board
+        self.levels = max(1, (board.size - 1).bit_length())
+        self.counts = [{} for _ in range(self.levels + 1)]
+        self.known = {}
+        for state in CELL_DISPLAY_STATES:
+            if state != board.initial_state:
+                for x, y in board.cells(state):
+                    self.update(x, y, state)
+        board.subscribe(self.update)
+
+    def update(self, x: int, y: int, state: int):
+        previous = self.known.get((x, y), self.board.initial_state)
+        if previous == state:
+            return
+        if state == self.board.initial_state:
+            del self.known[(x, y)]
+        else:
+            self.known[(x, y)] = state
+        for level in range(1, self.levels + 1):
+            key = (x >> level, y >> level)
+            block = self.counts[level].setdefault(key, {})
+            if previous != self.board.initial_state:
+                block[previous] -= 1
+                if not block[previous]:
+                    del block[previous]
+            if state != self.board.initial_state:
+                block[state] = block.get(state, 0) + 1
+            if not block:
+                del self.counts[level][key]
+
+    def block(self, level: int, block_x: int, block_y: int) -> dict[int, int]:
+        """
+        Number of cells in each state in the block, the initial state included
+        """
+        width = 1 << level
+        area = min(width, self.board.size - block_x * width) * min(
+            width, self.board.size - block_y * width
+        )
+        counts = dict(self.counts[level].get((block_x, block_y), {}))
+        counts[self.board.initial_state] = area - sum(counts.values())
+        return counts
+
+    def color(self, level: int, block_x: int, block_y: int) -> str:
+        """
+        Color of the block's tile: its states' colors blended, rare states
+        (like a few hits in a big block) being boosted to remain visible
+        """
+        counts = self.block(level, block_x, block_y)
+        area = sum(counts.values())
+        weights = {
+            state: sqrt(count / area)
+            for state, count in counts.items()
+            if state != self.board.initial_state
+        }
+        weights[self.board.initial_state] = max(0, 1 - sum(weights.values()))
+        total = sum(weights.values())
+        red, green, blue = (
+            round(
+                sum(
+                    STATE_COLORS[state][channel] * weight
+                    for state, weight in weights.items()
+                )
+                / total
+            )
+            for channel in range(3)
+        )
+        return f"#{red:02x}{green:02x}{blue:02x}"
+
+
+class ViewportBoardView:
+    """
+    Displays the part of a board visible in a scrollable, zoomable viewport.
+    Only the cells on screen get canvas items, drawn from the board's state on demand;
+    when zoomed out, cells are grouped into tiles colored after a BlockSummary.
+    This makes the cost of the view independent of the board's size.
+
+    Scroll with the scrollbars, the arrow keys or by dragging with the middle button,
+    zoom with the mouse wheel or +/-. Clicking on a tile zooms in on it.
+    """
+
+    board: Board
+    summary: BlockSummary
+    canvas: Canvas
+    # Zoom level
+    cell_pixels: float
+    # Coordinates (in cells) of the viewport's top left corner
+    origin_x: float
+    origin_y: float
+    # Items of the cells, or tiles, on screen
+    items: dict[tuple[int, int], tuple[int, ...]]
+    # Level of the tiles on screen, 0 when showing cells
+    level: int
+    updates: CoalescedUpdates
+
+    def __init__(
+        self,
+        master: Misc,
+        board: Board,
+        width: int = 640,
+        height: int = 640,
+        max_fps: float = MAX_FPS,
+    ):
+        self.board = board
+        self.summary = BlockSummary(board)
+        self.mainframe = Frame(master)
+        self.canvas = Canvas(
+            self.mainframe, width=width, height=height, highlightthickness=0
+        )
+        self.vertical_scrollbar = Scrollbar(
+            self.mainframe, orient="vertical", command=partial(self.scroll, "x")
+        )
+        self.horizontal_scrollbar = Scrollbar(
+            self.mainframe, orient="horizontal", command=partial(self.scroll, "y")
+        )
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.vertical_scrollbar.grid(row=0, column=1, sticky="ns")
+        self.horizontal_scrollbar.grid(row=1, column=0, sticky="ew")
+        self.mainframe.rowconfigure(0, weight=1)
+        self.mainframe.columnconfigure(0, weight=1)
+
+        self.cell_pixels = min(width, height) / board.size
+        self.origin_x = self.origin_y = 0
+        self.items = {}
+        self.level = 0
+
+        self.canvas.bind("<Configure>", lambda _: self.redraw())
+        for button in 1, 3:
+            handler = getattr(board, f"handle_cell_Button{button}")
+            self.canvas.bind(f"<Button-{button}>", partial(self.handle_click, handler))
+        self.canvas.bind("<ButtonPress-2>", self.start_drag)
+        self.canvas.bind("<B2-Motion>", self.drag)
+        self.canvas.bind("<MouseWheel>", self.handle_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.zoom(1.25, e.x, e.y))
+        self.canvas.bind("<Button-5>", lambda e: self.zoom(0.8, e.x, e.y))
+        self.canvas.bind("<Enter>", lambda _: self.canvas.focus_set())
+        for key, (dx, dy) in {
+            "<Up>": (-1, 0),
+            "<Down>": (1, 0),
+            "<Left>": (0, -1),
+            "<Right>": (0, 1),
+        }.items():
+            self.canvas.bind(key, partial(self.pan_by_screen, dx / 4, dy / 4))
+        self.canvas.bind("<plus>", lambda _: self.zoom(1.25))
+        self.canvas.bind("<minus>", lambda _: self.zoom(0.8))
+        self.updates = CoalescedUpdates(self.canvas, board, self.update_cells, max_fps)
+
+    @property
+    def viewport_size(self) -> tuple[float, float]:
+        """
+        Number of cells (rows, columns) fitting in the canvas
+        """
+        return (
+            max(self.canvas.winfo_height(), 1) / self.cell_pixels,
+            max(self.canvas.winfo_width(), 1) / self.cell_pixels,
+        )
+
+    def redraw(self):
+        self.canvas.delete("all")
+        self.items = {}
+        rows, columns = self.viewport_size
+        first_x, first_y = int(self.origin_x), int(self.origin_y)
+        last_x = min(int(self.origin_x + rows) + 1, self.board.size)
+        last_y = min(int(self.origin_y + columns) + 1, self.board.size)
+
+        if self.cell_pixels >= MIN_CELL_PIXELS:
+            self.level = 0
+            for x in range(first_x, last_x):
+                for y in range(first_y, last_y):
+                    self.draw_cell(x, y)
+        else:
+            self.level = 1
+            while (1 << self.level) * self.cell_pixels < MIN_TILE_PIXELS:
+                self.level += 1
+            self.level = min(self.level, self.summary.levels)
+            shift = self.level
+            for block_x in range(first_x >> shift, ((last_x - 1) >> shift) + 1):
+                for block_y in range(first_y >> shift, ((last_y - 1) >> shift) + 1):
+                    self.draw_tile(block_x, block_y)
+
+        self.vertical_scrollbar.set(
+            self.origin_x / self.board.size, (self.origin_x + rows) / self.board.size
+        )
+        self.horizontal_scrollbar.set(
+            self.origin_y / self.board.size,
+            (self.origin_y + columns) / self.board.size,
+        )
+
+    def pixel(self, x: float, y: float) -> tuple[float, float]:
+        """
+        Position on the canvas (left, top) of the top left corner of cell (x, y)
+        """
+        return (
+            (y - self.origin_y) * self.cell_pixels,
+            (x - self.origin_x) * self.cell_pixels,
+        )
+
+    def draw_cell(self, x: int, y: int):
+        display = CELL_DISPLAY_STATES[self.board @ (x, y)]
+        left, top = self.pixel(x, y)
+        items = (
+            self.canvas.create_rectangle(
+                left,
+                top,
+                left + self.cell_pixels,
+                top + self.cell_pixels,
+                fill=display["bg"],
+                outline="black",
+            ),
+        )
+        if self.cell_pixels >= MIN_TEXT_PIXELS:
+            items += (
+                self.canvas.create_text(
+                    left + self.cell_pixels / 2,
+                    top + self.cell_pixels / 2,
+                    text=display["text"],
+                ),
+            )
+        self.items[(x, y)] = items
+
+    def draw_tile(self, block_x: int, block_y: int):
+        width = 1 << self.level
+        left, top = self.pixel(block_x * width, block_y * width)
+        right, bottom = self.pixel(
+            min((block_x + 1) * width, self.board.size),
+            min((block_y + 1) * width, self.board.size),
+        )
+        self.items[(block_x, block_y)] = (
+            self.canvas.create_rectangle(
+                left,
+                top,
+                right,
+                bottom,
+                fill=self.summary.color(self.level, block_x, block_y),
+                outline="",
+            ),
+        )
+
+    def update_cells(self, changes: dict[tuple[int, int], int]):
+        if self.level:
+            # Recolor each tile once, however many of its cells changed
+            for key in {(x >> self.level, y >> self.level) for x, y in changes}:
+                if key in self.items:
+                    self.canvas.itemconfigure(
+                        self.items[key][0], fill=self.summary.color(self.level, *key)
+                    )
+            return
+        for (x, y), state in changes.items():
+            self.update_cell(x, y, state)
+
+    def update_cell(self, x: int, y: int, state: int):
+        if (x, y) in self.items:
+            display = CELL_DISPLAY_STATES[state]
+            rectangle, *text = self.items[(x, y)]
+            self.canvas.itemconfigure(rectangle, fill=display["bg"])
+            if text:
+                self.canvas.itemconfigure(text[0], text=display["text"])
+
+    def cell_at(self, pixel_x: float, pixel_y: float) -> Optional[tuple[int, int]]:
+        """
+        Coordinates of the cell under the given point of the canvas, if any
+        """
+        x = int(self.origin_x + pixel_y / self.cell_pixels)
+        y = int(self.origin_y + pixel_x / self.cell_pixels)
+        return (x, y) if self.board.within_bounds(x, y) else None
+
+    def handle_click(self, method: Callable[[int, int], Any], event: Event) -> Any:
+        if self.level:
+            return self.zoom(MIN_CELL_PIXELS / self.cell_pixels, event.x, event.y)
+        cell = self.cell_at(event.x, event.y)
+        if cell is not None:
+            return method(*cell)
+
+    def scroll(self, axis: str, action: str, amount: str, unit: str = None):
+        """
+        Handles the scrollbars' commands, scrolling along x (rows) or y (columns)
+        """
+        rows, columns = self.viewport_size
+        visible = rows if axis == "x" else columns
+        if action == "moveto":
+            target = float(amount) * self.board.size
+        else:
+            step = visible if unit == "pages" else max(visible / 10, 1)
+            target = getattr(self, f"origin_{axis}") + int(amount) * step
+        setattr(self, f"origin_{axis}", self.clamp(target, visible))
+        self.redraw()
+
+    def clamp(self, origin: float, visible: float) -> float:
+        return max(0, min(origin, self.board.size - visible))
+
+    def pan_by_screen(self, rows: float, columns: float, _: Event = None):
+        """
+        Moves the viewport by a fraction of its size
+        """
+        visible_rows, visible_columns = self.viewport_size
+        self.origin_x = self.clamp(self.origin_x + rows * visible_rows, visible_rows)
+        self.origin_y = self.clamp(
+            self.origin_y + columns * visible_columns, visible_columns
+        )
+        self.redraw()
+
+    def start_drag(self, event: Event):
+        self.drag_start = (event.x, event.y, self.origin_x, self.origin_y)
+
+    def drag(self, event: Event):
+        start_x, start_y, origin_x, origin_y = self.drag_start
+        rows, columns = self.viewport_size
+        self.origin_x = self.clamp(
+            origin_x - (event.y - start_y) / self.cell_pixels, rows
+        )
+        self.origin_y = self.clamp(
+            origin_y - (event.x - start_x) / self.cell_pixels, columns
+        )
+        self.redraw()
+
+    def handle_wheel(self, event: Event):
+        self.zoom(1.25 if event.delta > 0 else 0.8, event.x, event.y)
+
+    def zoom(self, factor: float, pixel_x: float = None, pixel_y: float = None):
+        """
+        Zooms by `factor`, keeping the point under (pixel_x, pixel_y) in place
+        (the center of the canvas by default)
+        """
+        if pixel_x is None:
+            pixel_x = self.canvas.winfo_width() / 2
+            pixel_y = self.canvas.winfo_height() / 2
+        fit = (
+            min(self.canvas.winfo_width(), self.canvas.winfo_height()) / self.board.size
+        )
+        # Don't zoom out past the whole board, nor in past a few cells
+        cell_pixels = max(fit, min(self.cell_pixels * factor, 128))
+        x = self.origin_x + pixel_y / self.cell_pixels
+        y = self.origin_y + pixel_x / self.cell_pixels
+        self.cell_pixels = cell_pixels
+        rows, columns = self.viewport_size
+        self.origin_x = self.clamp(x - pixel_y / cell_pixels, rows)
+        self.origin_y = self.clamp(y - pixel_x / cell_pixels, columns)
+        self.redraw()
+
+    def render(self, column: int, row: int, span: int = 1):
+        self.mainframe.grid(column=column, row=row, columnspan=span, rowspan=span)
+
+    def destroy(self):
+        self.updates.close()
+        self.board.unsubscribe(self.summary.update)
+        self.mainframe.destroy()
@@ -0,0 +1,94 @@
+from backends import SparseBackend
+from board import ControlledBoard, SHIP, SUNKEN, WATER
+from game import Game
+from view import BlockSummary, CoalescedUpdates
+
+
+class FakeWidget:
+    """
+    Records the callbacks scheduled through it instead of running Tk's event loop
+    """
+
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, milliseconds: int, callback) -> str:
+        self.scheduled.append(("after", milliseconds, callback))
+        return str(len(self.scheduled))
+
+    def after_idle(self, callback) -> str:
+        self.scheduled.append(("after_idle", 0, callback))
+        return str(len(self.scheduled))
+
+    def after_cancel(self, identifier: str):
+        self.scheduled[int(identifier) - 1] = None
+
+    def run(self):
+        scheduled, self.scheduled = self.scheduled, []
+        for call in filter(None, scheduled):
+            call[2]()
+
+
+def test_BlockSummary_counts_cells_by_block():
+    board = ControlledBoard(Game(), grid_size=5, fleet=[3], backend=SparseBackend)
+    board.change_cell(0, 0, SHIP)
+    board.change_cell(1, 1, SHIP)
+    board.change_cell(4, 4, SHIP)
+    summary = BlockSummary(board)
+
+    assert summary.block(1, 0, 0) == {SHIP: 2, WATER: 2}
+    # Blocks on the edges only count the cells of the board
+    assert summary.block(1, 2, 2) == {SHIP: 1, WATER: 0}
+    assert summary.block(1, 0, 2) == {WATER: 2}
+    assert summary.block(3, 0, 0) == {SHIP: 3, WATER: 22}
+
+    board.change_cell(0, 1, SHIP)
+    board.fire(0, 0)
+    assert summary.block(1, 0, 0) == {SHIP: 2, SUNKEN: 1, WATER: 1}
+    assert summary.block(2, 0, 0) == {SHIP: 2, SUNKEN: 1, WATER: 13}
+    assert summary.block(3, 0, 0) == {SHIP: 3, SUNKEN: 1, WATER: 21}
+
+    for x, y in (0, 0), (0, 1), (1, 1):
+        board.change_cell(x, y, WATER)
+    assert summary.block(1, 0, 0) == {WATER: 4}
+    assert summary.block(3, 0, 0) == {SHIP: 1, WATER: 24}
+    # Blocks left with nothing but water are forgotten
+    assert (0, 0) not in summary.counts[1]
+    assert summary.known == {(4, 4): SHIP}
+
+
+def test_CoalescedUpdates_flushes_each_cell_once_per_frame():
+    board = ControlledBoard(Game(), grid_size=4, fleet=[3])
+    widget = FakeWidget()
+    flushes = []
+    updates = CoalescedUpdates(widget, board, flushes.append, max_fps=0)
+
+    board.change_cell(0, 0, SHIP)
+    board.change_cell(1, 2, SHIP)
+    board.fire(0, 0)
+    board.fire(1, 2)
+    board.change_cell(0, 0, WATER)
+    assert [kind for kind, _, _ in widget.scheduled] == ["after_idle"]
+    widget.run()
+    assert flushes == [{(0, 0): WATER, (1, 2): SUNKEN}]
+
+    # At most max_fps flushes per second: the next one waits for its frame
+    updates.max_fps = 10
+    board.change_cell(3, 3, SHIP)
+    board.fire(3, 3)
+    [(kind, milliseconds, _)] = widget.scheduled
+    assert kind == "after" and 0 < milliseconds <= 101
+    widget.run()
+    assert flushes[1:] == [{(3, 3): SUNKEN}]
+
+    # Changes not flushed yet are dropped once closed
+    board.change_cell(2, 2, SHIP)
+    updates.close()
+    widget.run()
+    assert len(flushes) == 2
+    board.change_cell(2, 3, SHIP)
+    assert widget.scheduled == []
+
+
+if __name__ == "__main__":
+    [testfunc() for name, testfunc in locals().items() if name.startswith("test_")]